@@ -1,6 +1,7 @@
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import logging
+from callback_router import get_callback_router
 
 # Обработчик кнопки "Акции"
 async def show_sales(callback: types.CallbackQuery):
@@ -69,6 +70,7 @@ async def card_discount(callback: types.CallbackQuery):
 
 # Функция для регистрации обработчиков в диспетчере
 def register_handlers(dp):
-    dp.callback_query(lambda c: c.data == "sales")(show_sales)
-    dp.callback_query(lambda c: c.data == "first_order_discount")(first_order_discount)
-    dp.callback_query(lambda c: c.data == "card_discount")(card_discount) 
\ No newline at end of file
+    router = get_callback_router(dp)
+    router.exact("sales", show_sales)
+    router.exact("first_order_discount", first_order_discount)
+    router.exact("card_discount", card_discount) 
\ No newline at end of file
@@ -0,0 +1,349 @@
+# also_viewed.py - "С этим товаром также смотрят" для Telegram бота GoldenAppleBot
+# get_user_data объявлял историю просмотров (view_history), но просмотры нигде не
+# записывались и не использовались. Модуль ведет журнал просмотров и по нему строит
+# кнопку "Похожие товары": товары, которые чаще всего смотрели вместе с выбранным.
+#
+# Как устроено:
+# - просмотр - явное действие пользователя с товаром: нажатие кнопки "Похожие товары"
+#   этого товара. Показ товара в списке рекомендаций или поиска просмотром не считается:
+#   иначе все товары одной страницы сочетались бы друг с другом, и матрица повторяла бы
+#   выдачу одного запроса, а не интерес пользователей. Просмотры копятся в памяти и раз
+#   в interval пишутся в журнал interactions (interactions.db) одной транзакцией,
+#   как изменения в fsm_storage.py;
+# - CoOccurrence - разреженная матрица совместных просмотров: товар, просмотренный
+#   пользователем, сочетается с его последними window товарами (счетчики пар в обе
+#   стороны). Для каждого товара поддерживается список top-N соседей: между сокращениями
+#   матрицы счетчики только растут, поэтому соседа достаточно сравнить с последним
+#   в списке. Список соседей выдается одним обращением к словарю;
+# - память ограничена: строка матрицы хранит не больше row_size соседей (при
+#   двукратном превышении остаются самые частые), всего пар не больше max_pairs - при
+#   превышении самые длинные строки обрезаются до самых частых соседей, а счетчики
+#   делятся пополам (давние просмотры весят меньше новых); окна хранятся для max_users
+#   последних пользователей;
+# - AlsoViewed в фоне читает журнал после своей версии (с записями других рабочих
+#   процессов sharding.py) и применяет его к матрице в отдельном потоке. При запуске
+#   применяются последние replay записей журнала, записи старше retention удаляются;
+# - фоновую запись и чтение запускают и останавливают события диспетчера (start_also_viewed
+#   и stop_also_viewed в recommendations.py): их выполняют и run_polling, и каждый рабочий
+#   процесс sharding.py. Если очередь переполнилась, а запись не запущена, в лог пишется
+#   ошибка - просмотры иначе молча отбрасывались бы;
+# - число пар и товаров в матрице, записанные и примененные просмотры видны в /metrics и /stats.
+
+import asyncio  # Для фоновой записи и чтения журнала
+import heapq  # Самые частые соседи товара
+import logging  # Для логирования ошибок
+import os  # Для пути к файлу журнала и настроек
+import sqlite3  # Журнал просмотров
+import time  # Для времени просмотров
+from collections import OrderedDict  # LRU окон просмотров пользователей
+from concurrent.futures import ThreadPoolExecutor  # Поток для журнала и матрицы
+
+# Путь к журналу просмотров по умолчанию - рядом с модулем, а не в текущем каталоге
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "interactions.db")
+
+# Сколько записей журнала применять к матрице за один раз
+APPLY_BATCH = 50000
+
+# Как часто удалять записи журнала старше retention, секунд
+CLEANUP_INTERVAL = 3600
+
+
+def config_from_env() -> dict:
+    """Читает настройки похожих товаров из переменных окружения
+
+    Переменные окружения:
+        ALSO_VIEWED_DB_PATH - путь к журналу просмотров (interactions.db рядом с ботом)
+        ALSO_VIEWED_INTERVAL - как часто записывать и читать журнал, секунд (1)
+        ALSO_VIEWED_WINDOW - со сколькими последними товарами пользователя сочетается просмотр (10)
+        ALSO_VIEWED_NEIGHBORS - сколько соседей хранить в списке товара (10)
+        ALSO_VIEWED_ROW_SIZE - сколько соседей хранить в строке матрицы (100)
+        ALSO_VIEWED_MAX_PAIRS - сколько пар хранить в матрице (2 000 000)
+        ALSO_VIEWED_USERS - для скольких пользователей хранить окна просмотров (100 000)
+        ALSO_VIEWED_REPLAY - сколько последних записей журнала применять при запуске (1 000 000)
+        ALSO_VIEWED_RETENTION_DAYS - сколько дней хранить записи журнала (90)
+
+    Returns:
+        dict: Параметры для AlsoViewed
+    """
+    return {
+        "path": os.getenv("ALSO_VIEWED_DB_PATH") or DEFAULT_PATH,
+        "interval": float(os.getenv("ALSO_VIEWED_INTERVAL", "1")),
+        "window": int(os.getenv("ALSO_VIEWED_WINDOW", "10")),
+        "neighbors": int(os.getenv("ALSO_VIEWED_NEIGHBORS", "10")),
+        "row_size": int(os.getenv("ALSO_VIEWED_ROW_SIZE", "100")),
+        "max_pairs": int(os.getenv("ALSO_VIEWED_MAX_PAIRS", "2000000")),
+        "max_users": int(os.getenv("ALSO_VIEWED_USERS", "100000")),
+        "replay": int(os.getenv("ALSO_VIEWED_REPLAY", "1000000")),
+        "retention": float(os.getenv("ALSO_VIEWED_RETENTION_DAYS", "90")) * 24 * 3600,
+    }
+
+
+class CoOccurrence:
+    """Разреженная матрица совместных просмотров товаров со списками самых частых соседей"""
+
+    def __init__(self, window: int = 10, neighbors: int = 10, row_size: int = 100,
+                 max_pairs: int = 2000000, max_users: int = 100000):
+        self.window = window
+        self.neighbors_size = neighbors
+        self.row_size = max(row_size, neighbors)
+        self.max_pairs = max_pairs
+        self.max_users = max_users
+        self.rows = {}  # {товар: {сосед: число совместных просмотров}}
+        self.top = {}  # {товар: кортеж соседей по убыванию счетчика}
+        self._floor = {}  # {товар: счетчик последнего соседа полного списка}
+        self.windows = OrderedDict()  # LRU: {пользователь: последние просмотренные товары}
+
+        self.pairs = 0  # Пар в матрице (каждое направление отдельно)
+        self.interactions = 0  # Применено просмотров
+        self.prunes = 0  # Сколько раз матрица сокращалась
+
+    def neighbors(self, product_id: int) -> tuple:
+        """Соседи товара по убыванию числа совместных просмотров (пустой кортеж - данных нет)"""
+        return self.top.get(product_id, ())
+
+    def recent(self, user_id: int) -> list:
+        """Последние просмотренные пользователем товары, от давних к новым"""
+        return list(self.windows.get(user_id, ()))
+
+    def add(self, user_id: int, product_id: int):
+        """Учитывает просмотр товара пользователем
+
+        Товар сочетается с последними window товарами пользователя. Повторный
+        просмотр товара из окна пар не добавляет, а только делает его последним.
+        """
+        self.interactions += 1
+        recent = self.windows.pop(user_id, None)
+        if recent is None:
+            recent = []
+        elif product_id in recent:
+            recent.remove(product_id)
+            recent.append(product_id)
+            self.windows[user_id] = recent
+            return
+        for other in recent:
+            self._bump(product_id, other)
+            self._bump(other, product_id)
+        recent.append(product_id)
+        if len(recent) > self.window:
+            del recent[0]
+        self.windows[user_id] = recent
+        if len(self.windows) > self.max_users:
+            self.windows.popitem(last=False)
+        if self.pairs > self.max_pairs:
+            self.prune()
+
+    def _bump(self, product_id: int, other: int):
+        row = self.rows.get(product_id)
+        if row is None:
+            row = self.rows[product_id] = {}
+        count = row.get(other, 0) + 1
+        row[other] = count
+        if count > self._floor.get(product_id, 0):
+            self._promote(product_id, other, count, row)
+        if count == 1:
+            self.pairs += 1
+            if len(row) > 2 * self.row_size:
+                self._trim(product_id, row)
+
+    def _promote(self, product_id: int, other: int, count: int, row: dict):
+        # Счетчик соседа вырос выше последнего в списке: сосед встает на свое место
+        top = [neighbor for neighbor in self.top.get(product_id, ()) if neighbor != other]
+        position = len(top)
+        while position and row[top[position - 1]] < count:
+            position -= 1
+        top.insert(position, other)
+        del top[self.neighbors_size:]
+        # Кортеж подменяется целиком: читатели в другом потоке видят старый или новый список
+        self.top[product_id] = tuple(top)
+        if len(top) >= self.neighbors_size:
+            self._floor[product_id] = row[top[-1]]
+
+    def _trim(self, product_id: int, row: dict):
+        # В строке остаются row_size самых частых соседей и соседи из списка товара
+        keep = set(heapq.nlargest(self.row_size, row, key=row.get))
+        keep.update(self.top.get(product_id, ()))
+        removed = [other for other in row if other not in keep]
+        for other in removed:
+            del row[other]
+        self.pairs -= len(removed)
+
+    def prune(self):
+        """Сокращает матрицу до половины max_pairs пар (следующее сокращение - не скоро)
+
+        Строки обрезаются до общей длины: самой большой, при которой пары помещаются
+        в ограничение, - у каждого товара остаются самые частые соседи, а короткие строки
+        редких товаров не меняются. Счетчики делятся пополам с округлением вверх: давние
+        совместные просмотры весят меньше новых, но пара со счетчиком 1 не пропадает.
+        """
+        target = self.max_pairs // 2
+        lengths = sorted(len(row) for row in self.rows.values())
+        low, high = 1, max(lengths, default=1)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if sum(min(length, middle) for length in lengths) <= target:
+                low = middle
+            else:
+                high = middle - 1
+        rows, top, floor, pairs = {}, {}, {}, 0
+        for product_id, row in self.rows.items():
+            kept = heapq.nlargest(low, row, key=row.get) if len(row) > low else row
+            row = {other: (row[other] + 1) >> 1 for other in kept}
+            best = heapq.nlargest(self.neighbors_size, row, key=row.get)
+            rows[product_id] = row
+            top[product_id] = tuple(best)
+            if len(best) >= self.neighbors_size:
+                floor[product_id] = row[best[-1]]
+            pairs += len(row)
+        # Словари подменяются целиком: читатели в другом потоке видят старые или новые списки
+        self.rows, self.top, self._floor, self.pairs = rows, top, floor, pairs
+        self.prunes += 1
+
+
+class AlsoViewed:
+    """Журнал просмотров в SQLite и матрица совместных просмотров, обновляемая в фоне"""
+
+    def __init__(self, path: str = DEFAULT_PATH, interval: float = 1.0, window: int = 10,
+                 neighbors: int = 10, row_size: int = 100, max_pairs: int = 2000000,
+                 max_users: int = 100000, replay: int = 1000000, retention: float = 90 * 24 * 3600,
+                 batch: int = APPLY_BATCH, max_pending: int = 100000):
+        self.path = path
+        self.interval = interval
+        self.replay = replay
+        self.retention = retention
+        self.batch = batch
+        self.max_pending = max_pending
+        self.graph = CoOccurrence(window, neighbors, row_size, max_pairs, max_users)
+        self.version = None  # seq последней примененной записи журнала (None - журнал не открыт)
+        self._pending = []  # Просмотры, ожидающие записи в журнал: (пользователь, товар, время)
+        self._cleaned_at = 0.0
+        self._task = None
+        self._reported_stopped = False  # Ошибка о незапущенной записи уже в логе
+
+        # Одно соединение и один поток: журнал и матрица меняются только в нем
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="also-viewed")
+        self._conn = None
+
+        self.recorded = 0  # Просмотров принято
+        self.dropped = 0  # Просмотров отброшено: очередь записи переполнена
+        self.applied = 0  # Записей журнала применено к матрице
+
+    def record(self, user_id: int, product_ids):
+        """Ставит просмотры товаров в очередь записи в журнал (без обращения к базе)"""
+        now = time.time()
+        self._pending.extend((user_id, product_id, now) for product_id in product_ids)
+        self.recorded += len(product_ids)
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            # Журнал недоступен дольше обычного - память очереди ограничена
+            del self._pending[:overflow]
+            self.dropped += overflow
+            if self._task is None and not self._reported_stopped:
+                self._reported_stopped = True
+                logging.error("Журнал просмотров не запущен (AlsoViewed.start): просмотры не "
+                              "записываются и отбрасываются")
+
+    def neighbors(self, product_id: int) -> tuple:
+        """Соседи товара по убыванию числа совместных просмотров (CoOccurrence.neighbors)"""
+        return self.graph.neighbors(product_id)
+
+    def recent(self, user_id: int) -> list:
+        """Последние просмотренные пользователем товары (CoOccurrence.recent)"""
+        return self.graph.recent(user_id)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # Несколько рабочих процессов (sharding.py) пишут в один журнал
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS interactions ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+                "product_id INTEGER NOT NULL, viewed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_interactions_time ON interactions (viewed_at)")
+            conn.commit()
+            latest = conn.execute("SELECT MAX(seq) FROM interactions").fetchone()[0] or 0
+            # При запуске применяются только последние replay записей
+            self.version = max(latest - self.replay, 0)
+            self._conn = conn
+        return self._conn
+
+    def _sync(self, pending: list, apply: bool) -> int:
+        conn = self._connection()
+        now = time.time()
+        if pending:
+            with conn:
+                conn.executemany("INSERT INTO interactions (user_id, product_id, viewed_at) VALUES (?, ?, ?)",
+                                 pending)
+        if now - self._cleaned_at > CLEANUP_INTERVAL:
+            with conn:
+                conn.execute("DELETE FROM interactions WHERE viewed_at < ?", (now - self.retention,))
+            self._cleaned_at = now
+        applied = 0
+        while apply:
+            rows = conn.execute(
+                "SELECT seq, user_id, product_id FROM interactions WHERE seq > ? ORDER BY seq LIMIT ?",
+                (self.version, self.batch),
+            ).fetchall()
+            add = self.graph.add
+            for _, user_id, product_id in rows:
+                add(user_id, product_id)
+            if rows:
+                self.version = rows[-1][0]
+                applied += len(rows)
+            if len(rows) < self.batch:
+                break
+        self.applied += applied
+        return applied
+
+    async def sync(self, apply: bool = True) -> int:
+        """Записывает накопленные просмотры в журнал и применяет к матрице новые записи
+
+        Args:
+            apply (bool): Применять ли новые записи журнала (False - только запись)
+
+        Returns:
+            int: Сколько записей журнала применено
+        """
+        pending, self._pending = self._pending, []
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._sync, pending, apply)
+        except Exception:
+            # Просмотры вернутся в очередь и будут записаны следующей попыткой
+            self._pending = pending + self._pending
+            raise
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logging.error(f"Ошибка обновления журнала просмотров: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Запускает фоновую запись и чтение журнала (в работающем цикле событий)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу, записывает оставшиеся просмотры и закрывает журнал"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        try:
+            await self.sync(apply=False)
+        except Exception as e:
+            logging.error(f"Ошибка записи журнала просмотров: {e}")
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close)
+        self._executor.shutdown(wait=True)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
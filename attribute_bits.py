@@ -0,0 +1,170 @@
+# attribute_bits.py - Атрибуты товаров в виде битовых масок для Telegram бота GoldenAppleBot
+# Значения атрибутов каждой категории - небольшой закрытый словарь (ProductCategories:
+# от 5 до 19 значений на категорию). Каждому значению (группа, значение) категории
+# назначается бит, и набор атрибутов товара хранится одним целым числом фиксированной
+# ширины (uint8/16/32/64 - по размеру словаря категории). Маски всех товаров категории
+# лежат подряд в одном массиве numpy, рядом - массив id товаров в том же порядке.
+#
+# Подбор по критериям - несколько векторных операций над массивом масок:
+# - внутри группы критерии объединяются по ИЛИ (effect_volume + effect_length -
+#   товары с объемом или с удлинением): (маска & биты_группы) != 0;
+# - группы объединяются по И; группы с одним выбранным значением проверяются
+#   одним сравнением (маска & биты) == биты.
+
+import numpy as np  # Массивы масок и векторные операции
+
+from attribute_index import parse_criterion  # Разбор критерия "группа_значение"
+
+# Тип маски по числу значений в словаре категории
+_MASK_TYPES = ((8, np.uint8), (16, np.uint16), (32, np.uint32), (64, np.uint64))
+
+
+class CategoryBits:
+    """Маски атрибутов товаров одной категории"""
+
+    __slots__ = ("ids", "masks", "bits")
+
+    def __init__(self, ids: np.ndarray, postings: dict):
+        """
+        Args:
+            ids (np.ndarray): Отсортированные id товаров категории
+            postings (dict): {(группа, значение): отсортированные id товаров с этим значением}
+
+        Raises:
+            ValueError: Если в словаре категории больше 64 значений
+        """
+        width = next((dtype for size, dtype in _MASK_TYPES if len(postings) <= size), None)
+        if width is None:
+            raise ValueError(f"Слишком много значений атрибутов для битовой маски: {len(postings)}")
+        self.ids = ids
+        self.masks = np.zeros(len(ids), dtype=width)
+        self.bits = {}  # {(группа, значение): бит значения}
+        for number, (key, product_ids) in enumerate(sorted(postings.items())):
+            bit = width(1 << number)
+            self.bits[key] = bit
+            product_ids = np.asarray(product_ids, dtype=np.int64)
+            positions = np.searchsorted(ids, product_ids)
+            # Товары, которых нет в ids (изменились между чтениями базы), пропускаются
+            found = positions < len(ids)
+            found[found] = ids[positions[found]] == product_ids[found]
+            self.masks[positions[found]] |= bit
+
+    @classmethod
+    def from_masks(cls, ids: np.ndarray, masks: np.ndarray, bits: dict) -> "CategoryBits":
+        """Маски, уже посчитанные для товаров категории (например, столбцы columnar_catalog)
+
+        Массивы не копируются: срезы снимка, отображенного в память, остаются общими
+        для всех процессов.
+
+        Args:
+            ids (np.ndarray): Отсортированные id товаров категории
+            masks (np.ndarray): Маски атрибутов товаров в том же порядке
+            bits (dict): {(группа, значение): биты значения в масках}
+        """
+        entry = cls.__new__(cls)
+        entry.ids, entry.masks, entry.bits = ids, masks, bits
+        return entry
+
+    def group_masks(self, criteria: list) -> dict:
+        """Объединяет биты выбранных значений по группам: {группа: маска}
+
+        Значение, которого нет в словаре категории, не добавляет битов; если в группе
+        выбраны только такие значения, маска группы нулевая и подходящих товаров нет.
+        """
+        masks = {}
+        for criterion in criteria:
+            group, value = parse_criterion(criterion)
+            masks[group] = masks.get(group, 0) | int(self.bits.get((group, value), 0))
+        return masks
+
+    def match(self, criteria: list) -> np.ndarray:
+        """Возвращает id товаров, подходящих под критерии (ИЛИ внутри группы, И между группами)
+
+        Args:
+            criteria (list): Критерии в формате "группа_значение"
+
+        Returns:
+            np.ndarray: Отсортированные id подходящих товаров
+        """
+        if not criteria:
+            return self.ids
+        dtype = self.masks.dtype.type
+        required, any_of = 0, []
+        for group, mask in self.group_masks(criteria).items():
+            if mask == 0:
+                return self.ids[:0]
+            if mask & (mask - 1):
+                any_of.append(mask)  # Несколько значений группы - нужно хотя бы одно
+            else:
+                required |= mask
+        matched = None
+        if required:
+            required = dtype(required)
+            matched = (self.masks & required) == required
+        for mask in any_of:
+            hit = (self.masks & dtype(mask)) != 0
+            matched = hit if matched is None else np.logical_and(matched, hit, out=matched)
+        return self.ids[matched]
+
+    def memory_size(self) -> int:
+        """Объем массивов категории в байтах"""
+        return self.ids.nbytes + self.masks.nbytes
+
+
+class AttributeBits:
+    """Маски атрибутов товаров по категориям каталога"""
+
+    def __init__(self):
+        self.categories = {}  # {категория: CategoryBits}
+
+    def match(self, category: str, criteria: list):
+        """id товаров категории, подходящих под критерии, или None, если для категории нет масок"""
+        entry = self.categories.get(category)
+        if entry is None:
+            return None
+        return entry.match(criteria)
+
+    def memory_size(self) -> int:
+        """Объем массивов всех категорий в байтах"""
+        return sum(entry.memory_size() for entry in self.categories.values())
+
+    @classmethod
+    def from_index(cls, index) -> "AttributeBits":
+        """Строит маски по индексу атрибутов
+
+        Категории, словарь которых не помещается в 64 бита, пропускаются -
+        для них подбор выполняется по индексу атрибутов.
+
+        Args:
+            index (AttributeIndex): Построенный индекс атрибутов
+
+        Returns:
+            AttributeBits: Маски по категориям
+        """
+        return cls().updated(index, index.categories)
+
+    def updated(self, index, categories) -> "AttributeBits":
+        """Возвращает копию, в которой маски указанных категорий построены заново по индексу
+
+        Маски остальных категорий общие со старой копией; старая копия не меняется.
+
+        Args:
+            index (AttributeIndex): Индекс атрибутов новой версии каталога
+            categories: Категории, которых коснулись изменения
+
+        Returns:
+            AttributeBits: Новые маски
+        """
+        attribute_bits = AttributeBits()
+        attribute_bits.categories = dict(self.categories)
+        for category in categories:
+            attribute_bits.categories.pop(category, None)
+            ids = index.categories.get(category)
+            if not ids:
+                continue
+            try:
+                attribute_bits.categories[category] = CategoryBits(
+                    np.array(ids, dtype=np.int64), index.category_postings(category))
+            except ValueError:
+                continue
+        return attribute_bits
@@ -0,0 +1,284 @@
+# attribute_index.py - Инвертированный индекс атрибутов товаров для Telegram бота GoldenAppleBot
+# Для каждой тройки (категория, группа, значение) индекс хранит отсортированный массив
+# id товаров (posting list), например:
+#     ("lipstick", "type", "matte") -> [2, 31, 57, ...]
+# Подбор по критериям ["type_matte", "color_red"] - это пересечение двух массивов,
+# без просмотра всех товаров категории и без разбора JSON атрибутов.
+#
+# Массивы хранятся в array('q') - 8 байт на товар в каждом списке, а не ~36 байт,
+# как у списка чисел Python.
+
+import sqlite3  # База данных товаров
+from array import array  # Компактные массивы id товаров
+from bisect import bisect_left  # Поиск id в отсортированном массиве
+
+
+def parse_criterion(criterion: str) -> tuple:
+    """Разбирает критерий из callback-данных в пару (группа, значение)
+
+    Args:
+        criterion (str): Критерий в формате "группа_значение", например "type_matte"
+
+    Returns:
+        tuple: (группа, значение), например ("type", "matte")
+    """
+    group, _, value = criterion.partition("_")
+    return group, value
+
+
+# Во сколько раз массив должен быть длиннее текущего результата, чтобы искать
+# в нем двоичным поиском; иначе быстрее пересечение через множество
+# (шаг двоичного поиска в Python примерно в 8 раз дороже проверки элемента в множестве)
+GALLOP_RATIO = 8
+
+
+def intersect(postings: list) -> array:
+    """Пересекает отсортированные массивы id
+
+    Начинает с самого короткого массива. Если следующий массив намного длиннее
+    результата, каждый id результата ищется в нем двоичным поиском (граница поиска
+    только сдвигается вправо, стоимость O(k * log n), где k - длина результата);
+    иначе массив просматривается целиком с проверкой по множеству id результата.
+
+    Args:
+        postings (list): Отсортированные массивы id
+
+    Returns:
+        array: Отсортированный массив id, входящих во все массивы
+    """
+    if not postings:
+        return array("q")
+    postings = sorted(postings, key=len)
+    result = postings[0]
+    for other in postings[1:]:
+        if not result:
+            break
+        if len(other) > len(result) * GALLOP_RATIO:
+            matched = array("q")
+            position, end = 0, len(other)
+            for product_id in result:
+                position = bisect_left(other, product_id, position, end)
+                if position == end:
+                    break
+                if other[position] == product_id:
+                    matched.append(product_id)
+            result = matched
+        else:
+            result = array("q", sorted(set(result).intersection(other)))
+    return result
+
+
+# Если изменений больше чем 1/PATCH_RATIO длины массива, массив собирается заново
+# через множество; иначе копия массива правится вставками и удалениями по месту
+PATCH_RATIO = 16
+
+
+def patch(ids: array, remove: list, add: list) -> array:
+    """Возвращает копию отсортированного массива id без remove и с add
+
+    Исходный массив не меняется: его продолжают читать обработчики, пока новая
+    версия каталога не готова.
+
+    Args:
+        ids (array): Отсортированный массив id
+        remove (list): id, которые нужно удалить
+        add (list): id, которые нужно добавить
+
+    Returns:
+        array: Новый отсортированный массив без повторов добавленных id
+    """
+    if len(remove) + len(add) > len(ids) // PATCH_RATIO:
+        merged = set(ids)
+        merged.difference_update(remove)
+        merged.update(add)
+        return array("q", sorted(merged))
+    result = array("q", ids)
+    for product_id in remove:
+        position = bisect_left(result, product_id)
+        if position < len(result) and result[position] == product_id:
+            del result[position]
+    for product_id in add:
+        position = bisect_left(result, product_id)
+        if position == len(result) or result[position] != product_id:
+            result.insert(position, product_id)
+    return result
+
+
+def _contains(ids: array, product_id: int) -> bool:
+    position = bisect_left(ids, product_id)
+    return position < len(ids) and ids[position] == product_id
+
+
+class AttributeIndex:
+    """Инвертированный индекс: (категория, группа, значение) -> отсортированные id товаров"""
+
+    def __init__(self):
+        self.postings = {}  # {(категория, группа, значение): array id}
+        self.categories = {}  # {категория: array id всех товаров категории}
+        self.products = 0  # Сколько товаров проиндексировано
+
+    def add(self, product_id: int, category: str, attributes: dict):
+        """Добавляет товар в индекс
+
+        Товары должны добавляться в порядке возрастания id - тогда массивы
+        остаются отсортированными без дополнительной сортировки.
+        """
+        self.categories.setdefault(category, array("q")).append(product_id)
+        for group, values in attributes.items():
+            # Значение атрибута - строка или список строк ("effect": ["volume", "curl"])
+            if not isinstance(values, list):
+                values = [values]
+            for value in values:
+                key = (category, group, str(value))
+                postings = self.postings.get(key)
+                if postings is None:
+                    postings = self.postings[key] = array("q")
+                postings.append(product_id)
+        self.products += 1
+
+    def lookup(self, category: str, criteria: list) -> array:
+        """Возвращает id товаров категории, подходящих под критерии
+
+        Критерии одной группы объединяются по ИЛИ (effect_volume + effect_length -
+        товары с объемом или с удлинением), группы - по И.
+
+        Args:
+            category (str): Категория товаров
+            criteria (list): Критерии в формате "группа_значение"
+
+        Returns:
+            array: Отсортированный массив id подходящих товаров
+        """
+        if not criteria:
+            return self.categories.get(category, array("q"))
+        groups = {}  # {группа: [массивы id значений группы]}
+        for criterion in criteria:
+            group, value = parse_criterion(criterion)
+            found = self.postings.get((category, group, value))
+            groups.setdefault(group, [])
+            if found:
+                groups[group].append(found)
+        postings = []
+        for values in groups.values():
+            if not values:
+                # Ни одно значение группы не встречается у товаров - пересечение пустое
+                return array("q")
+            if len(values) == 1:
+                postings.append(values[0])
+            else:
+                postings.append(array("q", sorted(set().union(*values))))
+        return intersect(postings)
+
+    def category_postings(self, category: str) -> dict:
+        """Массивы id значений атрибутов одной категории: {(группа, значение): array id}"""
+        return {(group, value): ids for (key_category, group, value), ids in self.postings.items()
+                if key_category == category}
+
+    def updated(self, product_ids, products: list) -> tuple:
+        """Возвращает новый индекс с примененными изменениями товаров
+
+        Индекс копируется по частям: новые массивы создаются только для ключей,
+        которых коснулись изменения, остальные массивы общие со старым индексом.
+        Старый индекс не меняется.
+
+        Args:
+            product_ids: id всех измененных, добавленных и удаленных товаров
+            products (list): Текущее состояние измененных и добавленных товаров
+                             (словари с ключами id, category, attributes)
+
+        Returns:
+            tuple: (новый индекс, множество категорий, которых коснулись изменения)
+        """
+        index = AttributeIndex()
+        index.postings = dict(self.postings)
+        index.categories = dict(self.categories)
+        changed = sorted(set(product_ids))
+        affected = set()
+
+        # Сначала товары удаляются отовсюду, где они были...
+        keys_by_category = {}
+        for key in self.postings:
+            keys_by_category.setdefault(key[0], []).append(key)
+        for category, ids in self.categories.items():
+            present = [product_id for product_id in changed if _contains(ids, product_id)]
+            if not present:
+                continue
+            affected.add(category)
+            index.categories[category] = patch(ids, present, [])
+            for key in keys_by_category.get(category, ()):
+                postings = self.postings[key]
+                found = [product_id for product_id in present if _contains(postings, product_id)]
+                if found:
+                    index.postings[key] = patch(postings, found, [])
+
+        # ...затем добавляются в текущем состоянии
+        additions = {}  # {ключ индекса: [id]}
+        added = {}  # {категория: [id]}
+        for product in sorted(products, key=lambda product: product["id"]):
+            category = product["category"]
+            added.setdefault(category, []).append(product["id"])
+            for group, values in (product.get("attributes") or {}).items():
+                if not isinstance(values, list):
+                    values = [values]
+                for value in values:
+                    additions.setdefault((category, group, str(value)), []).append(product["id"])
+        for category, ids in added.items():
+            affected.add(category)
+            index.categories[category] = patch(index.categories.get(category, array("q")), [], ids)
+        for key, ids in additions.items():
+            index.postings[key] = patch(index.postings.get(key, array("q")), [], ids)
+
+        # Пустые массивы не хранятся
+        for key in [key for key, ids in index.postings.items() if not ids]:
+            del index.postings[key]
+        for category in [category for category, ids in index.categories.items() if not ids]:
+            del index.categories[category]
+        index.products = sum(len(ids) for ids in index.categories.values())
+        return index, affected
+
+    def memory_size(self) -> int:
+        """Примерный объем памяти, занимаемый массивами id, в байтах"""
+        arrays = list(self.postings.values()) + list(self.categories.values())
+        return sum(len(ids) * ids.itemsize for ids in arrays)
+
+    @classmethod
+    def from_db(cls, path: str = "recommendations.db") -> "AttributeIndex":
+        """Строит индекс по таблице product_attributes базы данных товаров
+
+        Строки читаются по составному индексу (category, attr_group, value, product_id),
+        то есть уже сгруппированными по ключу индекса и отсортированными по id -
+        каждый массив заполняется подряд, без разбора JSON атрибутов.
+        База должна быть переведена на схему catalog_db (catalog_db.migrate).
+
+        Args:
+            path (str): Путь к базе данных товаров
+
+        Returns:
+            AttributeIndex: Построенный индекс
+        """
+        index = cls()
+        conn = sqlite3.connect(path)
+        try:
+            rows = conn.execute("SELECT category, id FROM products ORDER BY category, id")
+            for category, product_id in rows:
+                ids = index.categories.get(category)
+                if ids is None:
+                    ids = index.categories[category] = array("q")
+                ids.append(product_id)
+                index.products += 1
+
+            rows = conn.execute(
+                "SELECT category, attr_group, value, product_id FROM product_attributes "
+                "ORDER BY category, attr_group, value, product_id"
+            )
+            postings = index.postings
+            current_key, ids = None, None
+            for category, group, value, product_id in rows:
+                key = (category, group, value)
+                if key != current_key:
+                    current_key = key
+                    ids = postings[key] = array("q")
+                ids.append(product_id)
+        finally:
+            conn.close()
+        return index
@@ -0,0 +1,150 @@
+# bench_also_viewed.py - Похожие товары: матрица совместных просмотров на 10 млн просмотров
+# Создает синтетический поток просмотров (по умолчанию 10 000 000): у каждого товара есть
+# группа похожих товаров, пользователь смотрит товары своей текущей группы (популярные -
+# чаще), иногда переходит к другой группе или смотрит случайный товар. Поток применяется
+# к CoOccurrence и выводит:
+# - скорость применения, число пар, товаров и объем матрицы по мере роста числа
+#   просмотров - объем ограничен max_pairs и не растет вместе с потоком;
+# - время выдачи соседей товара (готовый список) в сравнении с выбором самых частых
+#   соседей из строки матрицы при каждом запросе;
+# - долю соседей из той же группы товаров (качество списков);
+# - журнал AlsoViewed: запись просмотров и применение журнала при запуске.
+#
+# Запуск: python benchmarks/bench_also_viewed.py [--interactions 10000000] [--products 100000]
+
+import argparse
+import asyncio
+import heapq
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from also_viewed import AlsoViewed, CoOccurrence
+
+GROUP_SIZE = 50  # Товаров в группе похожих товаров
+
+
+def interactions(count: int, products: int, users: int, seed: int = 7):
+    """Поток просмотров (пользователь, товар)"""
+    rng = random.Random(seed)
+    groups = max(products // GROUP_SIZE, 1)
+    current = {}  # {пользователь: текущая группа}
+    for _ in range(count):
+        user_id = int(rng.paretovariate(0.8)) % users
+        group = current.get(user_id)
+        if group is None or rng.random() < 0.1:
+            group = current[user_id] = rng.randrange(groups)
+        if rng.random() < 0.1:
+            yield user_id, rng.randrange(products)
+        else:
+            # Популярные товары группы смотрят чаще
+            yield user_id, group * GROUP_SIZE + min(int(rng.expovariate(0.1)), GROUP_SIZE - 1)
+
+
+def graph_bytes(graph: CoOccurrence) -> int:
+    """Примерный объем матрицы, списков соседей и окон: контейнеры и отдельные объекты int"""
+    seen, total = set(), 0
+
+    def add(value):
+        nonlocal total
+        if id(value) not in seen:
+            seen.add(id(value))
+            total += sys.getsizeof(value)
+
+    for table in (graph.rows, graph.top, graph._floor, graph.windows):
+        add(table)
+        for key, value in table.items():
+            add(key)
+            add(value)
+            if isinstance(value, dict):
+                for other, count in value.items():
+                    add(other)
+                    add(count)
+            elif isinstance(value, (list, tuple)):
+                for other in value:
+                    add(other)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Похожие товары по совместным просмотрам")
+    parser.add_argument("--interactions", type=int, default=10000000, help="Количество просмотров")
+    parser.add_argument("--products", type=int, default=100000, help="Количество товаров")
+    parser.add_argument("--users", type=int, default=500000, help="Количество пользователей")
+    parser.add_argument("--max-pairs", type=int, default=2000000, help="Ограничение числа пар матрицы")
+    parser.add_argument("--journal", type=int, default=1000000, help="Просмотров для замера журнала")
+    args = parser.parse_args()
+
+    graph = CoOccurrence(max_pairs=args.max_pairs)
+    checkpoint = max(args.interactions // 5, 1)
+    mb = 1024 * 1024
+    print(f"{'просмотров':>12}{'просм./с':>12}{'пар':>12}{'товаров':>10}{'сокращений':>12}{'объем':>12}")
+    started = time.perf_counter()
+    paused = 0.0  # Замер объема не входит в скорость применения
+    applied = 0
+    for user_id, product_id in interactions(args.interactions, args.products, args.users):
+        graph.add(user_id, product_id)
+        applied += 1
+        if applied % checkpoint == 0:
+            elapsed = time.perf_counter() - started - paused
+            measured = time.perf_counter()
+            memory = graph_bytes(graph)
+            paused += time.perf_counter() - measured
+            print(f"{applied:>12}{applied / elapsed:>12.0f}{graph.pairs:>12}{len(graph.rows):>10}"
+                  f"{graph.prunes:>12}{memory / mb:>9.0f} МБ")
+            assert graph.pairs <= graph.max_pairs
+
+    # Выдача соседей: готовый список и выбор из строки матрицы при каждом запросе
+    product_ids = list(graph.rows)
+    lookups = random.Random(1).choices(product_ids, k=100000)
+    started = time.perf_counter()
+    for product_id in lookups:
+        graph.neighbors(product_id)
+    ready_us = (time.perf_counter() - started) / len(lookups) * 1e6
+    started = time.perf_counter()
+    for product_id in lookups:
+        row = graph.rows[product_id]
+        heapq.nlargest(graph.neighbors_size, row, key=row.get)
+    scan_us = (time.perf_counter() - started) / len(lookups) * 1e6
+    print(f"\nСоседи товара: готовый список {ready_us:.2f} мкс, выбор из строки матрицы {scan_us:.1f} мкс")
+
+    same = total = 0
+    for product_id in product_ids:
+        for other in graph.neighbors(product_id):
+            same += other // GROUP_SIZE == product_id // GROUP_SIZE
+            total += 1
+    print(f"Соседи из той же группы товаров: {same / max(total, 1) * 100:.1f}% "
+          f"(случайный товар - {GROUP_SIZE / args.products * 100:.2f}%)")
+
+    # Журнал: запись просмотров страницами по 5 товаров и применение при запуске
+    async def journal(path: str):
+        viewed = AlsoViewed(path, max_pairs=args.max_pairs)
+        stream = interactions(args.journal, args.products, args.users, seed=11)
+        started = time.perf_counter()
+        for user_id, product_id in stream:
+            viewed.record(user_id, [product_id])
+            if len(viewed._pending) >= 5000:
+                await viewed.sync(apply=False)
+        await viewed.sync(apply=False)
+        written = time.perf_counter() - started
+        await viewed.stop()
+
+        restarted = AlsoViewed(path, max_pairs=args.max_pairs, replay=args.journal)
+        started = time.perf_counter()
+        replayed = await restarted.sync()
+        replay = time.perf_counter() - started
+        await restarted.stop()
+        print(f"\nЖурнал: {args.journal} просмотров записано за {written:.1f} с "
+              f"({args.journal / written:.0f}/с), при запуске применено {replayed} "
+              f"за {replay:.1f} с ({replayed / replay:.0f}/с), файл {os.path.getsize(path) / mb:.0f} МБ")
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(journal(os.path.join(directory, "interactions.db")))
+
+
+if __name__ == "__main__":
+    main()
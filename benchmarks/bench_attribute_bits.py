@@ -0,0 +1,114 @@
+# bench_attribute_bits.py - Подбор по критериям: словари атрибутов, индекс и битовые маски
+# Создает синтетический каталог (по умолчанию 1 000 000 товаров) и сравнивает:
+# - память: атрибуты товаров как разобранные из JSON словари и списки Python,
+#   инвертированный индекс (AttributeIndex) и маски атрибутов (AttributeBits);
+# - подбор по критериям (ИЛИ внутри группы, И между группами): проверка словаря
+#   каждого товара категории, пересечение списков индекса и векторная проверка масок.
+# Результаты всех способов сверяются.
+#
+# Запуск: python benchmarks/bench_attribute_bits.py [--products 1000000]
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attribute_bits import AttributeBits
+from attribute_index import AttributeIndex, parse_criterion
+from bench_attribute_index import best_time, create_catalog
+
+QUERIES = [
+    ("lipstick", ["type_matte"]),
+    ("lipstick", ["type_matte", "color_red", "longevity_long"]),
+    ("mascara", ["effect_volume", "effect_length"]),
+    ("mascara", ["effect_volume", "effect_length", "price_premium", "brush_curved"]),
+    ("perfume", ["type_floral", "type_citrus", "season_summer", "season_spring", "intensity_light"]),
+]
+
+
+def deep_size(value, seen: set) -> int:
+    """Размер объекта Python вместе с вложенными словарями, списками и строками
+
+    Общие объекты (например, одинаковые ключи словарей) учитываются один раз.
+    """
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key, seen) + deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, list):
+        size += sum(deep_size(item, seen) for item in value)
+    return size
+
+
+def match_dicts(products: list, criteria: list) -> list:
+    groups = {}
+    for criterion in criteria:
+        group, value = parse_criterion(criterion)
+        groups.setdefault(group, set()).add(value)
+    matched = []
+    for product_id, attributes in products:
+        for group, wanted in groups.items():
+            values = attributes.get(group)
+            values = values if isinstance(values, list) else [values]
+            if wanted.isdisjoint(values):
+                break
+        else:
+            matched.append(product_id)
+    return matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор по критериям по битовым маскам атрибутов")
+    parser.add_argument("--products", type=int, default=1000000, help="Количество товаров")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        create_catalog(path, args.products)
+
+        conn = sqlite3.connect(path)
+        by_category = {}
+        for product_id, category, attributes in conn.execute(
+                "SELECT id, category, attributes FROM products ORDER BY id"):
+            by_category.setdefault(category, []).append((product_id, json.loads(attributes)))
+        conn.close()
+
+        index = AttributeIndex.from_db(path)
+        started = time.perf_counter()
+        attribute_bits = AttributeBits.from_index(index)
+        build = time.perf_counter() - started
+
+        seen = set()
+        dict_bytes = sum(deep_size(attributes, seen) for products in by_category.values()
+                         for _, attributes in products)
+        mask_bytes = sum(entry.masks.nbytes for entry in attribute_bits.categories.values())
+        print(f"Каталог: {args.products} товаров; маски построены за {build:.2f} с")
+        print(f"{'Представление атрибутов':44}{'память':>12}{'на товар':>12}")
+        for title, size in [("словари и списки Python (из JSON)", dict_bytes),
+                            ("AttributeIndex (списки id)", index.memory_size()),
+                            ("AttributeBits (маски + id)", attribute_bits.memory_size()),
+                            ("AttributeBits (только маски)", mask_bytes)]:
+            print(f"{title:44}{size / 1024 / 1024:>9.1f} МБ{size / args.products:>10.1f} Б")
+        widths = {category: entry.masks.dtype.name for category, entry in attribute_bits.categories.items()}
+        print(f"Ширина маски: {widths}")
+
+        print(f"\n{'Запрос':84}{'словари':>12}{'индекс':>12}{'маски':>12}{'найдено':>10}")
+        for category, criteria in QUERIES:
+            products = by_category[category]
+            dicts_ms, expected = best_time(lambda: match_dicts(products, criteria))
+            index_ms, found = best_time(lambda: index.lookup(category, criteria))
+            bits_ms, matched = best_time(lambda: attribute_bits.match(category, criteria))
+            assert list(found) == expected == matched.tolist()
+            title = f"{category} {' + '.join(criteria)}"
+            print(f"{title:84}{dicts_ms:>9.1f} мс{index_ms:>9.2f} мс{bits_ms:>9.2f} мс{len(expected):>10}")
+
+
+if __name__ == "__main__":
+    main()
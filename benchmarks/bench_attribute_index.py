@@ -0,0 +1,115 @@
+# bench_attribute_index.py - Подбор по критериям: поиск LIKE по JSON и инвертированный индекс
+# Создает синтетический каталог (по умолчанию 1 000 000 товаров) с категориями и критериями
+# из ProductCategories и сравнивает поиск id подходящих товаров:
+# - прежний запрос: attributes LIKE '%type_matte%' для каждого критерия (полный просмотр
+#   категории; такой шаблон не совпадает с JSON {"type": "matte"}, поэтому ничего не находит);
+# - тот же просмотр с шаблоном, совпадающим с JSON: attributes LIKE '%"type": "matte"%';
+# - пересечение списков инвертированного индекса (AttributeIndex.lookup).
+#
+# Запуск: python benchmarks/bench_attribute_index.py [--products 1000000]
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog_db
+from attribute_index import AttributeIndex, parse_criterion
+from recommendations import ProductCategories
+
+CATEGORIES = ["mascara", "lipstick", "perfume"]
+QUERIES = [
+    ("lipstick", ["type_matte"]),
+    ("lipstick", ["type_matte", "color_red"]),
+    ("lipstick", ["type_matte", "color_red", "longevity_long"]),
+    ("perfume", ["type_floral", "season_summer", "intensity_light"]),
+    ("mascara", ["effect_volume", "brush_curved", "price_premium"]),
+]
+ROUNDS = 5
+
+
+def create_catalog(path: str, products: int, migrate: bool = True):
+    """Заполняет базу синтетическими товарами со случайными атрибутами
+
+    migrate=False оставляет базу в прежнем формате - только таблица products с JSON атрибутами.
+    """
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, category TEXT, "
+                 "price REAL, rating REAL, attributes TEXT)")
+
+    def rows():
+        for product_id in range(1, products + 1):
+            category = CATEGORIES[product_id % len(CATEGORIES)]
+            attributes = {}
+            for group, values in getattr(ProductCategories, category.upper()).items():
+                options = list(values)
+                if group in ("effect", "season"):
+                    attributes[group] = rng.sample(options, 2)
+                else:
+                    attributes[group] = rng.choice(options)
+            yield (product_id, f"Товар {product_id}", category, rng.randint(300, 6000),
+                   round(rng.uniform(3.5, 5.0), 1), json.dumps(attributes))
+
+    conn.executemany("INSERT INTO products VALUES (?,?,?,?,?,?)", rows())
+    conn.commit()
+    if migrate:
+        # Таблица product_attributes и индексы, по которым строится AttributeIndex
+        catalog_db.migrate(conn)
+    conn.close()
+
+
+def best_time(func) -> tuple:
+    """Лучшее за ROUNDS прогонов время вызова (мс) и результат"""
+    best, result = float("inf"), None
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def like_scan(conn, category: str, patterns: list) -> list:
+    query = "SELECT id FROM products WHERE category = ?" + " AND attributes LIKE ?" * len(patterns)
+    return [row[0] for row in conn.execute(query, [category] + patterns)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение поиска по критериям")
+    parser.add_argument("--products", type=int, default=1000000, help="Количество товаров")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        started = time.perf_counter()
+        create_catalog(path, args.products)
+        print(f"Каталог: {args.products} товаров, создан за {time.perf_counter() - started:.1f} с")
+
+        started = time.perf_counter()
+        index = AttributeIndex.from_db(path)
+        print(f"Индекс: построен за {time.perf_counter() - started:.2f} с, ключей {len(index.postings)}, "
+              f"массивы id {index.memory_size() / 1024 / 1024:.1f} МБ")
+
+        conn = sqlite3.connect(path)
+        print(f"{'Запрос':62}{'LIKE (прежний)':>16}{'LIKE по JSON':>16}{'индекс':>12}{'найдено':>10}")
+        for category, criteria in QUERIES:
+            old_ms, old = best_time(lambda: like_scan(conn, category, [f"%{c}%" for c in criteria]))
+            json_patterns = ['%"{}": %"{}"%'.format(*parse_criterion(c)) for c in criteria]
+            scan_ms, scanned = best_time(lambda: like_scan(conn, category, json_patterns))
+            index_ms, found = best_time(lambda: index.lookup(category, criteria))
+            # Шаблон по JSON может ошибиться (значение другой группы), индекс - нет
+            assert set(found) <= set(scanned)
+            title = f"{category} {' + '.join(criteria)}"
+            print(f"{title:62}{old_ms:>13.1f} мс{scan_ms:>13.1f} мс{index_ms:>9.2f} мс{len(found):>10}"
+                  f" (прежний: {len(old)})")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
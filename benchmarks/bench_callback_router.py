@@ -0,0 +1,119 @@
+# bench_callback_router.py - Микробенчмарк маршрутизации callback-запросов
+# Сравнивает стоимость поиска обработчика для одного callback:
+# - старая схема: цепочка lambda-фильтров, проверяемых по очереди;
+# - CallbackRouter: словарь точных ключей + префиксное дерево.
+# Замер выполняется для текущего набора обработчиков и для набора в 10 раз больше.
+#
+# Запуск: python benchmarks/bench_callback_router.py
+
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Dispatcher
+
+import main_menu
+import akcii
+import order_cancel
+import order_status
+import how_to_order
+import gift_cards
+import missing_card
+import support
+import recommendations
+from callback_router import CallbackRouter, get_callback_router
+
+ITERATIONS = 200
+
+
+def collect_routes() -> list:
+    """Регистрирует обработчики всех модулей и возвращает их маршруты"""
+    dp = Dispatcher()
+    main_menu.register_handlers(dp)
+    akcii.register_handlers(dp)
+    order_cancel.register_handlers(dp)
+    order_status.register_handlers(dp)
+    how_to_order.register_handlers(dp)
+    gift_cards.register_handlers(dp)
+    missing_card.register_handlers(dp)
+    recommendations.register_handlers(dp, operator_chat_id=0)
+    support.register_handlers(dp, None, 0, main_menu.main_menu_kb)
+    return get_callback_router(dp).routes()
+
+
+def scale_routes(routes: list, factor: int) -> list:
+    """Размножает маршруты, добавляя к ключам уникальные суффиксы"""
+    scaled = list(routes)
+    for i in range(1, factor):
+        for route in routes:
+            key = f"{route.key.rstrip('_')}_v{i}" + ("_" if route.is_prefix else "")
+            scaled.append(SimpleNamespace(key=key, is_prefix=route.is_prefix, handler=route.handler))
+    return scaled
+
+
+def build_workload(routes: list) -> list:
+    """Формирует набор callback_data, на каждый из которых есть обработчик"""
+    workload = []
+    for route in routes:
+        if route.is_prefix:
+            workload.append(f"{route.key}lipstick_type_matte")
+        else:
+            workload.append(route.key)
+    return workload
+
+
+def build_linear_chain(routes: list) -> list:
+    """Воспроизводит прежнюю регистрацию через lambda-фильтры"""
+    chain = []
+    for route in routes:
+        if route.is_prefix:
+            chain.append((lambda p: lambda c: c.data.startswith(p))(route.key))
+        else:
+            chain.append((lambda k: lambda c: c.data == k)(route.key))
+    return chain
+
+
+def bench_linear(chain: list, callbacks: list) -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for callback in callbacks:
+            for check in chain:
+                if check(callback):
+                    break
+    return (time.perf_counter() - start) / (ITERATIONS * len(callbacks))
+
+
+def bench_router(router: CallbackRouter, callbacks: list) -> float:
+    resolve = router.resolve
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for callback in callbacks:
+            resolve(callback.data)
+    return (time.perf_counter() - start) / (ITERATIONS * len(callbacks))
+
+
+def run(routes: list, title: str):
+    router = CallbackRouter()
+    for route in routes:
+        if route.is_prefix:
+            router.prefix(route.key, route.handler)
+        else:
+            router.exact(route.key, route.handler)
+    router.compile()
+
+    callbacks = [SimpleNamespace(data=data) for data in build_workload(routes)]
+    linear = bench_linear(build_linear_chain(routes), callbacks)
+    trie = bench_router(router, callbacks)
+    print(f"{title}: обработчиков {len(routes)}, "
+          f"lambda-цепочка {linear * 1e6:.2f} мкс/callback, "
+          f"CallbackRouter {trie * 1e6:.2f} мкс/callback, "
+          f"ускорение x{linear / trie:.1f}")
+
+
+if __name__ == "__main__":
+    current = collect_routes()
+    run(current, "Текущий набор")
+    run(scale_routes(current, 10), "Набор x10")
@@ -0,0 +1,111 @@
+# bench_catalog_import.py - Импорт каталога из CSV и JSONL с подменой базы
+# Создает синтетическую выгрузку каталога (по умолчанию 1 000 000 товаров, около 0.1%
+# строк с ошибками) в форматах CSV и JSONL и загружает каждую командой
+# python catalog_import.py в отдельном процессе - отчет импорта содержит скорость
+# (строк/с) и пиковую память процесса.
+# Перед импортом открывается пул соединений (catalog_pool.CatalogPool) со старой базой:
+# после подмены файла запрос через тот же пул должен видеть новый каталог, а журнал
+# изменений - сообщать о сбросе версии (catalog_db.read_changes).
+#
+# Запуск: python benchmarks/bench_catalog_import.py [--products 1000000]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import catalog_db
+from attribute_index import AttributeIndex
+from bench_attribute_index import CATEGORIES, create_catalog
+from catalog_pool import CatalogPool
+from recommendations import ProductCategories
+
+
+def feed_records(products: int):
+    """Записи выгрузки; каждая тысячная - с ошибкой (неизвестное значение или рейтинг)"""
+    rng = random.Random(42)
+    for number in range(1, products + 1):
+        category = CATEGORIES[number % len(CATEGORIES)]
+        attributes = {}
+        for group, values in getattr(ProductCategories, category.upper()).items():
+            options = list(values)
+            attributes[group] = rng.sample(options, 2) if group in ("effect", "season") else rng.choice(options)
+        rating = round(rng.uniform(3.5, 5.0), 1)
+        if number % 1000 == 0:
+            if number % 2000 == 0:
+                attributes[next(iter(attributes))] = "unknown"
+            else:
+                rating = 7
+        yield {"id": number, "name": f"Товар {number}", "category": category,
+               "price": rng.randint(300, 6000), "rating": rating, "attributes": attributes}
+
+
+def write_feeds(directory: str, products: int) -> dict:
+    groups = sorted({group for category in CATEGORIES
+                     for group in getattr(ProductCategories, category.upper())})
+    paths = {"csv": os.path.join(directory, "feed.csv"), "jsonl": os.path.join(directory, "feed.jsonl")}
+    with open(paths["csv"], "w", encoding="utf-8") as csv_file, \
+            open(paths["jsonl"], "w", encoding="utf-8") as jsonl_file:
+        csv_file.write(",".join(["id", "name", "category", "price", "rating"] + [f"attr_{g}" for g in groups]) + "\n")
+        for record in feed_records(products):
+            jsonl_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            attributes = record["attributes"]
+            values = ["|".join(value) if isinstance(value, list) else value
+                      for value in (attributes.get(group, "") for group in groups)]
+            csv_file.write(",".join([str(record["id"]), record["name"], record["category"],
+                                     str(record["price"]), str(record["rating"])] + values) + "\n")
+    return paths
+
+
+async def count_products(pool: CatalogPool) -> int:
+    return await pool.run("count", lambda conn: conn.execute("SELECT COUNT(*) FROM products").fetchone()[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт каталога из CSV и JSONL")
+    parser.add_argument("--products", type=int, default=1000000, help="Количество товаров в выгрузке")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        feeds = write_feeds(directory, args.products)
+        print(f"Выгрузка: {args.products} строк, создана за {time.perf_counter() - started:.1f} с "
+              f"(CSV {os.path.getsize(feeds['csv']) / 1024 / 1024:.0f} МБ, "
+              f"JSONL {os.path.getsize(feeds['jsonl']) / 1024 / 1024:.0f} МБ)")
+
+        path = os.path.join(directory, "catalog.db")
+        create_catalog(path, 1000)
+
+        async def run():
+            pool = CatalogPool(path, size=2)
+            for file_format, feed in feeds.items():
+                before = await count_products(pool)
+                version = await pool.run("version", catalog_db.latest_change)
+                print(f"\n--- {file_format.upper()} ---")
+                result = await asyncio.to_thread(
+                    subprocess.run, [sys.executable, os.path.join(ROOT, "catalog_import.py"), feed, "--db", path],
+                    capture_output=True, text=True)
+                print(result.stdout.strip())
+                assert result.returncode == 0, result.stderr
+                after = await count_products(pool)
+                changes = await pool.run("changes", catalog_db.read_changes, version)
+                print(f"Пул соединений: товаров до импорта {before}, после {after}; "
+                      f"журнал изменений: сброс={changes['reset']}, версия {version} -> {changes['version']}")
+                assert after == args.products - args.products // 1000 and changes["reset"]
+            pool.close()
+
+        asyncio.run(run())
+        index = AttributeIndex.from_db(path)
+        print(f"\nИндекс атрибутов по новой базе: {index.products} товаров, {len(index.postings)} ключей")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# bench_catalog_pool.py - Запросы к базе товаров в цикле событий и через CatalogPool
+# Создает синтетический каталог (по умолчанию 300 000 товаров) и одновременно выполняет
+# подборы по критериям (catalog_db.find_product_ids) от многих "пользователей":
+# - прежний способ: новое соединение на каждый запрос, запрос выполняется прямо в цикле событий;
+# - CatalogPool: запросы в пуле потоков с постоянными соединениями.
+# Параллельно задача-"пульс" каждую миллисекунду засыпает и измеряет, насколько позже
+# она просыпается - это задержка, которую получили бы обновления остальных пользователей.
+#
+# Запуск: python benchmarks/bench_catalog_pool.py [--products 300000] [--requests 200]
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog_db
+from bench_attribute_index import QUERIES, create_catalog
+from catalog_pool import CatalogPool
+
+
+async def heartbeat(lags: list, stop: asyncio.Event):
+    """Измеряет опоздание пробуждения после sleep(1 мс)"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+def direct_query(path: str, category: str, criteria: list) -> list:
+    # Прежний способ: соединение на каждый запрос
+    conn = sqlite3.connect(path)
+    try:
+        return catalog_db.find_product_ids(conn, category, criteria)
+    finally:
+        conn.close()
+
+
+async def run(name: str, requests: int, query) -> None:
+    lags, stop = [], asyncio.Event()
+    pulse = asyncio.create_task(heartbeat(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(query(*QUERIES[i % len(QUERIES)]) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await pulse
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99)] if lags else 0.0
+    worst = lags[-1] if lags else 0.0
+    print(f"{name:34}{elapsed:>8.2f} с{requests / elapsed:>10.0f}/с"
+          f"{p99 * 1000:>12.1f} мс{worst * 1000:>12.1f} мс")
+
+
+async def main_async(path: str, requests: int, size: int):
+    async def direct(category, criteria):
+        return direct_query(path, category, criteria)
+
+    pool = CatalogPool(path, size=size, slow_query=float("inf"))
+
+    async def pooled(category, criteria):
+        return await pool.run("find_product_ids", catalog_db.find_product_ids, category, criteria)
+
+    print(f"{'Способ':34}{'время':>10}{'запросов':>11}{'пульс p99':>15}{'пульс макс':>15}")
+    await run("соединение на запрос, в цикле", requests, direct)
+    await run(f"CatalogPool, {size} потока", requests, pooled)
+    pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Задержка цикла событий при запросах к каталогу")
+    parser.add_argument("--products", type=int, default=300000, help="Количество товаров")
+    parser.add_argument("--requests", type=int, default=200, help="Количество подборов")
+    parser.add_argument("--pool-size", type=int, default=4, help="Потоков в пуле")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        create_catalog(path, args.products)
+        print(f"Каталог: {args.products} товаров, подборов: {args.requests}")
+        asyncio.run(main_async(path, args.requests, args.pool_size))
+
+
+if __name__ == "__main__":
+    main()
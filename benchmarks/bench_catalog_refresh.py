@@ -0,0 +1,117 @@
+# bench_catalog_refresh.py - Обновление каталога в памяти: полное перестроение и журнал изменений
+# Создает синтетический каталог (по умолчанию 1 000 000 товаров), строит снимок каталога
+# в памяти и для разного числа измененных товаров (рейтинг, атрибуты, категория,
+# добавление и удаление) сравнивает:
+# - полное перестроение снимка (CatalogSnapshot.build - чтение всей таблицы products);
+# - применение журнала изменений (catalog_db.read_changes + CatalogSnapshot.updated);
+# - для RecommendationSystem: повторную загрузку всех товаров (прежний refresh_data)
+#   и применение тех же изменений к загруженным спискам (apply_changes).
+# Снимок после применения журнала сверяется с полностью перестроенным.
+#
+# Запуск: python benchmarks/bench_catalog_refresh.py [--products 1000000] [--changes 1,100,1000,10000]
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog_db
+from bench_attribute_index import CATEGORIES, create_catalog
+from catalog_refresh import CatalogSnapshot
+from recommendations import ProductCategories, RecommendationSystem
+
+
+def change_products(conn, count: int, rng: random.Random):
+    """Изменяет count товаров: рейтинг, атрибуты, категорию; добавляет и удаляет товары"""
+    last_id = conn.execute("SELECT MAX(id) FROM products").fetchone()[0]
+    with conn:
+        for number in range(count):
+            product_id = rng.randint(1, last_id)
+            kind = number % 5
+            if kind == 0:
+                conn.execute("UPDATE products SET rating = ? WHERE id = ?",
+                             (round(rng.uniform(3.5, 5.0), 1), product_id))
+            elif kind in (1, 2):
+                category = CATEGORIES[number % len(CATEGORIES)]
+                attributes = {group: rng.choice(list(values))
+                              for group, values in getattr(ProductCategories, category.upper()).items()}
+                conn.execute("UPDATE products SET category = ?, attributes = ? WHERE id = ?",
+                             (category, json.dumps(attributes), product_id))
+            elif kind == 3:
+                conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            else:
+                conn.execute("INSERT INTO products (name, category, price, rating, attributes) "
+                             "VALUES (?, 'lipstick', 990, 4.8, ?)",
+                             (f"Новый товар {number}", json.dumps({"type": "matte", "color": "red"})))
+
+
+def load_rows(conn) -> tuple:
+    version = catalog_db.latest_change(conn)
+    return version, conn.execute("SELECT id, name, category, price, rating, attributes FROM products").fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Полное перестроение каталога и применение журнала")
+    parser.add_argument("--products", type=int, default=1000000, help="Количество товаров")
+    parser.add_argument("--changes", default="1,100,1000,10000", help="Число изменений через запятую")
+    args = parser.parse_args()
+    rng = random.Random(7)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        create_catalog(path, args.products)
+        conn = sqlite3.connect(path)
+
+        started = time.perf_counter()
+        snapshot = CatalogSnapshot.build(path)
+        build = time.perf_counter() - started
+
+        system = RecommendationSystem()
+        version, rows = load_rows(conn)
+        started = time.perf_counter()
+        for product_id, name, category, price, rating, attributes in rows:
+            product = {"id": product_id, "name": name, "category": category, "price": price,
+                       "rating": rating, "attributes": json.loads(attributes)}
+            system.products.append(product)
+            system.products_by_id[product_id] = product
+            system.products_by_category.setdefault(category, []).append(product)
+        system.version, system.data_loaded = version, True
+        reload = time.perf_counter() - started
+        print(f"Каталог: {args.products} товаров; полное перестроение снимка {build:.2f} с, "
+              f"загрузка товаров RecommendationSystem {reload:.2f} с (без чтения из базы)")
+
+        print(f"{'Изменений':>10}{'журнал + снимок':>18}{'из них снимок':>16}{'apply_changes':>16}")
+        for count in (int(value) for value in args.changes.split(",")):
+            change_products(conn, count, rng)
+            started = time.perf_counter()
+            changes = catalog_db.read_changes(conn, snapshot.version, limit=count * 2 + 1)
+            read = time.perf_counter() - started
+            started = time.perf_counter()
+            snapshot = snapshot.updated(changes)
+            update = time.perf_counter() - started
+            started = time.perf_counter()
+            system.apply_changes(catalog_db.read_changes(conn, system.version, limit=count * 2 + 1))
+            apply = time.perf_counter() - started
+            print(f"{count:>10}{(read + update) * 1000:>15.1f} мс{update * 1000:>13.1f} мс{apply * 1000:>13.1f} мс")
+
+        full = CatalogSnapshot.build(path)
+        assert full.version == snapshot.version
+        assert {key: list(ids) for key, ids in full.index.postings.items()} == \
+            {key: list(ids) for key, ids in snapshot.index.postings.items()}
+        assert all((full.ratings[category] == snapshot.ratings[category]).all() for category in full.ratings)
+        assert all((full.bits.categories[category].masks == snapshot.bits.categories[category].masks).all()
+                   for category in full.bits.categories)
+        total = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        assert len(system.products) == len(system.products_by_id) == total
+        print("Снимок после журнала совпадает с полностью перестроенным")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
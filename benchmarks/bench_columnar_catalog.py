@@ -0,0 +1,166 @@
+# bench_columnar_catalog.py - Столбцовый снимок каталога: размер, время загрузки и общая память
+# Создает синтетический каталог (по умолчанию 500 000 товаров) и сравнивает:
+# - размер: файл базы товаров, файл снимка и словари товаров в памяти процесса;
+# - загрузку: словари товаров, как в RecommendationSystem.load_data (чтение базы и разбор
+#   JSON атрибутов), и открытие снимка с отображением в память;
+# - первые K товаров по рейтингу и цене: ProductRankings и срезы порядков снимка
+#   (результаты сверяются);
+# - снимок каталога в памяти (catalog_refresh.CatalogSnapshot): построение по базе
+#   и по столбцовому снимку, как в рабочих процессах (индексы и подбор сверяются);
+# - память нескольких процессов: каждый процесс открывает снимок и читает все столбцы;
+#   по /proc/self/smaps_rollup (Linux) видно, что страницы снимка общие, а не личные.
+#
+# Запуск: python benchmarks/bench_columnar_catalog.py [--products 500000] [--processes 4]
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import columnar_catalog
+from bench_attribute_index import create_catalog
+from catalog_refresh import CatalogSnapshot
+from columnar_catalog import ColumnarCatalog
+from rankings import ProductRankings
+
+
+def load_dicts(path: str) -> dict:
+    """Товары по категориям в виде словарей, как в RecommendationSystem.load_data"""
+    conn = sqlite3.connect(path)
+    by_category = {}
+    for product_id, name, category, price, rating, attributes in conn.execute(
+            "SELECT id, name, category, price, rating, attributes FROM products ORDER BY id"):
+        by_category.setdefault(category, []).append({
+            "id": product_id, "name": name, "category": category, "price": price,
+            "rating": rating, "attributes": json.loads(attributes) if attributes else {},
+        })
+    conn.close()
+    return by_category
+
+
+def smaps_rollup() -> dict:
+    """Rss, Pss и личная память процесса в КБ (Linux) или пустой словарь"""
+    try:
+        with open("/proc/self/smaps_rollup") as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return {}
+    values = {}
+    for line in lines[1:]:
+        key, _, rest = line.partition(":")
+        values[key] = int(rest.split()[0])
+    return {"rss": values.get("Rss", 0), "pss": values.get("Pss", 0),
+            "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)}
+
+
+def touch_snapshot(path: str, barrier, results):
+    """Рабочий процесс: открывает снимок, читает все столбцы и сообщает о своей памяти"""
+    before = smaps_rollup()
+    catalog = ColumnarCatalog(path)
+    checksum = sum(int(column.view("uint8").sum()) for column in catalog.columns.values())
+    barrier.wait()  # Память измеряется, когда все процессы отобразили снимок
+    after = smaps_rollup()
+    barrier.wait()  # и никто не завершился, пока остальные не измерили свою
+    results.put((checksum, {key: after[key] - before.get(key, 0) for key in after}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Столбцовый снимок каталога")
+    parser.add_argument("--products", type=int, default=500000, help="Количество товаров")
+    parser.add_argument("--processes", type=int, default=4, help="Процессов, открывающих снимок")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        create_catalog(path, args.products)
+        snapshot = columnar_catalog.snapshot_path(path)
+        report = columnar_catalog.write(path, snapshot)
+
+        # Время - без tracemalloc (он замедляет создание объектов), память - отдельным прогоном
+        started = time.perf_counter()
+        by_category = load_dicts(path)
+        dict_load = time.perf_counter() - started
+        started = time.perf_counter()
+        catalog = ColumnarCatalog(snapshot)
+        columns_open = time.perf_counter() - started
+
+        tracemalloc.start()
+        dict_bytes = -tracemalloc.get_traced_memory()[0]
+        loaded = load_dicts(path)
+        dict_bytes += tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del loaded
+        tracemalloc.start()
+        columns_bytes = -tracemalloc.get_traced_memory()[0]
+        opened = ColumnarCatalog(snapshot)
+        columns_bytes += tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        opened.close()
+
+        mb = 1024 * 1024
+        print(f"Каталог: {args.products} товаров; снимок записан за {report['seconds']:.2f} с")
+        print(f"{'':40}{'размер':>12}{'загрузка':>14}{'память процесса':>18}")
+        print(f"{'база товаров (SQLite)':40}{os.path.getsize(path) / mb:>9.1f} МБ")
+        print(f"{'словари (load_data)':40}{'':>12}{dict_load * 1000:>11.0f} мс{dict_bytes / mb:>15.1f} МБ")
+        print(f"{'столбцовый снимок (mmap)':40}{report['bytes'] / mb:>9.1f} МБ"
+              f"{columns_open * 1000:>11.2f} мс{columns_bytes / mb:>15.2f} МБ")
+
+        rankings = ProductRankings.build(by_category)
+        print(f"\n{'Первые 10 товаров':40}{'ProductRankings':>18}{'снимок':>12}")
+        for category in ("lipstick", None):
+            for order in ("rating", "price", "price_desc"):
+                started = time.perf_counter()
+                expected = rankings.top(category, order, 10)
+                rankings_ms = (time.perf_counter() - started) * 1000
+                started = time.perf_counter()
+                found = catalog.top(category, order, 10)
+                columns_ms = (time.perf_counter() - started) * 1000
+                assert [product["id"] for product in found] == [product["id"] for product in expected]
+                title = f"{category or 'все категории'} / {order}"
+                print(f"{title:40}{rankings_ms:>15.3f} мс{columns_ms:>9.3f} мс")
+
+        started = time.perf_counter()
+        from_db = CatalogSnapshot.build(path)
+        build_db = time.perf_counter() - started
+        started = time.perf_counter()
+        from_columns = CatalogSnapshot.from_columns(path, catalog)
+        build_columns = time.perf_counter() - started
+        assert from_columns is not None and from_columns.version == from_db.version
+        assert from_columns.index.postings == from_db.index.postings
+        for category, entry in from_db.bits.categories.items():
+            for key in entry.bits:
+                criteria = [f"{key[0]}_{key[1]}"]
+                assert np.array_equal(from_columns.bits.match(category, criteria), entry.match(criteria))
+        print(f"\n{'Снимок каталога в памяти':40}{'по базе':>18}{'по столбцам':>12}")
+        print(f"{'построение':40}{build_db * 1000:>15.0f} мс{build_columns * 1000:>9.0f} мс")
+        del from_columns
+        catalog.close()
+
+        if args.processes > 0 and smaps_rollup():
+            context = multiprocessing.get_context("spawn")
+            barrier, results = context.Barrier(args.processes), context.Queue()
+            processes = [context.Process(target=touch_snapshot, args=(snapshot, barrier, results))
+                         for _ in range(args.processes)]
+            for process in processes:
+                process.start()
+            reports = [results.get(timeout=120) for _ in processes]
+            for process in processes:
+                process.join()
+            assert len({checksum for checksum, _ in reports}) == 1
+            print(f"\n{args.processes} процессов прочитали весь снимок; прирост памяти каждого процесса:")
+            for number, (_, memory) in enumerate(reports):
+                print(f"  процесс {number}: Rss {memory['rss'] / 1024:.1f} МБ, Pss {memory['pss'] / 1024:.1f} МБ, "
+                      f"личная {memory['private'] / 1024:.1f} МБ")
+
+
+if __name__ == "__main__":
+    main()
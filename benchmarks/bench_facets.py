@@ -0,0 +1,88 @@
+# bench_facets.py - Счетчики товаров на кнопках критериев
+# Создает синтетический каталог (по умолчанию 700 000 товаров - по 100 000 на категорию)
+# и для нескольких выборов критериев сравнивает время расчета счетчиков всех кнопок
+# категории: подбор по маскам AttributeBits для каждого переключенного критерия
+# и FacetIndex по различным маскам. Счетчики обоих способов сверяются.
+# Затем меняет товары одной категории и проверяет, что после CatalogSnapshot.updated
+# заново построены только ее счетчики.
+#
+# Запуск: python benchmarks/bench_facets.py [--products 700000]
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog_db
+from bench_attribute_index import best_time, create_catalog
+from catalog_refresh import CatalogSnapshot
+
+SELECTIONS = [
+    ("lipstick", []),
+    ("lipstick", ["type_matte", "color_red"]),
+    ("mascara", ["effect_volume", "effect_length", "price_premium"]),
+    ("perfume", ["type_floral", "season_summer", "season_spring", "intensity_light"]),
+]
+
+
+def toggle_by_match(attribute_bits, category: str, criteria: list) -> dict:
+    """Счетчики кнопок отдельным подбором по маскам для каждого переключенного критерия"""
+    entry = attribute_bits.categories[category]
+    counts = {}
+    for group, value in entry.bits:
+        criterion = f"{group}_{value}"
+        toggled = [c for c in criteria if c != criterion] if criterion in criteria else criteria + [criterion]
+        counts[criterion] = len(entry.match(toggled))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Счетчики товаров на кнопках критериев")
+    parser.add_argument("--products", type=int, default=700000, help="Количество товаров")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        create_catalog(path, args.products)
+        snapshot = CatalogSnapshot.build(path)
+        facets = snapshot.facets
+        sizes = {category: f"{len(entry.masks)} масок" for category, entry in facets.categories.items()}
+        print(f"Каталог: {args.products} товаров; различных масок по категориям: {sizes}; "
+              f"объем счетчиков {facets.memory_size() / 1024:.1f} КБ")
+
+        print(f"\n{'Выбор':76}{'подбор':>12}{'счетчики':>12}{'товаров':>10}")
+        for category, criteria in SELECTIONS:
+            match_ms, expected = best_time(lambda: toggle_by_match(snapshot.bits, category, criteria))
+            facets_ms, counts = best_time(lambda: facets.toggle_counts(category, criteria))
+            assert counts == expected
+            assert facets.count(category, criteria) == len(snapshot.bits.match(category, criteria))
+            title = f"{category} {' + '.join(criteria) or '(ничего не выбрано)'}"
+            print(f"{title:76}{match_ms:>9.2f} мс{facets_ms:>9.3f} мс"
+                  f"{facets.count(category, criteria):>10}")
+
+        # Изменение товара lipstick перестраивает только счетчики lipstick
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute("UPDATE products SET attributes = json_set(attributes, '$.color', 'nude') "
+                         "WHERE id = (SELECT MIN(id) FROM products WHERE category = 'lipstick')")
+        changes = catalog_db.read_changes(conn, snapshot.version)
+        conn.close()
+        started = time.perf_counter()
+        updated = snapshot.updated(changes)
+        elapsed = (time.perf_counter() - started) * 1000
+        rebuilt = [category for category, entry in updated.facets.categories.items()
+                   if entry is not facets.categories.get(category)]
+        assert rebuilt == ["lipstick"]
+        for category, criteria in SELECTIONS:
+            assert updated.facets.toggle_counts(category, criteria) == \
+                toggle_by_match(updated.bits, category, criteria)
+        print(f"\nОбновление снимка после изменения товара lipstick: {elapsed:.1f} мс, "
+              f"счетчики перестроены для {rebuilt}")
+
+
+if __name__ == "__main__":
+    main()
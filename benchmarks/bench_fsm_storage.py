@@ -0,0 +1,108 @@
+# bench_fsm_storage.py - Сравнение хранилищ состояний FSM: MemoryStorage и SQLiteStorage
+# Повторяет обращения к хранилищу из хендлеров бота:
+# - toggle_criteria (recommendations.py): get_data + update_data на каждое нажатие кнопки критерия;
+# - handle_messages (support.py): get_state на каждое сообщение пользователя.
+# Пользователи обращаются к хранилищу одновременно, как при параллельной обработке обновлений.
+# Для SQLiteStorage отдельно замеряется холодный старт (записи читаются с диска
+# после перезапуска) и число транзакций записи.
+#
+# Запуск: python benchmarks/bench_fsm_storage.py
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from fsm_storage import SQLiteStorage
+
+USERS = 1000
+STEPS = 50  # Обращений на пользователя в каждом сценарии
+BOT_ID = 123456
+
+
+def keys() -> list:
+    return [StorageKey(bot_id=BOT_ID, chat_id=1000 + i, user_id=1000 + i) for i in range(USERS)]
+
+
+async def toggle_criteria(storage, key: StorageKey, pause: float = 0):
+    """Выбор критериев подбора: чтение списка и запись обновленного
+
+    pause - пауза между нажатиями (время ответа пользователя и Bot API)
+    """
+    await storage.set_state(key, "RecommendationState:choosing_criteria")
+    await storage.update_data(key, {"category": "lipstick", "selected_criteria": []})
+    for step in range(STEPS):
+        data = await storage.get_data(key)
+        selected = data.get("selected_criteria", [])
+        criterion = f"type_{step % 7}"
+        if criterion in selected:
+            selected.remove(criterion)
+        else:
+            selected.append(criterion)
+        await storage.update_data(key, {"selected_criteria": selected})
+        if pause:
+            await asyncio.sleep(pause)
+
+
+async def handle_messages(storage, key: StorageKey):
+    """Сообщения пользователя: проверка текущего состояния"""
+    for _ in range(STEPS):
+        await storage.get_state(key)
+
+
+async def measure(storage, scenario) -> float:
+    """Время одного обращения к хранилищу, микросекунд"""
+    started = time.perf_counter()
+    await asyncio.gather(*(scenario(storage, key) for key in keys()))
+    return (time.perf_counter() - started) / (USERS * STEPS) * 1e6
+
+
+async def run():
+    memory = MemoryStorage()
+    memory_toggle = await measure(memory, toggle_criteria)
+    memory_messages = await measure(memory, handle_messages)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "fsm.db")
+        sqlite = SQLiteStorage(path)
+        sqlite_toggle = await measure(sqlite, toggle_criteria)
+        sqlite_messages = await measure(sqlite, handle_messages)
+        close_started = time.perf_counter()
+        await sqlite.close()
+        close_time = time.perf_counter() - close_started
+
+        # Групповая запись при реальном темпе: нажатие раз в 10 мс у каждого пользователя
+        paced = SQLiteStorage(path)
+        paced_started = time.perf_counter()
+        await asyncio.gather(*(toggle_criteria(paced, key, pause=0.01) for key in keys()))
+        await paced.close()
+        paced_time = time.perf_counter() - paced_started
+        flushes = paced.flushes
+
+        # Холодный старт: после перезапуска состояния читаются с диска
+        cold = SQLiteStorage(path)
+        cold_messages = await measure(cold, handle_messages)
+        restored = await cold.get_data(keys()[0])
+        reads = cold.reads
+        await cold.close()
+        size = os.path.getsize(path)
+
+    print(f"Пользователей: {USERS}, обращений на пользователя: {STEPS}")
+    print(f"{'':28}{'MemoryStorage':>16}{'SQLiteStorage':>16}")
+    print(f"{'toggle_criteria, мкс':28}{memory_toggle:>16.2f}{sqlite_toggle:>16.2f}")
+    print(f"{'handle_messages, мкс':28}{memory_messages:>16.2f}{sqlite_messages:>16.2f}")
+    print(f"SQLiteStorage: запись {USERS} пользователей при остановке {close_time * 1000:.1f} мс")
+    print(f"Групповая запись: {USERS * (STEPS + 2)} изменений за {paced_time:.2f} с "
+          f"записаны за {flushes} транзакций")
+    print(f"После перезапуска: handle_messages {cold_messages:.2f} мкс, чтений с диска {reads}, "
+          f"восстановлено критериев {len(restored['selected_criteria'])}, размер базы {size // 1024} КБ")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
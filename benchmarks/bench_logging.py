@@ -0,0 +1,70 @@
+# bench_logging.py - Стоимость отладочного вывода в горячем пути
+# Сравнивает время одного вызова в потоке обработки обновлений:
+# - print(f"DEBUG: ...") - прежний способ, синхронная запись в stdout
+#   (в /dev/null и в канал с построчной буферизацией, как stdout бота в docker/systemd);
+# - log.debug(...) при выключенном DEBUG - только проверка уровня;
+# - log.debug(...) при включенном DEBUG - запись уходит в очередь, вывод в фоновом потоке.
+# Фоновый поток пишет в /dev/null, чтобы замер не зависел от терминала.
+#
+# Запуск: python benchmarks/bench_logging.py
+
+import contextlib
+import io
+import logging
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot_logging
+
+CALLS = 100000
+
+
+def measure(func) -> float:
+    """Время одного вызова func, микросекунд"""
+    started = time.perf_counter()
+    for i in range(CALLS):
+        func(i)
+    return (time.perf_counter() - started) / CALLS * 1e6
+
+
+def main():
+    devnull = open(os.devnull, "w")
+    user_id, state, criteria = 123456789, "SupportState:in_chat", ["type_matte", "color_red"]
+
+    def debug_print(i):
+        print(f"DEBUG: Обработка сообщения от пользователя {user_id}, состояние: {state}, критерии: {criteria}")
+
+    with contextlib.redirect_stdout(devnull):
+        printed = measure(debug_print)
+
+    # Канал, который читает другой процесс, с построчной буферизацией
+    reader = subprocess.Popen(["cat"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    pipe = io.TextIOWrapper(reader.stdin, encoding="utf-8", line_buffering=True)
+    with contextlib.redirect_stdout(pipe):
+        piped = measure(debug_print)
+    pipe.close()
+    reader.wait()
+
+    bot_logging.setup_logging(level="INFO", rate_limit=0, queue_size=CALLS * 2, stream=devnull)
+    log = bot_logging.get_logger("bench")
+    disabled = measure(lambda i: log.debug("Обработка сообщения", user_id=user_id, state=state,
+                                           criteria=criteria))
+
+    logging.getLogger().setLevel(logging.DEBUG)
+    enabled = measure(lambda i: log.debug("Обработка сообщения", user_id=user_id, state=state,
+                                          criteria=criteria))
+    bot_logging.stop_logging()
+
+    print(f"Вызовов: {CALLS}")
+    print(f"print в /dev/null:            {printed:.2f} мкс")
+    print(f"print в канал:                {piped:.2f} мкс")
+    print(f"log.debug, DEBUG выключен:    {disabled:.2f} мкс")
+    print(f"log.debug, DEBUG включен:     {enabled:.2f} мкс (вывод в фоновом потоке)")
+
+
+if __name__ == "__main__":
+    main()
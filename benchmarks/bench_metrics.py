@@ -0,0 +1,101 @@
+# bench_metrics.py - Замер накладных расходов middleware метрик
+# Прогоняет одни и те же обновления через dp.feed_update с метриками и без них.
+# Хендлеры ничего не отправляют в Telegram, поэтому замер показывает стоимость
+# самой диспетчеризации и доли, которую добавляют метрики.
+#
+# Запуск: python benchmarks/bench_metrics.py
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.types import Update
+
+import metrics
+from callback_router import get_callback_router
+
+UPDATES = 20000
+ROUNDS = 5
+
+
+def build_dispatcher(with_metrics: bool) -> Dispatcher:
+    """Диспетчер с типичным набором хендлеров: команда, текст и callback-маршруты"""
+    dp = Dispatcher()
+    if with_metrics:
+        metrics.setup(dp, operator_chat_id=-100)
+
+    async def start_handler(message):
+        pass
+
+    async def text_handler(message):
+        pass
+
+    async def callback_handler(callback):
+        pass
+
+    dp.message.register(start_handler, F.text == "/start")
+    dp.message.register(text_handler)
+    router = get_callback_router(dp)
+    router.exact("product_recommendations", callback_handler)
+    router.prefix("criteria_", callback_handler)
+    return dp
+
+
+def build_updates(bot: Bot) -> list:
+    """Смесь сообщений и callback-запросов от разных пользователей"""
+    updates = []
+    for i in range(UPDATES):
+        user = {"id": 1000 + i % 500, "is_bot": False, "first_name": "User"}
+        chat = {"id": user["id"], "type": "private"}
+        if i % 2:
+            data = {"update_id": i, "callback_query": {
+                "id": str(i), "from": user, "chat_instance": "1",
+                "data": "criteria_lipstick_type_matte" if i % 4 == 1 else "product_recommendations",
+                "message": {"message_id": 1, "date": 0, "chat": chat, "text": ""},
+            }}
+        else:
+            data = {"update_id": i, "message": {
+                "message_id": i, "date": 0, "chat": chat, "from": user,
+                "text": "/start" if i % 4 == 0 else "Привет",
+            }}
+        updates.append(Update.model_validate(data, context={"bot": bot}))
+    return updates
+
+
+async def measure(dp: Dispatcher, bot: Bot, updates: list) -> float:
+    """Лучшее за ROUNDS прогонов время обработки одного обновления, микросекунд"""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        for update in updates:
+            await dp.feed_update(bot, update)
+        best = min(best, time.perf_counter() - started)
+    return best / len(updates) * 1e6
+
+
+async def run():
+    bot = Bot(token="123456:BENCHMARK")
+    updates = build_updates(bot)
+
+    baseline = await measure(build_dispatcher(False), bot, updates)
+    dp = build_dispatcher(True)
+    instrumented = await measure(dp, bot, updates)
+    await bot.session.close()
+
+    print(f"Обновлений в прогоне: {UPDATES}, прогонов: {ROUNDS}")
+    print(f"Без метрик:  {baseline:.1f} мкс на обновление")
+    print(f"С метриками: {instrumented:.1f} мкс на обновление "
+          f"(+{instrumented - baseline:.1f} мкс, +{(instrumented / baseline - 1) * 100:.1f}%)")
+
+    render_started = time.perf_counter()
+    text = dp[metrics.METRICS_KEY].render_prometheus()
+    print(f"Формирование /metrics: {(time.perf_counter() - render_started) * 1000:.2f} мс, "
+          f"{len(text)} байт")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
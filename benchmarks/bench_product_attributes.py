@@ -0,0 +1,78 @@
+# bench_product_attributes.py - Запросы к базе товаров: JSON в products и таблица product_attributes
+# Для каталогов разного размера (по умолчанию 10 тыс., 100 тыс. и 1 млн товаров) создает
+# базу в прежнем формате (атрибуты - JSON в products.attributes), переводит ее на новую
+# схему миграцией catalog_db.migrate и сравнивает задержку запросов:
+# - подбор по критериям: просмотр категории с LIKE по JSON и INTERSECT диапазонов
+#   составного индекса product_attributes (catalog_db.find_product_ids);
+# - случайные товары категории: ORDER BY RANDOM() LIMIT 3 и выбор случайных позиций
+#   в индексе idx_products_category с загрузкой выбранных товаров по первичному ключу.
+#
+# Запуск: python benchmarks/bench_product_attributes.py [--sizes 10000,100000,1000000,5000000]
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog_db
+from attribute_index import parse_criterion
+from bench_attribute_index import QUERIES, best_time, create_catalog, like_scan
+
+RANDOM_LIMIT = 3
+
+
+def random_by_sort(conn, category: str) -> list:
+    return conn.execute("SELECT * FROM products WHERE category = ? ORDER BY RANDOM() LIMIT ?",
+                        (category, RANDOM_LIMIT)).fetchall()
+
+
+def random_by_index(conn, category: str) -> list:
+    chosen = catalog_db.random_product_ids(conn, category, RANDOM_LIMIT)
+    placeholders = ",".join("?" * len(chosen))
+    return conn.execute(f"SELECT * FROM products WHERE id IN ({placeholders})", chosen).fetchall()
+
+
+def run(products: int):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        create_catalog(path, products, migrate=False)
+
+        conn = sqlite3.connect(path)
+        started = time.perf_counter()
+        catalog_db.migrate(conn)
+        migration = time.perf_counter() - started
+        rows = conn.execute("SELECT COUNT(*) FROM product_attributes").fetchone()[0]
+        print(f"\n{products} товаров: миграция {migration:.1f} с, строк product_attributes {rows}, "
+              f"база {os.path.getsize(path) / 1024 / 1024:.0f} МБ")
+
+        print(f"  {'Запрос':60}{'LIKE по JSON':>14}{'индекс':>12}{'найдено':>10}")
+        for category, criteria in QUERIES:
+            json_patterns = ['%"{}": %"{}"%'.format(*parse_criterion(c)) for c in criteria]
+            scan_ms, scanned = best_time(lambda: like_scan(conn, category, json_patterns))
+            index_ms, found = best_time(lambda: catalog_db.find_product_ids(conn, category, criteria))
+            assert set(found) <= set(scanned)
+            title = f"{category} {' + '.join(criteria)}"
+            print(f"  {title:60}{scan_ms:>11.2f} мс{index_ms:>9.2f} мс{len(found):>10}")
+
+        sort_ms, _ = best_time(lambda: random_by_sort(conn, "lipstick"))
+        index_ms, _ = best_time(lambda: random_by_index(conn, "lipstick"))
+        title = f"lipstick: {RANDOM_LIMIT} случайных товара"
+        print(f"  {title:60}{sort_ms:>11.2f} мс{index_ms:>9.2f} мс  (ORDER BY RANDOM() / индекс)")
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запросы к JSON атрибутам и к product_attributes")
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="Размеры каталога через запятую")
+    args = parser.parse_args()
+    for products in (int(size) for size in args.sizes.split(",")):
+        run(products)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench_product_queries.py - Накладные расходы загрузки найденных товаров на один запрос
+# Сравнивает загрузку товаров по списку id:
+# - прежний способ: PRAGMA table_info(products) на каждый запрос, SELECT * ... WHERE id IN (?, ?, ...)
+#   с новым текстом запроса для каждого размера списка и сборка словаря товара
+#   перебором столбцов (AdvancedRecommendationSystem._parse_results);
+# - catalog_db.fetch_products: столбцы читаются один раз на версию схемы, один постоянный
+#   текст запроса (подготовленное выражение из кэша sqlite3), словарь через zip по столбцам.
+# Оба способа используют одно постоянное соединение, как потоки CatalogPool.
+#
+# Запуск: python benchmarks/bench_product_queries.py [--products 100000]
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog_db
+from bench_attribute_index import create_catalog
+
+# Сколько товаров загружает один запрос пользователя
+BATCH_SIZES = (3, 20, 100, 500)
+REQUESTS = 2000
+CHUNK = 500
+
+
+def fetch_before(conn, product_ids) -> list:
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(products)")
+    columns = [col[1] for col in cursor.fetchall()]
+    rows = {}
+    for start in range(0, len(product_ids), CHUNK):
+        chunk = list(product_ids[start:start + CHUNK])
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f"SELECT * FROM products WHERE id IN ({placeholders})", chunk)
+        rows.update((row[0], row) for row in cursor.fetchall())
+    rows = [rows[product_id] for product_id in product_ids if product_id in rows]
+
+    results = []
+    attributes_idx = columns.index('attributes') if 'attributes' in columns else -1
+    for row in rows:
+        item = {}
+        for i, col in enumerate(columns):
+            if i < len(row):
+                item[col] = row[i]
+        if attributes_idx >= 0 and attributes_idx < len(row) and row[attributes_idx]:
+            try:
+                item['attributes'] = json.loads(row[attributes_idx])
+            except (json.JSONDecodeError, TypeError):
+                item['attributes'] = {}
+        else:
+            item['attributes'] = {}
+        results.append(item)
+    return results
+
+
+def per_request_us(func, conn, batches: list) -> float:
+    started = time.perf_counter()
+    for product_ids in batches:
+        func(conn, product_ids)
+    return (time.perf_counter() - started) / len(batches) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Накладные расходы загрузки товаров по id")
+    parser.add_argument("--products", type=int, default=100000, help="Количество товаров")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        create_catalog(path, args.products)
+        before_conn = sqlite3.connect(path)
+        after_conn = sqlite3.connect(path, factory=catalog_db.CatalogConnection)
+
+        print(f"Каталог: {args.products} товаров, {REQUESTS} запросов на размер")
+        print(f"{'товаров в запросе':>18}{'прежний':>14}{'fetch_products':>17}{'разница':>12}")
+        for size in BATCH_SIZES:
+            # Разные списки id в каждом запросе, как у разных пользователей
+            batches = [sorted(rng.sample(range(1, args.products + 1), size)) for _ in range(REQUESTS)]
+            assert fetch_before(before_conn, batches[0]) == catalog_db.fetch_products(after_conn, batches[0])
+            before = per_request_us(fetch_before, before_conn, batches)
+            after = per_request_us(catalog_db.fetch_products, after_conn, batches)
+            print(f"{size:>18}{before:>11.0f} мкс{after:>14.0f} мкс{before - after:>9.0f} мкс")
+
+        # Только обращение к схеме: прежде - PRAGMA table_info, теперь - проверка версии схемы
+        schema_before = per_request_us(lambda c, _: c.execute("PRAGMA table_info(products)").fetchall(),
+                                       before_conn, [None] * REQUESTS)
+        schema_after = per_request_us(lambda c, _: catalog_db.product_layout(c), after_conn, [None] * REQUESTS)
+        print(f"Схема таблицы на запрос: {schema_before:.1f} мкс -> {schema_after:.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
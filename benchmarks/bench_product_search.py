@@ -0,0 +1,114 @@
+# bench_product_search.py - Полнотекстовый поиск товаров: индекс FTS5 trigram и просмотр LIKE
+# Создает синтетический каталог (по умолчанию 1 000 000 товаров) с названиями из брендов,
+# линеек и оттенков, строит индекс поиска (catalog_db.sync_search_titles) и сравнивает
+# время запросов:
+# - просмотр таблицы: name LIKE '%слово%' для каждого слова (только названия, без
+#   характеристик; LIKE в SQLite не учитывает регистр кириллицы);
+# - индекс product_search, первые SEARCH_LIMIT товаров по релевантности (ORDER BY rank -
+#   bm25 для каждого совпадения);
+# - catalog_db.search_product_ids: по релевантности, только если совпадений не больше
+#   SEARCH_RANKED, иначе первые совпадения по id;
+# затем - стоимость поддержки индекса триггерами при изменении товаров.
+#
+# Запуск: python benchmarks/bench_product_search.py [--products 1000000]
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog_db
+from bench_attribute_index import best_time, create_catalog
+from recommendations import search_titles
+
+BRANDS = ["Velvet Rose", "Golden Touch", "Lumiere", "Aurora", "Nordic Bloom", "Silk Line",
+          "Cherry Lab", "Moonlight", "Petal Club", "Urban Glow", "Sakura", "Bella Vita"]
+LINES = ["Classic", "Intense", "Soft Focus", "Pro", "Natural", "Glam", "Daily", "Signature"]
+SHADES = ["Ruby", "Coral", "Nude", "Berry", "Peach", "Plum", "Sand", "Pearl", "Cocoa", "Rosewood"]
+
+QUERIES = [
+    "ruby",  # Редкое слово названия (1 из 10 оттенков)
+    "Velvet Rose ruby",  # Несколько слов названия
+    "матовая помада",  # Характеристика и категория - только в индексе
+    "тушь объем водостойкая",  # Три слова из названий категории и значений
+    "помад",  # Частое слово: совпадает с третью каталога
+    "Aurora Pro",  # Слова названия: несколько тысяч совпадений
+]
+
+
+def name_catalog(conn: sqlite3.Connection):
+    """Заменяет названия "Товар N" на "Бренд Линейка Оттенок N" (до создания триггеров)"""
+    for table, words in (("bench_brands", BRANDS), ("bench_lines", LINES), ("bench_shades", SHADES)):
+        conn.execute(f"CREATE TEMP TABLE {table} (word TEXT)")
+        conn.executemany(f"INSERT INTO {table} VALUES (?)", [(word,) for word in words])
+    with conn:
+        conn.execute(f"""UPDATE products SET name =
+            (SELECT word FROM bench_brands WHERE rowid = id % {len(BRANDS)} + 1) || ' ' ||
+            (SELECT word FROM bench_lines WHERE rowid = id / 7 % {len(LINES)} + 1) || ' ' ||
+            (SELECT word FROM bench_shades WHERE rowid = id / 11 % {len(SHADES)} + 1) || ' ' || id""")
+
+
+def like_scan(conn: sqlite3.Connection, text: str, limit: int) -> list:
+    words = [word for word in text.split() if len(word) >= 3]
+    query = "SELECT id FROM products WHERE " + " AND ".join(["name LIKE ?"] * len(words)) + " LIMIT ?"
+    return [row[0] for row in conn.execute(query, [f"%{word}%" for word in words] + [limit])]
+
+
+def search_by_rank(conn: sqlite3.Connection, text: str, limit: int) -> list:
+    return [row[0] for row in conn.execute(
+        "SELECT rowid FROM product_search WHERE product_search MATCH ? ORDER BY rank LIMIT ?",
+        (catalog_db.search_query(text), limit),
+    )]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Полнотекстовый поиск товаров")
+    parser.add_argument("--products", type=int, default=1000000, help="Количество товаров")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        create_catalog(path, args.products, migrate=False)
+        conn = sqlite3.connect(path)
+        name_catalog(conn)
+        catalog_db.migrate(conn)
+        size = os.path.getsize(path)
+        started = time.perf_counter()
+        indexed = catalog_db.sync_search_titles(conn, search_titles())
+        elapsed = time.perf_counter() - started
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        mb = 1024 * 1024
+        print(f"Каталог: {args.products} товаров; индекс поиска для {indexed} товаров построен "
+              f"за {elapsed:.1f} с, база {size / mb:.0f} -> {os.path.getsize(path) / mb:.0f} МБ")
+
+        limit = catalog_db.SEARCH_LIMIT
+        matches = "SELECT COUNT(*) FROM product_search WHERE product_search MATCH ?"
+        print(f"\n{'Запрос':28}{'совпадений':>12}{'LIKE':>12}{'все по rank':>14}{'search_product_ids':>20}")
+        for text in QUERIES:
+            total = conn.execute(matches, (catalog_db.search_query(text),)).fetchone()[0]
+            like_ms, _ = best_time(lambda: like_scan(conn, text, limit))
+            rank_ms, ranked = best_time(lambda: search_by_rank(conn, text, limit))
+            search_ms, found = best_time(lambda: catalog_db.search_product_ids(conn, text, limit))
+            assert len(found) == len(ranked) == min(total, limit)
+            if total <= catalog_db.SEARCH_RANKED:
+                assert found == ranked
+            print(f"{text:28}{total:>12}{like_ms:>9.1f} мс{rank_ms:>11.1f} мс{search_ms:>17.1f} мс")
+
+        # Триггеры обновляют строки поиска измененных товаров
+        changed = min(10000, args.products)
+        started = time.perf_counter()
+        with conn:
+            conn.execute("UPDATE products SET name = name || ' New' WHERE id <= ?", (changed,))
+        elapsed = time.perf_counter() - started
+        assert len(catalog_db.search_product_ids(conn, "new", changed + 1, ranked=0)) == changed
+        print(f"\nИзменение названий {changed} товаров с обновлением индекса: {elapsed * 1000:.0f} мс "
+              f"({elapsed / changed * 1e6:.0f} мкс на товар)")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
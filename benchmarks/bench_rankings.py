@@ -0,0 +1,131 @@
+# bench_rankings.py - Лучшие товары по рейтингу и цене: сортировка и упорядоченные списки
+# Заполняет RecommendationSystem синтетическими товарами (по умолчанию 100 000 товаров
+# в каждой из трех категорий) и сравнивает выбор первых K товаров:
+# - прежний способ - sorted() всей категории (или всего каталога) на каждый запрос;
+# - ProductRankings - срез заранее упорядоченного списка (для всего каталога - слияние
+#   списков категорий).
+# Затем применяет изменения каталога (apply_changes: рейтинг, цена, смена категории,
+# добавление и удаление) и сверяет первые товары каждого порядка с полной сортировкой.
+#
+# Запуск: python benchmarks/bench_rankings.py [--per-category 100000] [--limit 5]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_attribute_index import CATEGORIES, best_time
+from rankings import ORDERS, ProductRankings
+from recommendations import RecommendationSystem
+
+
+def make_product(product_id: int, category: str, rng: random.Random) -> dict:
+    return {"id": product_id, "name": f"Товар {product_id}", "category": category,
+            "price": rng.randint(300, 6000), "rating": round(rng.uniform(3.5, 5.0), 1), "attributes": {}}
+
+
+def make_changes(system: RecommendationSystem, count: int, rng: random.Random) -> dict:
+    """Изменения в формате catalog_db.read_changes для count товаров"""
+    products, deleted = [], []
+    last_id = max(system.products_by_id)
+    ids = rng.sample(list(system.products_by_id), count)
+    for number, product_id in enumerate(ids):
+        kind = number % 5
+        if kind == 3:
+            deleted.append(product_id)
+            continue
+        product = dict(system.products_by_id[product_id])
+        if kind == 0:
+            product["rating"] = round(rng.uniform(3.5, 5.0), 1)
+        elif kind == 1:
+            product["price"] = rng.randint(300, 6000)
+        elif kind == 2:
+            product["category"] = CATEGORIES[(CATEGORIES.index(product["category"]) + 1) % len(CATEGORIES)]
+        else:
+            last_id += 1
+            product = make_product(last_id, rng.choice(CATEGORIES), rng)
+        products.append(product)
+    return {"version": system.version + 1, "count": count, "products": products, "deleted": deleted}
+
+
+def check(system: RecommendationSystem, limit: int):
+    for order, key in ORDERS.items():
+        for category in CATEGORIES + [None]:
+            products = system.products_by_category[category] if category else system.products
+            expected = sorted(products, key=key)[:limit]
+            assert system.rankings.top(category, order, limit) == expected, (order, category)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Лучшие товары по рейтингу и цене")
+    parser.add_argument("--per-category", type=int, default=100000, help="Товаров в каждой категории")
+    parser.add_argument("--limit", type=int, default=5, help="Сколько товаров выбирать")
+    args = parser.parse_args()
+    rng = random.Random(3)
+    limit = args.limit
+
+    system = RecommendationSystem()
+    for product_id in range(1, args.per_category * len(CATEGORIES) + 1):
+        product = make_product(product_id, CATEGORIES[product_id % len(CATEGORIES)], rng)
+        system.products.append(product)
+        system.products_by_id[product_id] = product
+        system.products_by_category.setdefault(product["category"], []).append(product)
+    started = time.perf_counter()
+    system.rankings = ProductRankings.build(system.products_by_category)
+    system.data_loaded = True
+    print(f"Каталог: {len(system.products)} товаров ({args.per_category} в категории); "
+          f"упорядоченные списки построены за {time.perf_counter() - started:.2f} с")
+    check(system, limit)
+
+    category = CATEGORIES[0]
+    cases = [
+        (f"по рейтингу, {category}",
+         lambda: sorted(system.products_by_category[category], key=lambda x: x["rating"], reverse=True)[:limit],
+         lambda: system.rankings.top(category, "rating", limit)),
+        (f"по цене, {category}",
+         lambda: sorted(system.products_by_category[category], key=lambda x: x["price"])[:limit],
+         lambda: system.rankings.top(category, "price", limit)),
+        (f"по цене (дорогие), {category}",
+         lambda: sorted(system.products_by_category[category], key=lambda x: x["price"], reverse=True)[:limit],
+         lambda: system.rankings.top(category, "price_desc", limit)),
+        ("по рейтингу, весь каталог",
+         lambda: sorted(system.products, key=lambda x: x["rating"], reverse=True)[:limit],
+         lambda: system.rankings.top(None, "rating", limit)),
+    ]
+    print(f"\n{'Первые {0} товаров'.format(limit):36}{'sorted()':>12}{'списки':>12}")
+    for title, old, new in cases:
+        old_ms, _ = best_time(old)
+        new_ms, _ = best_time(new)
+        print(f"{title:36}{old_ms:>9.2f} мс{new_ms * 1000:>9.1f} мкс")
+
+    print(f"\n{'Изменений':>10}{'apply_changes':>16}{'из них списки':>16}{'сортировка заново':>20}")
+    for count in (1, 100, 1000, 10000):
+        changes = make_changes(system, count, rng)
+        category_changes = {}
+        for product_id in [product["id"] for product in changes["products"]] + changes["deleted"]:
+            old = system.products_by_id.get(product_id)
+            if old is not None:
+                category_changes.setdefault(old["category"], ([], []))[0].append(old)
+        for product in changes["products"]:
+            category_changes.setdefault(product["category"], ([], []))[1].append(product)
+        rankings = system.rankings
+
+        started = time.perf_counter()
+        system.apply_changes(changes)
+        total = time.perf_counter() - started
+        started = time.perf_counter()
+        rankings.updated(system.products_by_category, category_changes)
+        patched = time.perf_counter() - started
+        started = time.perf_counter()
+        ProductRankings.build(system.products_by_category)
+        rebuild = time.perf_counter() - started
+        print(f"{count:>10}{total * 1000:>13.1f} мс{patched * 1000:>13.1f} мс{rebuild * 1000:>17.1f} мс")
+        check(system, limit)
+    print("Первые товары всех порядков совпадают с полной сортировкой")
+
+
+if __name__ == "__main__":
+    main()
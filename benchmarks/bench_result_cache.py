@@ -0,0 +1,113 @@
+# bench_result_cache.py - Кэш результатов подбора: задержка, доля попаданий и сброс по версии
+# Создает синтетический каталог (по умолчанию 30 000 товаров), строит снимок каталога
+# и выполняет поток подборов AdvancedRecommendationSystem.get_recommendations, в котором
+# сочетания категории и критериев выбираются по закону Ципфа (немногие сочетания
+# популярны). Сравнивает задержку без кэша и с кэшем, выводит долю попаданий и объем.
+# Затем меняет один товар категории lipstick и проверяет, что сброшены только записи
+# этой категории, а результаты из кэша совпадают с подбором без кэша.
+#
+# Запуск: python benchmarks/bench_result_cache.py [--products 30000] [--requests 2000]
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_attribute_index import CATEGORIES, create_catalog
+
+
+def combinations(ProductCategories) -> list:
+    """Все сочетания категории и одного-двух критериев из разных групп"""
+    result = []
+    for category in CATEGORIES:
+        groups = getattr(ProductCategories, category.upper())
+        criteria = [f"{group}_{value}" for group, values in groups.items() for value in values]
+        result.extend((category, [criterion]) for criterion in criteria)
+        result.extend((category, list(pair)) for pair in itertools.combinations(criteria, 2)
+                      if pair[0].split("_")[0] != pair[1].split("_")[0])
+    return result
+
+
+async def run(recommendations, workload: list) -> list:
+    system = recommendations.AdvancedRecommendationSystem()
+    latencies = []
+    for category, criteria in workload:
+        started = time.perf_counter()
+        await system.get_recommendations(category, criteria)
+        latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+
+def report(title: str, latencies: list):
+    mean = sum(latencies) / len(latencies)
+    p95 = latencies[int(len(latencies) * 0.95)]
+    print(f"{title:28}{mean * 1000:>10.2f} мс{p95 * 1000:>10.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Кэш результатов подбора")
+    parser.add_argument("--products", type=int, default=30000, help="Количество товаров")
+    parser.add_argument("--requests", type=int, default=2000, help="Количество подборов")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        create_catalog(path, args.products)
+        os.environ["CATALOG_DB_PATH"] = path
+        import recommendations
+        from recommendations import ProductCategories
+
+        recommendations.warmup_catalog()
+        combos = combinations(ProductCategories)
+        rng = random.Random(5)
+        weights = [1 / rank ** 1.1 for rank in range(1, len(combos) + 1)]
+        workload = rng.choices(combos, weights=weights, k=args.requests)
+        print(f"Каталог: {args.products} товаров; сочетаний: {len(combos)}, подборов: {args.requests}, "
+              f"различных в потоке: {len({(c, tuple(k)) for c, k in workload})}")
+
+        async def scenario():
+            cache = recommendations.get_result_cache()
+            print(f"{'':28}{'среднее':>13}{'p95':>13}")
+            cache.max_entries = 0
+            report("без кэша", await run(recommendations, workload))
+            cache.max_entries = 1000
+            report("с кэшем (1000 записей)", await run(recommendations, workload))
+            print(f"Попаданий: {cache.hit_rate() * 100:.1f}% (без учета прогона без кэша - "
+                  f"{cache.hits / args.requests * 100:.1f}%), записей {len(cache)}, "
+                  f"объем {cache.bytes / 1024 / 1024:.1f} МБ, вытеснено {cache.evictions}")
+
+            # Изменение одного товара lipstick сбрасывает только записи lipstick
+            conn = sqlite3.connect(path)
+            with conn:
+                conn.execute("UPDATE products SET rating = 4.9 WHERE id = "
+                             "(SELECT MIN(id) FROM products WHERE category = 'lipstick')")
+            conn.close()
+            await recommendations.get_catalog_refresher().refresh(recommendations.get_catalog_pool())
+            system = recommendations.AdvancedRecommendationSystem()
+            stale, hits = cache.stale, cache.hits
+            checked = {}
+            for category, criteria in workload[:500]:
+                checked[(category, tuple(criteria))] = await system.get_recommendations(category, criteria)
+            invalidated = cache.stale - stale
+            print(f"После изменения товара lipstick: сброшено по версии {invalidated}, "
+                  f"попаданий {cache.hits - hits} из {len(workload[:500])}")
+            cache.max_entries = 0
+            for (category, criteria), cached in checked.items():
+                assert await system.get_recommendations(category, list(criteria)) == cached
+            # Сбрасываются только записи lipstick, и не больше, чем их было в потоке
+            assert 0 < invalidated <= len([key for key in checked if key[0] == "lipstick"])
+            print("Результаты из кэша совпадают с подбором без кэша")
+            recommendations.get_catalog_pool().close()
+
+        asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# bench_sampling.py - Случайные товары категории: ORDER BY RANDOM() и выбор в памяти
+# Создает синтетический каталог (по умолчанию 1 000 000 товаров, треть - lipstick) и сравнивает
+# выбор id случайных товаров категории:
+# - прежний запрос SELECT id ... ORDER BY RANDOM() LIMIT k (просмотр и сортировка категории);
+# - случайные позиции в индексе idx_products_category (catalog_db.random_product_ids);
+# - CatalogSampler: равномерно, с весом по рейтингу, с seed сессии на первой и на 50-й странице.
+# Также проверяет, что страницы одной сессии не повторяют товары, что выбор с весом
+# завершается, когда товаров с положительным рейтингом меньше, чем нужно, и что доля
+# товаров с рейтингом выше 4.5 при выборе с весом больше, чем при равномерном.
+#
+# Запуск: python benchmarks/bench_sampling.py [--products 1000000] [--limit 3]
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from array import array
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog_db
+from bench_attribute_index import best_time, create_catalog
+from catalog_refresh import CatalogSnapshot
+from sampling import CatalogSampler, CategorySample, new_session_seed
+
+CATEGORY = "lipstick"
+
+
+def check(sampler: CatalogSampler, conn, limit: int):
+    seed = new_session_seed()
+    pages = [sampler.sample(CATEGORY, limit, seed=seed, page=page) for page in range(200)]
+    seen = [product_id for page in pages for product_id in page]
+    assert len(seen) == len(set(seen)), "страницы сессии повторяют товары"
+    assert pages[7] == sampler.sample(CATEGORY, limit, seed=seed, page=7), "выбор не воспроизводим"
+    weighted = [sampler.sample(CATEGORY, limit, seed=seed, page=page, weighted=True) for page in range(50)]
+    flat = [product_id for page in weighted for product_id in page]
+    assert len(flat) == len(set(flat)), "выбор с весом повторяет товары"
+
+    # Товаров с положительным рейтингом меньше, чем нужно: остальные - из товаров с нулевым
+    zero_rated = CategorySample(array("q", [1, 2, 3]), np.array([5.0, 0.0, 0.0]))
+    drawn = zero_rated.sample(3, weighted=True)
+    assert drawn[0] == 1 and sorted(drawn) == [1, 2, 3], "выбор с нулевыми весами"
+    zero_pages = [zero_rated.sample(1, seed=seed, page=page, weighted=True) for page in range(4)]
+    assert sorted(sum(zero_pages[:3], [])) == [1, 2, 3] and zero_pages[3] == [], "страницы с нулевыми весами"
+
+    ratings = dict(conn.execute("SELECT id, rating FROM products WHERE category = ?", (CATEGORY,)))
+
+    def high_share(weighted_draw: bool) -> float:
+        drawn = [product_id for _ in range(2000)
+                 for product_id in sampler.sample(CATEGORY, limit, weighted=weighted_draw)]
+        return sum(ratings[product_id] > 4.5 for product_id in drawn) / len(drawn)
+
+    print(f"Доля товаров с рейтингом > 4.5: равномерно {high_share(False):.3f}, "
+          f"с весом {high_share(True):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение выбора случайных товаров")
+    parser.add_argument("--products", type=int, default=1000000, help="Количество товаров")
+    parser.add_argument("--limit", type=int, default=3, help="Сколько товаров выбирать")
+    args = parser.parse_args()
+    limit = args.limit
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        create_catalog(path, args.products)
+        conn = sqlite3.connect(path)
+        size = conn.execute("SELECT COUNT(*) FROM products WHERE category = ?", (CATEGORY,)).fetchone()[0]
+
+        snapshot = CatalogSnapshot.build(path)
+        started = time.perf_counter()
+        sampler = CatalogSampler.from_index(snapshot.index, snapshot.ratings)
+        print(f"Каталог: {args.products} товаров, {CATEGORY}: {size}; массивы построены за "
+              f"{time.perf_counter() - started:.2f} с, {sampler.memory_size() / 1024 / 1024:.1f} МБ")
+        check(sampler, conn, limit)
+
+        seed = new_session_seed()
+        cases = [
+            ("ORDER BY RANDOM() LIMIT k", lambda: conn.execute(
+                "SELECT id FROM products WHERE category = ? ORDER BY RANDOM() LIMIT ?",
+                (CATEGORY, limit)).fetchall()),
+            ("позиции в индексе категории", lambda: catalog_db.random_product_ids(conn, CATEGORY, limit)),
+            ("CatalogSampler, равномерно", lambda: sampler.sample(CATEGORY, limit)),
+            ("CatalogSampler, с весом", lambda: sampler.sample(CATEGORY, limit, weighted=True)),
+            ("CatalogSampler, seed, страница 0", lambda: sampler.sample(CATEGORY, limit, seed=seed)),
+            ("CatalogSampler, seed, страница 50", lambda: sampler.sample(CATEGORY, limit, seed=seed, page=50)),
+            ("CatalogSampler, seed, с весом, стр. 50",
+             lambda: sampler.sample(CATEGORY, limit, seed=seed, page=50, weighted=True)),
+        ]
+        print(f"{'Способ':42}{'время':>12}")
+        for title, func in cases:
+            elapsed, _ = best_time(func)
+            print(f"{title:42}{elapsed:>9.3f} мс")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# load_test.py - Сквозной нагрузочный тест бота на поддельном Bot API
+# Запускает fake_bot_api.py в этом процессе, а бота (main.py) - отдельным процессом,
+# направленным на поддельный сервер. Затем имитирует тысячи одновременных пользователей,
+# каждый из которых проходит сценарий:
+#     /start -> консультация по товару -> категория -> выбор критериев ->
+#     запрос рекомендаций (оператору) -> техподдержка -> имя -> вопрос оператору
+# Каждый пользователь ждет ответа бота на каждый шаг, как живой человек.
+#
+# Отчет: обновлений в секунду, p50/p95/p99 задержки ответа на шаг и вызовы API на диалог.
+#
+# Запуск: python benchmarks/load_test.py --users 2000
+
+import argparse
+import asyncio
+import os
+import random
+import signal
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_bot_api import FakeBotAPI, start_server
+
+OPERATOR_CHAT_ID = -1001000000000
+FIRST_USER_ID = 1000000
+
+# Сценарий: (тип обновления, текст или callback_data)
+SCENARIO = [
+    ("message", "/start"),
+    ("callback", "product_recommendations"),
+    ("callback", "category_lipstick"),
+    ("callback", "criteria_lipstick_type_matte"),
+    ("callback", "criteria_lipstick_color_red"),
+    ("callback", "criteria_lipstick_type_matte"),
+    ("callback", "show_recommendations_lipstick"),
+    ("callback", "support_request"),
+    ("message", "Анна"),
+    ("message", "Подскажите, пожалуйста, по оттенку"),
+]
+
+
+def percentile(values: list, p: float) -> float:
+    """Возвращает перцентиль p (0-100) отсортированного списка"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run_user(api: FakeBotAPI, user_id: int, latencies: list, timeout: float):
+    """Проходит сценарий от имени одного пользователя"""
+    message_id = None
+    for kind, payload in SCENARIO:
+        reply = api.expect_reply(user_id)
+        started = time.perf_counter()
+        if kind == "message":
+            api.push_message(user_id, payload)
+        else:
+            api.push_callback(user_id, payload, message_id)
+        try:
+            result = await asyncio.wait_for(reply, timeout)
+        except asyncio.TimeoutError:
+            print(f"Пользователь {user_id}: нет ответа на {payload}")
+            return False
+        latencies.append(time.perf_counter() - started)
+        message_id = result["message_id"]
+    return True
+
+
+async def run(users: int, ramp_up: float, port: int, timeout: float):
+    api = FakeBotAPI()
+    runner = await start_server(api, port=port)
+
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123456:LOAD-TEST",
+        OPERATOR_CHAT_ID=str(OPERATOR_CHAT_ID),
+        TELEGRAM_API_URL=f"http://127.0.0.1:{port}",
+    )
+    bot_process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "main.py"),
+        cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        await asyncio.wait_for(api.polling_started.wait(), 60)
+        startup_calls = sum(api.calls.values())
+
+        latencies = []
+
+        async def delayed_user(user_id: int):
+            await asyncio.sleep(random.uniform(0, ramp_up))
+            return await run_user(api, user_id, latencies, timeout)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(delayed_user(FIRST_USER_ID + i) for i in range(users)))
+        elapsed = time.perf_counter() - started
+    finally:
+        bot_process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(bot_process.wait(), 10)
+        except asyncio.TimeoutError:
+            bot_process.kill()
+        await runner.cleanup()
+
+    completed = sum(results)
+    latencies.sort()
+    user_calls = sum(count for chat, count in api.calls_by_chat.items() if chat >= FIRST_USER_ID)
+    operator_calls = api.calls_by_chat.get(OPERATOR_CHAT_ID, 0)
+    polling_calls = api.calls.get("getUpdates", 0)
+
+    print(f"Пользователей: {users}, завершили сценарий: {completed}")
+    print(f"Обновлений: {len(latencies)} за {elapsed:.2f} с -> {len(latencies) / elapsed:.1f} обновлений/с")
+    print(f"Задержка ответа на шаг: p50 {percentile(latencies, 50) * 1000:.1f} мс, "
+          f"p95 {percentile(latencies, 95) * 1000:.1f} мс, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} мс")
+    print(f"Вызовов API на диалог: {user_calls / max(users, 1):.1f} в чат пользователя, "
+          f"{operator_calls / max(users, 1):.1f} в чат операторов")
+    print(f"Вызовов getUpdates: {polling_calls}, вызовов при запуске бота: {startup_calls}")
+    print("Вызовы по методам: " + ", ".join(f"{m}={c}" for m, c in api.calls.most_common()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на поддельном Bot API")
+    parser.add_argument("--users", type=int, default=1000, help="Количество пользователей")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Время подключения пользователей, секунд")
+    parser.add_argument("--port", type=int, default=8081, help="Порт поддельного Bot API")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Таймаут ожидания ответа бота, секунд")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.users, args.ramp_up, args.port, args.timeout))
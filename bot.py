@@ -14,10 +14,13 @@ import order_status
 import how_to_order
 import gift_cards
 import missing_card
+import webhook
+import update_executor
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # polling или webhook
 
 # Проверяем наличие токена
 if not BOT_TOKEN:
@@ -51,7 +54,10 @@ async def main():
     
     # Запускаем бота
     logging.info("Бот запущен!")
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    if BOT_MODE == 'webhook':
+        await webhook.run_webhook(dp, bot, **webhook.config_from_env())
+    else:
+        await update_executor.run_polling(dp, bot)
 
 # Точка входа
 if __name__ == "__main__":
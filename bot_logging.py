@@ -0,0 +1,305 @@
+# bot_logging.py - Неблокирующее структурированное логирование для Telegram бота GoldenAppleBot
+# Записи логов не пишутся в stdout из цикла событий: обработчик корневого логгера только
+# кладет запись в очередь, а вывод выполняет фоновый поток (QueueListener).
+# Перед постановкой в очередь записи проходят фильтры:
+# - выборка (sampling) - для шумных логгеров сохраняется только доля DEBUG/INFO записей;
+# - ограничение частоты - не больше N записей в секунду на логгер, о пропущенных
+#   записях сообщает поле suppressed следующей записи.
+#
+# Записи структурированные: событие + поля ключ=значение, например
+#     2024-01-01 12:00:00,000 - support - DEBUG - Обработка сообщения user_id=123 state=None
+#
+# Использование:
+#     from bot_logging import get_logger
+#     log = get_logger(__name__)
+#     log.debug("Обработка сообщения", user_id=user_id, state=current_state)
+# Если уровень DEBUG выключен, вызов log.debug только проверяет уровень логгера.
+
+import atexit  # Для остановки фонового потока при выходе
+import json  # Для экранирования значений полей
+import logging  # Стандартная система логирования
+import logging.handlers  # QueueHandler и QueueListener
+import os  # Для чтения настроек из переменных окружения
+import queue  # Очередь записей между циклом событий и фоновым потоком
+import random  # Для выборки записей
+import sys  # Поток вывода по умолчанию
+import threading  # Блокировка фильтра ограничения частоты
+import time  # Для ограничения частоты
+
+# Атрибут записи logging.LogRecord, в котором хранятся структурированные поля
+FIELDS_ATTR = "fields"
+
+# Формат записи (как в logging.basicConfig бота) - поля добавляются после сообщения
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Запущенный фоновый поток вывода (setup_logging вызывается один раз на процесс)
+_listener = None
+
+# Кэш структурированных логгеров: {имя: StructLogger}
+_loggers = {}
+
+
+def config_from_env() -> dict:
+    """Читает настройки логирования из переменных окружения
+
+    Переменные окружения:
+        LOG_LEVEL - уровень логирования (INFO)
+        LOG_SAMPLE - доля сохраняемых DEBUG/INFO записей по логгерам,
+                     например "aiogram.event=0.1,support=0.5" (по умолчанию без выборки)
+        LOG_RATE_LIMIT - максимум записей DEBUG/INFO в секунду на логгер (100, 0 - без ограничения)
+        LOG_QUEUE_SIZE - размер очереди записей; при переполнении записи отбрасываются (10000)
+
+    Returns:
+        dict: Параметры для setup_logging
+    """
+    sample = {}
+    for item in os.getenv("LOG_SAMPLE", "").split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            sample[name.strip()] = float(rate)
+    return {
+        "level": os.getenv("LOG_LEVEL", "INFO").upper(),
+        "sample": sample,
+        "rate_limit": float(os.getenv("LOG_RATE_LIMIT", "100")),
+        "queue_size": int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    }
+
+
+def _format_value(value) -> str:
+    """Форматирует значение поля: простые строки как есть, остальные - в кавычках"""
+    if isinstance(value, str):
+        if value and not any(char in value for char in ' ="\n'):
+            return value
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Форматтер: обычная строка лога + структурированные поля ключ=значение"""
+
+    def __init__(self, fmt: str = LOG_FORMAT):
+        super().__init__(fmt)
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, FIELDS_ATTR, None)
+        if not fields:
+            return line
+        pairs = " ".join(f"{key}={_format_value(value)}" for key, value in fields.items())
+        # Трассировка исключения (если есть) остается после полей
+        head, newline, tail = line.partition("\n")
+        return f"{head} {pairs}{newline}{tail}"
+
+
+def _lookup(table: dict, name: str):
+    """Ищет настройку для логгера по его имени или имени ближайшего родителя"""
+    while name:
+        if name in table:
+            return table[name]
+        name = name.rpartition(".")[0]
+    return table.get("")
+
+
+class SamplingFilter(logging.Filter):
+    """Сохраняет только долю записей DEBUG/INFO для указанных логгеров
+
+    Предупреждения и ошибки проходят всегда.
+    """
+
+    def __init__(self, rates: dict, max_level: int = logging.INFO):
+        super().__init__()
+        self.rates = dict(rates)
+        self.max_level = max_level
+        self._cache = {}  # {имя логгера: доля}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        rate = self._cache.get(record.name)
+        if rate is None:
+            rate = _lookup(self.rates, record.name)
+            rate = self._cache[record.name] = 1.0 if rate is None else rate
+        return rate >= 1.0 or random.random() < rate
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничивает частоту записей DEBUG/INFO каждого логгера (token bucket)
+
+    Предупреждения и ошибки проходят всегда: их всплеск - признак сбоя, и именно
+    тогда они нужны все. Когда записи снова разрешены, в поле suppressed первой
+    записи указывается, сколько записей было пропущено.
+    """
+
+    def __init__(self, rate: float, burst: float = None, max_level: int = logging.INFO):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or rate
+        self.max_level = max_level
+        self._buckets = {}  # {имя логгера: [токены, время последнего пополнения, пропущено]}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.name)
+            if bucket is None:
+                bucket = self._buckets[record.name] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1.0
+            suppressed, bucket[2] = bucket[2], 0
+
+        if suppressed:
+            fields = getattr(record, FIELDS_ATTR, None) or {}
+            setattr(record, FIELDS_ATTR, {**fields, "suppressed": suppressed})
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Обработчик, который только кладет запись в очередь
+
+    В отличие от стандартного QueueHandler, не форматирует запись в потоке
+    цикла событий (форматирование выполняет фоновый поток) и не блокируется
+    при переполнении очереди - запись отбрасывается и учитывается в dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы %-форматирования могут измениться после вызова логгера,
+        # поэтому сообщение собирается сразу; структурированные поля уже являются копией
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructLogger:
+    """Обертка над logging.Logger для структурированных записей: событие + поля"""
+
+    __slots__ = ("logger",)
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def is_enabled(self, level: int) -> bool:
+        """Проверяет, будет ли записан лог уровня level (для дорогих полей)"""
+        return self.logger.isEnabledFor(level)
+
+    @property
+    def debug_enabled(self) -> bool:
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+    def _emit(self, level: int, event: str, fields: dict, exc_info=None):
+        # Запись создается напрямую: формат логов не использует имя файла и строку,
+        # поэтому поиск вызывающего кадра стека (findCaller) не нужен
+        if exc_info is True:
+            exc_info = sys.exc_info()
+        record = self.logger.makeRecord(
+            self.logger.name, level, "", 0, event, (), exc_info, extra={FIELDS_ATTR: fields}
+        )
+        self.logger.handle(record)
+
+    def log(self, level: int, event: str, exc_info=None, **fields):
+        if self.logger.isEnabledFor(level):
+            self._emit(level, event, fields, exc_info)
+
+    def debug(self, event: str, **fields):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self._emit(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields):
+        if self.logger.isEnabledFor(logging.INFO):
+            self._emit(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields):
+        if self.logger.isEnabledFor(logging.WARNING):
+            self._emit(logging.WARNING, event, fields)
+
+    def error(self, event: str, exc_info=None, **fields):
+        if self.logger.isEnabledFor(logging.ERROR):
+            self._emit(logging.ERROR, event, fields, exc_info)
+
+    def exception(self, event: str, **fields):
+        self.error(event, exc_info=True, **fields)
+
+
+def get_logger(name: str) -> StructLogger:
+    """Возвращает структурированный логгер для модуля
+
+    Args:
+        name (str): Имя логгера (обычно __name__)
+
+    Returns:
+        StructLogger: Логгер с методами debug/info/warning/error(событие, **поля)
+    """
+    logger = _loggers.get(name)
+    if logger is None:
+        logger = _loggers[name] = StructLogger(logging.getLogger(name))
+    return logger
+
+
+def setup_logging(level="INFO", sample: dict = None, rate_limit: float = 100.0,
+                  queue_size: int = 10000, stream=None) -> logging.handlers.QueueListener:
+    """Настраивает корневой логгер на запись через очередь и фоновый поток
+
+    Заменяет обработчики корневого логгера, поэтому существующие вызовы
+    logging.error(...) тоже начинают писать через очередь. Повторный вызов
+    возвращает уже запущенный поток вывода.
+
+    Args:
+        level: Уровень логирования (имя или число)
+        sample (dict, optional): Доля сохраняемых DEBUG/INFO записей по именам логгеров
+        rate_limit (float): Максимум записей DEBUG/INFO в секунду на логгер (0 - без ограничения)
+        queue_size (int): Размер очереди записей
+        stream: Поток вывода (по умолчанию sys.stderr)
+
+    Returns:
+        QueueListener: Фоновый поток вывода записей
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    log_queue = queue.Queue(queue_size)
+    handler = NonBlockingQueueHandler(log_queue)
+    if sample:
+        handler.addFilter(SamplingFilter(sample))
+    if rate_limit:
+        handler.addFilter(RateLimitFilter(rate_limit))
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(KeyValueFormatter())
+
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    # При выходе дописываем оставшиеся в очереди записи
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
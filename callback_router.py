@@ -0,0 +1,176 @@
+# callback_router.py - Маршрутизатор callback-запросов для Telegram бота GoldenAppleBot
+# Вместо цепочки lambda-фильтров (каждый callback проверялся всеми фильтрами по очереди)
+# все точные значения callback_data собираются в словарь, а префиксы - в префиксное дерево.
+# Поиск обработчика занимает время, зависящее только от длины callback_data,
+# а не от количества зарегистрированных обработчиков.
+
+import inspect  # Для определения аргументов, которые принимает обработчик
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.event.bases import SkipHandler  # Передает callback следующим обработчикам
+
+# Ключ, под которым маршрутизатор хранится в workflow_data диспетчера
+ROUTER_KEY = "callback_router"
+
+# Служебный ключ узла префиксного дерева, под которым хранится маршрут
+_ROUTE = None
+
+
+class CallbackRoute:
+    """Зарегистрированный маршрут: ключ callback_data и его обработчик
+
+    Аргументы обработчика определяются один раз при регистрации, поэтому
+    при вызове обработчику передаются только те данные aiogram (state, bot и т.д.),
+    которые он действительно принимает.
+    """
+
+    def __init__(self, key: str, handler, is_prefix: bool):
+        self.key = key
+        self.handler = handler
+        self.is_prefix = is_prefix
+
+        spec = inspect.getfullargspec(inspect.unwrap(handler))
+        self._params = {*spec.args[1:], *spec.kwonlyargs}
+        self._varkw = spec.varkw is not None
+
+    @property
+    def name(self) -> str:
+        """Имя маршрута для логов и метрик (например, "criteria_*")"""
+        return f"{self.key}*" if self.is_prefix else self.key
+
+    async def call(self, callback: types.CallbackQuery, data: dict):
+        """Вызывает обработчик, передавая только принимаемые им аргументы"""
+        if self._varkw:
+            kwargs = data
+        else:
+            kwargs = {k: data[k] for k in self._params if k in data}
+
+        result = self.handler(callback, **kwargs)
+        # Обработчики-lambda возвращают awaitable (например, callback.answer(...)),
+        # его тоже нужно дождаться
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+
+class CallbackRouter:
+    """Таблица маршрутизации callback-запросов
+
+    Точные ключи ищутся в словаре, префиксы - в префиксном дереве.
+    Если callback_data совпадает с точным ключом, используется он.
+    Иначе выбирается самый длинный зарегистрированный префикс, поэтому
+    результат не зависит от порядка регистрации обработчиков.
+    """
+
+    def __init__(self):
+        self._exact = {}  # Точные ключи: {callback_data: CallbackRoute}
+        self._prefixes = {}  # Префиксы: {префикс: CallbackRoute}
+        self._trie = None  # Скомпилированное префиксное дерево
+        self._compiled = False
+
+    def exact(self, key: str, handler):
+        """Регистрирует обработчик для точного значения callback_data
+
+        Args:
+            key (str): Значение callback_data (например, "back_to_main")
+            handler: Обработчик, первым аргументом принимающий CallbackQuery
+
+        Raises:
+            ValueError: Если для этого ключа уже зарегистрирован обработчик
+        """
+        if key in self._exact:
+            raise ValueError(f"Обработчик для callback '{key}' уже зарегистрирован")
+        self._exact[key] = CallbackRoute(key, handler, is_prefix=False)
+        self._compiled = False
+
+    def prefix(self, prefix: str, handler):
+        """Регистрирует обработчик для всех callback_data с указанным префиксом
+
+        Args:
+            prefix (str): Префикс callback_data (например, "criteria_")
+            handler: Обработчик, первым аргументом принимающий CallbackQuery
+
+        Raises:
+            ValueError: Если префикс пустой или уже зарегистрирован
+        """
+        if not prefix:
+            raise ValueError("Префикс callback не может быть пустым")
+        if prefix in self._prefixes:
+            raise ValueError(f"Обработчик для префикса '{prefix}' уже зарегистрирован")
+        self._prefixes[prefix] = CallbackRoute(prefix, handler, is_prefix=True)
+        self._compiled = False
+
+    def compile(self):
+        """Строит префиксное дерево из зарегистрированных префиксов
+
+        Вызывается автоматически при первом поиске после регистрации.
+        """
+        trie = {}
+        for prefix, route in self._prefixes.items():
+            node = trie
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[_ROUTE] = route
+        self._trie = trie
+        self._compiled = True
+
+    def resolve(self, data: str):
+        """Находит маршрут для значения callback_data
+
+        Args:
+            data (str): Значение callback_data
+
+        Returns:
+            CallbackRoute | None: Найденный маршрут или None, если обработчика нет
+        """
+        if data is None:
+            return None
+
+        route = self._exact.get(data)
+        if route is not None:
+            return route
+
+        if not self._compiled:
+            self.compile()
+
+        # Идем по дереву и запоминаем последний (самый длинный) найденный префикс
+        node = self._trie
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            route = node.get(_ROUTE, route)
+        return route
+
+    def routes(self) -> list:
+        """Возвращает список всех зарегистрированных маршрутов"""
+        return [*self._exact.values(), *self._prefixes.values()]
+
+    async def dispatch(self, callback: types.CallbackQuery, **data):
+        """Единый обработчик callback-запросов, регистрируемый в диспетчере
+
+        Если маршрут не найден, callback передается следующим обработчикам диспетчера.
+        """
+        route = self.resolve(callback.data)
+        if route is None:
+            raise SkipHandler()
+        return await route.call(callback, data)
+
+
+def get_callback_router(dp: Dispatcher) -> CallbackRouter:
+    """Возвращает маршрутизатор callback-запросов диспетчера, создавая его при первом вызове
+
+    При создании маршрутизатор регистрируется в диспетчере как обработчик callback-запросов.
+
+    Args:
+        dp (Dispatcher): Диспетчер бота
+
+    Returns:
+        CallbackRouter: Маршрутизатор, в который модули регистрируют свои обработчики
+    """
+    router = dp.get(ROUTER_KEY)
+    if router is None:
+        router = CallbackRouter()
+        dp[ROUTER_KEY] = router
+        dp.callback_query.register(router.dispatch)
+    return router
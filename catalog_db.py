@@ -0,0 +1,625 @@
+# catalog_db.py - Схема базы товаров recommendations.db для Telegram бота GoldenAppleBot
+# Атрибуты товара хранятся в таблице products одной JSON-строкой, поэтому SQLite не может
+# использовать индекс ни для одного критерия. Модуль добавляет нормализованную таблицу
+#     product_attributes(product_id, category, attr_group, value)
+# с одной строкой на каждое значение атрибута ("effect": ["volume", "curl"] - две строки)
+# и составным индексом (category, attr_group, value, product_id). Поиск по критерию -
+# диапазон этого индекса, уже отсортированный по id товара, без чтения таблицы products
+# и без разбора JSON.
+#
+# Таблица заполняется триггерами из products.attributes, поэтому остается согласованной
+# при любых изменениях products (init_db, ручные правки, импорт каталога).
+# Существующие базы переводятся на новую схему миграцией migrate(): она создает таблицу
+# и триггеры, а затем переносит атрибуты небольшими транзакциями. Бот в это время
+# продолжает читать базу (WAL), а прерванная миграция продолжается с места остановки.
+#
+# Журнал изменений product_changes: триггеры на products записывают id каждого
+# добавленного, измененного или удаленного товара. Номер последней записи - версия
+# каталога; read_changes() возвращает изменения после версии, чтобы структуры в памяти
+# (catalog_refresh.py) обновлялись без чтения всей таблицы products.
+#
+# Полнотекстовый поиск: таблица FTS5 product_search (токенизатор trigram) с названием
+# товара и русскими названиями его категории и значений атрибутов. Названия берутся
+# из таблицы search_titles (их записывает sync_search_titles из ProductCategories),
+# строки поиска обновляются триггерами на products. Trigram находит любую подстроку
+# от трех символов без учета регистра ("матов" - "Матовая"), поиск по индексу.
+# Таблица и триггеры поиска создаются отдельно от остальной схемы: если SQLite собран
+# без FTS5 (или без trigram), поиск недоступен (search_available), а каталог работает.
+
+import json  # Атрибуты товаров и списки id в запросах
+import logging  # Для логирования хода миграции
+import os  # Для проверки замены файла базы
+import random  # Для выбора случайных товаров
+import re  # Для разбора поискового запроса на слова
+import sqlite3  # База данных товаров
+import time  # Для замера времени миграции
+
+from attribute_index import parse_criterion  # Разбор критерия "группа_значение"
+
+# Сколько товаров переносить одной транзакцией при миграции
+MIGRATION_BATCH = 5000
+
+# Ключ таблицы catalog_meta: id последнего товара, атрибуты которого перенесены
+# в product_attributes; "done" - миграция завершена
+_BACKFILL_KEY = "attributes_backfill"
+
+# Ключ таблицы catalog_meta: id последнего товара, добавленного в индекс поиска
+# product_search при его построении; "done" - индекс построен
+_SEARCH_KEY = "search_backfill"
+
+# Сколько товаров поиск возвращает по умолчанию
+SEARCH_LIMIT = 50
+
+# До скольких совпадений товары упорядочиваются по релевантности (bm25 считается для
+# каждого совпадения); у более общего запроса - по возрастанию id, первые по индексу
+SEARCH_RANKED = 2000
+
+# Сколько записей журнала изменений читать за один раз
+CHANGES_BATCH = 10000
+
+# Сколько секунд хранить записи журнала изменений (7 дней); воркер, отставший
+# сильнее, перестраивает каталог в памяти целиком
+CHANGES_RETENTION = 7 * 24 * 3600
+
+# Текущее время в секундах Unix с долями секунды (в SQLite 3.40 нет unixepoch('subsec'))
+_NOW = "(julianday('now') - 2440587.5) * 86400.0"
+
+# Разворачивает JSON атрибутов товара в строки (product_id, category, attr_group, value):
+# скалярное значение - одна строка, список - строка на каждый элемент.
+# Некорректный JSON дает пустой набор атрибутов, а не ошибку записи товара.
+_EXPAND_ATTRIBUTES = """
+    SELECT {p}.id, {p}.category, g.key, CAST(g.value AS TEXT)
+    FROM {tables}json_each(CASE WHEN json_valid({p}.attributes) THEN {p}.attributes ELSE '{{}}' END) AS g
+    WHERE {where}g.type NOT IN ('array', 'object', 'null')
+    UNION ALL
+    SELECT {p}.id, {p}.category, g.key, CAST(v.value AS TEXT)
+    FROM {tables}json_each(CASE WHEN json_valid({p}.attributes) THEN {p}.attributes ELSE '{{}}' END) AS g,
+         json_each(g.value) AS v
+    WHERE {where}g.type = 'array' AND v.type NOT IN ('array', 'object', 'null')
+"""
+
+# Для триггеров: атрибуты добавленного или измененного товара NEW
+_EXPAND_NEW = _EXPAND_ATTRIBUTES.format(p="NEW", tables="", where="")
+
+# Для миграции: атрибуты товаров с id в диапазоне [?, ?] (параметры передаются дважды)
+_EXPAND_RANGE = _EXPAND_ATTRIBUTES.format(
+    p="p", tables="products AS p, ", where="p.id BETWEEN ? AND ? AND "
+)
+
+# Для массовой загрузки каталога: атрибуты всех товаров
+_EXPAND_ALL = _EXPAND_ATTRIBUTES.format(p="p", tables="products AS p, ", where="")
+
+# Строка индекса поиска товара {p}: название, затем названия категории (строка search_titles
+# с пустыми группой и значением) и значений атрибутов. В триггерах нельзя WITH, поэтому
+# пары (группа, значение) разворачиваются подзапросом, как в _EXPAND_ATTRIBUTES,
+# и название каждой пары читается по первичному ключу search_titles (CROSS JOIN задает
+# порядок: иначе планировщик перебирает названия категории и разворачивает JSON для каждого)
+_SEARCH_ROW = """
+    SELECT {p}.id, {p}.name, (
+        SELECT group_concat(title, ' ') FROM (
+            SELECT t.title FROM search_titles AS t
+            WHERE t.category = {p}.category AND t.attr_group = '' AND t.value = ''
+            UNION ALL
+            SELECT t.title
+            FROM json_each(CASE WHEN json_valid({p}.attributes) THEN {p}.attributes ELSE '{{}}' END) AS g
+                 CROSS JOIN search_titles AS t
+            WHERE g.type NOT IN ('array', 'object', 'null') AND t.category = {p}.category
+                  AND t.attr_group = g.key AND t.value = CAST(g.value AS TEXT)
+            UNION ALL
+            SELECT t.title
+            FROM json_each(CASE WHEN json_valid({p}.attributes) THEN {p}.attributes ELSE '{{}}' END) AS g,
+                 json_each(g.value) AS v CROSS JOIN search_titles AS t
+            WHERE g.type = 'array' AND v.type NOT IN ('array', 'object', 'null') AND t.category = {p}.category
+                  AND t.attr_group = g.key AND t.value = CAST(v.value AS TEXT)
+        )
+    )
+    FROM {tables}
+"""
+
+# Для триггеров: добавленный или измененный товар NEW (FROM (SELECT 1) - строка для SELECT)
+_SEARCH_NEW = _SEARCH_ROW.format(p="NEW", tables="(SELECT 1)")
+
+# Для построения индекса: товары с id в диапазоне [?, ?]
+_SEARCH_RANGE = _SEARCH_ROW.format(p="p", tables="products AS p WHERE p.id BETWEEN ? AND ?")
+
+# Таблица поиска; при изменении названий она создается заново (sync_search_titles)
+_SEARCH_TABLE = ("CREATE VIRTUAL TABLE IF NOT EXISTS product_search "
+                 "USING fts5(name, titles, tokenize='trigram')")
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value TEXT)",
+    # Первичный ключ исключает повторы значений, если триггер и перенос
+    # при миграции обработали один и тот же товар
+    """CREATE TABLE IF NOT EXISTS product_attributes (
+           product_id INTEGER NOT NULL,
+           category TEXT NOT NULL,
+           attr_group TEXT NOT NULL,
+           value TEXT NOT NULL,
+           PRIMARY KEY (product_id, attr_group, value)
+       ) WITHOUT ROWID""",
+    # Поиск по критерию: все товары категории с данным значением атрибута, по возрастанию id
+    """CREATE INDEX IF NOT EXISTS idx_product_attributes_criterion
+       ON product_attributes (category, attr_group, value, product_id)""",
+    # id товаров категории (индекс содержит rowid, поэтому таблица products не читается)
+    "CREATE INDEX IF NOT EXISTS idx_products_category ON products (category)",
+    f"""CREATE TRIGGER IF NOT EXISTS products_attributes_insert AFTER INSERT ON products
+        BEGIN
+            INSERT OR IGNORE INTO product_attributes (product_id, category, attr_group, value)
+            {_EXPAND_NEW};
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS products_attributes_update
+        AFTER UPDATE OF id, category, attributes ON products
+        BEGIN
+            DELETE FROM product_attributes WHERE product_id = OLD.id;
+            INSERT OR IGNORE INTO product_attributes (product_id, category, attr_group, value)
+            {_EXPAND_NEW};
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS products_attributes_delete AFTER DELETE ON products
+       BEGIN
+           DELETE FROM product_attributes WHERE product_id = OLD.id;
+       END""",
+    # Журнал изменений: id каждого добавленного, измененного или удаленного товара.
+    # Номер записи seq - версия каталога; структуры каталога в памяти применяют
+    # записи после своей версии (catalog_refresh.py), не перечитывая всю таблицу
+    """CREATE TABLE IF NOT EXISTS product_changes (
+           seq INTEGER PRIMARY KEY AUTOINCREMENT,
+           product_id INTEGER NOT NULL,
+           changed_at REAL NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_product_changes_time ON product_changes (changed_at)",
+    f"""CREATE TRIGGER IF NOT EXISTS products_changes_insert AFTER INSERT ON products
+        BEGIN
+            INSERT INTO product_changes (product_id, changed_at) VALUES (NEW.id, {_NOW});
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS products_changes_update AFTER UPDATE ON products
+        BEGIN
+            INSERT INTO product_changes (product_id, changed_at) VALUES (OLD.id, {_NOW});
+            INSERT INTO product_changes (product_id, changed_at)
+            SELECT NEW.id, {_NOW} WHERE NEW.id <> OLD.id;
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS products_changes_delete AFTER DELETE ON products
+        BEGIN
+            INSERT INTO product_changes (product_id, changed_at) VALUES (OLD.id, {_NOW});
+        END""",
+    # Русские названия для поиска: категория (attr_group и value пустые) и значения атрибутов
+    """CREATE TABLE IF NOT EXISTS search_titles (
+           category TEXT NOT NULL,
+           attr_group TEXT NOT NULL,
+           value TEXT NOT NULL,
+           title TEXT NOT NULL,
+           PRIMARY KEY (category, attr_group, value)
+       ) WITHOUT ROWID""",
+]
+
+# Таблица поиска FTS5 и триггеры, обновляющие ее строки. Создаются отдельно от остальной
+# схемы (sync_search_titles): без FTS5 или токенизатора trigram в SQLite не строится
+# только индекс поиска, а миграция и запись товаров работают
+_SEARCH_SCHEMA = [
+    _SEARCH_TABLE,
+    # rowid строки поиска - id товара
+    f"""CREATE TRIGGER IF NOT EXISTS products_search_insert AFTER INSERT ON products
+        BEGIN
+            INSERT INTO product_search (rowid, name, titles) {_SEARCH_NEW};
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS products_search_update
+        AFTER UPDATE OF id, name, category, attributes ON products
+        BEGIN
+            DELETE FROM product_search WHERE rowid = OLD.id;
+            INSERT INTO product_search (rowid, name, titles) {_SEARCH_NEW};
+        END""",
+    """CREATE TRIGGER IF NOT EXISTS products_search_delete AFTER DELETE ON products
+       BEGIN
+           DELETE FROM product_search WHERE rowid = OLD.id;
+       END""",
+]
+
+
+def _meta(conn: sqlite3.Connection, key: str):
+    row = conn.execute("SELECT value FROM catalog_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value):
+    conn.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def migrate(conn: sqlite3.Connection, batch_size: int = MIGRATION_BATCH) -> int:
+    """Переводит базу товаров на схему с таблицей product_attributes
+
+    Создает таблицу, индексы и триггеры, после чего переносит атрибуты товаров,
+    добавленных до появления триггеров. Каждая порция из batch_size товаров
+    переносится отдельной короткой транзакцией, поэтому бот, работающий с той же
+    базой, не блокируется надолго. Позиция переноса сохраняется в catalog_meta:
+    повторный вызов продолжает прерванную миграцию, а для уже переведенной базы
+    ничего не делает.
+
+    Args:
+        conn (sqlite3.Connection): Соединение с базой товаров (таблица products должна существовать)
+        batch_size (int): Сколько товаров переносить одной транзакцией
+
+    Returns:
+        int: Сколько товаров перенесено этим вызовом
+    """
+    # В режиме WAL чтение базы другими соединениями не блокируется записью
+    conn.execute("PRAGMA journal_mode=WAL")
+    with conn:
+        for statement in _SCHEMA:
+            conn.execute(statement)
+
+    with conn:
+        conn.execute(f"DELETE FROM product_changes WHERE changed_at < {_NOW} - ?", (CHANGES_RETENTION,))
+
+    position = _meta(conn, _BACKFILL_KEY)
+    if position == "done":
+        return 0
+
+    # Товары, добавленные после создания триггеров, уже в product_attributes,
+    # а INSERT OR IGNORE не даст перенести их значения второй раз
+    last_id = int(position) if position else -1 << 63
+    migrated = 0
+    started = time.perf_counter()
+    backfill = ("INSERT OR IGNORE INTO product_attributes (product_id, category, attr_group, value) "
+                + _EXPAND_RANGE)
+    while True:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM products WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+        )]
+        if not ids:
+            break
+        with conn:
+            conn.execute(backfill, (ids[0], ids[-1], ids[0], ids[-1]))
+            _set_meta(conn, _BACKFILL_KEY, ids[-1])
+        last_id = ids[-1]
+        migrated += len(ids)
+
+    with conn:
+        _set_meta(conn, _BACKFILL_KEY, "done")
+    if migrated:
+        logging.info(f"Атрибуты {migrated} товаров перенесены в product_attributes "
+                     f"за {time.perf_counter() - started:.1f} с")
+    return migrated
+
+
+def finish_bulk_load(conn: sqlite3.Connection, version: int = 0):
+    """Достраивает схему базы после массовой загрузки таблицы products (catalog_import.py)
+
+    Атрибуты всех товаров переносятся в product_attributes одним запросом, и только
+    после этого создаются индексы и триггеры: каждый индекс строится одной сортировкой,
+    а не обновляется при каждой вставке. Номера журнала изменений продолжаются
+    с version, поэтому версия каталога после замены базы не уменьшается, а читатели
+    старой базы видят в read_changes сброс и перечитывают каталог целиком.
+
+    Args:
+        conn (sqlite3.Connection): Соединение с новой базой, в которой заполнена только products
+        version (int): Версия каталога, с которой начнется журнал изменений новой базы
+    """
+    with conn:
+        for statement in _SCHEMA:
+            if statement.startswith("CREATE TABLE"):
+                conn.execute(statement)
+        conn.execute("INSERT OR IGNORE INTO product_attributes (product_id, category, attr_group, value) "
+                     + _EXPAND_ALL)
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        _set_meta(conn, _BACKFILL_KEY, "done")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('product_changes', ?)", (version,))
+
+
+def sync_search_titles(conn: sqlite3.Connection, titles: dict, batch_size: int = MIGRATION_BATCH) -> int:
+    """Записывает названия для поиска и при необходимости строит индекс product_search
+
+    Если названия отличаются от сохраненных, индекс создается заново. Товары
+    добавляются в индекс порциями по batch_size отдельными транзакциями, как при
+    миграции; позиция сохраняется в catalog_meta, и прерванное построение продолжается
+    с места остановки. Изменения товаров во время построения индекс получает от триггеров.
+
+    Args:
+        conn (sqlite3.Connection): Соединение с базой товаров (схема создана migrate или finish_bulk_load)
+        titles (dict): {(категория, группа, значение): название}; название категории -
+                       с пустыми группой и значением
+        batch_size (int): Сколько товаров добавлять одной транзакцией
+
+    Returns:
+        int: Сколько товаров добавлено в индекс этим вызовом
+
+    Raises:
+        sqlite3.OperationalError: Если в SQLite нет FTS5 или токенизатора trigram
+    """
+    with conn:
+        for statement in _SEARCH_SCHEMA:
+            conn.execute(statement)
+    rows = sorted((category, group, value, title) for (category, group, value), title in titles.items())
+    stored = sorted(conn.execute("SELECT category, attr_group, value, title FROM search_titles"))
+    if rows != stored:
+        with conn:
+            conn.execute("DELETE FROM search_titles")
+            conn.executemany("INSERT INTO search_titles (category, attr_group, value, title) "
+                             "VALUES (?, ?, ?, ?)", rows)
+            # Пересоздать таблицу быстрее, чем удалять из нее строки всех товаров
+            conn.execute("DROP TABLE IF EXISTS product_search")
+            conn.execute(_SEARCH_TABLE)
+            _set_meta(conn, _SEARCH_KEY, "")
+
+    position = _meta(conn, _SEARCH_KEY)
+    if position == "done":
+        return 0
+
+    last_id = int(position) if position else -1 << 63
+    indexed = 0
+    started = time.perf_counter()
+    while True:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM products WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+        )]
+        if not ids:
+            break
+        with conn:
+            # Строки, уже добавленные триггерами, заменяются
+            conn.execute("DELETE FROM product_search WHERE rowid BETWEEN ? AND ?", (ids[0], ids[-1]))
+            conn.execute("INSERT INTO product_search (rowid, name, titles) " + _SEARCH_RANGE,
+                         (ids[0], ids[-1]))
+            _set_meta(conn, _SEARCH_KEY, ids[-1])
+        last_id = ids[-1]
+        indexed += len(ids)
+
+    with conn:
+        _set_meta(conn, _SEARCH_KEY, "done")
+    if indexed:
+        logging.info(f"Индекс поиска построен для {indexed} товаров "
+                     f"за {time.perf_counter() - started:.1f} с")
+    return indexed
+
+
+def search_available(conn: sqlite3.Connection) -> bool:
+    """Есть ли индекс поиска: таблица product_search создана и SQLite может ее читать (FTS5)"""
+    try:
+        conn.execute("SELECT rowid FROM product_search LIMIT 0")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def search_query(text: str) -> str:
+    """Запрос FTS5 по тексту пользователя: все слова от трех символов (И между словами)
+
+    Слова короче трех символов trigram не находит, поэтому они отбрасываются.
+    Каждое слово - отдельная фраза в кавычках: символы синтаксиса FTS5 в тексте
+    пользователя не действуют. Пустая строка - в тексте нет подходящих слов.
+    """
+    words = dict.fromkeys(word for word in re.findall(r"\w+", text.lower()) if len(word) >= 3)
+    return " ".join(f'"{word}"' for word in words)
+
+
+def search_product_ids(conn: sqlite3.Connection, text: str, limit: int = SEARCH_LIMIT,
+                       ranked: int = SEARCH_RANKED) -> list:
+    """Возвращает id товаров, в названии или характеристиках которых есть все слова запроса
+
+    Если совпадений не больше ranked, товары упорядочены по релевантности (bm25):
+    совпадения в более коротких строках - выше. У более общего запроса расчет bm25 для
+    всех совпадений занимал бы сотни миллисекунд на миллионах товаров, поэтому
+    возвращаются первые совпадения по возрастанию id - они читаются прямо из индекса.
+
+    Args:
+        conn (sqlite3.Connection): Соединение с базой товаров
+        text (str): Текст запроса пользователя
+        limit (int): Сколько товаров вернуть
+        ranked (int): До скольких совпадений упорядочивать по релевантности
+
+    Returns:
+        list: id найденных товаров (пустой, если в запросе нет слов от трех символов)
+    """
+    query = search_query(text)
+    if not query:
+        return []
+    product_ids = [row[0] for row in conn.execute(
+        "SELECT rowid FROM product_search WHERE product_search MATCH ? ORDER BY rowid LIMIT ?",
+        (query, max(ranked, limit) + 1),
+    )]
+    if len(product_ids) > ranked:
+        return product_ids[:limit]
+    return [row[0] for row in conn.execute(
+        "SELECT rowid FROM product_search WHERE product_search MATCH ? ORDER BY rank LIMIT ?",
+        (query, limit),
+    )]
+
+
+def file_id(path: str) -> tuple:
+    """(устройство, inode) файла базы: меняется, когда файл базы заменяют новым (None - файла нет)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def find_product_ids(conn: sqlite3.Connection, category: str, criteria: list) -> list:
+    """Возвращает id товаров категории, подходящих под критерии
+
+    Критерии одной группы объединяются по ИЛИ (value IN (...) - несколько диапазонов
+    составного индекса idx_product_attributes_criterion), группы пересекаются через
+    INTERSECT. Без критериев возвращаются все товары категории.
+
+    Args:
+        conn (sqlite3.Connection): Соединение с базой товаров
+        category (str): Категория товаров
+        criteria (list): Критерии в формате "группа_значение"
+
+    Returns:
+        list: id подходящих товаров по возрастанию
+    """
+    if not criteria:
+        return category_product_ids(conn, category)
+    groups = {}  # {группа: [значения]}
+    for criterion in criteria:
+        group, value = parse_criterion(criterion)
+        groups.setdefault(group, []).append(value)
+    parts, params = [], []
+    for group, values in groups.items():
+        placeholders = ",".join("?" * len(values))
+        # Товар с несколькими выбранными значениями группы встречается несколько раз
+        distinct = "DISTINCT " if len(values) > 1 else ""
+        parts.append(f"SELECT {distinct}product_id FROM product_attributes "
+                     f"WHERE category = ? AND attr_group = ? AND value IN ({placeholders})")
+        params.extend((category, group, *values))
+    query = " INTERSECT ".join(parts) + " ORDER BY 1"
+    return [row[0] for row in conn.execute(query, params)]
+
+
+def category_product_ids(conn: sqlite3.Connection, category: str) -> list:
+    """Возвращает id всех товаров категории по возрастанию (по индексу idx_products_category)"""
+    return [row[0] for row in conn.execute(
+        "SELECT id FROM products WHERE category = ? ORDER BY id", (category,)
+    )]
+
+
+def random_product_ids(conn: sqlite3.Connection, category: str, limit: int) -> list:
+    """Возвращает id до limit случайных различных товаров категории
+
+    Случайные позиции выбираются среди товаров категории, и id товара на каждой
+    позиции читается из индекса idx_products_category (LIMIT 1 OFFSET позиция).
+    В отличие от ORDER BY RANDOM(), строки товаров категории не читаются и не сортируются.
+
+    Args:
+        conn (sqlite3.Connection): Соединение с базой товаров
+        category (str): Категория товаров
+        limit (int): Сколько товаров выбрать
+
+    Returns:
+        list: id выбранных товаров
+    """
+    total = conn.execute("SELECT COUNT(*) FROM products WHERE category = ?", (category,)).fetchone()[0]
+    product_ids = []
+    for position in random.sample(range(total), min(limit, total)):
+        row = conn.execute("SELECT id FROM products WHERE category = ? ORDER BY id LIMIT 1 OFFSET ?",
+                           (category, position)).fetchone()
+        if row is not None:
+            product_ids.append(row[0])
+    return product_ids
+
+
+def latest_change(conn: sqlite3.Connection) -> int:
+    """Номер последней записи журнала изменений - текущая версия каталога (0 - изменений не было)"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'product_changes'").fetchone()
+    return row[0] if row else 0
+
+
+def read_changes(conn: sqlite3.Connection, after: int, limit: int = CHANGES_BATCH) -> dict:
+    """Читает изменения каталога после версии after и текущее состояние измененных товаров
+
+    Товар, измененный несколько раз, загружается один раз - в текущем состоянии,
+    поэтому повторное применение тех же записей ничего не портит.
+
+    Args:
+        conn (sqlite3.Connection): Соединение с базой товаров
+        after (int): Версия каталога, до которой изменения уже применены
+        limit (int): Сколько записей журнала прочитать
+
+    Returns:
+        dict: {"version": версия после этих изменений,
+               "count": сколько записей журнала прочитано,
+               "products": измененные и добавленные товары (словари как в fetch_products),
+               "deleted": id удаленных товаров,
+               "changed_at": время самой ранней из прочитанных записей (секунды Unix) или None,
+               "reset": True, если записи после after уже удалены из журнала -
+                        тогда каталог нужно перечитать целиком}
+    """
+    changes = {"version": after, "count": 0, "products": [], "deleted": [],
+               "changed_at": None, "reset": False}
+    first = conn.execute("SELECT MIN(seq) FROM product_changes").fetchone()[0]
+    latest = latest_change(conn)
+    if (first is not None and first > after + 1) or (first is None and latest > after):
+        changes["version"], changes["reset"] = latest, True
+        return changes
+
+    rows = conn.execute(
+        "SELECT seq, product_id, changed_at FROM product_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+        (after, limit),
+    ).fetchall()
+    if not rows:
+        return changes
+    product_ids = list(dict.fromkeys(row[1] for row in rows))
+    products = fetch_products(conn, product_ids)
+    found = {product["id"] for product in products}
+    changes.update(version=rows[-1][0], count=len(rows), products=products,
+                   deleted=[product_id for product_id in product_ids if product_id not in found],
+                   changed_at=rows[0][2])
+    return changes
+
+
+class ProductLayout:
+    """Столбцы таблицы products для одной версии схемы базы и готовые запросы
+
+    Схема читается (PRAGMA table_info) один раз на версию схемы, а не при каждом
+    запросе. Тексты запросов постоянны, поэтому sqlite3 берет подготовленные
+    выражения из кэша соединения, а смещения столбцов вычислены заранее.
+    """
+
+    def __init__(self, columns: tuple):
+        self.columns = columns
+        self.attributes_offset = columns.index("attributes") if "attributes" in columns else -1
+        select = ", ".join(f"p.{column}" for column in columns)
+        # Список id передается одним параметром (JSON-массив): текст запроса не зависит
+        # от числа товаров, а CROSS JOIN сохраняет порядок id из массива
+        self.select_by_ids = (f"SELECT {select} FROM json_each(?) AS j "
+                              f"CROSS JOIN products AS p ON p.id = j.value")
+
+    def to_products(self, rows) -> list:
+        """Преобразует строки products в словари товаров с разобранными атрибутами"""
+        columns, offset, loads = self.columns, self.attributes_offset, json.loads
+        products = []
+        for row in rows:
+            product = dict(zip(columns, row))
+            raw = row[offset] if offset >= 0 else None
+            try:
+                product["attributes"] = loads(raw) if raw else {}
+            except (json.JSONDecodeError, TypeError) as e:
+                logging.warning(f"Ошибка декодирования JSON атрибутов товара {product.get('id')}: {e}")
+                product["attributes"] = {}
+            products.append(product)
+        return products
+
+
+class CatalogConnection(sqlite3.Connection):
+    """Соединение с базой товаров, запоминающее столбцы products для версии схемы
+
+    Используется как factory в sqlite3.connect (CatalogPool). Подготовленные
+    выражения sqlite3 тоже кэширует в соединении, поэтому кэш схемы хранится здесь же.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.layout_version = None
+        self.layout = None
+
+
+def product_layout(conn: sqlite3.Connection) -> ProductLayout:
+    """Возвращает столбцы таблицы products и запросы для текущей версии схемы базы
+
+    Версия схемы (PRAGMA schema_version) меняется при любом изменении схемы
+    (ALTER TABLE, новые индексы), после чего столбцы читаются заново.
+    Для обычного sqlite3.Connection схема читается при каждом вызове.
+    """
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    if getattr(conn, "layout_version", None) == version:
+        return conn.layout
+    layout = ProductLayout(tuple(row[1] for row in conn.execute("PRAGMA table_info(products)")))
+    if isinstance(conn, CatalogConnection):
+        conn.layout_version, conn.layout = version, layout
+    return layout
+
+
+def fetch_products(conn: sqlite3.Connection, product_ids) -> list:
+    """Загружает товары по id одним запросом, в порядке product_ids
+
+    Args:
+        conn (sqlite3.Connection): Соединение с базой товаров
+        product_ids: Последовательность id товаров
+
+    Returns:
+        list: Словари товаров (столбцы products, attributes - разобранный JSON)
+    """
+    if not product_ids:
+        return []
+    layout = product_layout(conn)
+    rows = conn.execute(layout.select_by_ids, (json.dumps(list(product_ids)),)).fetchall()
+    return layout.to_products(rows)
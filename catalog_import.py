@@ -0,0 +1,342 @@
+# catalog_import.py - Загрузка каталога товаров из файла для Telegram бота GoldenAppleBot
+# Раньше товары попадали в recommendations.db только из списка в init_db. Модуль загружает
+# каталог из выгрузки CSV или JSONL (миллионы строк) и подменяет им базу товаров.
+#
+# Как устроено:
+# - файл читается построчно, товары пишутся порциями по batch строк, поэтому память
+#   не зависит от размера файла;
+# - каждая строка проверяется по словарям ProductCategories: категория, группы и значения
+#   атрибутов, цена и рейтинг; неверные строки пропускаются (первые выводятся в отчете),
+#   а при превышении --max-errors импорт прерывается и база не меняется;
+# - новая база собирается во временном файле рядом с базой бота: без журнала транзакций,
+#   большими транзакциями и без индексов; атрибуты, индексы и триггеры создаются в конце
+#   (catalog_db.finish_bulk_load), затем строится индекс поиска (catalog_db.sync_search_titles;
+#   без FTS5 в SQLite каталог загружается без него, поиск по названию недоступен);
+# - готовый файл подменяет базу одним os.replace: работающий бот видит либо старый,
+#   либо полностью загруженный каталог. Пул соединений (catalog_pool.py) замечает замену
+#   файла и открывает соединения заново, каталог в памяти перестраивается целиком
+#   (catalog_refresh.py) - версия каталога в новой базе больше, чем в старой.
+#
+# Формат CSV: столбцы id (необязательный), name, category, price, rating и атрибуты -
+# либо столбец attributes с JSON, либо столбцы attr_<группа> (несколько значений через "|"):
+#     name,category,price,rating,attr_type,attr_color
+#     Помада Matte Red,lipstick,990,4.7,matte,red|berry
+# Формат JSONL: по объекту на строку с теми же полями, attributes - объект:
+#     {"name": "Тушь Volume", "category": "mascara", "price": 1500, "rating": 4.8,
+#      "attributes": {"effect": ["volume", "length"], "type": "waterproof"}}
+#
+# Запуск: python catalog_import.py products.csv [--db recommendations.db] [--format csv|jsonl]
+
+import argparse  # Для разбора аргументов командной строки
+import csv  # Выгрузка каталога в CSV
+import json  # Выгрузка каталога в JSONL и атрибуты товаров
+import logging  # Для логирования хода импорта
+import os  # Для временного файла и подмены базы
+import resource  # Для пикового объема памяти процесса
+import sqlite3  # База данных товаров
+import sys  # Для кода завершения и платформы
+import tempfile  # Временный файл новой базы
+import time  # Для замера скорости импорта
+
+import catalog_db  # Схема базы товаров
+import catalog_pool  # Путь к базе товаров по умолчанию
+from recommendations import ProductCategories, search_titles  # Словари критериев и названия для поиска
+
+# Сколько строк записывать одним executemany
+IMPORT_BATCH = 10000
+
+# Сколько строк записывать одной транзакцией
+IMPORT_TRANSACTION = 500000
+
+# Сколько неверных строк выводить в отчете
+ERROR_SAMPLES = 10
+
+# Таблица товаров (как в init_db); индексы создаются после загрузки
+_PRODUCTS_TABLE = ("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, category TEXT, "
+                   "price REAL, rating REAL, attributes TEXT)")
+
+
+def vocabularies() -> dict:
+    """Словари категорий: {категория: {группа: {значение: описание}}} из ProductCategories"""
+    return {name.lower(): groups for name, groups in vars(ProductCategories).items()
+            if name.isupper() and isinstance(groups, dict)}
+
+
+def read_csv(file):
+    """Записи CSV: (номер строки, словарь или ошибка разбора); атрибуты из столбцов attr_<группа>"""
+    reader = csv.DictReader(file)
+    for record in reader:
+        attributes = {}
+        for column, value in record.items():
+            if column and column.startswith("attr_") and value:
+                values = [item.strip() for item in value.split("|") if item.strip()]
+                attributes[column[5:]] = values[0] if len(values) == 1 else values
+        if record.get("attributes"):
+            try:
+                record["attributes"] = json.loads(record["attributes"])
+            except ValueError as e:
+                record = e
+        elif attributes:
+            record["attributes"] = attributes
+        yield reader.line_num, record
+
+
+def read_jsonl(file):
+    """Записи JSONL: (номер строки, словарь или ошибка разбора); пустые строки пропускаются"""
+    for number, line in enumerate(file, 1):
+        if line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, e
+
+
+def _number(record: dict, field: str, low: float, high: float = None) -> float:
+    value = record.get(field)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field}: ожидается число, получено {value!r}")
+    if value != value or value < low or (high is not None and value > high):
+        raise ValueError(f"{field}: значение {value} вне допустимого диапазона")
+    return value
+
+
+def validate(record: dict, vocabulary: dict) -> tuple:
+    """Проверяет запись выгрузки и возвращает строку для таблицы products
+
+    Args:
+        record (dict): Запись выгрузки (id, name, category, price, rating, attributes)
+        vocabulary (dict): Словари категорий (vocabularies())
+
+    Returns:
+        tuple: (id или None, name, category, price, rating, attributes в JSON)
+
+    Raises:
+        ValueError: Если запись не соответствует словарям категорий
+    """
+    if not isinstance(record, dict):
+        raise ValueError("запись должна быть объектом")
+    product_id = record.get("id")
+    if product_id in (None, ""):
+        product_id = None
+    else:
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            raise ValueError(f"id: ожидается целое число, получено {product_id!r}")
+        if product_id <= 0:
+            raise ValueError(f"id: ожидается положительное число, получено {product_id}")
+    name = record.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("name: пустое название товара")
+    category = record.get("category")
+    groups = vocabulary.get(category)
+    if groups is None:
+        raise ValueError(f"category: неизвестная категория {category!r}")
+    price = _number(record, "price", 0)
+    rating = _number(record, "rating", 0, 5)
+
+    attributes = record.get("attributes") or {}
+    if not isinstance(attributes, dict):
+        raise ValueError("attributes: ожидается объект")
+    for group, value in attributes.items():
+        allowed = groups.get(group)
+        if allowed is None:
+            raise ValueError(f"attributes: в категории {category} нет группы {group!r}")
+        values = value if isinstance(value, list) else [value]
+        if not values:
+            raise ValueError(f"attributes: пустой список значений группы {group}")
+        for item in values:
+            if not isinstance(item, str) or item not in allowed:
+                raise ValueError(f"attributes: в группе {category}.{group} нет значения {item!r}")
+    return (product_id, name.strip(), category, price, rating,
+            json.dumps(attributes, ensure_ascii=False))
+
+
+def _peak_rss() -> int:
+    """Пиковый объем памяти процесса в байтах"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux ru_maxrss в КБ, в macOS - в байтах
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _current_version(path: str) -> int:
+    """Версия каталога в заменяемой базе (0 - базы нет или в ней нет журнала изменений)"""
+    if not os.path.exists(path):
+        return 0
+    conn = sqlite3.connect(path)
+    try:
+        return catalog_db.latest_change(conn)
+    except sqlite3.DatabaseError:
+        return 0
+    finally:
+        conn.close()
+
+
+def _fsync(path: str):
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def swap_in(source: str, path: str):
+    """Подменяет базу товаров path готовым файлом source одной операцией os.replace
+
+    Перед заменой журнал WAL старой базы переносится в файл и обнуляется, чтобы
+    соединения с новым файлом не прочитали из него страницы старой базы.
+    """
+    if os.path.exists(path):
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+    os.replace(source, path)
+    if hasattr(os, "O_DIRECTORY"):
+        # Запись о новом файле в каталоге сохраняется на диск
+        descriptor = os.open(os.path.dirname(path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+
+def import_catalog(records, path: str, batch: int = IMPORT_BATCH,
+                   transaction: int = IMPORT_TRANSACTION, max_errors: int = 1000) -> dict:
+    """Загружает записи выгрузки в новую базу и подменяет ею базу товаров
+
+    Args:
+        records: Итератор (номер строки, запись) - read_csv или read_jsonl
+        path (str): Путь к базе товаров, которую нужно заменить
+        batch (int): Сколько строк записывать одним executemany
+        transaction (int): Сколько строк записывать одной транзакцией
+        max_errors (int): Сколько неверных строк допускается; при превышении база не меняется
+
+    Returns:
+        dict: Отчет: rows, imported, rejected, duplicates, errors (первые неверные строки),
+              version, seconds, rows_per_second, peak_rss
+
+    Raises:
+        ValueError: Если неверных строк больше max_errors
+    """
+    started = time.perf_counter()
+    vocabulary = vocabularies()
+    version = _current_version(path) + 1
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(prefix=".catalog-import-", suffix=".db", dir=directory)
+    os.close(descriptor)
+    report = {"rows": 0, "imported": 0, "rejected": 0, "duplicates": 0, "errors": [], "version": version}
+    try:
+        conn = sqlite3.connect(temporary, isolation_level=None)
+        try:
+            # Файл временный: при сбое он удаляется, поэтому журнал транзакций не нужен
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA cache_size=-65536")
+            conn.execute(_PRODUCTS_TABLE)
+            insert = "INSERT OR IGNORE INTO products VALUES (?, ?, ?, ?, ?, ?)"
+            rows, pending = [], 0
+            conn.execute("BEGIN")
+            for row in _checked(records, vocabulary, report, max_errors):
+                rows.append(row)
+                if len(rows) >= batch:
+                    pending += _write(conn, insert, rows, report)
+                    if pending >= transaction:
+                        conn.execute("COMMIT")
+                        conn.execute("BEGIN")
+                        pending = 0
+                        logging.info(f"Импорт каталога: записано {report['imported']} товаров")
+            _write(conn, insert, rows, report)
+            conn.execute("COMMIT")
+
+            catalog_db.finish_bulk_load(conn, version)
+            try:
+                catalog_db.sync_search_titles(conn, search_titles(), transaction)
+            except sqlite3.OperationalError as e:
+                logging.error(f"Индекс поиска не построен, поиск по названию будет недоступен: {e}")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA optimize")
+        finally:
+            conn.close()
+        _fsync(temporary)
+        swap_in(temporary, path)
+    except BaseException:
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(temporary + suffix):
+                os.remove(temporary + suffix)
+        raise
+
+    report["seconds"] = time.perf_counter() - started
+    report["rows_per_second"] = report["rows"] / report["seconds"] if report["seconds"] else 0.0
+    report["peak_rss"] = _peak_rss()
+    return report
+
+
+def _checked(records, vocabulary: dict, report: dict, max_errors: int):
+    """Проверенные строки для products; неверные записи учитываются в отчете"""
+    for number, record in records:
+        report["rows"] += 1
+        try:
+            if isinstance(record, Exception):
+                raise ValueError(f"ошибка разбора: {record}")
+            row = validate(record, vocabulary)
+        except ValueError as e:
+            report["rejected"] += 1
+            if len(report["errors"]) < ERROR_SAMPLES:
+                report["errors"].append((number, str(e)))
+            if report["rejected"] > max_errors:
+                raise ValueError(f"Неверных строк больше {max_errors}, импорт прерван; "
+                                 f"первые ошибки: {report['errors']}")
+            continue
+        yield row
+
+
+def _write(conn: sqlite3.Connection, insert: str, rows: list, report: dict) -> int:
+    """Записывает порцию строк; строки с уже записанным id учитываются как повторы"""
+    if not rows:
+        return 0
+    before = conn.total_changes
+    conn.executemany(insert, rows)
+    written = conn.total_changes - before
+    report["imported"] += written
+    report["duplicates"] += len(rows) - written
+    count = len(rows)
+    rows.clear()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка каталога товаров из CSV или JSONL")
+    parser.add_argument("source", help="Файл выгрузки каталога (.csv или .jsonl)")
+    parser.add_argument("--db", default=catalog_pool.db_path(), help="База товаров, которую нужно заменить")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Формат файла (по расширению)")
+    parser.add_argument("--batch", type=int, default=IMPORT_BATCH, help="Строк в одном executemany")
+    parser.add_argument("--transaction", type=int, default=IMPORT_TRANSACTION, help="Строк в одной транзакции")
+    parser.add_argument("--max-errors", type=int, default=1000, help="Сколько неверных строк допускается")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    file_format = args.format or ("csv" if args.source.lower().endswith(".csv") else "jsonl")
+    reader = read_csv if file_format == "csv" else read_jsonl
+    try:
+        with open(args.source, encoding="utf-8", newline="") as file:
+            report = import_catalog(reader(file), args.db, batch=args.batch,
+                                    transaction=args.transaction, max_errors=args.max_errors)
+    except ValueError as e:
+        print(f"Ошибка импорта: {e}")
+        sys.exit(1)
+
+    print(f"Каталог загружен в {args.db} (версия {report['version']})")
+    print(f"Строк: {report['rows']}, загружено: {report['imported']}, "
+          f"отклонено: {report['rejected']}, повторяющихся id: {report['duplicates']}")
+    for number, error in report["errors"]:
+        print(f"  строка {number}: {error}")
+    print(f"Время: {report['seconds']:.1f} с, {report['rows_per_second']:,.0f} строк/с, "
+          f"пиковая память: {report['peak_rss'] / 1024 / 1024:.0f} МБ")
+
+
+if __name__ == "__main__":
+    main()
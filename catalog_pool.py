@@ -0,0 +1,157 @@
+# catalog_pool.py - Пул соединений с базой товаров для Telegram бота GoldenAppleBot
+# Обработчики рекомендаций раньше открывали новое соединение sqlite3.connect('recommendations.db')
+# на каждый запрос и выполняли запрос прямо в цикле событий: один медленный запрос
+# задерживал обработку обновлений всех пользователей.
+#
+# Как устроено:
+# - запросы выполняются в отдельном пуле потоков, у каждого потока свое соединение,
+#   открытое один раз; обработчик ждет результат через await и не блокирует цикл событий;
+# - соединения только читают базу и настроены для чтения: mmap_size (файл базы
+#   отображается в память), cache_size (кэш страниц), временные данные в памяти;
+#   база в режиме WAL (catalog_db.migrate), поэтому чтение не ждет записи;
+# - путь к базе не зависит от текущего каталога процесса: по умолчанию
+#   recommendations.db рядом с модулем;
+# - время каждого запроса попадает в гистограмму по имени запроса (метрики /metrics
+#   и /stats), медленные запросы записываются в лог.
+# - если файл базы заменили (импорт каталога catalog_import.py), соединения открыты
+#   на старый файл; перед каждым запросом поток сверяет файл и открывает соединение заново.
+
+import asyncio  # Для ожидания результата запроса
+import logging  # Для логирования медленных запросов
+import os  # Для пути к файлу базы и настроек
+import sqlite3  # База данных товаров
+import threading  # Соединение для каждого потока пула
+import time  # Для замера времени запросов
+from concurrent.futures import ThreadPoolExecutor  # Потоки для выполнения запросов
+
+from catalog_db import CatalogConnection, file_id  # Соединение с кэшем схемы products
+from metrics import HandlerStats  # Гистограмма задержек и счетчик ошибок
+
+# Путь к базе товаров по умолчанию - рядом с модулем, а не в текущем каталоге
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommendations.db")
+
+
+def db_path() -> str:
+    """Путь к базе товаров: CATALOG_DB_PATH или recommendations.db рядом с ботом"""
+    return os.getenv("CATALOG_DB_PATH") or DEFAULT_PATH
+
+
+def config_from_env() -> dict:
+    """Читает настройки пула из переменных окружения
+
+    Переменные окружения:
+        CATALOG_DB_PATH - путь к базе товаров (recommendations.db рядом с ботом)
+        CATALOG_POOL_SIZE - сколько запросов выполнять одновременно (4)
+        CATALOG_MMAP_SIZE - сколько байт файла базы отображать в память (256 МБ)
+        CATALOG_CACHE_SIZE - кэш страниц каждого соединения, КБ (65536)
+        CATALOG_SLOW_QUERY - запросы дольше этого времени пишутся в лог, секунд (0.1)
+
+    Returns:
+        dict: Параметры для CatalogPool
+    """
+    return {
+        "path": db_path(),
+        "size": int(os.getenv("CATALOG_POOL_SIZE", "4")),
+        "mmap_size": int(os.getenv("CATALOG_MMAP_SIZE", str(256 * 1024 * 1024))),
+        "cache_size": int(os.getenv("CATALOG_CACHE_SIZE", "65536")),
+        "slow_query": float(os.getenv("CATALOG_SLOW_QUERY", "0.1")),
+    }
+
+
+class CatalogPool:
+    """Пул соединений для чтения базы товаров с асинхронным интерфейсом
+
+    Пример:
+        ids = await pool.run("find_product_ids", catalog_db.find_product_ids, category, criteria)
+    Функция вызывается в потоке пула как func(conn, *args).
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, size: int = 4, mmap_size: int = 256 * 1024 * 1024,
+                 cache_size: int = 65536, slow_query: float = 0.1):
+        self.path = path
+        self.size = size
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.slow_query = slow_query
+
+        self.queries = {}  # {имя запроса: HandlerStats}
+        self._local = threading.local()
+        self._connections = []  # Все открытые соединения (для закрытия)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="catalog-sqlite")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение используется только в своем потоке пула;
+        # check_same_thread=False нужен только для закрытия в close()
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=CatalogConnection)
+        conn.execute("PRAGMA query_only=1")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        # Отрицательное значение - размер в КБ, а не в страницах
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def _reconnect(self):
+        """Закрывает соединение потока, открытое на замененный файл базы"""
+        conn = self._local.conn
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
+        self._local.conn = None
+        logging.info(f"Файл базы товаров {self.path} заменен, соединение открывается заново")
+
+    def _execute(self, func, args: tuple) -> tuple:
+        """Выполняет функцию в потоке пула; возвращает (результат, время, ошибка)"""
+        current = file_id(self.path)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.file_id != current:
+            self._reconnect()
+            conn = None
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            self._local.file_id = current
+        started = time.perf_counter()
+        try:
+            return func(conn, *args), time.perf_counter() - started, None
+        except Exception as e:
+            return None, time.perf_counter() - started, e
+
+    def _record(self, name: str, elapsed: float, error: Exception = None):
+        # Вызывается в потоке цикла событий, поэтому метрики обновляются без блокировок
+        stats = self.queries.get(name)
+        if stats is None:
+            stats = self.queries[name] = HandlerStats()
+        stats.latency.observe(elapsed)
+        if error is not None:
+            stats.errors += 1
+        if elapsed >= self.slow_query:
+            logging.warning(f"Медленный запрос к каталогу {name}: {elapsed * 1000:.1f} мс")
+
+    async def run(self, name: str, func, *args):
+        """Выполняет func(conn, *args) в потоке пула и возвращает результат
+
+        Args:
+            name (str): Имя запроса для метрик
+            func: Функция, принимающая соединение первым аргументом
+            *args: Остальные аргументы функции
+
+        Returns:
+            Результат func; исключение func пробрасывается вызывающему
+        """
+        loop = asyncio.get_running_loop()
+        result, elapsed, error = await loop.run_in_executor(self._executor, self._execute, func, args)
+        self._record(name, elapsed, error)
+        if error is not None:
+            raise error
+        return result
+
+    def close(self):
+        """Дожидается выполняемых запросов и закрывает соединения"""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
@@ -0,0 +1,302 @@
+# catalog_refresh.py - Обновление каталога товаров в памяти для Telegram бота GoldenAppleBot
+# Индекс атрибутов, битовые маски, массивы для случайного выбора и матрицы совпадения
+# критериев строились один раз при запуске; чтобы увидеть изменения в recommendations.db,
+# их приходилось перестраивать целиком, читая всю таблицу products.
+#
+# Как устроено:
+# - триггеры catalog_db записывают id каждого измененного товара в журнал product_changes;
+#   номер последней записи - версия каталога;
+# - CatalogSnapshot - согласованный набор структур каталога в памяти для одной версии.
+#   Снимок не меняется после создания: обновление строит новый снимок, в котором заново
+#   созданы только массивы затронутых ключей и категорий, остальное общее со старым;
+# - CatalogRefresher в фоне читает журнал после версии текущего снимка, загружает только
+#   измененные товары, строит новый снимок в отдельном потоке и подменяет ссылку на снимок
+#   одним присваиванием. Обработчик берет снимок один раз и работает с одной версией;
+# - счетчики товаров на кнопках критериев (facets.py) обновляются вместе с масками;
+# - снимок помнит, при какой версии менялась каждая категория (category_version):
+#   по ней кэш результатов (result_cache.py) сбрасывает только записи затронутых категорий;
+# - задержка обновления (от записи изменения в базу до появления его в снимке) попадает
+#   в гистограмму - метрика bot_catalog_refresh_lag_seconds в /metrics и /stats;
+# - если нужные записи журнала уже удалены (catalog_db.CHANGES_RETENTION) или файл базы
+#   заменен, каталог перестраивается целиком;
+# - если рядом с базой есть столбцовый снимок текущей версии (columnar_catalog.py),
+#   снимок строится по нему (CatalogSnapshot.from_columns) без чтения таблицы products:
+#   id товаров категорий и маски атрибутов остаются срезами файла, общими для процессов.
+
+import asyncio  # Фоновая задача обновления
+import itertools  # Номера полных перестроений снимка
+import logging  # Для логирования ошибок обновления
+import os  # Для настроек из переменных окружения
+import sqlite3  # База данных товаров
+import time  # Для замера задержки обновления
+from array import array  # Массивы id индекса атрибутов
+
+import numpy as np  # Рейтинги товаров по категориям
+
+import catalog_db  # Журнал изменений товаров
+from attribute_bits import AttributeBits, CategoryBits  # Битовые маски атрибутов
+from attribute_index import AttributeIndex  # Инвертированный индекс атрибутов
+from facets import FacetIndex  # Счетчики товаров по критериям
+from metrics import Histogram  # Гистограмма задержки обновления
+from relevance import RelevanceIndex  # Матрицы совпадения критериев
+from sampling import CatalogSampler  # Массивы для случайного выбора
+
+# Номера полных перестроений снимка: версии журнала разных файлов базы могут совпасть,
+# поэтому версия категории - пара (номер перестроения, версия журнала)
+_builds = itertools.count(1)
+
+
+def config_from_env() -> dict:
+    """Читает настройки обновления каталога из переменных окружения
+
+    Переменные окружения:
+        CATALOG_REFRESH_INTERVAL - как часто проверять журнал изменений, секунд (1.0)
+
+    Returns:
+        dict: Параметры для CatalogRefresher
+    """
+    return {"interval": float(os.getenv("CATALOG_REFRESH_INTERVAL", "1.0"))}
+
+
+def _align(ids, known_ids: np.ndarray, known_values: np.ndarray) -> np.ndarray:
+    """Значения для ids по отсортированным known_ids (для отсутствующих id - 0)"""
+    ids = np.asarray(ids, dtype=np.int64)
+    values = np.zeros(len(ids), dtype=np.float64)
+    if len(known_ids):
+        positions = np.minimum(np.searchsorted(known_ids, ids), len(known_ids) - 1)
+        found = known_ids[positions] == ids
+        values[found] = known_values[positions[found]]
+    return values
+
+
+class CatalogSnapshot:
+    """Неизменяемый набор структур каталога в памяти для одной версии журнала изменений"""
+
+    __slots__ = ("version", "index", "ratings", "bits", "sampler", "relevance", "file_id",
+                 "build_id", "category_versions", "facets")
+
+    def __init__(self, version: int, index: AttributeIndex, ratings: dict, bits: AttributeBits,
+                 sampler: CatalogSampler, relevance: RelevanceIndex, file_id: tuple = None,
+                 build_id: int = 0, category_versions: dict = None, facets: FacetIndex = None):
+        self.version = version  # Номер последней примененной записи журнала
+        self.index = index
+        self.ratings = ratings  # {категория: рейтинги в порядке index.categories[категория]}
+        self.bits = bits
+        self.sampler = sampler
+        self.relevance = relevance
+        self.file_id = file_id  # (устройство, inode) файла базы, по которому построен снимок
+        self.build_id = build_id  # Номер полного перестроения, от которого ведет начало снимок
+        # {категория: версия журнала, при которой менялись товары категории}
+        self.category_versions = category_versions if category_versions is not None else {}
+        # Счетчики товаров на кнопках критериев; без них строятся по маскам
+        self.facets = facets if facets is not None else FacetIndex.from_bits(bits)
+
+    def category_version(self, category: str) -> tuple:
+        """Версия, при которой последний раз менялись товары категории
+
+        Не меняется, пока изменения каталога не касаются категории; результаты,
+        вычисленные для категории, верны, пока ее версия та же.
+        """
+        return self.build_id, self.category_versions.get(category, 0)
+
+    @classmethod
+    def build(cls, path: str) -> "CatalogSnapshot":
+        """Строит снимок по всей базе товаров
+
+        Версия читается до таблиц: изменения, сделанные во время построения,
+        будут применены еще раз при следующем обновлении, что ничего не портит.
+
+        Args:
+            path (str): Путь к базе данных товаров
+
+        Returns:
+            CatalogSnapshot: Новый снимок
+        """
+        conn = sqlite3.connect(path)
+        try:
+            file_id = catalog_db.file_id(path)
+            version = catalog_db.latest_change(conn)
+            rows = conn.execute("SELECT id, rating FROM products ORDER BY id").fetchall()
+        finally:
+            conn.close()
+        known = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        known_ids, known_ratings = known[:, 0].astype(np.int64), known[:, 1]
+
+        index = AttributeIndex.from_db(path)
+        ratings = {category: _align(ids, known_ids, np.nan_to_num(known_ratings))
+                   for category, ids in index.categories.items()}
+        return cls(version, index, ratings, AttributeBits.from_index(index),
+                   CatalogSampler.from_index(index, ratings), RelevanceIndex.from_index(index, ratings),
+                   file_id, next(_builds), {category: version for category in index.categories})
+
+    @classmethod
+    def from_columns(cls, path: str, columns):
+        """Строит снимок по столбцовому снимку каталога без чтения таблицы products
+
+        Массивы id товаров и маски атрибутов в AttributeBits - срезы файла, отображенного
+        в память, общие для всех рабочих процессов; списки id индекса атрибутов, массивы
+        для случайного выбора и матрицы совпадения критериев каждый процесс строит у себя
+        по столбцам, без запросов к базе.
+
+        Args:
+            path (str): Путь к базе данных товаров
+            columns (ColumnarCatalog): Столбцовый снимок каталога (columnar_catalog.py)
+
+        Returns:
+            CatalogSnapshot: Новый снимок или None, если столбцовый снимок записан
+                             не по текущей версии базы
+        """
+        conn = sqlite3.connect(path)
+        try:
+            if not columns.is_current(conn, path):
+                return None
+        finally:
+            conn.close()
+        data = columns.columns
+        index, ratings, bits = AttributeIndex(), {}, AttributeBits()
+        for category, (start, end) in columns.ranges.items():
+            ids, masks = data["id"][start:end], data["attributes"][start:end]
+            index.categories[category] = array("q", ids.tobytes())
+            index.products += end - start
+            value_bits = columns.value_bits(category)
+            for (group, value), key_bits in value_bits.items():
+                found = ids[(masks & np.uint64(key_bits)) != 0]
+                if len(found):
+                    index.postings[(category, group, value)] = array("q", found.tobytes())
+            category_ratings = data["rating"][start:end]
+            ratings[category] = (np.nan_to_num(category_ratings) if np.isnan(category_ratings).any()
+                                 else category_ratings)
+            bits.categories[category] = CategoryBits.from_masks(
+                ids, masks, {key: np.uint64(key_bits) for key, key_bits in value_bits.items()})
+        return cls(columns.version, index, ratings, bits,
+                   CatalogSampler.from_index(index, ratings), RelevanceIndex.from_index(index, ratings),
+                   columns.file_id, next(_builds), {category: columns.version for category in index.categories})
+
+    def updated(self, changes: dict) -> "CatalogSnapshot":
+        """Возвращает новый снимок с примененными изменениями (catalog_db.read_changes)
+
+        Args:
+            changes (dict): Изменения после версии этого снимка
+
+        Returns:
+            CatalogSnapshot: Новый снимок; этот снимок не меняется
+        """
+        products = changes["products"]
+        changed = [product["id"] for product in products] + list(changes["deleted"])
+        index, categories = self.index.updated(changed, products)
+
+        new_ratings = {product["id"]: product.get("rating") or 0.0 for product in products}
+        ratings = dict(self.ratings)
+        for category in categories:
+            ids = index.categories.get(category)
+            if not ids:
+                ratings.pop(category, None)
+                continue
+            old_ids = self.index.categories.get(category)
+            if old_ids:
+                values = _align(ids, np.asarray(old_ids, dtype=np.int64), self.ratings[category])
+            else:
+                values = np.zeros(len(ids), dtype=np.float64)
+            ids = np.asarray(ids, dtype=np.int64)
+            updates = [product["id"] for product in products if product["category"] == category]
+            if updates:
+                values[np.searchsorted(ids, updates)] = [new_ratings[product_id] for product_id in updates]
+            ratings[category] = values
+
+        category_versions = dict(self.category_versions)
+        for category in categories:
+            category_versions[category] = changes["version"]
+
+        bits = self.bits.updated(index, categories)
+        return CatalogSnapshot(changes["version"], index, ratings, bits,
+                               self.sampler.updated(index, ratings, categories),
+                               self.relevance.updated(index, ratings, categories),
+                               self.file_id, self.build_id, category_versions,
+                               self.facets.updated(bits, categories))
+
+
+class CatalogRefresher:
+    """Фоновое применение журнала изменений к снимку каталога в памяти"""
+
+    def __init__(self, path: str, interval: float = 1.0, batch: int = catalog_db.CHANGES_BATCH):
+        self.path = path
+        self.interval = interval
+        self.batch = batch
+        self.snapshot = None  # Текущий снимок (None - каталог еще не прогрет)
+        self.lag = Histogram()  # Задержка от записи изменения до появления в снимке
+        self.refreshes = 0  # Сколько раз снимок обновлялся по журналу
+        self.full_reloads = 0  # Сколько раз снимок строился заново целиком
+        self.listeners = []  # Асинхронные функции, вызываемые после каждого обновления
+        self._task = None
+
+    def build(self, columns=None) -> CatalogSnapshot:
+        """Строит снимок по всей базе и делает его текущим (вызывается в потоке)
+
+        Args:
+            columns (ColumnarCatalog): Столбцовый снимок каталога; если он записан по текущей
+                                       версии базы, снимок строится по нему
+        """
+        snapshot = CatalogSnapshot.from_columns(self.path, columns) if columns is not None else None
+        self.snapshot = snapshot if snapshot is not None else CatalogSnapshot.build(self.path)
+        return self.snapshot
+
+    async def refresh(self, pool) -> int:
+        """Применяет к текущему снимку все накопленные изменения
+
+        Args:
+            pool (CatalogPool): Пул соединений для чтения журнала и измененных товаров
+
+        Returns:
+            int: Сколько записей журнала применено
+        """
+        applied = 0
+        while True:
+            snapshot = self.snapshot
+            if snapshot is None:
+                return applied
+            if catalog_db.file_id(self.path) != snapshot.file_id:
+                # Файл базы заменен (например, импортом каталога) - журнал другой базы
+                changes = {"version": None, "count": 0, "changed_at": None, "reset": True}
+            else:
+                changes = await pool.run("catalog_changes", catalog_db.read_changes,
+                                         snapshot.version, self.batch)
+            if changes["reset"]:
+                new = await asyncio.to_thread(CatalogSnapshot.build, self.path)
+                self.full_reloads += 1
+            elif changes["count"]:
+                new = await asyncio.to_thread(snapshot.updated, changes)
+                self.refreshes += 1
+            else:
+                return applied
+            if self.snapshot is not snapshot:
+                # Пока строился новый снимок, каталог перестроили целиком (warmup_catalog)
+                continue
+            # Подмена снимка - одно присваивание: обработчики видят либо старую, либо новую версию
+            self.snapshot = new
+            if changes["changed_at"] is not None:
+                self.lag.observe(max(time.time() - changes["changed_at"], 0.0))
+            applied += changes["count"]
+            for listener in self.listeners:
+                await listener(changes)
+            if changes["reset"] or changes["count"] < self.batch:
+                return applied
+
+    async def _run(self, pool):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh(pool)
+            except Exception as e:
+                logging.error(f"Ошибка обновления каталога в памяти: {e}")
+
+    def start(self, pool):
+        """Запускает фоновую проверку журнала изменений (в работающем цикле событий)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(pool))
+
+    async def stop(self):
+        """Останавливает фоновую проверку журнала изменений"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,377 @@
+# columnar_catalog.py - Столбцовый снимок каталога товаров в файле для Telegram бота GoldenAppleBot
+# RecommendationSystem.load_data создавал словарь Python на каждый товар (вместе со словарем
+# атрибутов, разобранным из JSON), и каждый рабочий процесс (sharding.py) держал свою
+# полную копию каталога и тратил время на ее загрузку при каждом запуске.
+#
+# Как устроено:
+# - снимок - один двоичный файл рядом с базой (recommendations.db.columns): заголовок JSON
+#   и массивы NumPy, выровненные по 64 байтам. Товары упорядочены по категории и id;
+#   столбцы: id, код категории, цена и рейтинг (NaN - нет значения), номер названия
+#   в таблице различных названий (смещения + UTF-8), маска атрибутов (бит на значение
+#   из словаря категории, как в attribute_bits.py) и маска групп, записанных списком;
+# - рядом хранятся id по возрастанию с номерами строк (поиск товара по id двоичным поиском)
+#   и порядки строк каждой категории по рейтингу и цене - в тех же порядках, что и
+#   rankings.py, поэтому первые K товаров - срез массива;
+# - рабочие процессы отображают файл в память только для чтения (mmap): открытие не
+#   читает файл целиком, а страницы файла в памяти общие для всех процессов через
+#   кэш ОС. Словари создаются только для товаров, которые нужно показать;
+# - снимок верен для одной версии базы: заголовок хранит версию журнала изменений
+#   и (устройство, inode) файла базы. Если база изменилась, снимок не используется
+#   (is_current), пока его не запишут заново;
+# - рабочие процессы строят по снимку и снимок каталога в памяти (catalog_refresh.py,
+#   CatalogSnapshot.from_columns) без чтения таблицы products: id товаров категорий и маски
+#   атрибутов - срезы файла, а словари показываемых товаров (recommendations.fetch_products)
+#   создаются из столбцов без запросов к базе, пока каталог не изменился;
+# - файл пишется во временный и подменяется одним os.replace, поэтому процессы,
+#   уже отобразившие старый файл, продолжают читать его без ошибок.
+#
+# Запуск: python columnar_catalog.py [--db recommendations.db] [--out recommendations.db.columns]
+
+import argparse  # Для разбора аргументов командной строки
+import heapq  # Слияние упорядоченных списков категорий
+import json  # Заголовок снимка и атрибуты товаров в базе
+import mmap  # Отображение файла снимка в память
+import os  # Для временного файла и подмены снимка
+import sqlite3  # База данных товаров
+import struct  # Длина заголовка
+import tempfile  # Временный файл нового снимка
+import time  # Для замера времени записи
+from itertools import islice  # Первые K товаров слияния
+
+import numpy as np  # Столбцы снимка
+
+import catalog_db  # Версия каталога и файл базы
+from rankings import ORDERS  # Ключи порядков товаров (для слияния категорий)
+
+# Сигнатура и версия формата файла
+MAGIC = b"GACOLS01"
+
+# Выравнивание массивов в файле, байт
+ALIGNMENT = 64
+
+# Расширение файла снимка рядом с базой товаров
+SUFFIX = ".columns"
+
+# Столбцы таблицы products, которые хранит снимок; если в таблице есть другие столбцы,
+# словари товаров снимка неполные и товары загружаются из базы
+PRODUCT_COLUMNS = ("id", "name", "category", "price", "rating", "attributes")
+
+
+def snapshot_path(db_path: str) -> str:
+    """Путь к снимку базы товаров: CATALOG_COLUMNS_PATH или файл рядом с базой"""
+    return os.getenv("CATALOG_COLUMNS_PATH") or db_path + SUFFIX
+
+
+def _value_key(value) -> str:
+    # Значения атрибутов - строки или числа из JSON; ключ различает 1 и "1"
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _orders(ids: np.ndarray, prices: np.ndarray, ratings: np.ndarray) -> dict:
+    """Порядки строк категории, как ключи rankings.ORDERS (при равенстве - по id)"""
+    price = np.nan_to_num(prices)
+    no_price = np.isnan(prices)
+    return {
+        "rating": np.lexsort((ids, -np.nan_to_num(ratings))),
+        "price": np.lexsort((ids, price, no_price)),
+        "price_desc": np.lexsort((ids, -price, no_price)),
+    }
+
+
+def write(db_path: str, out_path: str) -> dict:
+    """Записывает столбцовый снимок базы товаров
+
+    Args:
+        db_path (str): Путь к базе данных товаров
+        out_path (str): Путь к файлу снимка; заменяется одной операцией
+
+    Returns:
+        dict: {"products": товаров, "bytes": размер файла, "seconds": время записи}
+
+    Raises:
+        ValueError: Если в словаре атрибутов категории больше 64 значений
+    """
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        file_id = catalog_db.file_id(db_path)
+        version = catalog_db.latest_change(conn)
+        product_columns = catalog_db.product_layout(conn).columns
+        # Товары без категории не попадают ни в одну категорию и в снимок не записываются
+        rows = conn.execute("SELECT id, name, category, price, rating, attributes FROM products "
+                            "WHERE category IS NOT NULL ORDER BY category, id").fetchall()
+    finally:
+        conn.close()
+
+    categories, ranges = [], {}
+    names, name_codes = {}, []
+    vocabularies = {}  # {категория: {(группа, ключ значения): номер бита}}
+    groups = {}  # {категория: {группа: номер группы}}
+    values = {}  # {категория: [[группа, значение], ...] в порядке битов}
+    attribute_masks, list_masks, category_codes = [], [], []
+    for row, (product_id, name, category, price, rating, attributes_json) in enumerate(rows):
+        if category not in ranges:
+            categories.append(category)
+            ranges[category] = [row, row]
+            vocabularies[category], groups[category], values[category] = {}, {}, []
+        ranges[category][1] = row + 1
+        category_codes.append(len(categories) - 1)
+        name_codes.append(names.setdefault(name or "", len(names)))
+
+        try:
+            attributes = json.loads(attributes_json) if attributes_json else {}
+        except json.JSONDecodeError:
+            attributes = {}
+        vocabulary, category_groups = vocabularies[category], groups[category]
+        mask = listed = 0
+        for group, group_values in attributes.items():
+            group_number = category_groups.setdefault(group, len(category_groups))
+            if isinstance(group_values, list):
+                listed |= 1 << group_number
+            else:
+                group_values = [group_values]
+            for value in group_values:
+                bit = vocabulary.get((group, _value_key(value)))
+                if bit is None:
+                    bit = vocabulary[(group, _value_key(value))] = len(vocabulary)
+                    values[category].append([group, value])
+                mask |= 1 << bit
+        if len(vocabulary) > 64 or len(category_groups) > 64:
+            raise ValueError(f"Слишком много значений атрибутов категории {category} для битовой маски")
+        attribute_masks.append(mask)
+        list_masks.append(listed)
+
+    count = len(rows)
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    prices = np.array([np.nan if row[3] is None else row[3] for row in rows], dtype=np.float64)
+    ratings = np.array([np.nan if row[4] is None else row[4] for row in rows], dtype=np.float64)
+    encoded = [name.encode("utf-8") for name in names]
+    name_offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+    by_id = np.argsort(ids, kind="stable").astype(np.uint32)
+
+    arrays = {
+        "id": ids,
+        "category": np.array(category_codes, dtype=np.uint8 if len(categories) <= 256 else np.uint16),
+        "price": prices,
+        "rating": ratings,
+        "name": np.array(name_codes, dtype=np.uint32),
+        "name_offsets": name_offsets,
+        "name_data": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "attributes": np.array(attribute_masks, dtype=np.uint64),
+        "lists": np.array(list_masks, dtype=np.uint64),
+        "sorted_id": ids[by_id],
+        "by_id": by_id,
+    }
+    for order in ORDERS:
+        arrays[f"order_{order}"] = np.zeros(count, dtype=np.uint32)
+    for category, (start, end) in ranges.items():
+        for order, positions in _orders(ids[start:end], prices[start:end], ratings[start:end]).items():
+            arrays[f"order_{order}"][start:end] = positions + start
+
+    header = {
+        "version": version,
+        "file_id": list(file_id) if file_id else None,
+        "columns": list(product_columns),
+        "products": count,
+        "categories": categories,
+        "ranges": ranges,
+        "values": values,
+        "groups": {category: list(category_groups) for category, category_groups in groups.items()},
+        "arrays": {},
+    }
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = [offset, array.dtype.str, len(array)]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    directory = os.path.dirname(os.path.abspath(out_path))
+    descriptor, temp_path = tempfile.mkstemp(prefix=".columns-", dir=directory)
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(MAGIC)
+            file.write(struct.pack("<Q", len(header_bytes)))
+            file.write(header_bytes)
+            for name, array in arrays.items():
+                file.seek(data_start + header["arrays"][name][0])
+                file.write(np.ascontiguousarray(array).tobytes())
+            file.truncate(data_start + offset)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, out_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return {"products": count, "bytes": os.path.getsize(out_path),
+            "seconds": time.perf_counter() - started}
+
+
+class ColumnarCatalog:
+    """Снимок каталога, отображенный в память только для чтения"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Путь к файлу снимка (columnar_catalog.write)
+
+        Raises:
+            ValueError: Если файл не является снимком каталога
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.opened_file = (stat.st_dev, stat.st_ino)  # Файл, который отображен (до подмены снимка)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} не является снимком каталога")
+        header_size, = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        header_end = len(MAGIC) + 8 + header_size
+        header = json.loads(self._mmap[len(MAGIC) + 8:header_end].decode("utf-8"))
+        data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+
+        self.version = header["version"]  # Версия журнала изменений, по которой записан снимок
+        self.file_id = tuple(header["file_id"]) if header["file_id"] else None
+        # Словари товаров совпадают со строками products (в таблице нет других столбцов)
+        self.complete = tuple(header.get("columns") or ()) == PRODUCT_COLUMNS
+        self.categories = header["categories"]
+        self.ranges = {category: tuple(bounds) for category, bounds in header["ranges"].items()}
+        self.values = {category: [tuple(value) for value in values]
+                       for category, values in header["values"].items()}
+        self.groups = header["groups"]
+        self.columns = {}  # {имя: массив NumPy поверх отображенного файла}
+        for name, (offset, dtype, length) in header["arrays"].items():
+            self.columns[name] = np.frombuffer(self._mmap, dtype=np.dtype(dtype), count=length,
+                                               offset=data_start + offset)
+
+    def __len__(self) -> int:
+        return len(self.columns["id"])
+
+    def is_current(self, conn: sqlite3.Connection, db_path: str) -> bool:
+        """Записан ли снимок по текущей версии базы товаров
+
+        Args:
+            conn (sqlite3.Connection): Соединение с базой товаров
+            db_path (str): Путь к базе товаров
+
+        Returns:
+            bool: True, если файл базы тот же и журнал изменений не продвинулся
+        """
+        return self.file_id == catalog_db.file_id(db_path) and catalog_db.latest_change(conn) == self.version
+
+    def value_bits(self, category: str) -> dict:
+        """Биты масок атрибутов категории по ключам индекса атрибутов
+
+        Ключ - (группа, значение текстом), как в таблице product_attributes
+        (CAST значения JSON AS TEXT: true - "1", false - "0"); значения null, списки
+        и объекты в индекс не попадают. Значения с одинаковым текстом (1 и "1")
+        дают один ключ с несколькими битами.
+
+        Args:
+            category (str): Категория товаров
+
+        Returns:
+            dict: {(группа, значение): биты}
+        """
+        keys = {}
+        for bit, (group, value) in enumerate(self.values.get(category, ())):
+            if value is None or isinstance(value, (list, dict)):
+                continue
+            text = ("1" if value else "0") if isinstance(value, bool) else str(value)
+            keys[(group, text)] = keys.get((group, text), 0) | 1 << bit
+        return keys
+
+    def _name(self, code: int) -> str:
+        offsets = self.columns["name_offsets"]
+        return bytes(self.columns["name_data"][offsets[code]:offsets[code + 1]]).decode("utf-8")
+
+    def product(self, row: int) -> dict:
+        """Словарь товара строки row - в том же виде, что в RecommendationSystem
+
+        Значения группы, записанной списком, перечисляются в порядке словаря категории.
+        """
+        columns = self.columns
+        category = self.categories[int(columns["category"][row])]
+        mask, listed = int(columns["attributes"][row]), int(columns["lists"][row])
+        attributes = {}
+        for bit, (group, value) in enumerate(self.values[category]):
+            if mask >> bit & 1:
+                attributes.setdefault(group, []).append(value)
+        for number, group in enumerate(self.groups[category]):
+            if group in attributes and not listed >> number & 1:
+                attributes[group] = attributes[group][0]
+        price, rating = float(columns["price"][row]), float(columns["rating"][row])
+        return {
+            "id": int(columns["id"][row]),
+            "name": self._name(int(columns["name"][row])),
+            "category": category,
+            "price": None if price != price else price,
+            "rating": None if rating != rating else rating,
+            "attributes": attributes,
+        }
+
+    def products(self, rows) -> list:
+        """Словари товаров строк rows"""
+        return [self.product(int(row)) for row in rows]
+
+    def get(self, product_id: int):
+        """Словарь товара по id или None"""
+        sorted_id = self.columns["sorted_id"]
+        position = int(np.searchsorted(sorted_id, product_id))
+        if position == len(sorted_id) or sorted_id[position] != product_id:
+            return None
+        return self.product(int(self.columns["by_id"][position]))
+
+    def top(self, category, order: str, limit: int) -> list:
+        """Первые limit товаров категории в заданном порядке (как ProductRankings.top)
+
+        Args:
+            category (str): Категория товаров; None - все категории
+            order (str): Порядок из rankings.ORDERS ("rating", "price", "price_desc")
+            limit (int): Сколько товаров вернуть
+
+        Returns:
+            list: Словари товаров
+        """
+        ordered = self.columns[f"order_{order}"]
+        if category:
+            bounds = self.ranges.get(category)
+            if bounds is None:
+                return []
+            return self.products(ordered[bounds[0]:min(bounds[1], bounds[0] + limit)])
+        lists = [self.products(ordered[start:min(end, start + limit)]) for start, end in self.ranges.values()]
+        return list(islice(heapq.merge(*lists, key=ORDERS[order]), limit))
+
+    def memory_size(self) -> int:
+        """Размер отображенного файла в байтах"""
+        return len(self._mmap)
+
+    def close(self):
+        """Закрывает отображение файла (массивы снимка после этого использовать нельзя)"""
+        self.columns = {}
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Массивы еще используются - отображение закроется вместе с ними
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запись столбцового снимка каталога товаров")
+    parser.add_argument("--db", default=None, help="База товаров (CATALOG_DB_PATH или recommendations.db)")
+    parser.add_argument("--out", default=None, help="Файл снимка (CATALOG_COLUMNS_PATH или <база>.columns)")
+    args = parser.parse_args()
+
+    import catalog_pool
+    db_path = args.db or catalog_pool.db_path()
+    out_path = args.out or snapshot_path(db_path)
+    report = write(db_path, out_path)
+    print(f"Снимок {out_path}: {report['products']} товаров, {report['bytes'] / 1024 / 1024:.1f} МБ "
+          f"(база {os.path.getsize(db_path) / 1024 / 1024:.1f} МБ), записан за {report['seconds']:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# facets.py - Счетчики товаров на кнопках критериев для Telegram бота GoldenAppleBot
+# Клавиатура критериев показывала все значения из ProductCategories, даже если с ними
+# не нашлось бы ни одного товара: пользователь попадал в тупик и тратил еще одно
+# редактирование сообщения и запрос к каталогу. Теперь рядом с каждой кнопкой видно,
+# сколько товаров подойдет, если нажать ее при текущем выборе.
+#
+# Как устроено:
+# - у товаров категории немного различных наборов атрибутов: маски AttributeBits
+#   сжимаются в массив различных масок и число товаров с каждой маской
+#   (сотни элементов вместо 100 000 товаров категории);
+# - счетчик кнопки - сумма чисел товаров по маскам, которые подходят под выбор с
+#   переключенным критерием (ИЛИ внутри группы, И между группами, как в AttributeBits);
+#   ограничения остальных групп считаются один раз на группу;
+# - при обновлении каталога (CatalogSnapshot.updated) счетчики строятся заново только
+#   для затронутых категорий, остальные общие со старым снимком; запросов к базе нет.
+
+import numpy as np  # Массивы масок и векторные операции
+
+from attribute_index import parse_criterion  # Разбор критерия "группа_значение"
+
+
+class CategoryFacets:
+    """Различные маски атрибутов товаров одной категории и число товаров с каждой"""
+
+    __slots__ = ("masks", "counts", "bits", "groups")
+
+    def __init__(self, category_bits):
+        """
+        Args:
+            category_bits (CategoryBits): Маски атрибутов товаров категории
+        """
+        masks, counts = np.unique(category_bits.masks, return_counts=True)
+        self.masks = masks
+        self.counts = counts.astype(np.int64)
+        self.bits = {key: int(bit) for key, bit in category_bits.bits.items()}  # {(группа, значение): бит}
+        self.groups = {}  # {группа: [(значение, бит)]}
+        for (group, value), bit in sorted(self.bits.items()):
+            self.groups.setdefault(group, []).append((value, bit))
+
+    def _selected(self, criteria: list) -> dict:
+        # Биты выбранных значений по группам; неизвестное значение не добавляет битов
+        masks = {}
+        for criterion in criteria:
+            group, value = parse_criterion(criterion)
+            masks[group] = masks.get(group, 0) | self.bits.get((group, value), 0)
+        return masks
+
+    def _hits(self, mask: int) -> np.ndarray:
+        # Какие различные маски содержат хотя бы один бит mask
+        return (self.masks & self.masks.dtype.type(mask)) != 0
+
+    def count(self, criteria: list) -> int:
+        """Сколько товаров категории подходит под критерии"""
+        allowed = np.ones(len(self.masks), dtype=bool)
+        for mask in self._selected(criteria).values():
+            allowed &= self._hits(mask)
+        return int(self.counts[allowed].sum())
+
+    def toggle_counts(self, criteria: list) -> dict:
+        """Сколько товаров подойдет, если переключить каждый критерий категории
+
+        Для невыбранного критерия - после его добавления, для выбранного - после снятия.
+
+        Args:
+            criteria (list): Выбранные критерии в формате "группа_значение"
+
+        Returns:
+            dict: {критерий: число товаров}
+        """
+        selected = self._selected(criteria)
+        hits = {group: self._hits(mask) for group, mask in selected.items()}
+        chosen = {}  # {группа: выбранные значения}
+        for criterion in criteria:
+            group, value = parse_criterion(criterion)
+            chosen.setdefault(group, set()).add(value)
+        result = {}
+        for group, values in self.groups.items():
+            # Товары, подходящие под выбор в остальных группах
+            weights = self.counts
+            for other, hit in hits.items():
+                if other != group:
+                    weights = np.where(hit, weights, 0)
+            current = selected.get(group, 0)
+            unrestricted = None
+            for value, bit in values:
+                if chosen.get(group, set()) == {value}:
+                    # Снят единственный выбранный критерий группы - группа не ограничивает выбор
+                    if unrestricted is None:
+                        unrestricted = int(weights.sum())
+                    result[f"{group}_{value}"] = unrestricted
+                else:
+                    mask = current ^ bit
+                    result[f"{group}_{value}"] = int(weights[self._hits(mask)].sum()) if mask else 0
+        return result
+
+    def memory_size(self) -> int:
+        """Объем массивов категории в байтах"""
+        return self.masks.nbytes + self.counts.nbytes
+
+
+class FacetIndex:
+    """Счетчики товаров по критериям для категорий каталога"""
+
+    def __init__(self):
+        self.categories = {}  # {категория: CategoryFacets}
+
+    def count(self, category: str, criteria: list):
+        """Число товаров категории, подходящих под критерии, или None, если счетчиков нет"""
+        entry = self.categories.get(category)
+        if entry is None:
+            return None
+        return entry.count(criteria)
+
+    def toggle_counts(self, category: str, criteria: list):
+        """Счетчики кнопок критериев категории (CategoryFacets.toggle_counts) или None"""
+        entry = self.categories.get(category)
+        if entry is None:
+            return None
+        return entry.toggle_counts(criteria)
+
+    def memory_size(self) -> int:
+        """Объем массивов всех категорий в байтах"""
+        return sum(entry.memory_size() for entry in self.categories.values())
+
+    @classmethod
+    def from_bits(cls, attribute_bits) -> "FacetIndex":
+        """Строит счетчики по маскам атрибутов всех категорий
+
+        Args:
+            attribute_bits (AttributeBits): Маски атрибутов
+
+        Returns:
+            FacetIndex: Счетчики по категориям
+        """
+        return cls().updated(attribute_bits, attribute_bits.categories)
+
+    def updated(self, attribute_bits, categories) -> "FacetIndex":
+        """Возвращает копию, в которой счетчики указанных категорий построены заново
+
+        Счетчики остальных категорий общие со старой копией; старая копия не меняется.
+        Категории без масок (словарь не помещается в 64 бита) пропускаются.
+
+        Args:
+            attribute_bits (AttributeBits): Маски атрибутов новой версии каталога
+            categories: Категории, которых коснулись изменения
+
+        Returns:
+            FacetIndex: Новые счетчики
+        """
+        facets = FacetIndex()
+        facets.categories = dict(self.categories)
+        for category in categories:
+            facets.categories.pop(category, None)
+            entry = attribute_bits.categories.get(category)
+            if entry is not None and len(entry.ids):
+                facets.categories[category] = CategoryFacets(entry)
+        return facets
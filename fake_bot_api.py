@@ -0,0 +1,215 @@
+# fake_bot_api.py - Локальная замена Telegram Bot API для нагрузочного тестирования
+# Сервер реализует методы Bot API, которые использует бот (getUpdates, sendMessage,
+# editMessageText, answerCallbackQuery и т.д.), хранит очередь обновлений для бота
+# и записывает все вызовы API, чтобы нагрузочный тест мог дождаться ответа бота
+# и посчитать количество вызовов на пользователя.
+#
+# Бот подключается к серверу через переменную окружения TELEGRAM_API_URL:
+#     python fake_bot_api.py --port 8081
+#     TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=123456:TEST python main.py
+
+import argparse  # Для разбора аргументов командной строки
+import asyncio  # Для long polling и ожидания ответов бота
+import json  # Для разбора reply_markup и других JSON-параметров
+import time  # Для дат сообщений
+from collections import Counter, defaultdict  # Для подсчета вызовов
+
+from aiohttp import web  # HTTP-сервер
+
+# Методы, которыми бот отвечает пользователю (по ним нагрузочный тест понимает,
+# что обновление обработано)
+REPLY_METHODS = {"sendMessage", "editMessageText", "editMessageReplyMarkup"}
+
+# Пользователь, от имени которого работает бот
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "GoldenAppleBot", "username": "golden_apple_test_bot"}
+
+
+class FakeBotAPI:
+    """Состояние поддельного Bot API: очередь обновлений, сообщения и журнал вызовов"""
+
+    def __init__(self):
+        self._updates = []  # Обновления, еще не подтвержденные ботом через offset
+        self._new_updates = asyncio.Event()  # Сигнал для ожидающего getUpdates
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._waiters = defaultdict(list)  # Ожидающие ответа бота: {chat_id: [Future]}
+        self._callback_users = {}  # {callback_query_id: user_id}
+
+        self.calls = Counter()  # Количество вызовов по методам
+        self.calls_by_chat = Counter()  # Количество вызовов по чатам
+        self.polling_started = asyncio.Event()  # Бот вызвал getUpdates хотя бы раз
+
+    # --- Формирование обновлений ---
+
+    def _message(self, chat_id: int, text: str, from_user: dict = None, message_id: int = None) -> dict:
+        if message_id is None:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "text": text,
+        }
+        if from_user:
+            message["from"] = from_user
+        return message
+
+    @staticmethod
+    def make_user(user_id: int) -> dict:
+        """Формирует пользователя Telegram для обновлений"""
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def push_update(self, update: dict) -> int:
+        """Ставит обновление в очередь getUpdates и возвращает его update_id"""
+        update["update_id"] = self._next_update_id
+        self._next_update_id += 1
+        self._updates.append(update)
+        self._new_updates.set()
+        return update["update_id"]
+
+    def push_message(self, user_id: int, text: str) -> int:
+        """Отправляет боту текстовое сообщение от пользователя"""
+        user = self.make_user(user_id)
+        return self.push_update({"message": self._message(user_id, text, from_user=user)})
+
+    def push_callback(self, user_id: int, data: str, message_id: int) -> int:
+        """Отправляет боту нажатие inline-кнопки под сообщением message_id"""
+        callback_id = f"{user_id}:{self._next_update_id}"
+        self._callback_users[callback_id] = user_id
+        message = self._message(user_id, "", from_user=BOT_USER, message_id=message_id)
+        return self.push_update({"callback_query": {
+            "id": callback_id,
+            "from": self.make_user(user_id),
+            "chat_instance": str(user_id),
+            "message": message,
+            "data": data,
+        }})
+
+    def expect_reply(self, chat_id: int) -> asyncio.Future:
+        """Возвращает Future, который завершится при следующем ответе бота в чат
+
+        Результат - словарь с методом и ID сообщения. Future нужно получить до
+        отправки обновления, чтобы не пропустить быстрый ответ.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id].append(future)
+        return future
+
+    # --- Обработка вызовов API ---
+
+    def _record(self, method: str, chat_id=None):
+        self.calls[method] += 1
+        if chat_id is not None:
+            self.calls_by_chat[chat_id] += 1
+
+    def _notify(self, chat_id: int, method: str, message_id: int):
+        waiters = self._waiters.get(chat_id)
+        if not waiters:
+            return
+        future = waiters.pop(0)
+        if not waiters:
+            del self._waiters[chat_id]
+        if not future.done():
+            future.set_result({"method": method, "message_id": message_id})
+
+    async def get_updates(self, params: dict):
+        self.polling_started.set()
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+
+        # Обновления с id меньше offset подтверждены ботом
+        if offset:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    async def call(self, method: str, params: dict):
+        """Выполняет метод Bot API и возвращает его результат"""
+        if method == "getUpdates":
+            self._record(method)
+            return await self.get_updates(params)
+
+        chat_id = params.get("chat_id")
+        chat_id = int(chat_id) if chat_id not in (None, "") else None
+
+        if method == "answerCallbackQuery":
+            self._record(method, self._callback_users.pop(params.get("callback_query_id"), None))
+            return True
+
+        self._record(method, chat_id)
+
+        if method == "getMe":
+            return BOT_USER
+        if method == "sendMessage":
+            message = self._message(chat_id, params.get("text", ""), from_user=BOT_USER)
+            self._notify(chat_id, method, message["message_id"])
+            return message
+        if method in ("editMessageText", "editMessageReplyMarkup"):
+            message_id = int(params.get("message_id") or 0)
+            message = self._message(chat_id, params.get("text", ""), from_user=BOT_USER, message_id=message_id)
+            self._notify(chat_id, method, message_id)
+            return message
+        if method == "getChat":
+            return {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}
+        if method == "getChatMember":
+            return {"status": "member", "user": self.make_user(int(params.get("user_id") or 0))}
+        # setMyCommands, deleteWebhook, setWebhook, deleteMessage и прочие методы
+        return True
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """HTTP-обработчик запросов вида /bot<token>/<method>"""
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+            if request.query:
+                params.update(request.query)
+        # Сложные параметры (reply_markup, allowed_updates) передаются строкой JSON
+        for key, value in params.items():
+            if isinstance(value, str) and value[:1] in "[{":
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    pass
+
+        result = await self.call(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    def make_app(self) -> web.Application:
+        """Создает aiohttp-приложение сервера"""
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+
+async def start_server(api: FakeBotAPI, host: str = "127.0.0.1", port: int = 8081) -> web.AppRunner:
+    """Запускает сервер поддельного Bot API и возвращает runner для остановки"""
+    runner = web.AppRunner(api.make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+
+    async def serve():
+        await start_server(FakeBotAPI(), args.host, args.port)
+        print(f"Поддельный Bot API: http://{args.host}:{args.port}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -15,12 +15,15 @@ import order_status
 import how_to_order
 import gift_cards
 import missing_card
+import webhook
+import update_executor
 import support
 import recommendations
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # polling или webhook
 OPERATOR_CHAT_ID = int(os.getenv('SUPPORT_CHAT_ID'))
 
 # Проверяем наличие токена
@@ -49,7 +52,7 @@ async def main():
         how_to_order.register_handlers(dp)
         gift_cards.register_handlers(dp)
         missing_card.register_handlers(dp)
-        recommendations.register_handlers(dp)
+        recommendations.register_handlers(dp, OPERATOR_CHAT_ID)
         
         # Регистрация обработчиков поддержки
         print(f"OPERATOR_CHAT_ID={OPERATOR_CHAT_ID}")
@@ -57,7 +60,10 @@ async def main():
         
         # Запускаем бота
         print("Бот запущен!")
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if BOT_MODE == 'webhook':
+            await webhook.run_webhook(dp, bot, **webhook.config_from_env())
+        else:
+            await update_executor.run_polling(dp, bot)
     except Exception as e:
         logging.error(f"Ошибка при инициализации обработчиков: {e}")
         raise
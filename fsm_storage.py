@@ -0,0 +1,245 @@
+# fsm_storage.py - Хранилище состояний FSM в SQLite для Telegram бота GoldenAppleBot
+# В отличие от MemoryStorage, состояния пользователей (мастер подбора рекомендаций,
+# чат поддержки, подтверждение отмены заказа) переживают перезапуск бота.
+#
+# Как устроено:
+# - последние использованные записи хранятся в памяти (LRU), поэтому get_state/get_data
+#   для активных пользователей не обращаются к диску, а память ограничена cache_size записями;
+# - изменения не пишутся на диск сразу: они копятся и раз в flush_interval записываются
+#   одной транзакцией (group commit). Несколько изменений одного пользователя за это
+#   время превращаются в одну запись;
+# - вся работа с SQLite выполняется в отдельном потоке и не блокирует цикл событий;
+# - база в режиме WAL, пустые записи (после state.clear()) удаляются.
+#
+# При аварийном завершении процесса теряются изменения не более чем за flush_interval.
+# При обычной остановке (dp.emit_shutdown -> close) все изменения записываются.
+
+import asyncio  # Для фоновой записи и ожидания загрузки
+import json  # Для сериализации данных состояния
+import logging  # Для логирования ошибок
+import os  # Для пути к файлу базы
+import sqlite3  # База данных
+import time  # Для времени изменения записей
+from collections import OrderedDict  # LRU-кэш записей
+from concurrent.futures import ThreadPoolExecutor  # Поток для работы с SQLite
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+# Путь к базе состояний по умолчанию - рядом с модулем, а не в текущем каталоге
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fsm.db")
+
+# Отметка удаления записи в очереди записи на диск
+_DELETED = object()
+
+
+def config_from_env() -> dict:
+    """Читает настройки хранилища из переменных окружения
+
+    Переменные окружения:
+        FSM_DB_PATH - путь к файлу базы состояний (fsm.db рядом с ботом)
+        FSM_CACHE_SIZE - сколько записей держать в памяти (10000)
+        FSM_FLUSH_INTERVAL - как часто записывать изменения на диск, секунд (0.1)
+
+    Returns:
+        dict: Параметры для SQLiteStorage
+    """
+    return {
+        "path": os.getenv("FSM_DB_PATH") or DEFAULT_PATH,
+        "cache_size": int(os.getenv("FSM_CACHE_SIZE", "10000")),
+        "flush_interval": float(os.getenv("FSM_FLUSH_INTERVAL", "0.1")),
+    }
+
+
+def _key(key: StorageKey) -> str:
+    """Строковый ключ записи в базе"""
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+class _Record:
+    """Запись хранилища: состояние и данные пользователя"""
+
+    __slots__ = ("state", "data")
+
+    def __init__(self, state: Optional[str] = None, data: Dict[str, Any] = None):
+        self.state = state
+        self.data = data if data is not None else {}
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в SQLite с LRU-кэшем и отложенной групповой записью"""
+
+    def __init__(self, path: str = DEFAULT_PATH, cache_size: int = 10000,
+                 flush_interval: float = 0.1):
+        self.path = path
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+
+        self._cache = OrderedDict()  # LRU: {ключ: _Record}
+        self._dirty = {}  # Измененные, но еще не записанные: {ключ: _Record или _DELETED}
+        self._writing = {}  # Записываемые сейчас (на случай чтения во время записи)
+        self._loading = {}  # Загружаемые сейчас из базы: {ключ: Future}
+        self._flush_task = None
+        self._flush_wakeup = None
+
+        # Одно соединение и один поток: все обращения к SQLite идут через него
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self._conn = self._executor.submit(self._connect).result()
+
+        self.reads = 0  # Сколько раз запись пришлось читать с диска
+        self.flushes = 0  # Сколько транзакций записи выполнено
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # В режиме WAL synchronous=NORMAL сохраняет целостность базы при сбое
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Несколько рабочих процессов (sharding.py) могут писать в одну базу
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        conn.commit()
+        return conn
+
+    # --- Работа с кэшем ---
+
+    async def _record(self, key: StorageKey) -> _Record:
+        """Возвращает запись из кэша, при необходимости загружая ее из базы"""
+        db_key = _key(key)
+        record = self._cache.get(db_key)
+        if record is not None:
+            self._cache.move_to_end(db_key)
+            return record
+
+        # Запись могла быть вытеснена из кэша, но еще не записана на диск
+        pending = self._dirty.get(db_key, self._writing.get(db_key))
+        if pending is not None:
+            record = _Record() if pending is _DELETED else pending
+        else:
+            loading = self._loading.get(db_key)
+            if loading is None:
+                loading = self._loading[db_key] = asyncio.ensure_future(self._load(db_key))
+                loading.add_done_callback(lambda _: self._loading.pop(db_key, None))
+            record = await loading
+            # Пока запись загружалась, ее могли создать другие вызовы
+            cached = self._cache.get(db_key)
+            if cached is not None:
+                return cached
+
+        self._remember(db_key, record)
+        return record
+
+    async def _load(self, db_key: str) -> _Record:
+        self.reads += 1
+        loop = asyncio.get_running_loop()
+        row = await loop.run_in_executor(self._executor, self._select, db_key)
+        if row is None:
+            return _Record()
+        state, data = row
+        return _Record(state, json.loads(data))
+
+    def _select(self, db_key: str):
+        return self._conn.execute("SELECT state, data FROM fsm WHERE key = ?", (db_key,)).fetchone()
+
+    def _remember(self, db_key: str, record: _Record):
+        self._cache[db_key] = record
+        if len(self._cache) > self.cache_size:
+            # Вытесняем самую давно использованную запись; если она изменена,
+            # она остается в _dirty до записи на диск
+            self._cache.popitem(last=False)
+
+    def _mark_dirty(self, key: StorageKey, record: _Record):
+        empty = record.state is None and not record.data
+        self._dirty[_key(key)] = _DELETED if empty else record
+        if self._flush_task is None:
+            self._flush_wakeup = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        self._flush_wakeup.set()
+
+    # --- Отложенная запись ---
+
+    async def _flush_loop(self):
+        """Фоновая задача: раз в flush_interval записывает накопленные изменения"""
+        while True:
+            await self._flush_wakeup.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._flush_wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка при записи состояний FSM: {e}")
+
+    async def flush(self):
+        """Записывает все накопленные изменения одной транзакцией"""
+        if not self._dirty:
+            return
+        self._writing, self._dirty = self._dirty, {}
+        # Сериализуем в потоке цикла событий: данные записей меняются только в нем
+        now = time.time()
+        upserts, deletes = [], []
+        for db_key, record in self._writing.items():
+            if record is _DELETED:
+                deletes.append((db_key,))
+            else:
+                upserts.append((db_key, record.state, json.dumps(record.data, ensure_ascii=False), now))
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._write, upserts, deletes)
+            self.flushes += 1
+        except Exception:
+            # Возвращаем изменения в очередь, более новые изменения имеют приоритет
+            self._dirty = {**self._writing, **self._dirty}
+            raise
+        finally:
+            self._writing = {}
+
+    def _write(self, upserts: list, deletes: list):
+        with self._conn:
+            if upserts:
+                self._conn.executemany(
+                    "INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, "
+                    "data = excluded.data, updated_at = excluded.updated_at",
+                    upserts,
+                )
+            if deletes:
+                self._conn.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+
+    # --- Интерфейс BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._record(key)
+        record.data = data.copy()
+        self._mark_dirty(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key)).data.copy()
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        record = await self._record(key)
+        record.data.update(data)
+        self._mark_dirty(key, record)
+        return record.data.copy()
+
+    async def close(self) -> None:
+        """Записывает оставшиеся изменения и закрывает базу"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._conn.close)
+        self._executor.shutdown(wait=True)
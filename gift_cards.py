@@ -4,6 +4,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 import logging
 import re
+from callback_router import get_callback_router
 
 # Определение состояний для проверки баланса карты
 class BalanceCheckState(StatesGroup):
@@ -304,12 +305,13 @@ async def gift_balance_problem(callback: types.CallbackQuery):
 
 # Функция для регистрации обработчиков в диспетчере
 def register_handlers(dp):
-    dp.callback_query(lambda c: c.data == "gift_cards")(gift_cards_menu)
-    dp.callback_query(lambda c: c.data == "gift_how_to_buy")(gift_how_to_buy)
-    dp.callback_query(lambda c: c.data == "gift_how_to_use")(gift_how_to_use)
-    dp.callback_query(lambda c: c.data == "gift_for_colleagues")(gift_for_colleagues)
-    dp.callback_query(lambda c: c.data == "gift_check_balance")(gift_check_balance)
-    dp.callback_query(lambda c: c.data == "gift_balance_physical")(gift_balance_physical)
+    router = get_callback_router(dp)
+    router.exact("gift_cards", gift_cards_menu)
+    router.exact("gift_how_to_buy", gift_how_to_buy)
+    router.exact("gift_how_to_use", gift_how_to_use)
+    router.exact("gift_for_colleagues", gift_for_colleagues)
+    router.exact("gift_check_balance", gift_check_balance)
+    router.exact("gift_balance_physical", gift_balance_physical)
     dp.message(BalanceCheckState.waiting_for_card_number)(process_card_number)
-    dp.callback_query(lambda c: c.data == "gift_balance_digital")(gift_balance_digital)
-    dp.callback_query(lambda c: c.data == "gift_balance_problem")(gift_balance_problem) 
\ No newline at end of file
+    router.exact("gift_balance_digital", gift_balance_digital)
+    router.exact("gift_balance_problem", gift_balance_problem) 
\ No newline at end of file
@@ -1,6 +1,7 @@
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import logging
+from callback_router import get_callback_router
 
 # Обработчик кнопки "Как оформить заказ"
 async def how_to_order(callback: types.CallbackQuery):
@@ -174,8 +175,9 @@ async def pickup_issue(callback: types.CallbackQuery):
 
 # Функция для регистрации обработчиков в диспетчере
 def register_handlers(dp):
-    dp.callback_query(lambda c: c.data == "how_to_order")(how_to_order)
-    dp.callback_query(lambda c: c.data == "payment_issue")(payment_issue)
-    dp.callback_query(lambda c: c.data == "address_issue")(address_issue)
-    dp.callback_query(lambda c: c.data == "cart_issue")(cart_issue)
-    dp.callback_query(lambda c: c.data == "pickup_issue")(pickup_issue) 
\ No newline at end of file
+    router = get_callback_router(dp)
+    router.exact("how_to_order", how_to_order)
+    router.exact("payment_issue", payment_issue)
+    router.exact("address_issue", address_issue)
+    router.exact("cart_issue", cart_issue)
+    router.exact("pickup_issue", pickup_issue) 
\ No newline at end of file
@@ -6,12 +6,25 @@ import asyncio  # Библиотека для асинхронного прог
 import logging  # Библиотека для логирования
 import os  # Библиотека для работы с операционной системой
 import sys  # Библиотека для работы с системными функциями
+import time  # Для замера времени запуска
+
+# Момент начала запуска - от него считается отчет о времени запуска
+_STARTED = time.perf_counter()
+
+# При запуске "python main.py" модуль называется __main__, а модули проекта
+# импортируют из него бота через "from main import bot". Регистрируем модуль
+# под именем main, иначе первый такой импорт выполнит main.py повторно
+# (второй бот, второй диспетчер и задержка в первом обработчике)
+if __name__ == "__main__":
+    sys.modules.setdefault("main", sys.modules[__name__])
 
 # Импорт библиотеки aiogram и её компонентов для создания Telegram ботов
 from aiogram import Bot, Dispatcher, types, F, Router  # Основные классы для создания бота
 from aiogram.enums.parse_mode import ParseMode  # Режимы форматирования текста
 from aiogram.fsm.storage.memory import MemoryStorage  # Хранилище состояний в памяти
 from aiogram.client.default import DefaultBotProperties  # Настройки бота по умолчанию
+from aiogram.client.session.aiohttp import AiohttpSession  # HTTP-сессия для запросов к Bot API
+from aiogram.client.telegram import TelegramAPIServer  # Адрес сервера Bot API
 from dotenv import load_dotenv  # Загрузка переменных окружения из .env файла
 from aiogram.filters import CommandStart  # Фильтр для обработки команды /start
 from aiogram.types import Message, BotCommand, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton  # Типы данных Telegram
@@ -27,49 +40,60 @@ import how_to_order  # Модуль инструкций по оформлени
 import gift_cards  # Модуль подарочных карт
 import missing_card  # Модуль для обработки отсутствующих карт лояльности
 import support  # Модуль поддержки пользователей
-
-# Настройка системы логирования для отслеживания работы бота
-# level=logging.INFO - будут записываться информационные сообщения и ошибки
-# format - определяет формат записи логов: время, имя модуля, уровень важности, сообщение
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+import update_executor  # Параллельная обработка обновлений с порядком для каждого пользователя
+import metrics  # Метрики задержек хендлеров (/metrics и /stats)
+import bot_logging  # Неблокирующее структурированное логирование
+import fsm_storage  # Хранилище состояний FSM в SQLite
+from startup_timer import StartupTimer  # Отчет о времени запуска по этапам
 
 # Загрузка переменных окружения из файла .env
 # Это безопасный способ хранения конфиденциальных данных (токенов, паролей)
 load_dotenv()
 
+# Настройка системы логирования для отслеживания работы бота
+# Записи кладутся в очередь и выводятся фоновым потоком, чтобы вывод логов
+# не блокировал цикл событий. Формат: время, имя модуля, уровень важности, сообщение и поля.
+# Уровень, выборка и ограничение частоты задаются переменными LOG_LEVEL, LOG_SAMPLE, LOG_RATE_LIMIT
+bot_logging.setup_logging(**bot_logging.config_from_env())
+
 # Получение токена бота из переменных окружения
 # Токен - это уникальный идентификатор бота, полученный от @BotFather
 TOKEN = os.getenv("BOT_TOKEN")
 print(f"DEBUG: Инициализация бота с токеном: {TOKEN[:5]}...{TOKEN[-5:]}")  # Выводим только начало и конец токена в целях безопасности
 
 # ID чата для операторов - проверяем оба возможных имени переменной окружения
-# Это ID чата, куда будут отправляться запросы от пользователей на поддержку
-OPERATOR_CHAT_ID = os.getenv("OPERATOR_CHAT_ID") or os.getenv("SUPPORT_CHAT_ID")
-print(f"DEBUG: ID чата операторов из переменной окружения: {OPERATOR_CHAT_ID}")
+# Это ID чата, куда будут отправляться запросы от пользователей на поддержку.
+# Telegram API требует, чтобы ID чата был целым числом; если переменная не задана
+# или не число, используется ID по умолчанию (то же значение видит супервизор sharding.py)
+OPERATOR_CHAT_ID = support.operator_chat_id_from_env()
+print(f"DEBUG: ID чата операторов: {OPERATOR_CHAT_ID}")
+
+# Режим получения обновлений: "polling" (по умолчанию) или "webhook"
+# Настройки webhook (адрес, порт, секретный токен) читаются в webhook.config_from_env()
+BOT_MODE = os.getenv("BOT_MODE", "polling")
 
-# Преобразуем OPERATOR_CHAT_ID в целое число (int), если это возможно
-# Telegram API требует, чтобы ID чата был целым числом
-try:
-    OPERATOR_CHAT_ID = int(OPERATOR_CHAT_ID)
-    print(f"DEBUG: ID чата операторов преобразован в int: {OPERATOR_CHAT_ID}")
-except (ValueError, TypeError):
-    # Если не удалось преобразовать (например, если переменная не установлена),
-    # устанавливаем значение вручную
-    print(f"DEBUG: ОШИБКА! Не удалось преобразовать ID чата операторов в int: {OPERATOR_CHAT_ID}")
-    OPERATOR_CHAT_ID = 7411289458  # ID пользователя который получает сообщения от бота
-    print(f"DEBUG: Установлен ID чата операторов вручную: {OPERATOR_CHAT_ID}")
+# Быстрый запуск: без диагностического сообщения операторам, независимые этапы
+# запуска (команды бота, подготовка базы данных) выполняются одновременно
+FAST_STARTUP = os.getenv("FAST_STARTUP", "").lower() in ("1", "true", "yes")
 
 # Инициализация бота и диспетчера
 # Bot - основной класс для взаимодействия с Telegram API
 # parse_mode=ParseMode.HTML - позволяет использовать HTML-теги в сообщениях (<b>, <i>, и т.д.)
-bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# TELEGRAM_API_URL позволяет направить запросы на другой сервер Bot API
+# (локальный сервер Telegram или fake_bot_api.py для нагрузочного тестирования)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 
-# MemoryStorage - хранилище для состояний пользователей в памяти сервера
+# Хранилище для состояний пользователей
 # Используется для запоминания на каком этапе диалога находится пользователь
-storage = MemoryStorage()
+# FSM_STORAGE=sqlite (по умолчанию) - состояния сохраняются в fsm.db и переживают перезапуск бота,
+# FSM_STORAGE=memory - состояния хранятся только в памяти сервера (MemoryStorage)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()
+if FSM_STORAGE == "memory":
+    storage = MemoryStorage()
+else:
+    storage = fsm_storage.SQLiteStorage(**fsm_storage.config_from_env())
 
 # Dispatcher - обработчик событий, управляет регистрацией обработчиков и маршрутизацией сообщений
 dp = Dispatcher(storage=storage)
@@ -83,6 +107,10 @@ print(f"DEBUG: Бот инициализирован: {bot.id}")
 # Это нужно, потому что модуль рекомендаций использует эти переменные
 import recommendations
 
+# Отчет о запуске: первый этап - импорт модулей и создание бота
+startup = StartupTimer(_STARTED)
+startup.add("импорт", time.perf_counter() - _STARTED)
+
 # Диагностическая функция для проверки возможности отправки сообщений
 # Используется для отладки проблем с отправкой сообщений пользователям
 async def diagnostic_send(user_id, text):
@@ -129,13 +157,6 @@ async def diagnostic_send(user_id, text):
         traceback.print_exc()
         return False
 
-# Регистрация обработчиков из модуля рекомендаций
-from recommendations import register_handlers as register_recommendation_handlers
-
-print("DEBUG: Регистрация обработчиков рекомендаций...")
-register_recommendation_handlers(dp)
-print("DEBUG: Обработчики рекомендаций зарегистрированы")
-
 # Функция, выполняемая при запуске бота
 # Используется для инициализации и проверки работоспособности бота при старте
 async def on_startup(bot):
@@ -187,55 +208,116 @@ async def diagnostic_command(message: Message):
         # Обрабатываем возможные ошибки при выполнении диагностики
         await message.reply(f"❌ Ошибка при выполнении диагностики: {e}")
 
+# Регистрация обработчиков из всех модулей проекта
+# Вынесена в отдельную функцию, чтобы ее могли вызывать рабочие процессы (sharding.py)
+def register_all_handlers(init_database: bool = True):
+    """Регистрирует обработчики всех модулей проекта в диспетчере dp
+    
+    Args:
+        init_database (bool): Инициализировать базу рекомендаций при регистрации.
+                              False - база готовится отдельно (prepare_catalog)
+    """
+    # Метрики подключаются первыми: команда /stats в чате операторов
+    # должна проверяться раньше общего обработчика сообщений поддержки
+    metrics.setup(dp, OPERATOR_CHAT_ID, **metrics.config_from_env())
+    
+    # Каждый модуль отвечает за свою функциональность и имеет свои обработчики
+    main_menu.register_handlers(dp)  # Обработчики главного меню
+    akcii.register_handlers(dp)  # Обработчики акций
+    order_cancel.register_handlers(dp)  # Обработчики отмены заказов
+    order_status.register_handlers(dp)  # Обработчики статуса заказов
+    how_to_order.register_handlers(dp)  # Обработчики инструкций по заказам
+    gift_cards.register_handlers(dp)  # Обработчики подарочных карт
+    missing_card.register_handlers(dp)  # Обработчики отсутствующих карт
+    
+    # Регистрация обработчиков рекомендаций
+    # Должна идти до поддержки: команды операторов (/send_link, /debug_send)
+    # иначе перехватит общий обработчик сообщений чата поддержки
+    recommendations.register_handlers(dp, OPERATOR_CHAT_ID, init_database=init_database)
+    
+    # Регистрация обработчиков поддержки
+    # Передаем дополнительные параметры: бот, ID чата оператора и клавиатуру главного меню
+    support.register_handlers(dp, bot, OPERATOR_CHAT_ID, main_menu.main_menu_kb)
+    
+    # Регистрация диагностического обработчика
+    # F.text.startswith("/diagnostic") - фильтр, срабатывающий на команду /diagnostic
+    dp.message.register(diagnostic_command, F.text.startswith("/diagnostic"))
+
+# Команды бота, отображаемые в меню Telegram
+BOT_COMMANDS = [
+    BotCommand(command="start", description="Запустить бота"),
+    BotCommand(command="help", description="Получить помощь"),
+    BotCommand(command="order", description="Оформить заказ"),
+    BotCommand(command="search", description="Найти товар по названию"),
+    BotCommand(command="diagnostic", description="Проверить работу бота")
+]
+
+def prepare_catalog(init_database: bool = True):
+    """Готовит каталог товаров: инициализирует базу данных и прогревает ее
+    
+    Выполняется в отдельном потоке, чтобы работа с SQLite не блокировала цикл событий.
+    
+    Args:
+        init_database (bool): False - база уже инициализирована при регистрации
+                              обработчиков, нужен только прогрев снимка каталога
+    """
+    if init_database:
+        with startup.phase("init_db"):
+            recommendations.init_db()
+    with startup.phase("прогрев каталога"):
+        recommendations.warmup_catalog()
+
 # Основная функция для запуска бота
 # Здесь регистрируются все обработчики из разных модулей и запускается поллинг
 async def main():
     """Основная функция для запуска бота
     
     Регистрирует обработчики из всех модулей, настраивает команды
-    и запускает процесс получения обновлений от Telegram API
+    и запускает процесс получения обновлений от Telegram API.
+    В режиме FAST_STARTUP команды бота и подготовка каталога выполняются
+    одновременно, а диагностическое сообщение операторам не отправляется.
     """
     try:
-        # Регистрация обработчиков из всех модулей проекта
-        # Каждый модуль отвечает за свою функциональность и имеет свои обработчики
-        main_menu.register_handlers(dp)  # Обработчики главного меню
-        akcii.register_handlers(dp)  # Обработчики акций
-        order_cancel.register_handlers(dp)  # Обработчики отмены заказов
-        order_status.register_handlers(dp)  # Обработчики статуса заказов
-        how_to_order.register_handlers(dp)  # Обработчики инструкций по заказам
-        gift_cards.register_handlers(dp)  # Обработчики подарочных карт
-        missing_card.register_handlers(dp)  # Обработчики отсутствующих карт
-        
-        # Регистрация обработчиков поддержки
-        # Передаем дополнительные параметры: бот, ID чата оператора и клавиатуру главного меню
-        support.register_handlers(dp, bot, OPERATOR_CHAT_ID, main_menu.main_menu_kb)
-        
-        # Регистрация обработчиков рекомендаций
-        recommendations.register_handlers(dp)
-        
-        # Настройка команд бота, отображаемых в меню Telegram
-        # Эти команды будут видны пользователям в меню бота
-        await bot.set_my_commands([
-            BotCommand(command="start", description="Запустить бота"),
-            BotCommand(command="help", description="Получить помощь"),
-            BotCommand(command="order", description="Оформить заказ"),
-            BotCommand(command="diagnostic", description="Проверить работу бота")
-        ])
-
-        # Регистрация диагностического обработчика
-        # F.text.startswith("/diagnostic") - фильтр, срабатывающий на команду /diagnostic
-        dp.message.register(diagnostic_command, F.text.startswith("/diagnostic"))
+        if FAST_STARTUP:
+            with startup.phase("обработчики"):
+                register_all_handlers(init_database=False)
+            
+            # Независимые этапы запуска выполняем одновременно
+            await asyncio.gather(
+                startup.run("set_my_commands", bot.set_my_commands(BOT_COMMANDS)),
+                asyncio.to_thread(prepare_catalog),
+            )
+        else:
+            with startup.phase("обработчики"):
+                register_all_handlers()
+            
+            # Настройка команд бота, отображаемых в меню Telegram
+            # Эти команды будут видны пользователям в меню бота
+            await startup.run("set_my_commands", bot.set_my_commands(BOT_COMMANDS))
+            
+            # Без снимка каталога отключены оценка релевантности, кэш результатов,
+            # счетчики на кнопках и битовые маски, поэтому прогреваем его и здесь
+            await asyncio.to_thread(prepare_catalog, init_database=False)
         
         # Логирование информации о запуске бота
         print("Бот запущен!")
         logging.info("Бот запущен!")
         
-        # Запуск диагностики при старте бота
-        await on_startup(bot)
+        if not FAST_STARTUP:
+            # Запуск диагностики при старте бота
+            await startup.run("диагностика", on_startup(bot))
         
-        # Запуск поллинга - процесса получения обновлений от Telegram API
-        # Бот будет постоянно проверять наличие новых сообщений и обрабатывать их
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        startup.log_report()
+        
+        if BOT_MODE == "webhook":
+            # Запуск webhook сервера - Telegram сам присылает обновления боту
+            import webhook
+            await webhook.run_webhook(dp, bot, **webhook.config_from_env())
+        else:
+            # Запуск поллинга - процесса получения обновлений от Telegram API
+            # Обновления разных пользователей обрабатываются параллельно,
+            # обновления одного пользователя - строго по порядку
+            await update_executor.run_polling(dp, bot)
     except Exception as e:
         # Обработка ошибок при запуске бота
         logging.error(f"Ошибка при запуске бота: {e}")
@@ -2,6 +2,10 @@ from aiogram import types, Dispatcher
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 import logging
+from callback_router import get_callback_router
+from bot_logging import get_logger
+
+log = get_logger(__name__)
 # from aiogram.dispatcher import Dispatcher
 
 # Клавиатура главного меню
@@ -28,7 +32,8 @@ async def show_main_menu(message):
     1. Если передан объект message с методом edit_text, пытается редактировать существующее сообщение
     2. Если редактирование не удалось или не применимо, отправляет новое сообщение
     """
-    print(f"DEBUG: Отображение главного меню вызвано для {getattr(message, 'chat', {}).get('id', 'неизвестно')}")
+    if log.debug_enabled:
+        log.debug("Отображение главного меню", chat_id=getattr(getattr(message, 'chat', None), 'id', 'неизвестно'))
     
     # Функция отправки нового сообщения
     async def send_new_menu():
@@ -70,13 +75,13 @@ async def show_main_menu(message):
 
 # Обработчик кнопки "Вернуться в главное меню"
 async def back_to_main_menu(callback: types.CallbackQuery, state: FSMContext = None):
-    print(f"DEBUG: back_to_main_menu callback received from user {callback.from_user.id}")
+    log.debug("Получен callback back_to_main", user_id=callback.from_user.id)
     
     try:
         # Если передано состояние, сбрасываем его
         if state:
             await state.clear()
-            print(f"DEBUG: State cleared for user {callback.from_user.id}")
+            log.debug("Состояние сброшено", user_id=callback.from_user.id)
             
         # Отвечаем на callback
         await callback.answer("Возвращаемся в главное меню")
@@ -119,7 +124,7 @@ def register_handlers(dp: Dispatcher):
     # Добавим обработчик для команды /menu
     @dp.message(lambda message: message.text == "/menu")
     async def menu_handler(message: types.Message):
-        print(f"DEBUG: Получена команда /menu от пользователя {message.from_user.id}")
+        log.debug("Получена команда /menu", user_id=message.from_user.id)
         await message.answer(
             "👋 Главное меню\n\n"
             "Выберите нужный раздел:",
@@ -127,6 +132,4 @@ def register_handlers(dp: Dispatcher):
         )
     
     # Регистрация обработчика для кнопки "Вернуться в главное меню"
-    @dp.callback_query(lambda c: c.data == "back_to_main")
-    async def back_to_main_handler(callback: types.CallbackQuery, state: FSMContext):
-        await back_to_main_menu(callback, state) 
\ No newline at end of file
+    get_callback_router(dp).exact("back_to_main", back_to_main_menu) 
\ No newline at end of file
@@ -0,0 +1,482 @@
+# metrics.py - Метрики обработки обновлений для Telegram бота GoldenAppleBot
+# Внешний middleware диспетчера замеряет время обработки каждого обновления и
+# относит его к хендлеру, который его обработал, а для callback-запросов - еще и
+# к маршруту CallbackRouter (например, "criteria_*"). Для каждого хендлера и маршрута
+# собираются гистограмма задержек, количество ошибок и количество выполняемых сейчас вызовов.
+#
+# Метрики доступны:
+# - в формате Prometheus на локальном HTTP-сервере (METRICS_PORT, путь /metrics);
+# - кратким отчетом по команде /stats в чате операторов.
+#
+# Стоимость замера - два вызова perf_counter и несколько обращений к словарям
+# на обновление, поэтому метрики можно не отключать в продакшене
+# (замер: python benchmarks/bench_metrics.py).
+
+import logging  # Для логирования ошибок
+import os  # Для чтения настроек из переменных окружения
+import time  # Для замера времени обработки
+from bisect import bisect_left  # Для поиска корзины гистограммы
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.types import Message
+
+from callback_router import ROUTER_KEY
+
+# Ключ, под которым метрики хранятся в workflow_data диспетчера
+METRICS_KEY = "metrics"
+
+# Ключ данных обновления, через который внутренний middleware сообщает внешнему,
+# какой хендлер обработал обновление
+_SLOT_KEY = "metrics_slot"
+
+# Верхние границы корзин гистограммы задержек, секунд
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Имя для обновлений, которые не обработал ни один хендлер
+UNHANDLED = "unhandled"
+
+
+def config_from_env() -> dict:
+    """Читает настройки HTTP-сервера метрик из переменных окружения
+
+    Переменные окружения:
+        METRICS_PORT - порт сервера /metrics; если не указан, сервер не запускается
+        METRICS_HOST - адрес, на котором слушает сервер (127.0.0.1)
+
+    Returns:
+        dict: Параметры для start_server
+    """
+    port = os.getenv("METRICS_PORT")
+    return {
+        "host": os.getenv("METRICS_HOST", "127.0.0.1"),
+        "port": int(port) if port else None,
+    }
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (как histogram в Prometheus)"""
+
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина - больше всех границ
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """Добавляет значение в гистограмму"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Оценивает квантиль q (0-1) линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        # Значение больше последней границы - точнее оценить нельзя
+        return self.buckets[-1]
+
+
+class HandlerStats:
+    """Метрики одного хендлера или маршрута callback-запросов"""
+
+    __slots__ = ("latency", "errors", "in_flight")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.in_flight = 0
+
+
+def handler_name(callback) -> str:
+    """Возвращает читаемое имя хендлера: модуль.функция (для lambda - с номером строки)"""
+    func = getattr(callback, "__func__", callback)
+    # Хендлеры объявлены внутри register_handlers - убираем "register_handlers.<locals>."
+    qualname = getattr(func, "__qualname__", repr(func)).rpartition("<locals>.")[2]
+    name = f"{getattr(func, '__module__', '?')}.{qualname}"
+    code = getattr(func, "__code__", None)
+    if name.endswith("<lambda>") and code is not None:
+        name += f":{code.co_firstlineno}"
+    return name
+
+
+class Metrics:
+    """Хранилище метрик: хендлеры, маршруты callback-запросов и общие счетчики"""
+
+    def __init__(self):
+        self.handlers = {}  # {имя хендлера: HandlerStats}
+        self.callbacks = {}  # {маршрут callback: HandlerStats}
+        # {имя запроса: HandlerStats} - запросы к базе товаров (CatalogPool.queries)
+        self.queries = {}
+        # Фоновое обновление каталога в памяти (catalog_refresh.CatalogRefresher) или None
+        self.catalog = None
+        # Кэш результатов подбора (result_cache.ResultCache) или None
+        self.result_cache = None
+        # Курсоры постраничного просмотра рекомендаций (result_cursors.CursorStore) или None
+        self.result_cursors = None
+        # Журнал просмотров и матрица похожих товаров (also_viewed.AlsoViewed) или None
+        self.also_viewed = None
+        self.updates = HandlerStats()  # Все обновления вместе
+        self.started_at = time.time()
+
+    def _stats(self, table: dict, name: str) -> HandlerStats:
+        stats = table.get(name)
+        if stats is None:
+            stats = table[name] = HandlerStats()
+        return stats
+
+    def handler_stats(self, name: str) -> HandlerStats:
+        return self._stats(self.handlers, name)
+
+    def callback_stats(self, name: str) -> HandlerStats:
+        return self._stats(self.callbacks, name)
+
+    def render_prometheus(self) -> str:
+        """Возвращает метрики в текстовом формате Prometheus"""
+        lines = []
+
+        def histogram(metric: str, label: str, table: dict):
+            lines.append(f"# TYPE {metric}_seconds histogram")
+            for name, stats in sorted(table.items()):
+                labels = f'{label}="{_escape(name)}"'
+                cumulative = 0
+                for upper, count in zip(stats.latency.buckets, stats.latency.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_seconds_bucket{{{labels},le="{upper}"}} {cumulative}')
+                lines.append(f'{metric}_seconds_bucket{{{labels},le="+Inf"}} {stats.latency.count}')
+                lines.append(f"{metric}_seconds_sum{{{labels}}} {stats.latency.sum:.6f}")
+                lines.append(f"{metric}_seconds_count{{{labels}}} {stats.latency.count}")
+
+        def counter(metric: str, kind: str, label: str, table: dict, field: str):
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, stats in sorted(table.items()):
+                lines.append(f'{metric}{{{label}="{_escape(name)}"}} {getattr(stats, field)}')
+
+        histogram("bot_handler_latency", "handler", self.handlers)
+        counter("bot_handler_errors_total", "counter", "handler", self.handlers, "errors")
+        counter("bot_handler_in_flight", "gauge", "handler", self.handlers, "in_flight")
+        histogram("bot_callback_latency", "route", self.callbacks)
+        counter("bot_callback_errors_total", "counter", "route", self.callbacks, "errors")
+        histogram("bot_catalog_query_latency", "query", self.queries)
+        counter("bot_catalog_query_errors_total", "counter", "query", self.queries, "errors")
+
+        if self.catalog is not None:
+            # Задержка от записи изменения в базу товаров до появления в каталоге в памяти
+            lag = self.catalog.lag
+            lines.append("# TYPE bot_catalog_refresh_lag_seconds histogram")
+            cumulative = 0
+            for upper, count in zip(lag.buckets, lag.counts):
+                cumulative += count
+                lines.append(f'bot_catalog_refresh_lag_seconds_bucket{{le="{upper}"}} {cumulative}')
+            lines.append(f'bot_catalog_refresh_lag_seconds_bucket{{le="+Inf"}} {lag.count}')
+            lines.append(f"bot_catalog_refresh_lag_seconds_sum {lag.sum:.6f}")
+            lines.append(f"bot_catalog_refresh_lag_seconds_count {lag.count}")
+            snapshot = self.catalog.snapshot
+            lines.append("# TYPE bot_catalog_version gauge")
+            lines.append(f"bot_catalog_version {snapshot.version if snapshot is not None else 0}")
+            lines.append("# TYPE bot_catalog_refreshes_total counter")
+            lines.append(f"bot_catalog_refreshes_total {self.catalog.refreshes}")
+            lines.append("# TYPE bot_catalog_full_reloads_total counter")
+            lines.append(f"bot_catalog_full_reloads_total {self.catalog.full_reloads}")
+
+        if self.result_cache is not None:
+            cache = self.result_cache
+            lines.append("# TYPE bot_result_cache_requests_total counter")
+            lines.append(f'bot_result_cache_requests_total{{result="hit"}} {cache.hits}')
+            lines.append(f'bot_result_cache_requests_total{{result="miss"}} {cache.misses}')
+            lines.append("# TYPE bot_result_cache_invalidations_total counter")
+            lines.append(f'bot_result_cache_invalidations_total{{reason="version"}} {cache.stale}')
+            lines.append(f'bot_result_cache_invalidations_total{{reason="ttl"}} {cache.expired}')
+            lines.append(f'bot_result_cache_invalidations_total{{reason="evicted"}} {cache.evictions}')
+            lines.append("# TYPE bot_result_cache_entries gauge")
+            lines.append(f"bot_result_cache_entries {len(cache)}")
+            lines.append("# TYPE bot_result_cache_bytes gauge")
+            lines.append(f"bot_result_cache_bytes {cache.bytes}")
+
+        if self.result_cursors is not None:
+            cursors = self.result_cursors
+            lines.append("# TYPE bot_result_cursors gauge")
+            lines.append(f"bot_result_cursors {len(cursors)}")
+            lines.append("# TYPE bot_result_cursors_bytes gauge")
+            lines.append(f"bot_result_cursors_bytes {cursors.bytes}")
+            lines.append("# TYPE bot_result_cursor_pages_total counter")
+            lines.append(f'bot_result_cursor_pages_total{{result="served"}} {cursors.pages}')
+            lines.append(f'bot_result_cursor_pages_total{{result="missing"}} {cursors.missing}')
+            lines.append("# TYPE bot_result_cursor_evictions_total counter")
+            lines.append(f"bot_result_cursor_evictions_total {cursors.evictions}")
+        if self.also_viewed is not None:
+            viewed = self.also_viewed
+            lines.append("# TYPE bot_also_viewed_pairs gauge")
+            lines.append(f"bot_also_viewed_pairs {viewed.graph.pairs}")
+            lines.append("# TYPE bot_also_viewed_products gauge")
+            lines.append(f"bot_also_viewed_products {len(viewed.graph.rows)}")
+            lines.append("# TYPE bot_also_viewed_views_total counter")
+            lines.append(f'bot_also_viewed_views_total{{result="recorded"}} {viewed.recorded}')
+            lines.append(f'bot_also_viewed_views_total{{result="dropped"}} {viewed.dropped}')
+            lines.append("# TYPE bot_also_viewed_applied_total counter")
+            lines.append(f"bot_also_viewed_applied_total {viewed.applied}")
+            lines.append("# TYPE bot_also_viewed_prunes_total counter")
+            lines.append(f"bot_also_viewed_prunes_total {viewed.graph.prunes}")
+
+        lines.append("# TYPE bot_updates_total counter")
+        lines.append(f"bot_updates_total {self.updates.latency.count}")
+        lines.append("# TYPE bot_update_errors_total counter")
+        lines.append(f"bot_update_errors_total {self.updates.errors}")
+        lines.append("# TYPE bot_updates_in_flight gauge")
+        lines.append(f"bot_updates_in_flight {self.updates.in_flight}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, top: int = 10) -> str:
+        """Возвращает краткий отчет для команды /stats
+
+        Args:
+            top (int): Сколько самых нагруженных хендлеров показать
+
+        Returns:
+            str: Текст отчета (HTML)
+        """
+        total = self.updates.latency
+        uptime = max(time.time() - self.started_at, 1e-9)
+        lines = [
+            "<b>📊 Статистика обработки обновлений</b>",
+            f"Обновлений: {total.count} ({total.count / uptime:.2f}/с), "
+            f"ошибок: {self.updates.errors}, сейчас в работе: {self.updates.in_flight}",
+            f"p50 {total.quantile(0.5) * 1000:.1f} мс, p95 {total.quantile(0.95) * 1000:.1f} мс, "
+            f"p99 {total.quantile(0.99) * 1000:.1f} мс",
+        ]
+
+        def section(title: str, table: dict):
+            # Сортируем по суммарному времени: наверху то, что сильнее всего нагружает бота
+            ranked = sorted(
+                ((name, stats) for name, stats in table.items() if stats.latency.count),
+                key=lambda item: item[1].latency.sum, reverse=True,
+            )[:top]
+            if not ranked:
+                return
+            lines.append("")
+            lines.append(f"<b>{title}</b> (вызовов / p95 / ошибок)")
+            for name, stats in ranked:
+                lines.append(
+                    f"<code>{_escape_html(name)}</code>: {stats.latency.count} / "
+                    f"{stats.latency.quantile(0.95) * 1000:.1f} мс / {stats.errors}"
+                )
+
+        section("Хендлеры", self.handlers)
+        section("Callback-маршруты", self.callbacks)
+        section("Запросы к каталогу", self.queries)
+        if self.catalog is not None and self.catalog.snapshot is not None:
+            lag = self.catalog.lag
+            lines.append("")
+            lines.append(
+                f"<b>Каталог в памяти</b>: версия {self.catalog.snapshot.version}, "
+                f"обновлений {self.catalog.refreshes}, перестроений {self.catalog.full_reloads}, "
+                f"задержка p95 {lag.quantile(0.95) * 1000:.0f} мс"
+            )
+        if self.result_cache is not None and self.result_cache.hits + self.result_cache.misses:
+            cache = self.result_cache
+            lines.append(
+                f"<b>Кэш результатов</b>: попаданий {cache.hit_rate() * 100:.1f}% "
+                f"({cache.hits} из {cache.hits + cache.misses}), записей {len(cache)}, "
+                f"{cache.bytes / 1024:.0f} КБ, сброшено по версии {cache.stale}"
+            )
+        if self.result_cursors is not None and self.result_cursors.opened:
+            cursors = self.result_cursors
+            lines.append(
+                f"<b>Курсоры рекомендаций</b>: {len(cursors)}, {cursors.bytes / 1024:.0f} КБ, "
+                f"страниц показано {cursors.pages}, устарело {cursors.missing}"
+            )
+        if self.also_viewed is not None and self.also_viewed.applied:
+            viewed = self.also_viewed
+            lines.append(
+                f"<b>Похожие товары</b>: {len(viewed.graph.rows)} товаров, {viewed.graph.pairs} пар, "
+                f"просмотров применено {viewed.applied}, отброшено {viewed.dropped}"
+            )
+        return "\n".join(lines)
+
+
+def _escape(value: str) -> str:
+    """Экранирует значение метки Prometheus"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _escape_html(value: str) -> str:
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: время обработки, ошибки и счетчики в работе
+
+    Хендлер, обработавший обновление, становится известен только после фильтров,
+    поэтому его метрики записывает HandlerMetricsMiddleware в общий слот данных обновления.
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self.unhandled = metrics.handler_stats(UNHANDLED)
+
+    async def __call__(self, handler, event, data):
+        updates = self.metrics.updates
+        slot = data[_SLOT_KEY] = [self.unhandled, None]  # [метрики хендлера, метрики маршрута]
+        updates.in_flight += 1
+        failed = False
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            updates.in_flight -= 1
+            for stats in (updates, *slot):
+                if stats is not None:
+                    stats.latency.observe(elapsed)
+                    if failed:
+                        stats.errors += 1
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: определяет хендлер и считает его вызовы в работе
+
+    Метрики хендлера и признак "это CallbackRouter" определяются один раз
+    на функцию-хендлер и кэшируются.
+    """
+
+    def __init__(self, metrics: Metrics, dp: Dispatcher):
+        self.metrics = metrics
+        self.dp = dp
+        self._handlers = {}  # {функция-хендлер: (HandlerStats, CallbackRouter или None)}
+        self._routes = {}  # {CallbackRoute: (HandlerStats хендлера, HandlerStats маршрута)}
+
+    def _describe(self, callback) -> tuple:
+        router = self.dp.get(ROUTER_KEY)
+        if router is None or getattr(callback, "__self__", None) is not router:
+            router = None
+        return self.metrics.handler_stats(handler_name(callback)), router
+
+    def _describe_route(self, route) -> tuple:
+        return self.metrics.handler_stats(handler_name(route.handler)), self.metrics.callback_stats(route.name)
+
+    async def __call__(self, handler, event, data):
+        slot = data.get(_SLOT_KEY)
+        if slot is None:
+            return await handler(event, data)
+
+        callback = data["handler"].callback
+        info = self._handlers.get(callback)
+        if info is None:
+            info = self._handlers[callback] = self._describe(callback)
+        stats, router = info
+        route_stats = None
+        if router is not None:
+            # Все callback-запросы идут через CallbackRouter.dispatch -
+            # уточняем, какой маршрут и хендлер выбраны
+            route = router.resolve(event.data)
+            if route is not None:
+                route_info = self._routes.get(route)
+                if route_info is None:
+                    route_info = self._routes[route] = self._describe_route(route)
+                stats, route_stats = route_info
+
+        previous = slot[0], slot[1]
+        slot[0], slot[1] = stats, route_stats
+        stats.in_flight += 1
+        try:
+            return await handler(event, data)
+        except SkipHandler:
+            # Хендлер отказался от обновления - его обработает следующий
+            slot[0], slot[1] = previous
+            raise
+        finally:
+            stats.in_flight -= 1
+
+
+async def stats_command(message: Message, metrics: Metrics):
+    """Обработчик команды /stats: краткий отчет о задержках хендлеров (только чат операторов)"""
+    try:
+        await message.answer(metrics.summary())
+    except Exception as e:
+        logging.error(f"Ошибка при отправке статистики: {e}")
+
+
+async def start_server(metrics: Metrics, host: str = "127.0.0.1", port: int = 9100):
+    """Запускает HTTP-сервер с метриками в формате Prometheus на пути /metrics
+
+    Returns:
+        web.AppRunner: runner для остановки сервера
+    """
+    # aiohttp.web импортируется только при включенном сервере метрик
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
+
+
+def setup(dp: Dispatcher, operator_chat_id: int = None, host: str = "127.0.0.1",
+          port: int = None) -> Metrics:
+    """Подключает метрики к диспетчеру
+
+    Регистрирует middleware, команду /stats для чата операторов и запуск
+    HTTP-сервера /metrics при старте бота (если указан порт).
+    Команду /stats нужно регистрировать до общего обработчика сообщений поддержки,
+    поэтому setup вызывается перед регистрацией обработчиков модулей.
+
+    Args:
+        dp (Dispatcher): Диспетчер бота
+        operator_chat_id (int, optional): ID чата операторов, в котором доступна /stats
+        host (str): Адрес HTTP-сервера метрик
+        port (int, optional): Порт HTTP-сервера метрик; None - сервер не запускается
+
+    Returns:
+        Metrics: Хранилище метрик (также доступно как dp["metrics"])
+    """
+    metrics = dp.get(METRICS_KEY)
+    if metrics is not None:
+        return metrics
+
+    metrics = dp[METRICS_KEY] = Metrics()
+    dp.update.outer_middleware(UpdateMetricsMiddleware(metrics))
+    handler_middleware = HandlerMetricsMiddleware(metrics, dp)
+    dp.message.middleware(handler_middleware)
+    dp.callback_query.middleware(handler_middleware)
+
+    if operator_chat_id is not None:
+        # Асинхронная функция-фильтр: синхронные фильтры (в том числе F-выражения)
+        # aiogram выполняет в пуле потоков, а этот фильтр проверяется для каждого сообщения
+        async def is_stats_command(message: Message) -> bool:
+            return message.chat.id == operator_chat_id and (message.text or "").startswith("/stats")
+
+        dp.message.register(stats_command, is_stats_command)
+
+    if port:
+        runners = []
+
+        async def on_startup(**kwargs):
+            runners.append(await start_server(metrics, host, port))
+
+        async def on_shutdown(**kwargs):
+            for runner in runners:
+                await runner.cleanup()
+
+        dp.startup.register(on_startup)
+        dp.shutdown.register(on_shutdown)
+
+    return metrics
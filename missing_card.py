@@ -1,6 +1,7 @@
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import logging
+from callback_router import get_callback_router
 
 # Клавиатура для меню "Не пришла карта"
 missing_card_kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -159,8 +160,9 @@ async def update_card_info(callback: types.CallbackQuery):
 
 # Функция для регистрации обработчиков в диспетчере
 def register_handlers(dp):
-    dp.callback_query(lambda c: c.data == "missing_card")(missing_card_menu)
-    dp.callback_query(lambda c: c.data == "card_not_arrived")(card_not_arrived)
-    dp.callback_query(lambda c: c.data == "resend_sms")(resend_sms)
-    dp.callback_query(lambda c: c.data == "shipping_time")(shipping_time)
-    dp.callback_query(lambda c: c.data == "update_card_info")(update_card_info) 
\ No newline at end of file
+    router = get_callback_router(dp)
+    router.exact("missing_card", missing_card_menu)
+    router.exact("card_not_arrived", card_not_arrived)
+    router.exact("resend_sms", resend_sms)
+    router.exact("shipping_time", shipping_time)
+    router.exact("update_card_info", update_card_info) 
\ No newline at end of file
@@ -4,6 +4,10 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 import logging
 import re
+from callback_router import get_callback_router
+from bot_logging import get_logger
+
+log = get_logger(__name__)
 
 # Определение состояний для отмены заказа
 class OrderState(StatesGroup):
@@ -12,7 +16,7 @@ class OrderState(StatesGroup):
 
 # Основной обработчик кнопки "Отменить заказ"
 async def order_cancellation_handler(callback: types.CallbackQuery):
-    print(f"DEBUG: Received order_cancellation callback from user {callback.from_user.id}")
+    log.debug("Получен callback order_cancellation", user_id=callback.from_user.id)
     
     try:
         # Обязательно отвечаем на callback
@@ -209,9 +213,10 @@ async def handle_error(callback):
 
 # Функция для регистрации обработчиков в диспетчере
 def register_handlers(dp):
-    dp.callback_query(lambda c: c.data == "order_cancellation")(order_cancellation_handler)
-    dp.callback_query(lambda c: c.data == "proceed_with_cancel")(proceed_with_cancel)
+    router = get_callback_router(dp)
+    router.exact("order_cancellation", order_cancellation_handler)
+    router.exact("proceed_with_cancel", proceed_with_cancel)
     dp.message(OrderState.waiting_for_order_number)(handle_order_cancel)
-    dp.callback_query(lambda c: c.data == "confirm_cancel")(confirm_cancel_order)
-    dp.callback_query(lambda c: c.data == "decline_cancel")(decline_cancel)
-    dp.callback_query(lambda c: c.data == "changed_mind_cancel")(changed_mind_cancel) 
\ No newline at end of file
+    router.exact("confirm_cancel", confirm_cancel_order)
+    router.exact("decline_cancel", decline_cancel)
+    router.exact("changed_mind_cancel", changed_mind_cancel) 
\ No newline at end of file
@@ -4,6 +4,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 import logging
 import re
+from callback_router import get_callback_router
 
 # Определение состояний для проверки статуса заказа
 class OrderStatusState(StatesGroup):
@@ -112,6 +113,7 @@ async def handle_order_number(message: types.Message, state: FSMContext):
 
 # Функция для регистрации обработчиков в диспетчере
 def register_handlers(dp):
-    dp.callback_query(lambda c: c.data == "order_status")(check_order_status)
-    dp.callback_query(lambda c: c.data == "enter_order_number")(enter_order_number)
+    router = get_callback_router(dp)
+    router.exact("order_status", check_order_status)
+    router.exact("enter_order_number", enter_order_number)
     dp.message(OrderStatusState.waiting_for_order_number)(handle_order_number) 
\ No newline at end of file
@@ -0,0 +1,137 @@
+# rankings.py - Товары категорий, заранее упорядоченные по рейтингу и цене, для Telegram бота GoldenAppleBot
+# RecommendationSystem выбирал лучшие по рейтингу или самые дешевые товары сортировкой
+# всей категории при каждом запросе, чтобы взять первые limit товаров.
+#
+# Как устроено:
+# - для каждой категории хранятся списки товаров, уже упорядоченные по рейтингу
+#   (по убыванию), по цене (по возрастанию) и по цене (по убыванию); списки строятся
+#   один раз на версию каталога, и первые K товаров - срез списка за O(K);
+# - при равных значениях товары упорядочены по id, поэтому результат не зависит
+#   от порядка загрузки;
+# - лучшие товары всего каталога (без категории) - слияние упорядоченных списков
+#   категорий (heapq.merge), из которого берутся первые K товаров;
+# - изменения каталога применяются к копии списков затронутых категорий: места
+#   удаляемых и добавляемых товаров находятся двоичным поиском, и новый список
+#   собирается из срезов старого за один проход; при большом числе изменений список
+#   сортируется заново. Старые списки не меняются, их продолжают читать обработчики
+#   до подмены.
+
+import heapq  # Слияние упорядоченных списков категорий
+from bisect import bisect_left  # Поиск места товара в упорядоченном списке
+from itertools import islice  # Первые K товаров слияния
+
+
+def _rating_key(product: dict) -> tuple:
+    # Товары без рейтинга - в конце
+    return -(product.get("rating") or 0), product["id"]
+
+
+def _price_key(product: dict) -> tuple:
+    # Товары без цены - в конце при любом направлении сортировки
+    price = product.get("price")
+    return price is None, price or 0, product["id"]
+
+
+def _price_desc_key(product: dict) -> tuple:
+    price = product.get("price")
+    return price is None, -(price or 0), product["id"]
+
+
+# Порядки товаров: {название: ключ сортировки}
+ORDERS = {
+    "rating": _rating_key,
+    "price": _price_key,
+    "price_desc": _price_desc_key,
+}
+
+# Если изменений больше чем 1/PATCH_RATIO длины списка, список сортируется заново
+PATCH_RATIO = 16
+
+
+def _patched(ordered: list, key, removed: list, added: list) -> list:
+    """Копия упорядоченного списка без removed (прежние версии товаров) и с added"""
+    if len(removed) + len(added) > len(ordered) // PATCH_RATIO:
+        removed_ids = {id(product) for product in removed}
+        result = [product for product in ordered if id(product) not in removed_ids]
+        result.extend(added)
+        result.sort(key=key)
+        return result
+    # Позиции удаляемых и вставляемых товаров в исходном списке - двоичным поиском;
+    # новый список собирается из срезов исходного за один проход
+    skip = set()
+    for product in removed:
+        position = bisect_left(ordered, key(product), key=key)
+        if position < len(ordered) and ordered[position] is product:
+            skip.add(position)
+    inserts = sorted(((bisect_left(ordered, key(product), key=key), key(product), product)
+                      for product in added), key=lambda item: item[:2])
+    cuts = sorted(skip | {position for position, _, _ in inserts})
+    result, start, next_insert = [], 0, 0
+    for cut in cuts:
+        result.extend(ordered[start:cut])
+        while next_insert < len(inserts) and inserts[next_insert][0] == cut:
+            result.append(inserts[next_insert][2])
+            next_insert += 1
+        start = cut + 1 if cut in skip else cut
+    result.extend(ordered[start:])
+    return result
+
+
+class ProductRankings:
+    """Упорядоченные по рейтингу и цене списки товаров каждой категории для одной версии каталога"""
+
+    def __init__(self, orders: dict = None):
+        self.orders = orders or {}  # {(категория, порядок): список товаров}
+
+    @classmethod
+    def build(cls, products_by_category: dict) -> "ProductRankings":
+        """Строит упорядоченные списки для всех категорий
+
+        Args:
+            products_by_category (dict): {категория: список словарей товаров}
+
+        Returns:
+            ProductRankings: Упорядоченные списки
+        """
+        return cls().updated(products_by_category, {category: ([], products)
+                                                    for category, products in products_by_category.items()})
+
+    def updated(self, products_by_category: dict, changes: dict) -> "ProductRankings":
+        """Возвращает новые списки с примененными изменениями; эти списки не меняются
+
+        Args:
+            products_by_category (dict): Товары по категориям новой версии каталога
+            changes (dict): {категория: (прежние версии удаленных и измененных товаров,
+                             новые версии добавленных и измененных товаров)}
+
+        Returns:
+            ProductRankings: Новые списки; списки незатронутых категорий общие со старыми
+        """
+        orders = dict(self.orders)
+        for category, (removed, added) in changes.items():
+            for order, key in ORDERS.items():
+                if not products_by_category.get(category):
+                    orders.pop((category, order), None)
+                    continue
+                ordered = orders.get((category, order))
+                if ordered is None:
+                    orders[(category, order)] = sorted(products_by_category[category], key=key)
+                else:
+                    orders[(category, order)] = _patched(ordered, key, removed, added)
+        return ProductRankings(orders)
+
+    def top(self, category, order: str, limit: int) -> list:
+        """Первые limit товаров категории в заданном порядке
+
+        Args:
+            category (str): Категория товаров; None - все категории
+            order (str): Порядок из ORDERS ("rating", "price", "price_desc")
+            limit (int): Сколько товаров вернуть
+
+        Returns:
+            list: Словари товаров
+        """
+        if category:
+            return self.orders.get((category, order), [])[:limit]
+        lists = [ordered for (_, name), ordered in self.orders.items() if name == order]
+        return list(islice(heapq.merge(*lists, key=ORDERS[order]), limit))
@@ -5,15 +5,34 @@
 # Импорт стандартных библиотек Python
 import logging  # Для логирования ошибок и информационных сообщений
 import json  # Для работы с JSON-структурами (используется для атрибутов товаров)
+import html  # Для экранирования текста поискового запроса
 import sqlite3  # Для работы с SQLite базой данных
 import random  # Для случайного выбора товаров при формировании рекомендаций
+import weakref  # Для списка загруженных систем рекомендаций
 from datetime import datetime  # Для работы с датами и временем
-import pandas as pd  # Для анализа данных и создания датафреймов
-from aiogram import types, Dispatcher  # Основные компоненты библиотеки aiogram
+from aiogram import types, Dispatcher, F  # Основные компоненты библиотеки aiogram
 from aiogram.fsm.context import FSMContext  # Для работы с состояниями пользователей
 from aiogram.fsm.state import State, StatesGroup  # Для определения состояний
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton  # Для создания интерактивных кнопок
 import asyncio  # Для асинхронного выполнения задач
+from callback_router import get_callback_router  # Маршрутизатор callback-запросов
+import catalog_refresh  # Обновление каталога в памяти по журналу изменений
+from catalog_refresh import CatalogRefresher, CatalogSnapshot  # Снимок каталога в памяти
+from rankings import ProductRankings  # Товары, упорядоченные по рейтингу и цене
+import result_cache  # Кэш результатов подбора по версиям категорий
+from result_cache import ResultCache, cache_key  # Ключ и хранилище результатов
+import result_cursors  # Курсоры постраничного просмотра рекомендаций
+from result_cursors import CursorStore  # Хранилище курсоров
+import also_viewed  # Похожие товары по совместным просмотрам
+from also_viewed import AlsoViewed  # Журнал просмотров и матрица соседей
+import catalog_db  # Схема базы товаров: нормализованные атрибуты и миграция
+import catalog_pool  # Пул соединений с базой товаров с асинхронным интерфейсом
+import columnar_catalog  # Столбцовый снимок каталога, общий для рабочих процессов
+from columnar_catalog import ColumnarCatalog  # Снимок, отображенный в память
+from bot_logging import get_logger  # Структурированное логирование через фоновый поток
+from metrics import METRICS_KEY  # Ключ метрик в данных диспетчера
+
+log = get_logger(__name__)
 
 # Класс состояний для процесса подбора рекомендаций
 # Используется для отслеживания на каком этапе взаимодействия находится пользователь
@@ -22,6 +41,7 @@ class RecommendationState(StatesGroup):
     waiting_for_criteria = State()  # Ожидание ввода критериев пользователем
     choosing_criteria = State()  # Состояние выбора конкретных критериев
     waiting_for_operator_reply = State()  # Ожидание ответа оператора на запрос пользователя
+    waiting_for_search = State()  # Ожидание текста поискового запроса
 
 # Временное хранилище для данных пользователей
 # Используется для сохранения промежуточных результатов взаимодействия
@@ -35,6 +55,20 @@ recommendation_requests = {}
 # В этот чат будут отправляться запросы от пользователей, если автоматический подбор не справился
 OPERATOR_CHAT_ID = None
 
+# Сколько товаров показывать на одной странице автоматических рекомендаций
+RESULT_PAGE_SIZE = 5
+
+# Кнопки категорий товаров: (категория, текст кнопки); названия на кнопках участвуют и в поиске
+CATEGORY_BUTTONS = [
+    ("lipstick", "💄 Помада"),
+    ("mascara", "👁️ Тушь для ресниц"),
+    ("perfume", "🧴 Парфюм"),
+    ("blush", "🌸 Румяна"),
+    ("highlighter", "✨ Хайлайтер"),
+    ("powder", "🌟 Пудра"),
+    ("eyeshadow", "👀 Тени"),
+]
+
 def init_db():
     """Инициализирует базу данных рекомендаций, если она не существует
     
@@ -49,14 +83,22 @@ def init_db():
     - price: цена товара
     - rating: рейтинг товара (от 0 до 5)
     - attributes: JSON-строка с атрибутами товара (тип, эффект, цвет и т.д.)
+    
+    Атрибуты дополнительно хранятся в таблице product_attributes (по строке на значение)
+    с составными индексами для поиска по критериям. Существующая база переводится
+    на эту схему миграцией catalog_db.migrate без пересоздания; ошибка миграции
+    записывается в лог, а товары остаются в базе. Если индекс поиска построить
+    не удалось (нет FTS5), отключается только поиск по названию.
     """
+    # Путь к базе не зависит от текущего каталога (CATALOG_DB_PATH или рядом с ботом)
+    db_path = catalog_pool.db_path()
     try:
         import os
         # Проверяем наличие файла базы данных
-        db_exists = os.path.exists('recommendations.db')
+        db_exists = os.path.exists(db_path)
         
         # Подключаемся к базе данных (если файл не существует, он будет создан)
-        conn = sqlite3.connect('recommendations.db')
+        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         
         # Проверяем структуру существующей таблицы, если база данных уже существует
@@ -245,19 +287,26 @@ def init_db():
         print(f"Количество товаров в базе данных: {row_count}")
         
         conn.close()
+    except sqlite3.OperationalError as e:
+        # База занята или недоступна (блокировка, ошибка ввода-вывода) - товары в ней
+        # целы, поэтому файл не удаляем
+        logging.error(f"Ошибка инициализации базы данных: {e}")
+        print(f"Ошибка при инициализации БД: {e}")
+        return
     except Exception as e:
         # Логируем ошибку инициализации базы данных
         logging.error(f"Ошибка инициализации базы данных: {e}")
         print(f"Ошибка при инициализации БД: {e}")
-        # Если возникла ошибка, пробуем создать базу данных заново
+        # Файл не является рабочей базой с таблицей products - пробуем создать базу заново
         try:
             import os
-            # Удаляем файл базы данных, если он существует
-            if os.path.exists('recommendations.db'):
-                os.remove('recommendations.db')
+            # Удаляем файл базы данных и его журнал WAL, если они существуют
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
             
             # Создаем новую базу данных с базовой структурой
-            conn = sqlite3.connect('recommendations.db')
+            conn = sqlite3.connect(db_path)
             cursor = conn.cursor()
             cursor.execute('''CREATE TABLE IF NOT EXISTS products
                           (id INTEGER PRIMARY KEY,
@@ -273,12 +322,45 @@ def init_db():
             # Логируем критическую ошибку, если не удалось пересоздать базу данных
             logging.error(f"Критическая ошибка при пересоздании базы данных: {inner_e}")
             print(f"Критическая ошибка: {inner_e}")
+            return
+    
+    # Миграция выполняется отдельно от пересоздания: при ее ошибке каталог остается
+    # на месте, а повторный запуск продолжит миграцию с места остановки
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            # Нормализованная таблица атрибутов и индексы (для старой базы - миграция на месте)
+            catalog_db.migrate(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        logging.error(f"Ошибка миграции базы данных {db_path}: {e}")
+        print(f"Ошибка миграции БД: {e}")
+        return
+    
+    # Индекс полнотекстового поиска по названиям и характеристикам товаров. Если SQLite
+    # собран без FTS5 или токенизатора trigram, поиск по названию отключается,
+    # а каталог продолжает работать
+    global _search_available
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            catalog_db.sync_search_titles(conn, search_titles())
+        finally:
+            conn.close()
+        _search_available = True
+    except Exception as e:
+        _search_available = False
+        logging.error(f"Индекс поиска не построен, поиск по названию отключен: {e}")
+        print(f"Ошибка построения индекса поиска: {e}")
 
 def get_category_criteria_keyboard(category: str, selected_criteria: list = None) -> InlineKeyboardMarkup:
     """Создает клавиатуру с критериями для выбранной категории товаров
     
     Формирует интерактивную клавиатуру с доступными критериями для выбранной категории.
-    Выбранные критерии отмечаются специальным символом.
+    Выбранные критерии отмечаются специальным символом. Если снимок каталога уже
+    построен, рядом с каждым критерием показывается, сколько товаров подойдет после
+    его переключения (facets.py), а на кнопке показа - сколько подходит сейчас.
     
     Args:
         category (str): Категория товара (mascara, lipstick, perfume и т.д.)
@@ -293,6 +375,10 @@ def get_category_criteria_keyboard(category: str, selected_criteria: list = None
     # Получаем критерии для выбранной категории из константного класса ProductCategories
     category_data = getattr(ProductCategories, category.upper(), {})
     
+    # Счетчики товаров по критериям из снимка каталога в памяти (до прогрева - без счетчиков)
+    snapshot = get_catalog_snapshot()
+    facet_counts = snapshot.facets.toggle_counts(category, selected_criteria) if snapshot is not None else None
+    
     buttons = []
     # Добавляем смайлики для разных групп критериев для улучшения пользовательского опыта
     emoji_map = {
@@ -391,8 +477,12 @@ def get_category_criteria_keyboard(category: str, selected_criteria: list = None
                 elif criteria_id == "transparent": criteria_emoji = "👻 "
                 elif criteria_id == "tinted": criteria_emoji = "🎨 "
                 
+            count = ""
+            if facet_counts is not None:
+                count = f" ({facet_counts.get(f'{criteria_group}_{criteria_id}', 0)})"
+                
             criteria_buttons.append(InlineKeyboardButton(
-                text=f"{marker}{criteria_emoji}{criteria_name}",
+                text=f"{marker}{criteria_emoji}{criteria_name}{count}",
                 callback_data=f"criteria_{category}_{criteria_group}_{criteria_id}"
             ))
             
@@ -407,8 +497,11 @@ def get_category_criteria_keyboard(category: str, selected_criteria: list = None
             buttons.append(row)
     
     # Добавляем кнопки управления
+    show_text = "✨ Показать рекомендации"
+    if facet_counts is not None:
+        show_text += f" ({snapshot.facets.count(category, selected_criteria)})"
     buttons.extend([
-        [InlineKeyboardButton(text="✨ Показать рекомендации", callback_data=f"show_recommendations_{category}")],
+        [InlineKeyboardButton(text=show_text, callback_data=f"show_recommendations_{category}")],
         [InlineKeyboardButton(text="🔄 Сбросить", callback_data=f"reset_criteria_{category}")],
         [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_categories")]
     ])
@@ -428,11 +521,14 @@ async def get_user_data(user_id: int) -> dict:
         dict: Словарь с данными пользователя, включающий историю просмотров,
               историю покупок и предпочтения
     """
-    return user_storage.get(user_id, {
+    data = user_storage.get(user_id, {
         'view_history': [],  # История просмотров товаров пользователем
         'purchase_history': [],  # История покупок пользователя
         'preferences': {}  # Предпочтения пользователя (выбранные критерии)
     })
+    # Последние просмотренные товары - из журнала просмотров (also_viewed.py)
+    data['view_history'] = get_also_viewed().recent(user_id)
+    return data
 
 # Класс с категориями товаров и их критериями
 class ProductCategories:
@@ -583,11 +679,16 @@ class ProductCategories:
     }
 
 # Класс для управления системой рекомендаций
+# Экземпляры RecommendationSystem с загруженными товарами (обновляются в фоне)
+_loaded_systems = weakref.WeakSet()
+
 class RecommendationSystem:
     """Базовый класс системы рекомендаций
     
     Предоставляет основные методы для загрузки данных из базы данных
-    и генерации рекомендаций по различным критериям.
+    и генерации рекомендаций по различным критериям. Если рядом с базой есть
+    столбцовый снимок текущей версии каталога (columnar_catalog.py), товары
+    не загружаются: рекомендации берутся из снимка, отображенного в память.
     """
     
     def __init__(self):
@@ -598,24 +699,54 @@ class RecommendationSystem:
         """
         self.products = []  # Список всех товаров
         self.products_by_category = {}  # Словарь товаров по категориям
+        self.products_by_id = {}  # Словарь товаров по id
+        self.rankings = ProductRankings()  # Товары категорий по рейтингу и цене
+        self.columns = None  # Столбцовый снимок каталога (ColumnarCatalog) вместо загруженных товаров
+        self.version = 0  # Версия каталога (номер записи журнала изменений) загруженных данных
         self.data_loaded = False  # Флаг загрузки данных
+        # Одновременные первые запросы ждут одну загрузку, а не загружают товары каждый сам
+        self._load_lock = asyncio.Lock()
         
-    def load_data(self):
+    async def load_data(self, use_columns: bool = True):
         """Загружает данные о товарах из базы данных
         
         Заполняет self.products и self.products_by_category данными из БД.
         Если данные уже загружены, повторная загрузка не производится.
+        Запрос выполняется в пуле соединений и не блокирует цикл событий;
+        одновременные вызовы выполняют одну загрузку, а загруженные данные
+        заменяют прежние одним присваиванием.
+        
+        Args:
+            use_columns (bool): Если есть снимок текущей версии каталога
+                                (get_columnar_catalog), использовать его вместо загрузки
         """
         if self.data_loaded:
             return
         
+        async with self._load_lock:
+            # Пока ждали блокировку, данные мог загрузить другой вызов
+            if self.data_loaded:
+                return
+            await self._load_data(use_columns)
+    
+    async def _load_data(self, use_columns: bool):
+        """Загружает товары (load_data под блокировкой)"""
         try:
-            # Подключение к БД и получение данных
-            conn = sqlite3.connect('recommendations.db')
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name, category, price, rating, attributes FROM products")
-            rows = cursor.fetchall()
+            columns = get_columnar_catalog() if use_columns else None
+            pool = get_catalog_pool()
+            if columns is not None and await pool.run("columnar_catalog", columns.is_current, pool.path):
+                self.columns = columns
+                self.version = columns.version
+                self.data_loaded = True
+                _loaded_systems.add(self)
+                return
+            
+            # Получение данных через пул соединений с базой товаров
+            version, rows = await pool.run("load_products", _select_all_products)
             
+            products = []
+            products_by_category = {}
+            products_by_id = {}
             # Обработка результатов запроса
             for row in rows:
                 product_id, name, category, price, rating, attributes_json = row
@@ -638,15 +769,23 @@ class RecommendationSystem:
                 }
                 
                 # Добавляем товар в общий список
-                self.products.append(product)
+                products.append(product)
+                products_by_id[product_id] = product
                 
                 # Добавляем товар в словарь по категориям
-                if category not in self.products_by_category:
-                    self.products_by_category[category] = []
-                self.products_by_category[category].append(product)
+                if category not in products_by_category:
+                    products_by_category[category] = []
+                products_by_category[category].append(product)
             
-            conn.close()
+            # Заменяем данные целиком, без await между присваиваниями
+            self.products = products
+            self.products_by_category = products_by_category
+            self.products_by_id = products_by_id
+            self.rankings = ProductRankings.build(products_by_category)
+            self.version = version
             self.data_loaded = True
+            # Дальнейшие изменения каталога применяются в фоне (refresh_data)
+            _loaded_systems.add(self)
             print(f"Загружено {len(self.products)} товаров из базы данных")
         
         except Exception as e:
@@ -654,21 +793,89 @@ class RecommendationSystem:
             logging.error(f"Ошибка при загрузке данных из БД: {e}")
             print(f"Ошибка при загрузке данных: {e}")
     
-    def refresh_data(self):
-        """Принудительно обновляет данные из базы данных
+    async def refresh_data(self):
+        """Обновляет данные после изменения базы данных
         
-        Очищает кеш и заново загружает данные о товарах.
-        Используется, если данные в базе были изменены.
+        Читает из журнала изменений только товары, измененные после загрузки
+        данных, и применяет их (apply_changes). Данные загружаются заново целиком,
+        только если нужные записи журнала уже удалены.
         """
-        self.products = []
-        self.products_by_category = {}
-        self.data_loaded = False
-        self.load_data()
+        if not self.data_loaded:
+            await self.load_data()
+            return
+        
+        pool = get_catalog_pool()
+        while True:
+            changes = await pool.run("catalog_changes", catalog_db.read_changes, self.version)
+            if self.columns is not None and (changes["reset"] or changes["count"]):
+                # Снимок устарел - загружаем товары из базы и дальше применяем изменения к ним
+                self.columns = None
+                self.data_loaded = False
+                await self.load_data(use_columns=False)
+                return
+            if changes["reset"]:
+                self.products = []
+                self.products_by_category = {}
+                self.products_by_id = {}
+                self.rankings = ProductRankings()
+                self.data_loaded = False
+                await self.load_data()
+                return
+            if not changes["count"]:
+                return
+            self.apply_changes(changes)
     
-    def get_recommendations_by_popularity(self, category=None, limit=5):
+    def apply_changes(self, changes: dict):
+        """Применяет изменения каталога (catalog_db.read_changes) к загруженным данным
+        
+        Новые списки строятся только для категорий, которых коснулись изменения,
+        и заменяют старые одновременно, без await между присваиваниями, поэтому
+        обработчики не видят наполовину обновленные данные.
+        
+        Args:
+            changes (dict): Изменения после версии загруженных данных
+        """
+        products = changes["products"]
+        changed = {product["id"] for product in products} | set(changes["deleted"])
+        
+        products_by_id = dict(self.products_by_id)
+        # {категория: (прежние версии товаров, новые версии товаров)}
+        category_changes = {}
+        for product_id in changed:
+            old = products_by_id.pop(product_id, None)
+            if old is not None:
+                category_changes.setdefault(old["category"], ([], []))[0].append(old)
+        for product in products:
+            products_by_id[product["id"]] = product
+            category_changes.setdefault(product["category"], ([], []))[1].append(product)
+        affected = set(category_changes)
+        
+        products_by_category = dict(self.products_by_category)
+        for category in affected:
+            category_products = [product for product in products_by_category.get(category, [])
+                                 if product["id"] not in changed]
+            category_products.extend(product for product in products if product["category"] == category)
+            category_products.sort(key=lambda product: product["id"])
+            if category_products:
+                products_by_category[category] = category_products
+            else:
+                products_by_category.pop(category, None)
+        
+        all_products = [product for category_products in products_by_category.values()
+                        for product in category_products]
+        rankings = self.rankings.updated(products_by_category, category_changes)
+        
+        self.products = all_products
+        self.products_by_category = products_by_category
+        self.products_by_id = products_by_id
+        self.rankings = rankings
+        self.version = changes["version"]
+    
+    async def get_recommendations_by_popularity(self, category=None, limit=5):
         """Возвращает рекомендации на основе рейтинга популярности
         
-        Выбирает товары с наивысшим рейтингом из указанной категории.
+        Выбирает товары с наивысшим рейтингом из указанной категории - первые
+        limit товаров заранее упорядоченного списка (rankings.py), без сортировки.
         
         Args:
             category (str, optional): Категория товаров для рекомендаций.
@@ -679,24 +886,18 @@ class RecommendationSystem:
             list: Список словарей с информацией о рекомендованных товарах.
         """
         # Загружаем данные, если они ещё не загружены
-        self.load_data()
-        
-        # Выбираем товары из указанной категории или из всех категорий
-        if category:
-            products = self.products_by_category.get(category, [])
-        else:
-            products = self.products
-        
-        # Сортируем товары по рейтингу (от высшего к низшему)
-        sorted_products = sorted(products, key=lambda x: x['rating'], reverse=True)
+        await self.load_data()
         
-        # Возвращаем лимитированное количество товаров
-        return sorted_products[:limit]
+        # Товары категории (или всех категорий) по убыванию рейтинга
+        if self.columns is not None:
+            return self.columns.top(category, "rating", limit)
+        return self.rankings.top(category, "rating", limit)
     
-    def get_recommendations_by_price(self, category=None, limit=5, ascending=True):
+    async def get_recommendations_by_price(self, category=None, limit=5, ascending=True):
         """Возвращает рекомендации на основе цены
         
-        Выбирает товары с наименьшей или наибольшей ценой из указанной категории.
+        Выбирает товары с наименьшей или наибольшей ценой из указанной категории -
+        первые limit товаров заранее упорядоченного списка (rankings.py), без сортировки.
         
         Args:
             category (str, optional): Категория товаров для рекомендаций.
@@ -709,33 +910,33 @@ class RecommendationSystem:
             list: Список словарей с информацией о рекомендованных товарах.
         """
         # Загружаем данные, если они ещё не загружены
-        self.load_data()
+        await self.load_data()
         
-        # Выбираем товары из указанной категории или из всех категорий
-        if category:
-            products = self.products_by_category.get(category, [])
-        else:
-            products = self.products
-        
-        # Сортируем товары по цене (по возрастанию или убыванию)
-        sorted_products = sorted(products, key=lambda x: x['price'], reverse=not ascending)
-        
-        # Возвращаем лимитированное количество товаров
-        return sorted_products[:limit]
+        # Товары категории (или всех категорий) по возрастанию или убыванию цены
+        order = "price" if ascending else "price_desc"
+        if self.columns is not None:
+            return self.columns.top(category, order, limit)
+        return self.rankings.top(category, order, limit)
 
 # Расширенная система рекомендаций
 class AdvancedRecommendationSystem:
     """Расширенная система рекомендаций с возможностью фильтрации по критериям
     
     Этот класс предоставляет продвинутые методы для поиска товаров, соответствующих
-    заданным критериям. Работает напрямую с базой данных для более гибкого поиска.
+    заданным критериям. Подходящие товары ищутся по инвертированному индексу атрибутов,
+    а данные найденных товаров загружаются из базы данных одним подготовленным
+    запросом или берутся из столбцового снимка каталога (fetch_products). Результаты подбора по критериям хранятся
+    в кэше (result_cache.py), пока не изменятся товары категории.
     """
     
-    def get_recommendations(self, category: str, criteria: list) -> list:
+    async def get_recommendations(self, category: str, criteria: list) -> list:
         """Возвращает рекомендации по категории и списку критериев
         
-        Выполняет запрос к базе данных и фильтрует товары, соответствующие 
-        всем указанным критериям из выбранной категории.
+        Находит id товаров, соответствующих критериям (критерии одной группы - по ИЛИ,
+        группы - по И), по битовым маскам атрибутов товаров категории и загружает эти
+        товары из базы данных. Пока маски в памяти не построены (прогрев каталога еще
+        идет), id ищутся в базе по составному индексу таблицы product_attributes.
+        Запросы к базе выполняются в пуле соединений и не блокируют цикл событий.
         
         Args:
             category (str): Категория товаров для поиска (mascara, lipstick, perfume и т.д.)
@@ -746,131 +947,380 @@ class AdvancedRecommendationSystem:
             list: Список словарей с информацией о рекомендованных товарах
         """
         # Вывод отладочной информации для отслеживания вызовов
-        print(f"Поиск рекомендаций для категории: {category}, критерии: {criteria}")
-        
-        # Подключение к базе данных SQLite
-        conn = sqlite3.connect('recommendations.db')
-        cursor = conn.cursor()
+        log.debug("Поиск рекомендаций", category=category, criteria=list(criteria))
         
+        pool = get_catalog_pool()
         try:
-            # Проверяем структуру таблицы products и наличие столбца attributes
-            # Это важно, так как критерии хранятся в JSON формате в этом столбце
-            cursor.execute("PRAGMA table_info(products)")
-            columns = [col[1] for col in cursor.fetchall()]
-            print(f"Столбцы таблицы products: {columns}")
-            
-            # Формируем базовый SQL запрос для выборки товаров заданной категории
-            query = f"SELECT * FROM products WHERE category = ?"
-            params = [category]
-            
-            # Если в таблице есть столбец attributes и заданы критерии,
-            # расширяем запрос дополнительными условиями LIKE для каждого критерия
-            # Поиск выполняется по вхождению критерия в JSON строку атрибутов
-            if 'attributes' in columns and criteria:
-                query += " AND " + " AND ".join(["attributes LIKE ?" for _ in criteria])
-                params += [f'%{c}%' for c in criteria]
-            
-            # Выполняем SQL запрос с параметрами
-            print(f"SQL запрос: {query}")
-            print(f"Параметры: {params}")
-            cursor.execute(query, params)
-            
-            # Получаем результаты запроса
-            rows = cursor.fetchall()
-            print(f"Найдено товаров: {len(rows)}")
-            
-            # Преобразуем результаты запроса в список словарей для удобства использования
-            results = self._parse_results(rows, columns)
+            # Подходящие товары ищутся по битовым маскам атрибутов, затем в индексе
+            # (категория, группа, значение) -> id товаров, до прогрева - в базе
+            snapshot = get_catalog_snapshot()
+            if snapshot is not None:
+                cache, key = get_result_cache(), cache_key("match", category, criteria)
+                version = snapshot.category_version(category)
+                cached = cache.get(key, version)
+                if cached is not None:
+                    return list(cached)
+            matched = snapshot.bits.match(category, criteria) if snapshot is not None else None
+            if matched is not None:
+                product_ids = matched.tolist()
+            elif snapshot is not None:
+                product_ids = snapshot.index.lookup(category, criteria)
+            else:
+                product_ids = await pool.run("find_product_ids", catalog_db.find_product_ids,
+                                             category, criteria)
+            log.debug("Найдено товаров", category=category, count=len(product_ids))
             
-            # Возвращаем результаты, если они найдены, или пустой список
-            return results
+            # Загружаем найденные товары одним подготовленным запросом
+            products = []
+            if product_ids:
+                products = await fetch_products(product_ids)
+            if snapshot is not None:
+                cache.put(key, version, products)
+            return list(products)
         
         except Exception as e:
             # Логируем ошибку при выполнении запроса
             logging.error(f"Ошибка при поиске рекомендаций: {e}")
-            print(f"Ошибка при поиске рекомендаций: {e}")
             return []
-        
-        finally:
-            # Закрываем соединение с базой данных в любом случае
-            conn.close()
 
-    def _parse_results(self, rows, columns) -> list:
-        """Преобразует результаты SQL запроса в список словарей
-        
-        Args:
-            rows (list): Список кортежей с результатами запроса
-            columns (list): Список имен столбцов таблицы
-            
-        Returns:
-            list: Список словарей с данными о товарах
-        """
-        results = []
-        
-        # Индекс столбца attributes для быстрого доступа
-        attributes_idx = columns.index('attributes') if 'attributes' in columns else -1
-        
-        for row in rows:
-            # Создаем словарь товара из данных запроса
-            item = {}
-            for i, col in enumerate(columns):
-                if i < len(row):
-                    item[col] = row[i]
-            
-            # Преобразуем JSON строку атрибутов в словарь Python
-            if attributes_idx >= 0 and attributes_idx < len(row) and row[attributes_idx]:
-                try:
-                    item['attributes'] = json.loads(row[attributes_idx])
-                except (json.JSONDecodeError, TypeError) as e:
-                    print(f"Ошибка декодирования JSON для товара: {e}")
-                    item['attributes'] = {}
-            else:
-                item['attributes'] = {}
-            
-            results.append(item)
-        
-        return results
-    
-    def get_random_recommendations(self, category, limit=3):
+    async def get_random_recommendations(self, category, limit=3, seed=None, page=0, weighted=False):
         """Возвращает случайные рекомендации из указанной категории
         
         Используется, когда нет конкретных критериев или для разнообразия предложений.
+        После прогрева каталога id товаров выбираются в памяти (sampling.CatalogSampler)
+        за O(limit), до прогрева - случайными позициями в индексе idx_products_category.
+        Загружаются только выбранные товары.
         
         Args:
             category (str): Категория товаров (mascara, lipstick, perfume и т.д.)
             limit (int, optional): Максимальное количество рекомендаций. По умолчанию 3.
+            seed (int, optional): Ключ сессии пользователя (sampling.new_session_seed);
+                                  с ним выбор воспроизводим и страницы не повторяются
+            page (int, optional): Номер страницы "Показать другие рекомендации" для seed
+            weighted (bool, optional): Чаще выбирать товары с высоким рейтингом
             
         Returns:
             list: Список словарей с информацией о случайно выбранных товарах
         """
-        conn = sqlite3.connect('recommendations.db')
-        cursor = conn.cursor()
-        
+        pool = get_catalog_pool()
         try:
-            # Получаем структуру таблицы для корректного парсинга результатов
-            cursor.execute("PRAGMA table_info(products)")
-            columns = [col[1] for col in cursor.fetchall()]
-            
-            # Выполняем запрос с случайной сортировкой и ограничением количества
-            cursor.execute(
-                "SELECT * FROM products WHERE category = ? ORDER BY RANDOM() LIMIT ?", 
-                (category, limit)
-            )
-            
-            results = cursor.fetchall()
-            return self._parse_results(results, columns)
+            snapshot = get_catalog_snapshot()
+            if snapshot is not None:
+                product_ids = snapshot.sampler.sample(category, limit, seed=seed, page=page, weighted=weighted)
+            else:
+                product_ids = await pool.run("random_product_ids", catalog_db.random_product_ids,
+                                             category, limit)
+            if not product_ids:
+                return []
+            return await fetch_products(product_ids)
             
         except Exception as e:
             logging.error(f"Ошибка при получении случайных рекомендаций: {e}")
-            print(f"Ошибка: {e}")
             return []
+
+    async def get_ranked_recommendations(self, category: str, criteria: list, limit: int = 5) -> list:
+        """Возвращает товары категории, лучше всего совпадающие с критериями
+        
+        Используется, когда ни один товар не подходит под все критерии сразу:
+        вся категория ранжируется по числу совпавших критериев, а при равном
+        числу совпадений - по рейтингу (relevance.RelevanceIndex).
+        
+        Args:
+            category (str): Категория товаров
+            criteria (list): Критерии в формате "группа_значение"
+            limit (int, optional): Максимальное количество рекомендаций. По умолчанию 5.
             
-        finally:
-            conn.close()
+        Returns:
+            list: Словари товаров по убыванию оценки; в каждом ключ "relevance"
+                  с совпавшими ("matched") и несовпавшими ("missing") критериями
+        """
+        snapshot = get_catalog_snapshot()
+        if snapshot is None or not criteria:
+            return []
+        try:
+            cache, key = get_result_cache(), cache_key("ranked", category, criteria, limit)
+            version = snapshot.category_version(category)
+            cached = cache.get(key, version)
+            if cached is not None:
+                return list(cached)
+            ranked = snapshot.relevance.rank(category, criteria, limit)
+            if not ranked:
+                cache.put(key, version, [])
+                return []
+            products = await fetch_products([product_id for product_id, *_ in ranked])
+            by_id = {product["id"]: product for product in products}
+            results = []
+            for product_id, score, matched, missing in ranked:
+                product = by_id.get(product_id)
+                if product is not None:
+                    product["relevance"] = {"score": score, "matched": matched, "missing": missing}
+                    results.append(product)
+            cache.put(key, version, results)
+            return list(results)
+        
+        except Exception as e:
+            logging.error(f"Ошибка при ранжировании рекомендаций: {e}")
+            return []
+
+def _select_all_products(conn) -> tuple:
+    """Версия каталога и все товары (выполняется в потоке пула соединений)
+    
+    Версия читается до товаров: изменения, сделанные между двумя запросами,
+    будут применены еще раз при обновлении, что ничего не портит.
+    """
+    version = catalog_db.latest_change(conn)
+    return version, conn.execute("SELECT id, name, category, price, rating, attributes FROM products").fetchall()
+
+# Пул соединений с базой товаров, создается при первом запросе в каждом процессе
+_catalog_pool = None
+
+def get_catalog_pool() -> catalog_pool.CatalogPool:
+    """Возвращает пул соединений с базой товаров, при первом вызове создает его
+    
+    Настройки пула читаются из переменных окружения (catalog_pool.config_from_env).
+    
+    Returns:
+        catalog_pool.CatalogPool: Пул соединений
+    """
+    global _catalog_pool
+    if _catalog_pool is None:
+        _catalog_pool = catalog_pool.CatalogPool(**catalog_pool.config_from_env())
+    return _catalog_pool
+
+async def close_catalog_pool(**kwargs):
+    """Закрывает пул соединений с базой товаров (при остановке диспетчера)"""
+    global _catalog_pool
+    pool, _catalog_pool = _catalog_pool, None
+    if pool is not None:
+        await asyncio.to_thread(pool.close)
+
+# Столбцовый снимок каталога, отображенный в память; открывается при первом запросе
+_columnar_catalog = None
+
+def get_columnar_catalog():
+    """Возвращает столбцовый снимок каталога, если файл снимка есть
+    
+    Файл (columnar_catalog.snapshot_path) пишет write_columnar_catalog - например,
+    супервизор рабочих процессов при запуске. Снимок открывается заново, если файл
+    подменили. Соответствие текущей версии базы проверяет ColumnarCatalog.is_current.
+    
+    Returns:
+        ColumnarCatalog: Снимок или None
+    """
+    global _columnar_catalog
+    path = columnar_catalog.snapshot_path(catalog_pool.db_path())
+    current = catalog_db.file_id(path)
+    if current is None:
+        return None
+    if _columnar_catalog is None or _columnar_catalog.opened_file != current:
+        try:
+            _columnar_catalog = ColumnarCatalog(path)
+        except (OSError, ValueError) as e:
+            logging.error(f"Не удалось открыть снимок каталога {path}: {e}")
+            return None
+    return _columnar_catalog
+
+def write_columnar_catalog() -> dict:
+    """Записывает столбцовый снимок текущей базы товаров рядом с ней
+    
+    Returns:
+        dict: Отчет columnar_catalog.write или None, если снимок записать не удалось
+    """
+    path = catalog_pool.db_path()
+    try:
+        report = columnar_catalog.write(path, columnar_catalog.snapshot_path(path))
+    except (OSError, ValueError, sqlite3.Error) as e:
+        logging.error(f"Не удалось записать снимок каталога: {e}")
+        return None
+    log.info("Снимок каталога записан", products=report["products"], bytes=report["bytes"],
+             seconds=round(report["seconds"], 3))
+    return report
 
 # Инициализация системы рекомендаций (будет использоваться далее)
 recommendation_system = AdvancedRecommendationSystem()
 
+# Снимок каталога в памяти (индекс атрибутов, битовые маски, массивы для случайного
+# выбора, матрицы совпадения критериев); строится при прогреве каталога и затем
+# обновляется в фоне по журналу изменений базы товаров
+_catalog_refresher = None
+
+def get_catalog_refresher() -> CatalogRefresher:
+    """Возвращает объект фонового обновления каталога, при первом вызове создает его
+    
+    Returns:
+        CatalogRefresher: Обновление снимка каталога по журналу изменений
+    """
+    global _catalog_refresher
+    if _catalog_refresher is None:
+        _catalog_refresher = CatalogRefresher(catalog_pool.db_path(), **catalog_refresh.config_from_env())
+        # Загруженные списки товаров RecommendationSystem тоже получают изменения
+        _catalog_refresher.listeners.append(_refresh_recommendation_system)
+    return _catalog_refresher
+
+def get_catalog_snapshot():
+    """Возвращает текущий снимок каталога в памяти, если он уже построен
+    
+    Снимок строится при прогреве каталога (warmup_catalog). До этого поиск
+    по критериям выполняется в базе данных по таблице product_attributes,
+    чтобы первый запрос не ждал построения индексов. Снимок не меняется:
+    обработчик, взявший его один раз, работает с одной версией каталога.
+    
+    Returns:
+        CatalogSnapshot: Снимок каталога или None
+    """
+    refresher = _catalog_refresher
+    return refresher.snapshot if refresher is not None else None
+
+def refresh_catalog_snapshot() -> CatalogSnapshot:
+    """Перестраивает снимок каталога целиком
+    
+    Если есть столбцовый снимок текущей версии базы (get_columnar_catalog), снимок
+    строится по нему, иначе - по всей таблице products. Новый снимок строится
+    целиком и только затем заменяет старый, поэтому поиск во время перестроения
+    использует прежний снимок.
+    
+    Returns:
+        CatalogSnapshot: Новый снимок
+    """
+    return get_catalog_refresher().build(get_columnar_catalog())
+
+async def fetch_products(product_ids) -> list:
+    """Загружает товары по id в порядке product_ids
+    
+    Пока снимок каталога в памяти соответствует столбцовому снимку (та же версия
+    каталога и тот же файл базы), словари товаров создаются из столбцов, отображенных
+    в память, без запроса к базе. Иначе товары загружаются одним подготовленным
+    запросом (catalog_db.fetch_products) в пуле соединений.
+    
+    Args:
+        product_ids: Последовательность id товаров
+        
+    Returns:
+        list: Словари товаров
+    """
+    columns, snapshot = _columnar_catalog, get_catalog_snapshot()
+    if (columns is not None and snapshot is not None and columns.complete
+            and snapshot.version == columns.version and snapshot.file_id == columns.file_id):
+        products = [columns.get(product_id) for product_id in product_ids]
+        if None not in products:
+            return products
+    return await get_catalog_pool().run("fetch_products", catalog_db.fetch_products, product_ids)
+
+async def _refresh_recommendation_system(changes: dict):
+    # Применяет изменения каталога к загруженным спискам товаров RecommendationSystem
+    for system in list(_loaded_systems):
+        await system.refresh_data()
+
+async def start_catalog_refresher(**kwargs):
+    """Запускает фоновое обновление каталога в памяти (при запуске диспетчера)"""
+    get_catalog_refresher().start(get_catalog_pool())
+    await warmup_result_cache()
+
+# Кэш результатов подбора, создается при первом запросе в каждом процессе
+_result_cache = None
+
+def get_result_cache() -> ResultCache:
+    """Возвращает кэш результатов подбора, при первом вызове создает его
+    
+    Настройки кэша читаются из переменных окружения (result_cache.config_from_env).
+    
+    Returns:
+        ResultCache: Кэш результатов
+    """
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(**result_cache.config_from_env())
+    return _result_cache
+
+async def warmup_result_cache() -> int:
+    """Заполняет кэш результатов популярными сочетаниями из RESULT_CACHE_WARMUP
+    
+    Выполняется, только если снимок каталога уже построен: до прогрева каталога
+    результаты не кэшируются.
+    
+    Returns:
+        int: Сколько сочетаний подобрано
+    """
+    combinations = result_cache.warmup_from_env()
+    if not combinations or get_catalog_snapshot() is None:
+        return 0
+    for category, criteria in combinations:
+        # Так же, как при подборе без оператора: при пустом результате - ближайшие товары
+        if not await recommendation_system.get_recommendations(category, criteria) and criteria:
+            await recommendation_system.get_ranked_recommendations(category, criteria)
+    log.info("Кэш результатов прогрет", combinations=len(combinations), entries=len(get_result_cache()))
+    return len(combinations)
+
+# Курсоры постраничного просмотра рекомендаций, создаются при первом запросе в каждом процессе
+_result_cursors = None
+
+def get_result_cursors() -> CursorStore:
+    """Возвращает хранилище курсоров рекомендаций, при первом вызове создает его
+    
+    Настройки читаются из переменных окружения (result_cursors.config_from_env).
+    
+    Returns:
+        CursorStore: Хранилище курсоров
+    """
+    global _result_cursors
+    if _result_cursors is None:
+        _result_cursors = CursorStore(**result_cursors.config_from_env())
+    return _result_cursors
+
+# Похожие товары по журналу просмотров, создаются при первом запросе в каждом процессе
+_also_viewed = None
+
+def get_also_viewed() -> AlsoViewed:
+    """Возвращает журнал просмотров и матрицу похожих товаров, при первом вызове создает их
+    
+    Настройки читаются из переменных окружения (also_viewed.config_from_env).
+    
+    Returns:
+        AlsoViewed: Журнал просмотров и матрица соседей
+    """
+    global _also_viewed
+    if _also_viewed is None:
+        _also_viewed = AlsoViewed(**also_viewed.config_from_env())
+    return _also_viewed
+
+async def start_also_viewed(**kwargs):
+    """Запускает фоновую запись и чтение журнала просмотров"""
+    get_also_viewed().start()
+
+async def stop_also_viewed(**kwargs):
+    """Записывает оставшиеся просмотры и закрывает журнал"""
+    global _also_viewed
+    viewed, _also_viewed = _also_viewed, None
+    if viewed is not None:
+        await viewed.stop()
+
+async def stop_catalog_refresher(**kwargs):
+    """Останавливает фоновое обновление каталога в памяти"""
+    if _catalog_refresher is not None:
+        await _catalog_refresher.stop()
+
+def warmup_catalog() -> dict:
+    """Прогревает каталог товаров перед приемом обновлений
+    
+    Строит снимок каталога: индекс атрибутов товаров, битовые маски атрибутов,
+    массивы id для случайного выбора и матрицы совпадения критериев (при этом
+    таблица products читается целиком и файл базы оказывается в кэше ОС), чтобы
+    первый запрос пользователя не ждал чтения с диска, и проверяет, что каталог не пуст.
+    
+    Returns:
+        dict: Количество товаров по категориям {категория: количество}
+    """
+    snapshot = refresh_catalog_snapshot()
+    index = snapshot.index
+    counts = {category: len(ids) for category, ids in index.categories.items()}
+    
+    if not counts:
+        logging.error("Каталог товаров пуст")
+    log.info("Каталог прогрет", products=sum(counts.values()), categories=len(counts),
+             version=snapshot.version, index_keys=len(index.postings), index_bytes=index.memory_size(),
+             bits_bytes=snapshot.bits.memory_size(), sampler_bytes=snapshot.sampler.memory_size(),
+             relevance_bytes=snapshot.relevance.memory_size(), facets_bytes=snapshot.facets.memory_size())
+    return counts
 # Функция для рендеринга клавиатуры с категориями товаров
 def get_categories_keyboard() -> InlineKeyboardMarkup:
     """Создает клавиатуру с доступными категориями товаров
@@ -1081,15 +1531,11 @@ async def start_recommendations(callback: types.CallbackQuery, state: FSMContext
         if state:
             await state.clear()
         
-        # Создаем клавиатуру с категориями товаров
+        # Создаем клавиатуру с категориями товаров и поиском по названию
         categories_kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="💄 Помада", callback_data="category_lipstick")],
-            [InlineKeyboardButton(text="👁️ Тушь для ресниц", callback_data="category_mascara")],
-            [InlineKeyboardButton(text="🧴 Парфюм", callback_data="category_perfume")],
-            [InlineKeyboardButton(text="🌸 Румяна", callback_data="category_blush")],
-            [InlineKeyboardButton(text="✨ Хайлайтер", callback_data="category_highlighter")],
-            [InlineKeyboardButton(text="🌟 Пудра", callback_data="category_powder")],
-            [InlineKeyboardButton(text="👀 Тени", callback_data="category_eyeshadow")],
+            *[[InlineKeyboardButton(text=text, callback_data=f"category_{category}")]
+              for category, text in CATEGORY_BUTTONS],
+            *_search_buttons(),
             [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main")]
         ])
         
@@ -1118,7 +1564,7 @@ async def select_category(callback: types.CallbackQuery, state: FSMContext):
         category = callback.data.split("_")[1]
         
         # Отладочный вывод для диагностики
-        print(f"DEBUG: select_category - пользователь {callback.from_user.id}, выбрана категория {category}")
+        log.debug("Выбрана категория", user_id=callback.from_user.id, category=category)
         
         # Получаем имя пользователя или ID, если имя отсутствует
         user_tag = f"@{callback.from_user.username}" if callback.from_user.username else f"ID: {callback.from_user.id}"
@@ -1146,13 +1592,13 @@ async def select_category(callback: types.CallbackQuery, state: FSMContext):
             "user_name": user_name
         }
         
-        print(f"DEBUG: Сохранили данные в recommendation_requests: {recommendation_requests[callback.from_user.id]}")
+        log.debug("Сохранен запрос на рекомендации", user_id=callback.from_user.id,
+                  category=category, message_id=message.message_id)
         
         # Устанавливаем состояние выбора критериев
         await state.set_state(RecommendationState.choosing_criteria)
     except Exception as e:
         logging.error(f"Error in select_category: {e}")
-        print(f"DEBUG: Ошибка в select_category: {e}")
         await callback.message.answer(
             "😞 Произошла ошибка. Пожалуйста, попробуйте позже.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
@@ -1177,7 +1623,7 @@ async def toggle_criteria(callback: types.CallbackQuery, state: FSMContext):
         selected_criteria = data.get("selected_criteria", [])
         
         # Отладочный вывод перед изменением
-        print(f"DEBUG: Выбранные критерии ДО изменения: {selected_criteria}")
+        log.debug("Критерии до изменения", user_id=callback.from_user.id, criteria=selected_criteria.copy())
         
         # Переключаем статус критерия (добавляем или удаляем)
         if criteria_key in selected_criteria:
@@ -1189,7 +1635,7 @@ async def toggle_criteria(callback: types.CallbackQuery, state: FSMContext):
         await state.update_data(selected_criteria=selected_criteria.copy())
         
         # Отладочный вывод после изменения
-        print(f"DEBUG: Выбранные критерии ПОСЛЕ изменения: {selected_criteria}")
+        log.debug("Критерии после изменения", user_id=callback.from_user.id, criteria=selected_criteria.copy())
         
         # Обновляем сообщение с заголовком и клавиатурой
         try:
@@ -1251,7 +1697,7 @@ async def show_recommendations(callback: types.CallbackQuery, state: FSMContext)
         selected_criteria = data.get("selected_criteria", [])
         
         # Отладочный вывод для диагностики
-        print(f"DEBUG: Выбраны критерии перед отправкой: {selected_criteria}")
+        log.debug("Критерии перед отправкой", user_id=callback.from_user.id, criteria=list(selected_criteria))
         
         # Отправляем пользователю сообщение о том, что подбираем рекомендации
         waiting_message = await callback.message.edit_text(
@@ -1330,10 +1776,14 @@ async def show_recommendations(callback: types.CallbackQuery, state: FSMContext)
             logging.error(f"Ошибка при отправке запроса оператору: {e}")
             # Если не удалось отправить запрос оператору, используем автоматические рекомендации
             advanced_system = AdvancedRecommendationSystem()
-            recommendations = advanced_system.get_recommendations(category, selected_criteria)
+            recommendations = await advanced_system.get_recommendations(category, selected_criteria)
+            if not recommendations and selected_criteria:
+                # Под все критерии сразу ничего не подошло - показываем ближайшие товары
+                recommendations = await advanced_system.get_ranked_recommendations(category, selected_criteria)
             
             # Отправляем автоматические рекомендации
-            await send_auto_recommendations(callback.message, category, recommendations)
+            await send_auto_recommendations(callback.message, category, recommendations,
+                                            user_id=user_id, criteria=selected_criteria)
             await state.clear()
         
     except Exception as e:
@@ -1345,8 +1795,67 @@ async def show_recommendations(callback: types.CallbackQuery, state: FSMContext)
             ])
         )
 
-async def send_auto_recommendations(message, category, recommendations):
-    """Отправляет автоматические рекомендации, если оператор недоступен"""
+def _auto_recommendations_text(category: str, products: list, start: int = 0, total: int = None) -> str:
+    # Текст страницы автоматических рекомендаций; товары нумеруются с start + 1
+    text = "✨ *Вот что мы вам рекомендуем:*\n\n"
+    if products[0].get('relevance'):
+        text += "Товаров, подходящих под все критерии, нет - вот самые близкие:\n\n"
+    
+    for i, product in enumerate(products, start + 1):
+        text += f"*{i}. {product['name']}*\n"
+        text += f"💰 Цена: {product['price']} руб.\n"
+        
+        # Для товаров, подобранных по степени совпадения, объясняем выбор
+        relevance = product.get('relevance')
+        if relevance:
+            total_criteria = len(relevance['matched']) + len(relevance['missing'])
+            text += f"🎯 Совпадает критериев: {len(relevance['matched'])} из {total_criteria}\n"
+            if relevance['missing']:
+                missing = [get_criterion_name(category, c) for c in relevance['missing']]
+                text += f"- Не совпадает: {', '.join(missing)}\n"
+        
+        # Добавляем атрибуты товара
+        if 'attributes' in product:
+            for attr_type, attr_value in product['attributes'].items():
+                if isinstance(attr_value, list):
+                    attr_value = ", ".join(attr_value)
+                text += f"- {attr_type.capitalize()}: {attr_value}\n"
+        
+        text += "\n"
+    
+    if total is not None and total > len(products):
+        text += f"Показаны {start + 1}-{start + len(products)} из {total}\n"
+    return text
+
+def _similar_buttons(products: list, start: int = 0) -> list:
+    # Кнопки "Похожие товары" для товаров страницы по две в ряд; номер - как в тексте страницы
+    buttons = [InlineKeyboardButton(text=f"👀 Похожие товары №{i}", callback_data=f"similar_{product['id']}")
+               for i, product in enumerate(products, start + 1) if product.get('id') is not None]
+    return [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+
+def _auto_recommendations_keyboard(category: str, cursor: str = None, products: list = (),
+                                   start: int = 0) -> InlineKeyboardMarkup:
+    # Клавиатура после автоматических рекомендаций: похожие товары для товаров страницы,
+    # с курсором - кнопка следующей страницы
+    buttons = _similar_buttons(products, start)
+    if cursor is not None:
+        buttons.append([InlineKeyboardButton(text="🔄 Показать другие рекомендации",
+                                             callback_data=f"refresh_recommendations_{category}_{cursor}")])
+    buttons.extend([
+        [InlineKeyboardButton(text="🔍 Подобрать ещё", callback_data=f"category_{category}")],
+        [InlineKeyboardButton(text="📝 Оформить заказ", callback_data="order")],
+        [InlineKeyboardButton(text="🔙 К категориям", callback_data="recommend_products")],
+        [InlineKeyboardButton(text="🔙 В главное меню", callback_data="back_to_main")]
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def send_auto_recommendations(message, category, recommendations, user_id=None, criteria=None):
+    """Отправляет автоматические рекомендации, если оператор недоступен
+    
+    Показывается первая страница (RESULT_PAGE_SIZE товаров). Если товаров больше и
+    известен пользователь, результат сохраняется в курсоре (result_cursors.py), и кнопка
+    "Показать другие рекомендации" листает его без повторного подбора.
+    """
     try:
         # Если рекомендаций нет, сообщаем об этом
         if not recommendations:
@@ -1361,39 +1870,248 @@ async def send_auto_recommendations(message, category, recommendations):
             )
             return
         
-        # Формируем текст с рекомендациями
-        text = "✨ *Вот что мы вам рекомендуем:*\n\n"
-        
-        for i, product in enumerate(recommendations, 1):
-            text += f"*{i}. {product['name']}*\n"
-            text += f"💰 Цена: {product['price']} руб.\n"
-            
-            # Добавляем атрибуты товара
-            if 'attributes' in product:
-                for attr_type, attr_value in product['attributes'].items():
-                    if isinstance(attr_value, list):
-                        attr_value = ", ".join(attr_value)
-                    text += f"- {attr_type.capitalize()}: {attr_value}\n"
-            
-            text += "\n"
-        
-        # Создаем клавиатуру для действий после рекомендаций
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔍 Подобрать ещё", callback_data=f"category_{category}")],
-            [InlineKeyboardButton(text="📝 Оформить заказ", callback_data="order")],
-            [InlineKeyboardButton(text="🔙 К категориям", callback_data="recommend_products")],
-            [InlineKeyboardButton(text="🔙 В главное меню", callback_data="back_to_main")]
-        ])
+        page = recommendations[:RESULT_PAGE_SIZE]
+        cursor = None
+        if user_id is not None and len(recommendations) > len(page):
+            cursor = get_result_cursors().open(user_id, cache_key("auto", category, criteria or []),
+                                               recommendations, position=len(page))
+        total = min(len(recommendations), get_result_cursors().max_items) if cursor else None
         
         # Отправляем сообщение с рекомендациями
         await message.edit_text(
-            text,
+            _auto_recommendations_text(category, page, 0, total),
             parse_mode="Markdown",
-            reply_markup=keyboard
+            reply_markup=_auto_recommendations_keyboard(category, cursor, page)
         )
     except Exception as e:
         logging.error(f"Ошибка при отправке автоматических рекомендаций: {e}")
 
+async def refresh_recommendations(callback: types.CallbackQuery):
+    """Показывает следующую страницу рекомендаций из курсора пользователя
+    
+    callback_data: refresh_recommendations_{категория}_{номер курсора}. Каталог не
+    запрашивается; если курсор истек или вытеснен, пользователю предлагается
+    подобрать товары заново.
+    """
+    try:
+        parts = callback.data.split("_")
+        category = parts[2]
+        cursor = parts[3] if len(parts) > 3 else None
+        page = get_result_cursors().next_page(callback.from_user.id, cursor, RESULT_PAGE_SIZE) if cursor else None
+        if page is None:
+            await callback.answer("Подборка устарела - выберите критерии заново", show_alert=True)
+            await callback.message.edit_reply_markup(reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="🔍 Подобрать ещё", callback_data=f"category_{category}")],
+                [InlineKeyboardButton(text="🔙 В главное меню", callback_data="back_to_main")]
+            ]))
+            return
+        
+        products, start, total = page
+        await callback.answer()
+        await callback.message.edit_text(
+            _auto_recommendations_text(category, products, start, total),
+            parse_mode="Markdown",
+            reply_markup=_auto_recommendations_keyboard(category, cursor, products, start)
+        )
+    except Exception as e:
+        logging.error(f"Ошибка при показе следующей страницы рекомендаций: {e}")
+
+# Доступен ли поиск по названию (None - еще не проверялся в этом процессе); без FTS5
+# или токенизатора trigram в SQLite индекс поиска не строится (init_db)
+_search_available = None
+
+# Ответ на попытку поиска, когда индекс поиска недоступен
+SEARCH_UNAVAILABLE = "🔎 Поиск по названию сейчас недоступен. Выберите категорию товаров."
+
+async def search_available() -> bool:
+    """Доступен ли поиск по названию; проверка выполняется один раз в каждом процессе"""
+    global _search_available
+    if _search_available is None:
+        _search_available = await get_catalog_pool().run("search_available", catalog_db.search_available)
+    return _search_available
+
+def _search_buttons() -> list:
+    # Кнопка поиска по названию, если поиск не отключен
+    if _search_available is False:
+        return []
+    return [[InlineKeyboardButton(text="🔎 Поиск по названию", callback_data="search_products")]]
+
+# Приглашение ввести поисковый запрос
+SEARCH_PROMPT = ("🔎 *Поиск товаров*\n\n"
+                 "Напишите название или характеристику товара, например: _матовая помада_ "
+                 "или _тушь объем_. Слова короче трех букв не учитываются.")
+
+def _search_prompt_keyboard() -> InlineKeyboardMarkup:
+    # Клавиатура под приглашением к поиску
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔙 К категориям", callback_data="recommend_products")],
+        [InlineKeyboardButton(text="🔙 В главное меню", callback_data="back_to_main")]
+    ])
+
+def _search_results_text(products: list, start: int, total: int) -> str:
+    # Текст страницы результатов поиска (HTML, как в format_recommendation); нумерация с start + 1
+    text = "🔎 <b>Результаты поиска</b>\n\n"
+    for i, product in enumerate(products, start + 1):
+        text += f"<b>{i}.</b> {format_recommendation(product)}\n"
+    if total > len(products):
+        text += f"Показаны {start + 1}-{start + len(products)} из {total}\n"
+    return text
+
+def _search_results_keyboard(cursor: str = None, products: list = (), start: int = 0) -> InlineKeyboardMarkup:
+    # Клавиатура под результатами поиска: похожие товары для товаров страницы,
+    # с курсором - кнопка следующей страницы
+    buttons = _similar_buttons(products, start)
+    if cursor is not None:
+        buttons.append([InlineKeyboardButton(text="➡️ Ещё результаты", callback_data=f"search_more_{cursor}")])
+    buttons.extend([
+        [InlineKeyboardButton(text="🔎 Новый поиск", callback_data="search_products")],
+        [InlineKeyboardButton(text="📝 Оформить заказ", callback_data="order")],
+        [InlineKeyboardButton(text="🔙 К категориям", callback_data="recommend_products")],
+        [InlineKeyboardButton(text="🔙 В главное меню", callback_data="back_to_main")]
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def send_search_results(message: types.Message, text: str):
+    """Ищет товары по тексту запроса и отправляет первую страницу результатов
+    
+    Поиск идет по индексу FTS5 product_search (catalog_db.search_product_ids) в пуле
+    соединений. Найденные товары сохраняются в курсоре (result_cursors.py), и кнопка
+    "Ещё результаты" листает их без повторного поиска.
+    """
+    if not await search_available():
+        await message.answer(SEARCH_UNAVAILABLE, reply_markup=_search_prompt_keyboard())
+        return
+    query = catalog_db.search_query(text)
+    if not query:
+        await message.answer("Введите хотя бы одно слово от трех букв.", reply_markup=_search_prompt_keyboard())
+        return
+    
+    cursors = get_result_cursors()
+    pool = get_catalog_pool()
+    product_ids = await pool.run("search_products", catalog_db.search_product_ids, text, cursors.max_items)
+    products = await fetch_products(product_ids)
+    log.debug("Поиск товаров", user_id=message.from_user.id, query=query, found=len(products))
+    if not products:
+        await message.answer(
+            f"😔 По запросу «{html.escape(text)}» ничего не найдено.\n\n"
+            "Попробуйте другие слова или выберите категорию.",
+            reply_markup=_search_results_keyboard()
+        )
+        return
+    
+    page = products[:RESULT_PAGE_SIZE]
+    cursor = None
+    if len(products) > len(page):
+        cursor = cursors.open(message.from_user.id, ("search", query), products, position=len(page))
+    await message.answer(
+        _search_results_text(page, 0, len(products)),
+        parse_mode="HTML",
+        reply_markup=_search_results_keyboard(cursor, page)
+    )
+
+async def start_search(callback: types.CallbackQuery, state: FSMContext):
+    """Кнопка "Поиск по названию": следующее сообщение пользователя - поисковый запрос"""
+    try:
+        if not await search_available():
+            await callback.answer(SEARCH_UNAVAILABLE, show_alert=True)
+            return
+        await callback.answer()
+        await state.set_state(RecommendationState.waiting_for_search)
+        await callback.message.edit_text(SEARCH_PROMPT, parse_mode="Markdown",
+                                         reply_markup=_search_prompt_keyboard())
+    except Exception as e:
+        logging.error(f"Ошибка при открытии поиска товаров: {e}")
+
+async def search_command(message: types.Message, state: FSMContext):
+    """Команда /search <запрос>; без запроса бот ждет текст запроса следующим сообщением"""
+    try:
+        text = message.text.partition(" ")[2].strip()
+        if not await search_available():
+            await message.answer(SEARCH_UNAVAILABLE, reply_markup=_search_prompt_keyboard())
+            return
+        if not text:
+            await state.set_state(RecommendationState.waiting_for_search)
+            await message.answer(SEARCH_PROMPT, parse_mode="Markdown", reply_markup=_search_prompt_keyboard())
+            return
+        await send_search_results(message, text)
+    except Exception as e:
+        logging.error(f"Ошибка при поиске товаров: {e}")
+        await message.answer("😞 Не удалось выполнить поиск. Пожалуйста, попробуйте позже.")
+
+async def search_text(message: types.Message, state: FSMContext):
+    """Текст поискового запроса после кнопки "Поиск по названию" или /search без запроса"""
+    try:
+        await state.clear()
+        await send_search_results(message, message.text)
+    except Exception as e:
+        logging.error(f"Ошибка при поиске товаров: {e}")
+        await message.answer("😞 Не удалось выполнить поиск. Пожалуйста, попробуйте позже.")
+
+async def search_more(callback: types.CallbackQuery):
+    """Показывает следующую страницу результатов поиска из курсора пользователя
+    
+    callback_data: search_more_{номер курсора}. Если курсор истек или вытеснен,
+    пользователю предлагается повторить поиск.
+    """
+    try:
+        cursor = callback.data[len("search_more_"):]
+        page = get_result_cursors().next_page(callback.from_user.id, cursor, RESULT_PAGE_SIZE)
+        if page is None:
+            await callback.answer("Результаты поиска устарели - повторите поиск", show_alert=True)
+            await callback.message.edit_reply_markup(reply_markup=_search_results_keyboard())
+            return
+        
+        products, start, total = page
+        await callback.answer()
+        await callback.message.edit_text(
+            _search_results_text(products, start, total),
+            parse_mode="HTML",
+            reply_markup=_search_results_keyboard(cursor, products, start)
+        )
+    except Exception as e:
+        logging.error(f"Ошибка при показе следующей страницы поиска: {e}")
+
+def _similar_keyboard(products: list) -> InlineKeyboardMarkup:
+    # Клавиатура под похожими товарами: похожие на каждый из них и возврат
+    buttons = _similar_buttons(products)
+    buttons.extend([
+        *_search_buttons(),
+        [InlineKeyboardButton(text="🔙 К категориям", callback_data="recommend_products")],
+        [InlineKeyboardButton(text="🔙 В главное меню", callback_data="back_to_main")]
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def similar_products(callback: types.CallbackQuery):
+    """Показывает товары, которые чаще всего смотрели вместе с выбранным
+    
+    callback_data: similar_{id товара}. Нажатие - явный интерес к товару, поэтому оно
+    и записывается в журнал как просмотр (показ товара в списке просмотром не считается).
+    Соседи товара берутся из готового списка матрицы совместных просмотров
+    (also_viewed.py) без обращения к журналу; из базы загружаются только показываемые
+    товары. Ответ - новым сообщением, чтобы исходная подборка осталась у пользователя.
+    """
+    try:
+        product_id = int(callback.data[len("similar_"):])
+        get_also_viewed().record(callback.from_user.id, [product_id])
+        neighbors = get_also_viewed().neighbors(product_id)
+        products = []
+        if neighbors:
+            products = await fetch_products([product_id, *neighbors])
+        source = next((product for product in products if product['id'] == product_id), None)
+        similar = [product for product in products if product['id'] != product_id][:RESULT_PAGE_SIZE]
+        if not similar:
+            await callback.answer("Похожих товаров пока нет: этот товар смотрели слишком мало", show_alert=True)
+            return
+        
+        await callback.answer()
+        title = f" «{html.escape(source['name'])}»" if source else ""
+        text = f"👀 <b>С товаром{title} также смотрят</b>\n\n"
+        for i, product in enumerate(similar, 1):
+            text += f"<b>{i}.</b> {format_recommendation(product)}\n"
+        await callback.message.answer(text, parse_mode="HTML", reply_markup=_similar_keyboard(similar))
+    except Exception as e:
+        logging.error(f"Ошибка при показе похожих товаров: {e}")
+
 async def test_send_link(message: types.Message):
     """Тестовый обработчик команды /send_link для отладки проблем с отправкой ссылки пользователю"""
     try:
@@ -1530,17 +2248,65 @@ def get_category_name(category: str) -> str:
     }
     return categories.get(category, category)
 
+def search_titles() -> dict:
+    """Русские названия категорий и значений атрибутов для индекса поиска
+    
+    Returns:
+        dict: {(категория, группа, значение): название} для catalog_db.sync_search_titles;
+              у названия категории (текст кнопки и get_category_name) группа и значение пустые
+    """
+    titles = {}
+    for category, text in CATEGORY_BUTTONS:
+        titles[(category, "", "")] = f"{text.split(' ', 1)[1]} {get_category_name(category)}"
+    for name, groups in vars(ProductCategories).items():
+        if name.isupper() and isinstance(groups, dict):
+            for group, values in groups.items():
+                for value, title in values.items():
+                    titles[(name.lower(), group, value)] = title
+    return titles
+
+def get_criterion_name(category: str, criterion: str) -> str:
+    """Получить русское название критерия "группа_значение" из ProductCategories"""
+    group, _, value = criterion.partition("_")
+    category_data = getattr(ProductCategories, category.upper(), {})
+    return category_data.get(group, {}).get(value, criterion)
+
 # Функция для регистрации обработчиков
-def register_handlers(dp: Dispatcher):
+def register_handlers(dp: Dispatcher, operator_chat_id: int = None, init_database: bool = True):
     # Инициализация базы данных при запуске
-    init_db()
+    # (в режиме быстрого запуска main.py выполняет ее отдельно, в потоке)
+    if init_database:
+        init_db()
     
-    # Получаем ID чата операторов из main.py
+    # Получаем ID чата операторов из main.py, если он не передан явно
     global OPERATOR_CHAT_ID
-    from main import OPERATOR_CHAT_ID as MAIN_OPERATOR_CHAT_ID
-    OPERATOR_CHAT_ID = MAIN_OPERATOR_CHAT_ID
+    if operator_chat_id is None:
+        from main import OPERATOR_CHAT_ID as operator_chat_id
+    OPERATOR_CHAT_ID = operator_chat_id
     
-    print(f"DEBUG: Регистрация обработчиков рекомендаций, OPERATOR_CHAT_ID={OPERATOR_CHAT_ID}")
+    log.debug("Регистрация обработчиков рекомендаций", operator_chat_id=OPERATOR_CHAT_ID)
+    
+    # Метрики /metrics и /stats
+    metrics = dp.get(METRICS_KEY)
+    if metrics is not None:
+        # Время запросов к базе товаров
+        metrics.queries = get_catalog_pool().queries
+        # Задержка обновления каталога в памяти по изменениям базы товаров
+        metrics.catalog = get_catalog_refresher()
+        # Попадания в кэш результатов подбора и его объем
+        metrics.result_cache = get_result_cache()
+        # Курсоры страниц "Показать другие рекомендации"
+        metrics.result_cursors = get_result_cursors()
+        # Журнал просмотров и матрица похожих товаров
+        metrics.also_viewed = get_also_viewed()
+    # Изменения базы товаров применяются к каталогу в памяти в фоне
+    dp.startup.register(start_catalog_refresher)
+    dp.shutdown.register(stop_catalog_refresher)
+    # Журнал просмотров для кнопки "Похожие товары": запись и чтение в фоне
+    dp.startup.register(start_also_viewed)
+    dp.shutdown.register(stop_also_viewed)
+    # Соединения с базой товаров закрываются при остановке бота
+    dp.shutdown.register(close_catalog_pool)
     
     # Регистрация диагностического обработчика ПЕРВЫМ в списке
     dp.message(lambda message: message.text and message.text.startswith("/debug_send"))(debug_send_message)
@@ -1549,15 +2315,24 @@ def register_handlers(dp: Dispatcher):
     dp.message(lambda message: message.text and message.text.startswith("/send_link_test"))(send_link_test)
     dp.message(lambda message: message.text and message.text.startswith("/send_link"))(test_send_link)
     
+    # Поиск товаров: команда /search и текст запроса после кнопки "Поиск по названию"
+    dp.message(lambda message: message.text and message.text.startswith("/search"))(search_command)
+    dp.message(RecommendationState.waiting_for_search, F.text)(search_text)
+    
     # Регистрация обработчиков для рекомендаций
-    dp.callback_query(lambda c: c.data == "product_recommendations")(start_recommendations)
-    dp.callback_query(lambda c: c.data == "recommend_products")(start_recommendations)
-    dp.callback_query(lambda c: c.data.startswith("category_"))(select_category)
-    dp.callback_query(lambda c: c.data.startswith("criteria_"))(toggle_criteria)
-    dp.callback_query(lambda c: c.data.startswith("header_"))(lambda c: c.answer("Это заголовок категории"))
-    dp.callback_query(lambda c: c.data.startswith("reset_criteria_"))(reset_criteria)
-    dp.callback_query(lambda c: c.data.startswith("show_recommendations_"))(show_recommendations)
-    dp.callback_query(lambda c: c.data == "back_to_categories")(start_recommendations)
+    router = get_callback_router(dp)
+    router.exact("product_recommendations", start_recommendations)
+    router.exact("recommend_products", start_recommendations)
+    router.exact("back_to_categories", start_recommendations)
+    router.prefix("category_", select_category)
+    router.prefix("criteria_", toggle_criteria)
+    router.prefix("header_", lambda c: c.answer("Это заголовок категории"))
+    router.prefix("reset_criteria_", reset_criteria)
+    router.prefix("show_recommendations_", show_recommendations)
+    router.prefix("refresh_recommendations_", refresh_recommendations)
+    router.exact("search_products", start_search)
+    router.prefix("search_more_", search_more)
+    router.prefix("similar_", similar_products)
 
 async def process_category_selection(callback: types.CallbackQuery, state: FSMContext):
     """Обработка выбора категории товаров"""
@@ -1571,7 +2346,7 @@ async def process_category_selection(callback: types.CallbackQuery, state: FSMCo
         # Получаем ID сообщения (если есть) или используем текущее сообщение
         message_id = user_data.get('recommendation_message_id', callback.message.message_id)
         
-        print(f"DEBUG: process_category_selection - пользователь {callback.from_user.id}, категория {category}, message_id {message_id}")
+        log.debug("Выбрана категория", user_id=callback.from_user.id, category=category, message_id=message_id)
         
         # Отправляем ответ на callback, чтобы убрать индикатор загрузки
         await callback.answer()
@@ -1589,7 +2364,6 @@ async def process_category_selection(callback: types.CallbackQuery, state: FSMCo
             "user_name": user_name
         }
         
-        print(f"DEBUG: Сохраняем запрос в recommendation_requests: {recommendation_requests[callback.from_user.id]}")
         logging.info(f"Сохранен запрос на рекомендации: user_id={callback.from_user.id}, category={category}, message_id={message_id}")
         
         # Формируем сообщение для оператора
@@ -1624,7 +2398,6 @@ async def process_category_selection(callback: types.CallbackQuery, state: FSMCo
         )
         
     except Exception as e:
-        print(f"DEBUG: Ошибка при обработке выбора категории: {e}")
         logging.error(f"Ошибка при обработке выбора категории: {e}")
         await callback.answer("Произошла ошибка при обработке запроса.")
         
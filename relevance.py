@@ -0,0 +1,154 @@
+# relevance.py - Ранжирование товаров по степени совпадения с критериями для Telegram бота GoldenAppleBot
+# Подбор по критериям требует совпадения всех выбранных критериев, и при нескольких
+# критериях (например, effect_volume + effect_length + price_premium) часто ничего не находит.
+# Здесь вся категория ранжируется по сумме весов совпавших критериев плюс рейтинг товара.
+#
+# Как устроено:
+# - для каждой категории хранится матрица "критерий x товар" (numpy bool, строка на каждое
+#   значение атрибута категории), массив id товаров и вклад рейтинга каждого товара;
+# - оценка товара = сумма весов совпавших критериев + RATING_WEIGHT * рейтинг / 5; вклад
+#   рейтинга меньше веса одного критерия, поэтому товар с большим числом совпадений всегда
+#   выше, а рейтинг упорядочивает товары с одинаковыми совпадениями;
+# - оценки всей категории считаются векторно (по строке матрицы на выбранный критерий),
+#   лучшие k товаров выбираются через argpartition без сортировки всей категории;
+# - для каждого выбранного товара возвращается объяснение: какие критерии совпали, какие нет.
+
+import numpy as np  # Векторные вычисления по всей категории
+
+from attribute_index import parse_criterion  # Разбор критерия "группа_значение"
+
+# Вклад рейтинга 5.0 в оценку; меньше веса одного критерия (1.0)
+RATING_WEIGHT = 0.5
+
+
+class CategoryMatrix:
+    """Матрица совпадения критериев для товаров одной категории"""
+
+    __slots__ = ("ids", "rating_score", "rows", "matrix")
+
+    def __init__(self, ids: np.ndarray, ratings: np.ndarray, postings: dict):
+        """
+        Args:
+            ids (np.ndarray): Отсортированные id товаров категории
+            ratings (np.ndarray): Рейтинги товаров в том же порядке
+            postings (dict): {(группа, значение): отсортированные id товаров с этим значением}
+        """
+        self.ids = ids
+        self.rating_score = (np.nan_to_num(ratings) * (RATING_WEIGHT / 5.0)).astype(np.float32)
+        self.rows = {}  # {(группа, значение): номер строки матрицы}
+        self.matrix = np.zeros((len(postings), len(ids)), dtype=bool)
+        for row, (key, product_ids) in enumerate(sorted(postings.items())):
+            self.rows[key] = row
+            product_ids = np.asarray(product_ids, dtype=np.int64)
+            positions = np.searchsorted(ids, product_ids)
+            # Товары, которых нет в ids (изменились между чтениями базы), пропускаются
+            found = positions < len(ids)
+            found[found] = ids[positions[found]] == product_ids[found]
+            self.matrix[row, positions[found]] = True
+
+    def rank(self, criteria: list, limit: int, weights: dict = None) -> list:
+        """Выбирает limit товаров категории с наибольшей оценкой
+
+        Args:
+            criteria (list): Критерии в формате "группа_значение"
+            limit (int): Сколько товаров вернуть
+            weights (dict, optional): {критерий: вес}, по умолчанию вес каждого критерия 1.0
+
+        Returns:
+            list: [(id товара, оценка, совпавшие критерии, несовпавшие критерии)]
+                  по убыванию оценки
+        """
+        n = len(self.ids)
+        limit = min(limit, n)
+        if limit <= 0:
+            return []
+        weights = weights or {}
+        score = self.rating_score.copy()
+        selected = []  # [(критерий, строка матрицы или None)]
+        for criterion in dict.fromkeys(criteria):
+            row = self.rows.get(parse_criterion(criterion))
+            selected.append((criterion, row))
+            if row is None:
+                continue
+            weight = weights.get(criterion, 1.0)
+            if weight == 1.0:
+                # Сложение с bool-строкой без промежуточного массива
+                np.add(score, self.matrix[row], out=score)
+            else:
+                score += self.matrix[row] * np.float32(weight)
+
+        if limit < n:
+            top = np.argpartition(score, n - limit)[n - limit:]
+        else:
+            top = np.arange(n)
+        # По убыванию оценки, при равной оценке - по возрастанию id
+        top = top[np.lexsort((self.ids[top], -score[top]))]
+
+        results = []
+        for position in top.tolist():
+            matched, missing = [], []
+            for criterion, row in selected:
+                if row is not None and self.matrix[row, position]:
+                    matched.append(criterion)
+                else:
+                    missing.append(criterion)
+            results.append((int(self.ids[position]), float(score[position]), matched, missing))
+        return results
+
+    def memory_size(self) -> int:
+        """Объем массивов категории в байтах"""
+        return self.ids.nbytes + self.rating_score.nbytes + self.matrix.nbytes
+
+
+class RelevanceIndex:
+    """Матрицы совпадения критериев по категориям каталога"""
+
+    def __init__(self):
+        self.categories = {}  # {категория: CategoryMatrix}
+
+    def rank(self, category: str, criteria: list, limit: int = 5, weights: dict = None) -> list:
+        """Лучшие товары категории по совпадению с критериями (см. CategoryMatrix.rank)"""
+        entry = self.categories.get(category)
+        if entry is None:
+            return []
+        return entry.rank(criteria, limit, weights)
+
+    def memory_size(self) -> int:
+        """Объем массивов всех категорий в байтах"""
+        return sum(entry.memory_size() for entry in self.categories.values())
+
+    @classmethod
+    def from_index(cls, index, ratings: dict) -> "RelevanceIndex":
+        """Строит матрицы по индексу атрибутов и рейтингам товаров
+
+        Args:
+            index (AttributeIndex): Построенный индекс атрибутов
+            ratings (dict): {категория: рейтинги товаров в порядке index.categories[категория]}
+
+        Returns:
+            RelevanceIndex: Матрицы по категориям
+        """
+        return cls().updated(index, ratings, index.categories)
+
+    def updated(self, index, ratings: dict, categories) -> "RelevanceIndex":
+        """Возвращает копию, в которой матрицы указанных категорий построены заново
+
+        Матрицы остальных категорий общие со старой копией; старая копия не меняется.
+
+        Args:
+            index (AttributeIndex): Индекс атрибутов новой версии каталога
+            ratings (dict): {категория: рейтинги товаров в порядке index.categories[категория]}
+            categories: Категории, которых коснулись изменения
+
+        Returns:
+            RelevanceIndex: Новые матрицы
+        """
+        relevance = RelevanceIndex()
+        relevance.categories = dict(self.categories)
+        for category in categories:
+            relevance.categories.pop(category, None)
+            ids = index.categories.get(category)
+            if ids:
+                relevance.categories[category] = CategoryMatrix(
+                    np.array(ids, dtype=np.int64), ratings[category], index.category_postings(category))
+        return relevance
@@ -0,0 +1,179 @@
+# result_cache.py - Кэш результатов подбора рекомендаций для Telegram бота GoldenAppleBot
+# Многие пользователи выбирают одни и те же сочетания категории и критериев, а каждый
+# подбор заново загружал найденные товары из SQLite и разбирал JSON их атрибутов.
+#
+# Как устроено:
+# - ключ записи - вид подбора, категория и отсортированный набор критериев без повторов
+#   (порядок выбора критериев не важен) и параметры подбора (например, limit);
+# - запись хранит версию категории в снимке каталога (CatalogSnapshot.category_version)
+#   и верна, пока версия не изменилась: изменение товаров категории сбрасывает записи
+#   только этой категории, остальные остаются в кэше;
+# - размер ограничен числом записей и примерным объемом в байтах, лишние записи
+#   вытесняются по давности использования (LRU); запись живет не дольше ttl секунд;
+# - попадания, промахи, устаревшие записи, вытеснения и объем видны в /metrics и /stats;
+# - при запуске кэш можно прогреть популярными сочетаниями (RESULT_CACHE_WARMUP).
+#
+# Закэшированные списки товаров общие для всех пользователей и не должны изменяться.
+
+import os  # Для настроек из переменных окружения
+import sys  # Для оценки объема записей
+import time  # Для срока жизни записей
+from collections import OrderedDict  # LRU-кэш записей
+
+
+def config_from_env() -> dict:
+    """Читает настройки кэша результатов из переменных окружения
+
+    Переменные окружения:
+        RESULT_CACHE_SIZE - сколько результатов хранить (1000; 0 - кэш отключен)
+        RESULT_CACHE_BYTES - примерный объем кэша в байтах (16 МБ)
+        RESULT_CACHE_TTL - сколько секунд хранить результат (300)
+
+    Returns:
+        dict: Параметры для ResultCache
+    """
+    return {
+        "max_entries": int(os.getenv("RESULT_CACHE_SIZE", "1000")),
+        "max_bytes": int(os.getenv("RESULT_CACHE_BYTES", str(16 * 1024 * 1024))),
+        "ttl": float(os.getenv("RESULT_CACHE_TTL", "300")),
+    }
+
+
+def warmup_from_env() -> list:
+    """Сочетания для прогрева кэша из RESULT_CACHE_WARMUP
+
+    Формат: сочетания через запятую, в каждом категория и критерии через "+":
+        RESULT_CACHE_WARMUP=mascara:effect_volume+type_waterproof,lipstick:type_matte
+
+    Returns:
+        list: [(категория, [критерии])]
+    """
+    combinations = []
+    for item in os.getenv("RESULT_CACHE_WARMUP", "").split(","):
+        category, _, criteria = item.strip().partition(":")
+        if category:
+            combinations.append((category, [criterion for criterion in criteria.split("+") if criterion]))
+    return combinations
+
+
+def cache_key(kind: str, category: str, criteria, *params) -> tuple:
+    """Ключ результата: вид подбора, категория, отсортированные критерии без повторов, параметры"""
+    return (kind, category, tuple(sorted(set(criteria)))) + params
+
+
+def estimate_size(value, seen: set = None) -> int:
+    """Примерный объем результата в байтах (словари, списки и строки товаров)
+
+    Объекты из seen не учитываются; учтенные объекты добавляются в seen.
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(key, seen) + estimate_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(item, seen) for item in value)
+    return size
+
+
+class _Entry:
+    """Запись кэша: результат, версия категории, срок жизни и число обращений"""
+
+    __slots__ = ("value", "version", "expires_at", "size", "hits")
+
+    def __init__(self, value, version, expires_at: float, size: int):
+        self.value = value
+        self.version = version
+        self.expires_at = expires_at
+        self.size = size
+        self.hits = 0
+
+
+class ResultCache:
+    """LRU-кэш результатов подбора с ограничением по числу записей, объему и времени"""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 16 * 1024 * 1024, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # LRU: {ключ: _Entry}
+
+        self.bytes = 0  # Примерный объем всех записей
+        self.hits = 0  # Результат взят из кэша
+        self.misses = 0  # Результата в кэше не было
+        self.stale = 0  # Запись сброшена: товары категории изменились
+        self.expired = 0  # Запись сброшена: истек срок жизни
+        self.evictions = 0  # Запись вытеснена из-за ограничения размера
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple, version):
+        """Возвращает результат, вычисленный для той же версии категории, или None
+
+        Args:
+            key (tuple): Ключ результата (cache_key)
+            version: Текущая версия категории (CatalogSnapshot.category_version)
+
+        Returns:
+            Закэшированный результат или None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.version != version or entry.expires_at <= time.monotonic():
+            if entry.version != version:
+                self.stale += 1
+            else:
+                self.expired += 1
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        entry.hits += 1
+        self.hits += 1
+        return entry.value
+
+    def put(self, key: tuple, version, value):
+        """Сохраняет результат для версии категории и вытесняет лишние записи
+
+        Args:
+            key (tuple): Ключ результата (cache_key)
+            version: Версия категории, для которой вычислен результат
+            value: Результат (не должен изменяться после сохранения)
+        """
+        if self.max_entries <= 0:
+            return
+        size = estimate_size(value) + estimate_size(key)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _Entry(value, version, time.monotonic() + self.ttl, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+
+    def clear(self):
+        """Удаляет все записи (счетчики сохраняются)"""
+        self._entries.clear()
+        self.bytes = 0
+
+    def hit_rate(self) -> float:
+        """Доля запросов, обслуженных из кэша"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def popular(self, top: int = 10) -> list:
+        """Самые востребованные записи кэша: [(ключ, обращений)] по убыванию"""
+        ranked = sorted(self._entries.items(), key=lambda item: item[1].hits, reverse=True)
+        return [(key, entry.hits) for key, entry in ranked[:top]]
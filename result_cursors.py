@@ -0,0 +1,164 @@
+# result_cursors.py - Курсоры постраничного просмотра рекомендаций для Telegram бота GoldenAppleBot
+# Кнопка "Показать другие рекомендации" вела на callback refresh_recommendations_{категория},
+# для которого не было обработчика, а каждый показ рекомендаций заново выполнял подбор.
+#
+# Как устроено:
+# - после подбора результат сохраняется в курсоре, ключ которого - пользователь и запрос
+#   (категория и отсортированные критерии); повторный подбор того же запроса тем же
+#   пользователем заменяет его курсор;
+# - номер курсора (короткая контрольная сумма запроса) передается в callback_data кнопки,
+#   и следующая страница берется из курсора без обращения к каталогу; после последней
+#   страницы просмотр начинается сначала;
+# - курсор хранит не больше max_items товаров и не больше max_bytes байт (примерно),
+#   курсоров не больше max_cursors (лишние вытесняются по давности использования),
+#   курсор живет ttl секунд с последнего обращения;
+# - число курсоров, их объем и показанные страницы видны в /metrics и /stats.
+#
+# Товары в курсорах общие с кэшем результатов (result_cache.py) и не должны изменяться.
+
+import os  # Для настроек из переменных окружения
+import time  # Для срока жизни курсоров
+import zlib  # Номер курсора по запросу
+from collections import OrderedDict  # LRU-хранилище курсоров
+
+from result_cache import estimate_size  # Оценка объема товаров
+
+
+def config_from_env() -> dict:
+    """Читает настройки курсоров из переменных окружения
+
+    Переменные окружения:
+        RESULT_CURSORS_SIZE - сколько курсоров хранить (10000)
+        RESULT_CURSOR_ITEMS - сколько товаров хранить в одном курсоре (50)
+        RESULT_CURSOR_BYTES - примерный объем одного курсора в байтах (256 КБ)
+        RESULT_CURSOR_TTL - сколько секунд хранить курсор после последнего обращения (1800)
+
+    Returns:
+        dict: Параметры для CursorStore
+    """
+    return {
+        "max_cursors": int(os.getenv("RESULT_CURSORS_SIZE", "10000")),
+        "max_items": int(os.getenv("RESULT_CURSOR_ITEMS", "50")),
+        "max_bytes": int(os.getenv("RESULT_CURSOR_BYTES", str(256 * 1024))),
+        "ttl": float(os.getenv("RESULT_CURSOR_TTL", "1800")),
+    }
+
+
+def cursor_id(query: tuple) -> str:
+    """Номер курсора запроса для callback_data (8 шестнадцатеричных цифр)"""
+    return format(zlib.crc32(repr(query).encode()), "08x")
+
+
+class _Cursor:
+    """Курсор: товары результата, позиция следующей страницы, срок жизни и объем"""
+
+    __slots__ = ("items", "position", "expires_at", "size")
+
+    def __init__(self, items: list, expires_at: float, size: int):
+        self.items = items
+        self.position = 0
+        self.expires_at = expires_at
+        self.size = size
+
+
+class CursorStore:
+    """LRU-хранилище курсоров с ограничением числа курсоров, их размера и времени жизни"""
+
+    def __init__(self, max_cursors: int = 10000, max_items: int = 50, max_bytes: int = 256 * 1024,
+                 ttl: float = 1800.0):
+        self.max_cursors = max_cursors
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._cursors = OrderedDict()  # LRU: {(id пользователя, номер курсора): _Cursor}
+
+        self.bytes = 0  # Примерный объем всех курсоров
+        self.opened = 0  # Создано курсоров
+        self.pages = 0  # Страниц показано из курсоров
+        self.missing = 0  # Курсор не найден: истек срок жизни или вытеснен
+        self.evictions = 0  # Курсор вытеснен из-за ограничения числа курсоров
+
+    def __len__(self) -> int:
+        return len(self._cursors)
+
+    def open(self, user_id: int, query: tuple, items: list, position: int = 0) -> str:
+        """Сохраняет результат запроса в курсоре пользователя
+
+        Args:
+            user_id (int): ID пользователя
+            query (tuple): Ключ запроса (result_cache.cache_key)
+            items (list): Товары результата; сохраняются первые, помещающиеся в ограничения
+            position (int): С какого товара начнется следующая страница
+
+        Returns:
+            str: Номер курсора для callback_data
+        """
+        number = cursor_id(query)
+        key = (user_id, number)
+        if key in self._cursors:
+            self._remove(key)
+        kept, seen = [], set()
+        size = estimate_size(kept)
+        for item in items[:self.max_items]:
+            item_size = estimate_size(item, seen)
+            if kept and size + item_size > self.max_bytes:
+                break
+            kept.append(item)
+            size += item_size
+        now = time.monotonic()
+        cursor = _Cursor(kept, now + self.ttl, size)
+        cursor.position = position
+        self._cursors[key] = cursor
+        self.bytes += size
+        self.opened += 1
+        # Срок жизни продлевается при обращении, поэтому в начале LRU - курсоры, истекающие раньше
+        while self._cursors:
+            oldest = next(iter(self._cursors))
+            if self._cursors[oldest].expires_at > now:
+                break
+            self._remove(oldest)
+        while len(self._cursors) > self.max_cursors:
+            self._remove(next(iter(self._cursors)))
+            self.evictions += 1
+        return number
+
+    def next_page(self, user_id: int, number: str, size: int):
+        """Возвращает следующую страницу курсора и сдвигает его позицию
+
+        После последней страницы просмотр начинается сначала.
+
+        Args:
+            user_id (int): ID пользователя
+            number (str): Номер курсора из callback_data
+            size (int): Сколько товаров на странице
+
+        Returns:
+            tuple: (товары страницы, номер первого товара страницы с 0, всего товаров)
+                   или None, если курсора нет
+        """
+        key = (user_id, number)
+        cursor = self._cursors.get(key)
+        now = time.monotonic()
+        if cursor is None or cursor.expires_at <= now:
+            if cursor is not None:
+                self._remove(key)
+            self.missing += 1
+            return None
+        if cursor.position >= len(cursor.items):
+            cursor.position = 0
+        start = cursor.position
+        page = cursor.items[start:start + size]
+        cursor.position = start + size
+        cursor.expires_at = now + self.ttl
+        self._cursors.move_to_end(key)
+        self.pages += 1
+        return page, start, len(cursor.items)
+
+    def _remove(self, key: tuple):
+        cursor = self._cursors.pop(key)
+        self.bytes -= cursor.size
+
+    def clear(self):
+        """Удаляет все курсоры (счетчики сохраняются)"""
+        self._cursors.clear()
+        self.bytes = 0
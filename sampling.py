@@ -0,0 +1,196 @@
+# sampling.py - Выбор случайных товаров категории для Telegram бота GoldenAppleBot
+# Прежний запрос SELECT * ... ORDER BY RANDOM() LIMIT ? читал и сортировал всю категорию
+# при каждом вызове. Здесь id товаров каждой категории хранятся в памяти в массиве,
+# и k различных товаров выбираются за O(k), независимо от размера категории:
+# - равномерный выбор - k различных позиций массива (random.sample по range);
+# - выбор с весом по рейтингу - двоичный поиск случайной точки в накопленных суммах
+#   рейтингов (O(log n) на выбор); повторно выбранный товар выбирается заново.
+#   Товары с нулевым рейтингом выбираются равномерно только после всех товаров
+#   с положительным рейтингом;
+#   Накопленные суммы строятся одной векторной операцией, поэтому при изменении
+#   каталога массивы категории быстро строятся заново (catalog_refresh.py);
+# - воспроизводимый выбор для сессии пользователя (seed): равномерный выбор - это
+#   псевдослучайная перестановка позиций категории, зависящая от seed, и страница p
+#   ("Показать другие рекомендации") - ее элементы с p*k по (p+1)*k. Страницы одной
+#   сессии не повторяют товары и не зависят друг от друга, страница считается за O(k).
+
+import random  # Генератор случайных чисел
+from array import array  # Компактные массивы id
+
+import numpy as np  # Накопленные суммы рейтингов и двоичный поиск
+
+_MASK64 = (1 << 64) - 1
+
+# Раундов сети Фейстеля в перестановке позиций
+_ROUNDS = 4
+
+
+def _mix(value: int, key: int) -> int:
+    """Перемешивание 64-битного числа (splitmix64) с ключом"""
+    z = (value * 0x9E3779B97F4A7C15 + key) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+class Permutation:
+    """Псевдослучайная перестановка чисел 0..n-1, заданная seed
+
+    Сеть Фейстеля - биекция на [0, 2^bits); значения за пределами [0, n) снова
+    пропускаются через сеть (cycle walking), что дает биекцию на [0, n).
+    2^bits < 4n, поэтому в среднем нужно не больше четырех проходов.
+    """
+
+    __slots__ = ("n", "half", "mask", "keys")
+
+    def __init__(self, n: int, seed: int):
+        bits = max((n - 1).bit_length(), 2)
+        bits += bits % 2
+        self.n = n
+        self.half = bits // 2
+        self.mask = (1 << self.half) - 1
+        self.keys = [_mix(seed & _MASK64, round_number) for round_number in range(_ROUNDS)]
+
+    def __getitem__(self, index: int) -> int:
+        half, mask = self.half, self.mask
+        value = index
+        while True:
+            left, right = value >> half, value & mask
+            for key in self.keys:
+                left, right = right, left ^ (_mix(right, key) & mask)
+            value = (left << half) | right
+            if value < self.n:
+                return value
+
+
+class CategorySample:
+    """id товаров одной категории и накопленные суммы рейтингов для выбора с весом"""
+
+    __slots__ = ("ids", "cumulative", "positive")
+
+    def __init__(self, ids: array, ratings: np.ndarray):
+        """
+        Args:
+            ids (array): id товаров категории
+            ratings (np.ndarray): Рейтинги товаров в том же порядке
+        """
+        self.ids = ids
+        # Отрицательные веса считаются нулевыми; если все веса нулевые, выбор равномерный
+        weights = np.clip(np.nan_to_num(np.asarray(ratings, dtype=np.float64)), 0.0, None)
+        if not weights.sum():
+            weights = np.ones(len(ids))
+        self.cumulative = np.cumsum(weights)
+        self.positive = int(np.count_nonzero(weights))  # Товаров с положительным весом
+
+    def _weighted_positions(self, rng: random.Random, count: int):
+        """Последовательность до count различных позиций с весом по рейтингу"""
+        n = len(self.ids)
+        cumulative = self.cumulative
+        total = float(cumulative[-1])
+        wanted = min(count, n)
+        seen = set()
+        while len(seen) < min(wanted, self.positive):
+            # Позиция i выбирается, если точка попала в [cumulative[i-1], cumulative[i]) -
+            # с вероятностью, пропорциональной весу; товар с нулевым весом не выбирается
+            position = int(np.searchsorted(cumulative, rng.random() * total, side="right"))
+            if position < n and position not in seen:
+                seen.add(position)
+                yield position
+        if len(seen) < wanted:
+            # Товары с положительным весом закончились - остальные равномерно из товаров
+            # с нулевым весом (иначе цикл выше не завершился бы)
+            zero = np.flatnonzero(np.diff(cumulative, prepend=0.0) == 0)
+            for index in rng.sample(range(len(zero)), wanted - len(seen)):
+                yield int(zero[index])
+
+    def sample(self, k: int, seed: int = None, page: int = 0, weighted: bool = False) -> list:
+        """Выбирает до k различных id товаров категории
+
+        Args:
+            k (int): Сколько товаров выбрать
+            seed (int, optional): Ключ сессии пользователя; с ним выбор воспроизводим,
+                                  а страницы не повторяют товары друг друга
+            page (int): Номер страницы при выборе с seed
+            weighted (bool): Выбирать с вероятностью, пропорциональной рейтингу
+
+        Returns:
+            list: id выбранных товаров (пустой список, если страница за концом категории)
+        """
+        ids, n = self.ids, len(self.ids)
+        start = page * k if seed is not None else 0
+        stop = min(start + k, n)
+        if start >= stop:
+            return []
+        if not weighted:
+            if seed is None:
+                return [ids[position] for position in random.sample(range(n), stop)]
+            permutation = Permutation(n, seed)
+            return [ids[permutation[index]] for index in range(start, stop)]
+        # С весом: страница p - элементы с p*k по (p+1)*k последовательности выбора,
+        # которая для одного seed всегда одинакова (O((p+1)*k))
+        rng = random.Random(seed) if seed is not None else random
+        positions = list(self._weighted_positions(rng, stop))
+        return [ids[position] for position in positions[start:stop]]
+
+    def memory_size(self) -> int:
+        """Объем массивов категории в байтах"""
+        return len(self.ids) * self.ids.itemsize + self.cumulative.nbytes
+
+
+class CatalogSampler:
+    """Выбор случайных товаров по категориям каталога"""
+
+    def __init__(self):
+        self.categories = {}  # {категория: CategorySample}
+
+    def sample(self, category: str, k: int, seed: int = None, page: int = 0,
+               weighted: bool = False) -> list:
+        """Выбирает до k различных id товаров категории (см. CategorySample.sample)"""
+        entry = self.categories.get(category)
+        if entry is None:
+            return []
+        return entry.sample(k, seed=seed, page=page, weighted=weighted)
+
+    def memory_size(self) -> int:
+        """Объем массивов всех категорий в байтах"""
+        return sum(entry.memory_size() for entry in self.categories.values())
+
+    @classmethod
+    def from_index(cls, index, ratings: dict) -> "CatalogSampler":
+        """Строит массивы по индексу атрибутов и рейтингам товаров
+
+        Args:
+            index (AttributeIndex): Построенный индекс атрибутов (id товаров по категориям)
+            ratings (dict): {категория: рейтинги товаров в порядке index.categories[категория]}
+
+        Returns:
+            CatalogSampler: Массивы по категориям
+        """
+        return cls().updated(index, ratings, index.categories)
+
+    def updated(self, index, ratings: dict, categories) -> "CatalogSampler":
+        """Возвращает копию, в которой массивы указанных категорий построены заново
+
+        Массивы остальных категорий общие со старой копией; старая копия не меняется.
+
+        Args:
+            index (AttributeIndex): Индекс атрибутов новой версии каталога
+            ratings (dict): {категория: рейтинги товаров в порядке index.categories[категория]}
+            categories: Категории, которых коснулись изменения
+
+        Returns:
+            CatalogSampler: Новые массивы
+        """
+        sampler = CatalogSampler()
+        sampler.categories = dict(self.categories)
+        for category in categories:
+            sampler.categories.pop(category, None)
+            ids = index.categories.get(category)
+            if ids:
+                sampler.categories[category] = CategorySample(ids, ratings[category])
+        return sampler
+
+
+def new_session_seed() -> int:
+    """Случайный ключ сессии для воспроизводимого выбора"""
+    return random.getrandbits(63)
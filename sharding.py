@@ -0,0 +1,408 @@
+# sharding.py - Многопроцессный режим работы Telegram бота GoldenAppleBot
+# Процесс-супервизор получает обновления от Telegram (getUpdates) и распределяет их
+# между N рабочими процессами по хешу ID пользователя. Каждый рабочий процесс
+# поднимает свой экземпляр бота и диспетчера (main.py) и обрабатывает только своих
+# пользователей, поэтому состояния FSM и порядок обновлений каждого пользователя сохраняются.
+#
+# Словари в памяти модулей (например, support.active_chats) у каждого процесса свои,
+# поэтому команды операторов о пользователе направляются в процесс этого пользователя:
+# ответ "ID текст", /end ID, /send_link ID и кнопка "force_send_ID" обрабатываются там же,
+# где сообщения самого пользователя. Остальные сообщения чата операторов
+# (например, /stats) направляются в рабочий процесс 0.
+#
+# Рабочий процесс выполняет события запуска и остановки диспетчера (dp.startup и
+# dp.shutdown), как update_executor.run_polling. Сервер /metrics каждого процесса
+# слушает порт METRICS_PORT + номер процесса.
+#
+# Запуск: python sharding.py --workers 4
+
+import argparse  # Для разбора аргументов командной строки
+import asyncio  # Для асинхронного цикла получения обновлений
+import logging  # Для логирования ошибок
+import multiprocessing  # Для запуска рабочих процессов
+import os  # Для чтения настроек из переменных окружения
+import queue  # Для исключения queue.Empty
+import threading  # Для потока чтения очереди в рабочем процессе
+import time  # Для подсчета пропускной способности
+
+from dotenv import load_dotenv  # Загрузка переменных окружения из .env файла
+
+import bot_logging  # Неблокирующее структурированное логирование
+
+# Адрес Bot API по умолчанию
+DEFAULT_API_URL = "https://api.telegram.org"
+
+# Типы обновлений, которые обрабатывает бот (сообщения и нажатия кнопок)
+DEFAULT_ALLOWED_UPDATES = ["message", "callback_query"]
+
+# Модули, которые сервер процессов (forkserver) импортирует один раз заранее:
+# рабочие процессы создаются копированием уже готового процесса и не тратят
+# около секунды на импорт aiogram при каждом запуске и перезапуске
+PRELOAD_MODULES = ["aiogram", "aiogram.types", "aiogram.methods", "aiohttp", "dotenv"]
+
+# Команды операторов, первый аргумент которых - ID пользователя
+OPERATOR_USER_COMMANDS = ("/end", "/send_link", "/send_link_test", "/debug_send")
+
+# Поля обновления, в которых может находиться событие
+UPDATE_EVENT_FIELDS = (
+    "message", "edited_message", "callback_query", "inline_query",
+    "chosen_inline_result", "my_chat_member", "chat_member", "chat_join_request",
+    "channel_post", "edited_channel_post",
+)
+
+
+def extract_user_and_chat(update: dict) -> tuple:
+    """Определяет ID пользователя и ID чата для сырого обновления Telegram
+
+    Args:
+        update (dict): Обновление в формате Bot API
+
+    Returns:
+        tuple: (user_id, chat_id), любое из значений может быть None
+    """
+    for field in UPDATE_EVENT_FIELDS:
+        event = update.get(field)
+        if not event:
+            continue
+        user_id = (event.get("from") or {}).get("id")
+        chat = event.get("chat") or (event.get("message") or {}).get("chat") or {}
+        return user_id, chat.get("id")
+    return None, None
+
+
+def operator_target_user(update: dict) -> int:
+    """Определяет пользователя, к которому относится обновление из чата операторов
+
+    Ответ оператора "ID текст", команды /end, /send_link, /send_link_test и /debug_send
+    с ID пользователя первым аргументом и кнопка "force_send_ID".
+
+    Args:
+        update (dict): Обновление в формате Bot API
+
+    Returns:
+        int: ID пользователя или None, если обновление не относится к пользователю
+    """
+    callback = update.get("callback_query")
+    if callback:
+        data = callback.get("data") or ""
+        target = data[len("force_send_"):] if data.startswith("force_send_") else ""
+    else:
+        words = ((update.get("message") or {}).get("text") or "").split(maxsplit=2)
+        if words and words[0].startswith("/"):
+            command = words[0].split("@")[0]
+            target = words[1] if command in OPERATOR_USER_COMMANDS and len(words) > 1 else ""
+        else:
+            target = words[0] if words else ""
+    try:
+        return int(target)
+    except ValueError:
+        return None
+
+
+def shard_for_update(update: dict, workers: int, operator_chat_id: int = None) -> int:
+    """Выбирает рабочий процесс для обновления
+
+    Обновления распределяются по хешу ID пользователя, поэтому все обновления
+    одного пользователя обрабатываются одним процессом в порядке поступления.
+    Обновления из чата операторов идут в процесс пользователя, к которому
+    относятся (operator_target_user), остальные - в процесс 0.
+
+    Args:
+        update (dict): Обновление в формате Bot API
+        workers (int): Количество рабочих процессов
+        operator_chat_id (int, optional): ID чата операторов
+
+    Returns:
+        int: Номер рабочего процесса
+    """
+    user_id, chat_id = extract_user_and_chat(update)
+    if operator_chat_id is not None and chat_id == operator_chat_id:
+        target = operator_target_user(update)
+        return 0 if target is None else hash(target) % workers
+    key = user_id if user_id is not None else chat_id
+    if key is None:
+        key = update.get("update_id", 0)
+    return hash(key) % workers
+
+
+def _worker_main(index: int, updates, stats, report_interval: float):
+    """Точка входа рабочего процесса"""
+    try:
+        asyncio.run(_worker_loop(index, updates, stats, report_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_loop(index: int, updates, stats, report_interval: float):
+    """Обрабатывает обновления своего шарда через диспетчер из main.py"""
+    from startup_timer import StartupTimer
+    timer = StartupTimer()
+
+    # Импортируем main внутри процесса: у каждого процесса свой бот и диспетчер
+    with timer.phase("импорт"):
+        import main
+        from aiogram.types import Update
+        from update_executor import UserOrderedExecutor, config_from_env, update_key
+    # Сервер /metrics у каждого процесса свой: порт METRICS_PORT + номер процесса
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        os.environ["METRICS_PORT"] = str(int(metrics_port) + index)
+    # База рекомендаций уже подготовлена супервизором
+    with timer.phase("обработчики"):
+        main.register_all_handlers(init_database=False)
+    executor = UserOrderedExecutor(**config_from_env())
+
+    # Те же события запуска и остановки диспетчера, что в update_executor.run_polling:
+    # обработчики модулей (обновление каталога, журнал просмотров, сервер метрик и
+    # будущие) регистрируются в dp.startup/dp.shutdown, а не вызываются здесь по одному
+    dp, bot = main.dp, main.bot
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    with timer.phase("запуск диспетчера"):
+        await dp.emit_startup(bot=bot, **workflow_data)
+    logging.info(f"Воркер {index}: {timer.report()}")
+
+    loop = asyncio.get_running_loop()
+    local_queue = asyncio.Queue()
+
+    # Снимок каталога в памяти строится в фоне (по столбцовому снимку, записанному
+    # супервизором, если каталог с тех пор не менялся); пока он не готов,
+    # поиск по критериям идет по индексам базы товаров. Затем снимок
+    # обновляется в фоне по журналу изменений базы (start_catalog_refresher
+    # при запуске диспетчера), а кэш результатов прогревается по готовому снимку
+    async def warmup_catalog():
+        await asyncio.to_thread(main.recommendations.warmup_catalog)
+        await main.recommendations.warmup_result_cache()
+
+    warmup = asyncio.create_task(warmup_catalog())
+
+    # Поток перекладывает обновления из межпроцессной очереди в очередь asyncio,
+    # чтобы не блокировать цикл событий ожиданием
+    def pump():
+        while True:
+            update = updates.get()
+            loop.call_soon_threadsafe(local_queue.put_nowait, update)
+            if update is None:
+                break
+
+    threading.Thread(target=pump, daemon=True).start()
+
+    processed = 0  # Сколько обновлений обработано с момента последнего отчета
+
+    async def handle(update: Update):
+        nonlocal processed
+        await dp.feed_update(bot, update, **workflow_data)
+        processed += 1
+
+    async def report():
+        nonlocal processed
+        last_report = time.monotonic()
+        while True:
+            await asyncio.sleep(report_interval)
+            now = time.monotonic()
+            stats.put((index, processed, now - last_report))
+            processed = 0
+            last_report = now
+
+    reporter = asyncio.create_task(report())
+    try:
+        while True:
+            update = await local_queue.get()
+            if update is None:
+                break
+            try:
+                parsed = Update.model_validate(update, context={"bot": bot})
+            except Exception as e:
+                logging.error(f"Воркер {index}: не удалось разобрать обновление {update.get('update_id')}: {e}")
+                continue
+            await executor.submit(update_key(parsed), lambda parsed=parsed: handle(parsed))
+    finally:
+        await executor.join()
+        reporter.cancel()
+        await asyncio.gather(warmup, return_exceptions=True)
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        # Записываем на диск оставшиеся изменения состояний FSM
+        await dp.storage.close()
+        await bot.session.close()
+
+
+class Supervisor:
+    """Супервизор: получает обновления и распределяет их по рабочим процессам"""
+
+    def __init__(self, workers: int, token: str, operator_chat_id: int = None,
+                 api_url: str = DEFAULT_API_URL, allowed_updates: list = None,
+                 report_interval: float = 10.0, polling_timeout: int = 30):
+        self.workers = workers
+        self.token = token
+        self.operator_chat_id = operator_chat_id
+        self.api_url = api_url.rstrip("/")
+        self.allowed_updates = allowed_updates or DEFAULT_ALLOWED_UPDATES
+        self.report_interval = report_interval
+        self.polling_timeout = polling_timeout
+
+        self._context = self._make_context()
+        self._queues = []
+        self._processes = []
+        self._stats = None
+        self.routed = [0] * workers  # Сколько обновлений отправлено каждому процессу
+
+    @staticmethod
+    def _make_context():
+        """Контекст запуска процессов: forkserver с предзагрузкой, иначе spawn
+
+        Оба способа не копируют в рабочие процессы цикл событий и потоки супервизора.
+        """
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(PRELOAD_MODULES)
+            return context
+        return multiprocessing.get_context("spawn")
+
+    def _start_worker(self, index: int):
+        """Запускает (или перезапускает) рабочий процесс с номером index"""
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self._queues[index], self._stats, self.report_interval),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    def start_workers(self):
+        """Запускает рабочие процессы"""
+        # База рекомендаций готовится один раз здесь, а не в каждом процессе
+        import recommendations
+        recommendations.init_db()
+        # Столбцовый снимок каталога (columnar_catalog.py): рабочие процессы строят по нему
+        # снимок каталога в памяти без чтения таблицы products, id и маски атрибутов
+        # категорий - общие страницы файла; словари показываемых товаров создаются из
+        # столбцов, пока каталог не изменился
+        recommendations.write_columnar_catalog()
+
+        self._stats = self._context.Queue()
+        self._queues = [self._context.Queue() for _ in range(self.workers)]
+        self._processes = [None] * self.workers
+        for index in range(self.workers):
+            self._start_worker(index)
+        logging.info(f"Запущено рабочих процессов: {self.workers}")
+
+    async def watch(self, interval: float = 1.0):
+        """Перезапускает рабочие процессы, которые завершились с ошибкой
+
+        Очередь процесса сохраняется, поэтому новый процесс продолжает
+        обработку с первого необработанного обновления своего шарда.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logging.error(f"Воркер {index} завершился (код {process.exitcode}), перезапускаем")
+                    self._start_worker(index)
+
+    def stop_workers(self, timeout: float = 10.0):
+        """Останавливает рабочие процессы после обработки уже отправленных обновлений"""
+        for updates in self._queues:
+            updates.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def route(self, update: dict):
+        """Отправляет обновление в рабочий процесс его шарда"""
+        index = shard_for_update(update, self.workers, self.operator_chat_id)
+        self.routed[index] += 1
+        self._queues[index].put(update)
+
+    async def poll(self):
+        """Получает обновления через getUpdates и распределяет их по процессам
+
+        Обновления берутся в виде JSON без разбора в модели aiogram: разбор
+        выполняют рабочие процессы, супервизор не нагружает свое ядро.
+        """
+        from aiohttp import ClientSession, ClientError
+
+        url = f"{self.api_url}/bot{self.token}/getUpdates"
+        offset = None
+        async with ClientSession() as session:
+            while True:
+                payload = {"timeout": self.polling_timeout, "allowed_updates": self.allowed_updates}
+                if offset is not None:
+                    payload["offset"] = offset
+                try:
+                    async with session.post(url, json=payload) as response:
+                        result = await response.json()
+                except (ClientError, asyncio.TimeoutError, ValueError) as e:
+                    logging.error(f"Ошибка при получении обновлений: {e}")
+                    await asyncio.sleep(1)
+                    continue
+
+                if not result.get("ok"):
+                    logging.error(f"Bot API вернул ошибку: {result.get('description')}")
+                    await asyncio.sleep(1)
+                    continue
+
+                for update in result["result"]:
+                    offset = update["update_id"] + 1
+                    self.route(update)
+
+    async def report(self):
+        """Периодически выводит пропускную способность каждого рабочего процесса"""
+        loop = asyncio.get_running_loop()
+        totals = [0] * self.workers
+        while True:
+            try:
+                index, processed, elapsed = await loop.run_in_executor(
+                    None, self._stats.get, True, self.report_interval
+                )
+            except queue.Empty:
+                continue
+            totals[index] += processed
+            rate = processed / elapsed if elapsed > 0 else 0.0
+            logging.info(
+                f"Воркер {index}: {rate:.1f} обновлений/с, "
+                f"обработано всего {totals[index]}, отправлено {self.routed[index]}"
+            )
+
+    async def run(self):
+        """Запускает рабочие процессы и цикл получения обновлений"""
+        self.start_workers()
+        reporter = asyncio.create_task(self.report())
+        watcher = asyncio.create_task(self.watch())
+        try:
+            await self.poll()
+        finally:
+            watcher.cancel()
+            reporter.cancel()
+            self.stop_workers()
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Многопроцессный режим бота")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BOT_WORKERS", os.cpu_count() or 2)),
+                        help="Количество рабочих процессов")
+    parser.add_argument("--report-interval", type=float, default=10.0,
+                        help="Интервал отчета о пропускной способности, секунд")
+    args = parser.parse_args()
+
+    bot_logging.setup_logging(**bot_logging.config_from_env())
+
+    # ID чата операторов читается так же, как в рабочих процессах (main.py)
+    from support import operator_chat_id_from_env
+    supervisor = Supervisor(
+        workers=args.workers,
+        token=os.getenv("BOT_TOKEN"),
+        operator_chat_id=operator_chat_id_from_env(),
+        api_url=os.getenv("TELEGRAM_API_URL") or DEFAULT_API_URL,
+        report_interval=args.report_interval,
+    )
+    try:
+        asyncio.run(supervisor.run())
+    except KeyboardInterrupt:
+        logging.info("Супервизор остановлен!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# startup_timer.py - Замер длительности этапов запуска Telegram бота GoldenAppleBot
+# Каждый этап запуска (импорт модулей, регистрация обработчиков, команды бота,
+# подготовка базы данных) замеряется отдельно, а в конце в лог выводится отчет:
+#     Запуск за 412 мс: импорт 380 мс, обработчики 6 мс, set_my_commands 21 мс, ...
+# Этапы, выполняемые одновременно, замеряются каждый по отдельности, поэтому
+# их сумма может быть больше общего времени запуска.
+
+import logging  # Для вывода отчета
+import time  # Для замера времени
+from contextlib import contextmanager  # Для замера этапа в блоке with
+
+
+class StartupTimer:
+    """Замер этапов запуска от заданного момента (обычно - начала импорта main.py)"""
+
+    def __init__(self, started: float = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = []  # [(название этапа, длительность в секундах)]
+
+    def add(self, name: str, seconds: float):
+        """Добавляет уже замеренный этап"""
+        self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name: str):
+        """Замеряет этап, выполняемый внутри блока with"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    async def run(self, name: str, awaitable):
+        """Замеряет асинхронный этап и возвращает его результат"""
+        with self.phase(name):
+            return await awaitable
+
+    @property
+    def elapsed(self) -> float:
+        """Сколько секунд прошло с начала запуска"""
+        return time.perf_counter() - self.started
+
+    def report(self) -> str:
+        """Формирует отчет о времени запуска по этапам"""
+        phases = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in self.phases)
+        return f"Запуск за {self.elapsed * 1000:.0f} мс: {phases}"
+
+    def log_report(self):
+        """Выводит отчет в лог"""
+        logging.info(self.report())
@@ -1,7 +1,12 @@
 import logging
+import os
 from aiogram import types, Bot, Dispatcher, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from callback_router import get_callback_router
+from bot_logging import get_logger
+
+log = get_logger(__name__)
 
 # Состояние для чата поддержки
 class SupportState(StatesGroup):
@@ -9,6 +14,26 @@ class SupportState(StatesGroup):
     in_chat = State()
     waiting_for_question = State()
 
+# ID чата операторов, если переменная окружения не задана или не является числом
+DEFAULT_OPERATOR_CHAT_ID = 7411289458  # ID пользователя который получает сообщения от бота
+
+def operator_chat_id_from_env() -> int:
+    """ID чата операторов из OPERATOR_CHAT_ID или SUPPORT_CHAT_ID
+    
+    Единственное место, где читается эта настройка: по ней и бот (main.py), и
+    супервизор многопроцессного режима (sharding.py) узнают сообщения операторов.
+    
+    Returns:
+        int: ID чата операторов или DEFAULT_OPERATOR_CHAT_ID
+    """
+    value = os.getenv("OPERATOR_CHAT_ID") or os.getenv("SUPPORT_CHAT_ID")
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        logging.error(f"ID чата операторов не задан или не число ({value!r}), "
+                      f"используется {DEFAULT_OPERATOR_CHAT_ID}")
+        return DEFAULT_OPERATOR_CHAT_ID
+
 # Активные чаты {user_id: True}
 active_chats = {}
 user_contacts = {}  # Хранение номеров пользователей {user_id: phone_number}
@@ -85,7 +110,7 @@ async def handle_messages(message: types.Message, state: FSMContext, bot, OPERAT
     user_id = message.from_user.id
     current_state = await state.get_state()
     
-    print(f"DEBUG: Обработка сообщения от пользователя {user_id}, состояние: {current_state}")
+    log.debug("Обработка сообщения", user_id=user_id, state=current_state)
 
     # Если пользователь ожидает ввода имени
     if current_state == "SupportState:waiting_for_name":
@@ -124,7 +149,7 @@ async def handle_messages(message: types.Message, state: FSMContext, bot, OPERAT
 
             text = parts[1]  # Текст сообщения
 
-            print(f"DEBUG: Оператор отправляет сообщение пользователю {target_user_id}: {text[:20]}...")
+            log.debug("Оператор отправляет сообщение", user_id=target_user_id, text=text[:20])
 
             # Проверяем, активен ли чат с пользователем
             if target_user_id not in active_chats:
@@ -172,17 +197,17 @@ async def handle_messages(message: types.Message, state: FSMContext, bot, OPERAT
         
         # Если пользователь в состоянии чата поддержки
         if is_in_support:
-            print(f"DEBUG: Пользователь {user_id} отправил сообщение в чат поддержки: {message.text[:20]}...")
+            log.debug("Сообщение в чат поддержки", user_id=user_id, text=message.text[:20])
             
             # Если пользователь в списке активных чатов, но состояние не установлено
             if not current_state and user_id in active_chats:
                 await state.set_state(SupportState.in_chat)
-                print(f"DEBUG: Установлено состояние SupportState.in_chat для пользователя {user_id}")
+                log.debug("Установлено состояние SupportState.in_chat", user_id=user_id)
             
             # Если пользователь не в списке активных чатов, добавляем его
             if user_id not in active_chats:
                 active_chats[user_id] = True
-                print(f"DEBUG: Пользователь {user_id} добавлен в список активных чатов")
+                log.debug("Пользователь добавлен в активные чаты", user_id=user_id)
             
             # Пересылаем сообщение оператору
             try:
@@ -214,7 +239,7 @@ async def start_support_chat(callback: types.CallbackQuery, state: FSMContext, b
     
     try:
         # Добавляем отладочную информацию
-        print(f"DEBUG: Получен запрос на техподдержку от пользователя {user_id}")
+        log.debug("Запрос на техподдержку", user_id=user_id)
         
         # Отвечаем на callback
         await callback.answer("Подключаем вас к чату поддержки...")
@@ -266,7 +291,7 @@ async def handle_support_name(message: types.Message, state: FSMContext, bot, OP
         # Устанавливаем состояние в чате
         active_chats[user_id] = True
         await state.set_state(SupportState.in_chat)
-        print(f"DEBUG: Установлено состояние SupportState.in_chat для пользователя {user_id}")
+        log.debug("Установлено состояние SupportState.in_chat", user_id=user_id)
         
         # Создаем кнопки для чата поддержки
         support_kb = types.InlineKeyboardMarkup(inline_keyboard=[
@@ -314,24 +339,25 @@ async def handle_support_name(message: types.Message, state: FSMContext, bot, OP
 
 # Функция для регистрации обработчиков
 def register_handlers(dp: Dispatcher, bot: Bot, OPERATOR_CHAT_ID, main_menu_kb):
-    print(f"DEBUG: Регистрация обработчиков поддержки, OPERATOR_CHAT_ID={OPERATOR_CHAT_ID}")
+    log.debug("Регистрация обработчиков поддержки", operator_chat_id=OPERATOR_CHAT_ID)
     
+    router = get_callback_router(dp)
+
     # Регистрация обработчика запроса поддержки
-    @dp.callback_query(F.data == "support_request")
     async def support_callback_wrapper(callback: types.CallbackQuery, state: FSMContext):
-        print(f"DEBUG: Получен callback support_request от {callback.from_user.id}")
+        log.debug("Получен callback support_request", user_id=callback.from_user.id)
         await start_support_chat(callback, state, bot, OPERATOR_CHAT_ID)
+    router.exact("support_request", support_callback_wrapper)
     
     # Обработчик для завершения чата с клиентской стороны
-    @dp.callback_query(lambda c: c.data == "end_chat")
     async def end_chat_wrapper(callback: types.CallbackQuery, state: FSMContext):
-        print(f"DEBUG: Получен callback end_chat от {callback.from_user.id}")
+        log.debug("Получен callback end_chat", user_id=callback.from_user.id)
         await end_chat_callback(callback, state, bot, OPERATOR_CHAT_ID)
+    router.exact("end_chat", end_chat_wrapper)
     
     # Обработчик для принудительной отправки сообщения даже если пользователь не в чате
-    @dp.callback_query(lambda c: c.data and c.data.startswith("force_send_"))
     async def force_send_wrapper(callback: types.CallbackQuery, state: FSMContext):
-        print(f"DEBUG: Получен callback force_send от {callback.from_user.id}")
+        log.debug("Получен callback force_send", user_id=callback.from_user.id)
         try:
             target_user_id = int(callback.data.split("_")[2])
             # Получаем исходное сообщение оператора
@@ -355,27 +381,28 @@ def register_handlers(dp: Dispatcher, bot: Bot, OPERATOR_CHAT_ID, main_menu_kb):
         except Exception as e:
             logging.error(f"Ошибка в force_send_wrapper: {e}")
             await callback.answer("Произошла ошибка. Попробуйте еще раз.")
+    router.prefix("force_send_", force_send_wrapper)
     
     # Обработчик для отмены отправки
-    @dp.callback_query(lambda c: c.data == "cancel_send")
     async def cancel_send_wrapper(callback: types.CallbackQuery):
         await callback.message.edit_text("✅ Отправка сообщения отменена.")
         await callback.answer()
+    router.exact("cancel_send", cancel_send_wrapper)
     
     # Регистрация обработчика для команды завершения чата от оператора
     @dp.message(lambda message: message.chat.id == OPERATOR_CHAT_ID and message.text and message.text.startswith("/end"))
     async def operator_end_chat_wrapper(message: types.Message):
-        print(f"DEBUG: Получена команда /end от оператора {message.from_user.id}")
+        log.debug("Получена команда /end от оператора", operator_id=message.from_user.id)
         await operator_end_chat(message, bot)
     
     # Регистрация обработчика для получения контактов
     @dp.message(lambda message: message.contact is not None)
     async def contact_handler_wrapper(message: types.Message):
-        print(f"DEBUG: Получен контакт от {message.from_user.id}")
+        log.debug("Получен контакт", user_id=message.from_user.id)
         await handle_contact(message, bot, main_menu_kb)
     
     # Общий обработчик сообщений для чата поддержки (самый низкий приоритет)
     @dp.message()
     async def message_handler_wrapper(message: types.Message, state: FSMContext):
-        print(f"DEBUG: Обработка сообщения от {message.from_user.id} в чате {message.chat.id}")
+        log.debug("Сообщение для чата поддержки", user_id=message.from_user.id, chat_id=message.chat.id)
         await handle_messages(message, state, bot, OPERATOR_CHAT_ID) 
\ No newline at end of file
@@ -0,0 +1,170 @@
+# update_executor.py - Параллельная обработка обновлений с сохранением порядка для каждого пользователя
+# Обновления разных пользователей обрабатываются одновременно (с ограничением на количество
+# одновременно выполняемых хендлеров), а обновления одного пользователя - строго по очереди.
+# Так медленный хендлер (ожидание оператора, запрос к SQLite) не задерживает остальных
+# пользователей, а быстрые нажатия одного пользователя (toggle_criteria) не гоняются
+# за общие данные состояния.
+#
+# Очередь пользователя существует только пока в ней есть обновления: после обработки
+# последнего она удаляется, поэтому память не растет с количеством уникальных пользователей.
+
+import asyncio  # Для задач, семафоров и таймаутов
+import logging  # Для логирования ошибок
+import os  # Для чтения настроек из переменных окружения
+from collections import deque  # Очередь обновлений пользователя
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+
+def config_from_env() -> dict:
+    """Читает настройки исполнителя из переменных окружения
+
+    Переменные окружения:
+        UPDATE_CONCURRENCY - сколько обновлений может обрабатываться одновременно (64)
+        UPDATE_MAX_PENDING - сколько обновлений может ожидать обработки (10000)
+
+    Returns:
+        dict: Параметры для UserOrderedExecutor
+    """
+    return {
+        "max_concurrency": int(os.getenv("UPDATE_CONCURRENCY", "64")),
+        "max_pending": int(os.getenv("UPDATE_MAX_PENDING", "10000")),
+    }
+
+
+def update_key(update: Update):
+    """Возвращает ключ очереди для обновления: ID пользователя, иначе ID чата
+
+    Args:
+        update (Update): Обновление Telegram
+
+    Returns:
+        Ключ, по которому обновления выстраиваются в одну очередь
+    """
+    event = update.event
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    return update.update_id
+
+
+class UserOrderedExecutor:
+    """Исполнитель задач с очередью на каждого пользователя
+
+    Задачи с одинаковым ключом выполняются строго в порядке поступления,
+    задачи с разными ключами - параллельно, но не более max_concurrency одновременно.
+    """
+
+    def __init__(self, max_concurrency: int = 64, max_pending: int = 10000):
+        self.max_concurrency = max_concurrency
+        self._running = asyncio.Semaphore(max_concurrency)  # Ограничение выполняемых задач
+        self._pending = asyncio.Semaphore(max_pending)  # Ограничение принятых задач
+        self._queues = {}  # Очереди пользователей: {ключ: deque задач}
+        self._tasks = set()  # Задачи, разбирающие очереди пользователей
+
+    @property
+    def active_keys(self) -> int:
+        """Количество пользователей, у которых есть необработанные задачи"""
+        return len(self._queues)
+
+    async def submit(self, key, job):
+        """Ставит задачу в очередь пользователя
+
+        Если принятых задач уже max_pending, ожидает освобождения места.
+
+        Args:
+            key: Ключ очереди (обычно ID пользователя)
+            job: Функция без аргументов, возвращающая awaitable
+        """
+        await self._pending.acquire()
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(job)
+            return
+
+        queue = self._queues[key] = deque([job])
+        task = asyncio.create_task(self._drain(key, queue))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, key, queue: deque):
+        """Выполняет задачи пользователя по очереди, затем удаляет очередь"""
+        try:
+            while queue:
+                job = queue.popleft()
+                try:
+                    async with self._running:
+                        await job()
+                except Exception as e:
+                    logging.error(f"Ошибка при обработке обновления для {key}: {e}")
+                finally:
+                    self._pending.release()
+        finally:
+            # Очередь пуста - освобождаем память
+            del self._queues[key]
+
+    async def join(self):
+        """Дожидается выполнения всех принятых задач"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+async def submit_update(executor: UserOrderedExecutor, dp: Dispatcher, bot: Bot, update: Update, **kwargs):
+    """Ставит обновление в очередь его пользователя для обработки диспетчером"""
+    await executor.submit(update_key(update), lambda: dp.feed_update(bot, update, **kwargs))
+
+
+async def run_polling(dp: Dispatcher, bot: Bot, executor: UserOrderedExecutor = None,
+                      polling_timeout: int = 30):
+    """Получает обновления через long polling и обрабатывает их через исполнитель
+
+    Замена dp.start_polling: обновления разных пользователей обрабатываются
+    параллельно, обновления одного пользователя - по порядку.
+
+    Args:
+        dp (Dispatcher): Диспетчер с зарегистрированными обработчиками
+        bot (Bot): Экземпляр бота
+        executor (UserOrderedExecutor, optional): Исполнитель; по умолчанию создается
+                                                  с настройками из переменных окружения
+        polling_timeout (int): Таймаут long polling запроса, секунд
+    """
+    if executor is None:
+        executor = UserOrderedExecutor(**config_from_env())
+
+    allowed_updates = dp.resolve_used_update_types()
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+
+    await dp.emit_startup(bot=bot, **workflow_data)
+    logging.info(f"Start polling (одновременно до {executor.max_concurrency} обновлений)")
+    offset = None
+    delay = 1.0
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset,
+                    timeout=polling_timeout,
+                    allowed_updates=allowed_updates,
+                    request_timeout=polling_timeout + 10,
+                )
+            except Exception as e:
+                # Сетевые ошибки и ошибки Telegram: повторяем с растущей задержкой
+                logging.error(f"Ошибка при получении обновлений: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+
+            delay = 1.0
+            for update in updates:
+                offset = update.update_id + 1
+                await submit_update(executor, dp, bot, update, **workflow_data)
+    finally:
+        logging.info("Polling stopped")
+        await executor.join()
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        await bot.session.close()
@@ -0,0 +1,228 @@
+# webhook.py - Режим приема обновлений через webhook для Telegram бота GoldenAppleBot
+# Вместо long polling бот поднимает встроенный aiohttp-сервер, на который Telegram
+# отправляет обновления POST-запросами. Сервер сразу отвечает Telegram и передает
+# обновление в очередь, из которой оно попадает в исполнитель update_executor
+# (параллельно для разных пользователей, по порядку для одного пользователя).
+# Если задан WEBHOOK_URL, запросы принимаются только с секретным токеном: без
+# WEBHOOK_SECRET токен создается случайным при запуске и передается в setWebhook.
+#
+# Для локальной проверки можно отправить на сервер записанные обновления:
+#     python webhook.py post updates.jsonl --url http://127.0.0.1:8080/webhook --secret SECRET
+
+import argparse  # Для разбора аргументов командной строки
+import asyncio  # Для фоновых задач обработки очереди
+import hmac  # Для сравнения секретного токена за постоянное время
+import json  # Для чтения записанных обновлений
+import logging  # Для логирования ошибок
+import os  # Для чтения настроек из переменных окружения
+import secrets  # Для случайного секретного токена
+
+from aiohttp import ClientSession, web  # Встроенный HTTP-сервер и клиент
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+import update_executor
+from update_executor import UserOrderedExecutor, submit_update
+
+# Заголовок, в котором Telegram передает секретный токен webhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def config_from_env() -> dict:
+    """Читает настройки webhook из переменных окружения
+
+    Переменные окружения:
+        WEBHOOK_URL - публичный адрес бота (https://example.com). Если не указан,
+                      setWebhook не вызывается (удобно для локальной проверки)
+        WEBHOOK_PATH - путь, на который Telegram отправляет обновления (/webhook)
+        WEBHOOK_HOST - адрес, на котором слушает сервер (0.0.0.0)
+        WEBHOOK_PORT - порт сервера (8080)
+        WEBHOOK_SECRET - секретный токен для проверки запросов от Telegram. Если не указан
+                         вместе с WEBHOOK_URL, токен создается случайным при запуске
+        WEBHOOK_QUEUE_SIZE - максимальный размер очереди обновлений (10000)
+
+    Параллельность обработки задается настройками update_executor (UPDATE_CONCURRENCY).
+
+    Returns:
+        dict: Параметры для run_webhook
+    """
+    return {
+        "url": os.getenv("WEBHOOK_URL") or None,
+        "path": os.getenv("WEBHOOK_PATH", "/webhook"),
+        "host": os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+        "port": int(os.getenv("WEBHOOK_PORT", "8080")),
+        "secret_token": os.getenv("WEBHOOK_SECRET") or None,
+        "queue_size": int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000")),
+    }
+
+
+class WebhookServer:
+    """Прием обновлений от Telegram с немедленным ответом и фоновой обработкой
+
+    Обработчик запроса только проверяет секретный токен, разбирает JSON и кладет
+    обновление в очередь. Фоновая задача передает обновления из очереди в исполнитель,
+    поэтому Telegram получает ответ без ожидания хендлеров.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str = "/webhook",
+                 secret_token: str = None, executor: UserOrderedExecutor = None,
+                 queue_size: int = 10000):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.executor = executor or UserOrderedExecutor(**update_executor.config_from_env())
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self._task = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Принимает обновление от Telegram и ставит его в очередь"""
+        if self.secret_token and not hmac.compare_digest(
+                request.headers.get(SECRET_HEADER, "").encode(), self.secret_token.encode()):
+            return web.Response(status=401, text="Invalid secret token")
+
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400, text="Invalid JSON")
+        if not isinstance(update, dict):
+            # Обновление Telegram - всегда объект JSON
+            return web.Response(status=400, text="Update must be a JSON object")
+
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку обновления позже
+            logging.error("Очередь webhook переполнена, обновление отклонено")
+            return web.Response(status=503, text="Queue is full")
+
+        return web.Response(status=200)
+
+    async def _consume(self):
+        """Фоновая задача: разбирает очередь и передает обновления в исполнитель
+
+        Задача одна, поэтому обновления попадают в очереди пользователей
+        в порядке поступления.
+        """
+        while True:
+            update = await self.queue.get()
+            try:
+                parsed = Update.model_validate(update, context={"bot": self.bot})
+                await submit_update(self.executor, self.dp, self.bot, parsed)
+            except Exception as e:
+                # Ошибка одного обновления не должна останавливать единственную задачу очереди
+                logging.error(f"Ошибка при обработке обновления: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def start(self):
+        """Запускает фоновую задачу обработки очереди"""
+        self._task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        """Дожидается обработки уже принятых обновлений и останавливает фоновую задачу"""
+        await self.queue.join()
+        await self.executor.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    def setup(self, app: web.Application):
+        """Регистрирует обработчик webhook и фоновые задачи в приложении aiohttp"""
+        app.router.add_post(self.path, self.handle)
+
+        async def on_startup(_app):
+            await self.start()
+
+        async def on_shutdown(_app):
+            await self.stop()
+
+        app.on_startup.append(on_startup)
+        app.on_shutdown.append(on_shutdown)
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, url: str = None, path: str = "/webhook",
+                      host: str = "0.0.0.0", port: int = 8080, secret_token: str = None,
+                      executor: UserOrderedExecutor = None, queue_size: int = 10000):
+    """Запускает бота в режиме webhook и работает до отмены задачи
+
+    Args:
+        dp (Dispatcher): Диспетчер с зарегистрированными обработчиками
+        bot (Bot): Экземпляр бота
+        url (str, optional): Публичный адрес бота. Если указан, вызывается setWebhook
+        path (str): Путь, на который Telegram отправляет обновления
+        host (str): Адрес, на котором слушает сервер
+        port (int): Порт сервера
+        secret_token (str, optional): Секретный токен для проверки запросов. Если указан url,
+            а токен нет, создается случайный токен: иначе любой, кто знает адрес,
+            мог бы отправить боту поддельные обновления (например, команды операторов)
+        executor (UserOrderedExecutor, optional): Исполнитель обработки обновлений
+        queue_size (int): Максимальный размер очереди обновлений
+    """
+    if url and not secret_token:
+        secret_token = secrets.token_urlsafe(32)
+        logging.warning("WEBHOOK_SECRET не задан: для setWebhook создан случайный секретный токен")
+
+    server = WebhookServer(dp, bot, path=path, secret_token=secret_token,
+                           executor=executor, queue_size=queue_size)
+    app = web.Application()
+    server.setup(app)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+
+    await dp.emit_startup(bot=bot, dispatcher=dp, **dp.workflow_data)
+    try:
+        await site.start()
+        logging.info(f"Webhook сервер слушает {host}:{port}{path}")
+
+        if url:
+            await bot.set_webhook(
+                url=url.rstrip("/") + path,
+                secret_token=secret_token,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+            logging.info(f"Webhook установлен: {url.rstrip('/') + path}")
+
+        # Работаем, пока задачу не отменят (Ctrl+C или остановка процесса)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, **dp.workflow_data)
+        await bot.session.close()
+
+
+async def post_updates(path: str, url: str, secret_token: str = None):
+    """Отправляет записанные обновления (по одному JSON в строке) на webhook сервер
+
+    Args:
+        path (str): Путь к файлу с обновлениями в формате JSON Lines
+        url (str): Адрес webhook сервера
+        secret_token (str, optional): Секретный токен webhook
+    """
+    headers = {SECRET_HEADER: secret_token} if secret_token else {}
+    sent = 0
+    async with ClientSession() as session:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                async with session.post(url, json=json.loads(line), headers=headers) as response:
+                    if response.status != 200:
+                        print(f"Обновление отклонено: HTTP {response.status} {await response.text()}")
+                    else:
+                        sent += 1
+    print(f"Принято сервером обновлений: {sent}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Утилиты webhook режима")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    post_parser = subparsers.add_parser("post", help="Отправить записанные обновления на webhook")
+    post_parser.add_argument("file", help="Файл с обновлениями (JSON Lines)")
+    post_parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    post_parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"))
+    args = parser.parse_args()
+
+    asyncio.run(post_updates(args.file, args.url, args.secret))